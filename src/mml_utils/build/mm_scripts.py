@@ -1,5 +1,6 @@
 from pathlib import Path
 
+from mml_utils.layout import iter_files
 from mml_utils.os_utils import escape_space
 
 
@@ -70,8 +71,7 @@ def get_next_file(filelist: Path = None, directory: Path = None):
             for line in fh:
                 yield Path(line.strip())
     elif directory:
-        for file in directory.iterdir():
-            yield file
+        yield from iter_files(directory)
 
 
 def build_mm_script(parameters='', outpath: Path = None, mm_path: Path = None, filelist: Path = None,
@@ -103,18 +103,24 @@ def write_ensure_directories(outpath, target_dirs):
         out.write(f'./bin/wsdserverctl start\n')
 
 
-def write_shell_script(writer, directory, filelist, mm_outpath, mm_path, parameters, replace):
-    target_dirs = set()
-    writer.writeline(f'# Remember to set path, e.g., `export PATH=$PATH:/mnt/c/public_mm/bin`\n')
+def iter_mm_targets(directory: Path = None, filelist: Path = None, mm_outpath: Path = None, replace=None):
+    """Yield (path to input file, path to output mmi file) for each file to run metamap on."""
     for target_file in get_next_file(filelist, directory):
         target_dir = mm_outpath or target_file.parent
-        target_dirs.add(target_dir)
         if replace:
             file = target_file.as_posix().replace(replace[0], replace[1])
         else:
             file = target_file.as_posix()
+        yield file, Path(target_dir) / f'{target_file.stem}.mmi'
+
+
+def write_shell_script(writer, directory, filelist, mm_outpath, mm_path, parameters, replace):
+    target_dirs = set()
+    writer.writeline(f'# Remember to set path, e.g., `export PATH=$PATH:/mnt/c/public_mm/bin`\n')
+    for file, outfile in iter_mm_targets(directory, filelist, mm_outpath, replace):
+        target_dirs.add(outfile.parent)
         writer.writeline(
             f'{escape_space(mm_path)} {parameters} {escape_space(file)}'
-            f' {escape_space((target_dir / target_file.stem).as_posix())}.mmi'
+            f' {escape_space(outfile.as_posix())}'
         )
     return target_dirs
@@ -0,0 +1,100 @@
+"""
+Track which notes have been written by `build_files` so that `--resume` can continue exactly where it stopped, even
+    when notes are written by several threads and so finish (and are added to filelists) out of order.
+
+Notes are numbered in the order they first appear in the source. A progress file (`.build_progress.json`) is
+    periodically written to the output directory recording:
+    * `notes`: number of notes such that every note before it has been written (and is in its filelist)
+    * `filelists`: size (in bytes) of each filelist at that time
+    * `listed`: paths of later notes which had also been written (and listed) at that time
+    * `position`: position in the source (see `text_sources`) of the first row of the next note to write
+    * `recent`: note_ids of the notes just before it, which might have more parts (rows) after that position
+    * `loads`: text assigned to each directory (with `--balance`)
+When resuming, the source seeks to `position` (or, if the source cannot, the first `notes` notes are read and
+    skipped) and the rest re-written; paths in `listed` or added to a filelist after the recorded size are not
+    listed again.
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+PROGRESS_FILENAME = '.build_progress.json'
+
+
+def get_progress_path(outdir: Path) -> Path:
+    return Path(outdir) / PROGRESS_FILENAME
+
+
+def read_progress(outdir: Path) -> dict | None:
+    try:
+        with open(get_progress_path(outdir), encoding='utf8') as fh:
+            return json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _to_json(value):
+    """Convert note_ids/positions from other libraries (e.g., numpy integers)."""
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+def write_progress(outdir: Path, **data):
+    """Write progress durably: to a temporary file, synced to disk, and then renamed."""
+    path = get_progress_path(outdir)
+    tmp = path.with_name(f'{path.name}.tmp')
+    with open(tmp, 'w', encoding='utf8') as out:
+        json.dump({'updated': time.time(), **data}, out, default=_to_json)
+        out.flush()
+        os.fsync(out.fileno())
+    tmp.replace(path)
+
+
+def read_listed_since(filelist: Path, size) -> set[str]:
+    """
+    Paths added to `filelist` after its first `size` bytes. A partial last line (e.g., if the process was killed
+        while writing it) is removed from the file.
+    """
+    with open(filelist, 'rb+') as fh:
+        fh.seek(size)
+        data = fh.read()
+        if data and not data.endswith(b'\n'):
+            fh.truncate(size + data.rfind(b'\n') + 1)
+            data = data[:data.rfind(b'\n') + 1]
+    return {line.strip() for line in data.decode().splitlines() if line.strip()}
+
+
+class ProgressTracker:
+    """Track notes (numbered in order read) as they are written, possibly out of order."""
+
+    def __init__(self, start=0, recent=(), max_recent=10):
+        """
+        :param recent: note_ids of the notes just before `start` (when resuming)
+        :param max_recent: number of notes before the next note to write whose note_ids are kept
+        """
+        self.done = start  # all notes before this have been written
+        self.ahead = {}  # note number -> path of notes written before some earlier note
+        self.max_recent = max_recent
+        # note number -> (note_id, position) of notes not yet written and the last `max_recent` written
+        self.started = {start - len(recent) + i: (note_id, None) for i, note_id in enumerate(recent)}
+
+    def start(self, number, note_id, position=None):
+        self.started[number] = (note_id, position)
+
+    def complete(self, number, path):
+        if number != self.done:
+            self.ahead[number] = path
+            return
+        self.started.pop(self.done - self.max_recent, None)
+        self.done += 1
+        while self.done in self.ahead:
+            del self.ahead[self.done]
+            self.started.pop(self.done - self.max_recent, None)
+            self.done += 1
+
+    def get_position(self):
+        """Position of the next note to write (None if unknown)."""
+        return self.started.get(self.done, (None, None))[1]
+
+    def get_recent(self):
+        return [self.started[i][0] for i in range(self.done - self.max_recent, self.done) if i in self.started]
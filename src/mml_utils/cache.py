@@ -0,0 +1,175 @@
+"""
+Cache MetaMapLite output keyed by note text and the settings which affect the output.
+
+The same notes are often re-run (e.g., new cohort pulls, re-extracting after a crash, or the same note under a
+    different id). `MmlCache` stores each output file (json or mmi) in a SQLite database keyed by a hash of the
+    note's text and the run configuration (UMLS version/dataset, restrictions, properties), so that only notes
+    not seen before need to be sent to MetaMapLite. The cache is bounded in size: once it exceeds `max_size_mb`,
+    the least recently used results are removed.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from mml_utils.db_utils import Cursor
+from mml_utils.filelists import get_output_path
+
+CACHED_FORMATS = {'json', 'mmi'}
+
+
+def get_config_key(output_format='json', *, version=None, dataset='USAbase', restrict_to_sts=None,
+                   restrict_to_src=None, property_file=None, properties=None) -> str:
+    """Summarise the settings which change MetaMapLite's output (version/dataset should already be resolved)."""
+    return json.dumps({
+        'output_format': output_format,
+        'version': version,
+        'dataset': dataset,
+        'restrict_to_sts': sorted(restrict_to_sts or ()),
+        'restrict_to_src': sorted(restrict_to_src or ()),
+        'property_file': str(property_file) if property_file else None,
+        'properties': sorted([str(key), str(value)] for key, value in (properties or ())),
+    }, sort_keys=True)
+
+
+class MmlCache:
+    """
+    Bounded, content-addressed store of MetaMapLite output.
+
+    cache = MmlCache('mml_cache.db', max_size_mb=2048)
+    misses = cache.apply(files, config_key, 'json')  # writes output for cached files
+    ... run metamaplite on misses ...
+    cache.store(misses, config_key, 'json')
+    """
+
+    def __init__(self, path: Path, max_size_mb=1024):
+        self.path = Path(path)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.lock = threading.Lock()  # may be shared by workers of `MmlPool`
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with Cursor(self.conn) as cur:
+            cur.execute('create table if not exists results ('
+                        ' key text primary key, doc_id text, data blob, size integer, last_used real)')
+            cur.execute('create index if not exists results_last_used on results (last_used)')
+        self.size = self.conn.execute('select coalesce(sum(size), 0) from results').fetchone()[0]
+
+    @staticmethod
+    def get_key(text: bytes, config_key: str) -> str:
+        return hashlib.sha256(config_key.encode('utf8') + b'\0' + text).hexdigest()
+
+    def get(self, key):
+        """Return (doc_id, output) if cached, otherwise None."""
+        with self.lock, Cursor(self.conn) as cur:
+            row = cur.execute('select doc_id, data from results where key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            cur.execute('update results set last_used = ? where key = ?', (time.time(), key))
+        self.hits += 1
+        return row
+
+    def put(self, key, doc_id, data: bytes):
+        with self.lock, Cursor(self.conn) as cur:
+            prev = cur.execute('select size from results where key = ?', (key,)).fetchone()
+            cur.execute('insert or replace into results (key, doc_id, data, size, last_used) values (?, ?, ?, ?, ?)',
+                        (key, doc_id, data, len(data), time.time()))
+            self.size += len(data) - (prev[0] if prev else 0)
+            if self.size > self.max_size:
+                self._evict(cur)
+
+    def _evict(self, cur: Cursor):
+        """Remove least recently used results until the cache is within its size limit."""
+        removed = []
+        for key, size in cur.execute('select key, size from results order by last_used').fetchall():
+            if self.size <= self.max_size:
+                break
+            removed.append((key,))
+            self.size -= size
+        cur.cur.executemany('delete from results where key = ?', removed)
+        self.evictions += len(removed)
+
+    def apply(self, files, config_key, output_format='json') -> list[str]:
+        """
+        Write cached output for each file found in the cache.
+        :param files: input text files (output will be written alongside as MetaMapLite does)
+        :param config_key: from `get_config_key`
+        :return: files not found in the cache
+        """
+        if output_format not in CACHED_FORMATS:
+            logger.warning(f'Caching is not supported for output format: {output_format}.')
+            return list(files)
+        remaining = []
+        for file in files:
+            try:
+                text = Path(file).read_bytes()
+            except FileNotFoundError:  # leave it to MetaMapLite to report
+                with self.lock:
+                    self.misses += 1
+                remaining.append(file)
+                continue
+            row = self.get(self.get_key(text, config_key))
+            if row is None:
+                remaining.append(file)
+                continue
+            doc_id, data = row
+            if output_format == 'mmi':
+                data = _replace_mmi_doc_id(data, doc_id, Path(file).stem)
+            get_output_path(file, output_format).write_bytes(data)
+        return remaining
+
+    def store(self, files, config_key, output_format='json', since: float = None) -> int:
+        """
+        Add MetaMapLite output for files to the cache.
+        :param since: only store output written after this time (i.e., ignore output from previous runs)
+        :return: number of files stored
+        """
+        if output_format not in CACHED_FORMATS:
+            return 0
+        n_stored = 0
+        for file in files:
+            outfile = get_output_path(file, output_format)
+            try:
+                if since is not None and outfile.stat().st_mtime < since:
+                    continue
+                data = outfile.read_bytes()
+                text = Path(file).read_bytes()
+            except FileNotFoundError:
+                continue
+            self.put(self.get_key(text, config_key), Path(file).stem, data)
+            n_stored += 1
+        return n_stored
+
+    def log_stats(self):
+        total = self.hits + self.misses
+        logger.info(f'MetaMapLite cache: {self.hits:,} hits, {self.misses:,} misses'
+                    f' (hit rate: {100.0 * self.hits / total if total else 0:.1f}%);'
+                    f' {self.evictions:,} evicted; size: {self.size / 1024 / 1024:,.1f}/'
+                    f'{self.max_size / 1024 / 1024:,.0f} MB.')
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _replace_mmi_doc_id(data: bytes, old_doc_id, new_doc_id) -> bytes:
+    """Each line of mmi output begins with the document identifier (i.e., the file stem)."""
+    if old_doc_id == new_doc_id:
+        return data
+    old_prefix = f'{old_doc_id}|'.encode('utf8')
+    new_prefix = f'{new_doc_id}|'.encode('utf8')
+    return b''.join(
+        new_prefix + line[len(old_prefix):] if line.startswith(old_prefix) else line
+        for line in data.splitlines(keepends=True)
+    )
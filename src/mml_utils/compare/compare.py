@@ -2,6 +2,7 @@ import csv
 from pathlib import Path
 
 from mml_utils.compare.merger import DataComparator
+from mml_utils.note_store import NoteStore
 from mml_utils.excel.tables import send_csv_to_excel
 
 
@@ -51,11 +52,14 @@ def write_binary_comparison(miss1, miss2, outpath: Path, name1=None, name2=None,
 
 
 def extract_binary_text_differences(path1: Path, path2: Path, outpath: Path = None, name1=None, name2=None,
-                                    text_encoding='latin1'):
+                                    text_encoding='latin1', note_store: Path = None):
     if outpath is None:
         outpath = Path('.')
-    dc1 = DataComparator(path1, name=name1, text_encoding=text_encoding)
-    dc2 = DataComparator(path2, name=name2, text_encoding=text_encoding)
+    store = NoteStore(note_store) if note_store else None
+    dc1 = DataComparator(path1, name=name1, text_encoding=text_encoding, note_store=store)
+    dc2 = DataComparator(path2, name=name2, text_encoding=text_encoding, note_store=store)
     miss1, miss2 = binary_compare(dc1, dc2)
+    if store is not None:
+        store.close()
     outfile = write_binary_comparison(miss1, miss2, outpath, dc1.name, dc2.name, text_encoding=text_encoding)
     send_csv_to_excel(outfile, close=True)
@@ -2,6 +2,7 @@ import csv
 from pathlib import Path
 import functools
 
+from mml_utils.note_store import NoteStore, get_note_id
 from mml_utils.review.extract_data import find_target_text
 
 
@@ -9,10 +10,14 @@ from mml_utils.review.extract_data import find_target_text
 class DataComparator:
     """Aids in comparison of output of different feature extraction methods."""
 
-    def __init__(self, path: Path, name=None, text_encoding='latin1'):
+    def __init__(self, path: Path, name=None, text_encoding='latin1', note_store: NoteStore = None):
+        """
+        :param note_store: read note text from this note store (see `note_store`) rather than text files
+        """
         notes_path = sorted(path.glob('notes_*.csv'))[-1]
         mml_path = sorted(path.glob('mml_*.csv'))[-1]
         self.text_encoding = text_encoding
+        self.note_store = note_store
         self.name = name or path.stem
         self.data = self._read_csv(mml_path)
         self.file_dict = self._read_to_filedict(notes_path)
@@ -71,8 +76,11 @@ class DataComparator:
         return sorted(data)
 
     def get_context(self, encoding='latin1', width=20):
-        with open(self.file_dict[self.docid], encoding=encoding or self.text_encoding) as fh:
-            text = fh.read()
+        if self.note_store is not None:
+            text = self.note_store.get_text(get_note_id(self.docid)) or ''
+        else:
+            with open(self.file_dict[self.docid], encoding=encoding or self.text_encoding) as fh:
+                text = fh.read()
         text = text.replace('\n', '\r\n')
         try:
             start, end = find_target_text(text, self.matched, self.start, self.end)
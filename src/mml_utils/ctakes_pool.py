@@ -0,0 +1,341 @@
+"""
+Run multiple cTAKES pipelines in parallel over shards of an input directory.
+
+cTAKES reads whole directories, so the text files are split (balanced by size) into shard directories containing
+    links to the original files (`{shard_dir}/shard0000`). Each worker runs its own cTAKES JVM on a shard, writing
+    `.xmi` files to `{shard_dir}/shard0000.xmi`. When a pipeline exits, its output is moved into `outdir` and the
+    links for completed files are removed; if cTAKES failed, the shard (now containing only the remaining files) is
+    retried. Re-running with the same `shard_dir` resumes with the files still in the shards.
+
+cTAKES places a lock on its (HSQL) dictionary, so parallel pipelines generally need separate cTAKES installs: pass
+    one `ctakes_home` per worker (workers are assigned installs round-robin).
+"""
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from mml_utils.layout import iter_files
+from mml_utils.manifest import RunManifest
+from mml_utils.os_utils import bat_or_sh, get_cp_sep, is_windows
+from mml_utils.planner import JVM_OVERHEAD, get_available_memory, get_cpu_count, parse_heap_size
+from mml_utils.profiling import ProcessSampler, build_summary, get_report_path, write_run_report
+from mml_utils.sharding import shard_files
+
+DEFAULT_HEAP = '3g'  # `-Xmx` in cTAKES' `runClinicalPipeline` script
+PIPER_RUNNER = 'org.apache.ctakes.core.pipeline.PiperFileRunner'
+DEFAULT_PIPER = 'org/apache/ctakes/clinical/pipeline/DefaultFastPipeline.piper'
+
+
+def get_xmi_path(file, xmi_dir: Path) -> Path:
+    """cTAKES writes `{name}.xmi` for each input file."""
+    return Path(xmi_dir) / f'{Path(file).name}.xmi'
+
+
+def get_ctakes_shard_dir(directory: Path, shard_dir: Path = None) -> Path:
+    return shard_dir or directory.parent / f'{directory.name}_ctakes_shards'
+
+
+def build_ctakes_command(directory: Path, xmi_dir: Path, ctakes_home: Path, *, umls_key=None, dictionary=None,
+                         max_heap=None, piper=DEFAULT_PIPER) -> list[str]:
+    """
+    Build command to run cTAKES on `directory`.
+    :param max_heap: if specified, run java directly (with the classpath used by `runClinicalPipeline`) with this
+        heap size; otherwise, run `bin/runClinicalPipeline` (and use the heap size set in that script)
+    :param piper: piper file to run (only used with `max_heap`)
+    """
+    ctakes_home = Path(ctakes_home)
+    if max_heap is None:
+        script = ctakes_home / 'bin' / f'runClinicalPipeline.{bat_or_sh()}'
+        cmd = [str(script)] if is_windows() or os.access(script, os.X_OK) else ['sh', str(script)]
+    else:
+        sep = get_cp_sep()
+        cmd = ['java', '-cp', sep.join(str(ctakes_home / p) for p in ('desc', 'resources', os.path.join('lib', '*'))),
+               '-Xms512M', f'-Xmx{max_heap}']
+        log4j = ctakes_home / 'config' / 'log4j.xml'
+        if log4j.exists():
+            cmd.append(f'-Dlog4j.configuration=file:{log4j}')
+        cmd += [PIPER_RUNNER, '-p', piper]
+    cmd += ['-i', str(directory), '--xmiOut', str(xmi_dir)]
+    if umls_key:
+        cmd += ['--key', umls_key]
+    if dictionary:
+        cmd += ['--lookupXml', str(dictionary)]
+    return cmd
+
+
+def plan_ctakes_workers(max_heap=None, reserve_mb=2048) -> int:
+    """Number of cTAKES pipelines which fit in available memory and CPUs."""
+    cpus = get_cpu_count()
+    available = get_available_memory()
+    if available is None:
+        return 1
+    per_worker = parse_heap_size(max_heap or DEFAULT_HEAP) * JVM_OVERHEAD
+    n_workers = max(min(int((available - reserve_mb * 1024 ** 2) // per_worker), cpus), 1)
+    logger.info(f'Planned {n_workers} cTAKES pipeline(s) with heap {max_heap or DEFAULT_HEAP}'
+                f' (available memory: {available / 1024 ** 3:.1f} GB; CPUs: {cpus}).')
+    return n_workers
+
+
+def _link(src: Path, dst: Path):
+    """Link (or, if links are not supported, copy) `src` to `dst`."""
+    try:
+        os.symlink(src.absolute(), dst)
+    except OSError:  # e.g., Windows without developer mode
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+
+def iter_shard_files(shard: Path):
+    with os.scandir(shard) as it:
+        for entry in it:
+            yield Path(entry.path)
+
+
+def get_original_path(link: Path) -> Path:
+    """File in the input directory which a shard's link points to (copies cannot be traced back)."""
+    return Path(os.readlink(link)) if link.is_symlink() else link
+
+
+def split_directory_to_shards(directory: Path, outdir: Path, *, shard_dir: Path = None, n_shards=None,
+                              shard_size=None) -> list[Path]:
+    """
+    Split files in `directory` without output in `outdir` into shard directories of links.
+        If shards from a previous run already exist, those which still contain files are returned instead.
+    :param n_shards: number of shards
+    :param shard_size: maximum number of files in each shard (overrides `n_shards`)
+    :return: list of shard directories
+    """
+    shard_dir = get_ctakes_shard_dir(directory, shard_dir)
+    if shard_dir.exists() and next(shard_dir.glob('shard*'), None):
+        shards = sorted(p for p in shard_dir.glob('shard*') if p.is_dir() and p.suffix != '.xmi'
+                        and next(iter_shard_files(p), None))
+        logger.info(f'Resuming with {len(shards)} unfinished cTAKES shards in {shard_dir}.')
+        return shards
+    files = [
+        path for path in iter_files(directory) if not get_xmi_path(path, outdir).exists()
+    ]
+    if shard_size:
+        n_shards = -(-len(files) // shard_size)
+    n_shards = min(n_shards or 1, len(files))
+    if n_shards == 0:
+        return []
+    shards = []
+    for i, shard_files_ in enumerate(shard_files(files, n_shards)):
+        shard = shard_dir / f'shard{i:04d}'
+        shard.mkdir(parents=True)
+        for file in shard_files_:
+            _link(file, shard / file.name)
+        shards.append(shard)
+    logger.info(f'Split {len(files):,} files from {directory} into {len(shards)} cTAKES shards in {shard_dir}.')
+    return shards
+
+
+class CtakesPool:
+    """Run up to `n_workers` cTAKES pipelines, each taking the next shard directory from a shared queue."""
+
+    def __init__(self, shards, ctakes_homes, outdir: Path, *, n_workers=None, max_heap=None, umls_key=None,
+                 dictionary=None, retries=2, progress_interval=60, manifest: RunManifest = None, profile=False):
+        self.queue = queue.Queue()
+        self.total = 0
+        for shard in shards:
+            self.queue.put(Path(shard))
+            self.total += sum(1 for _ in iter_shard_files(shard))
+        self.n_shards = self.queue.qsize()
+        self.ctakes_homes = [Path(p) for p in ([ctakes_homes] if isinstance(ctakes_homes, (str, Path))
+                                                else ctakes_homes)]
+        self.outdir = Path(outdir)
+        self.n_workers = n_workers
+        self.max_heap = max_heap
+        self.umls_key = umls_key
+        self.dictionary = dictionary
+        self.retries = retries  # times to re-run a shard after cTAKES fails
+        self.progress_interval = progress_interval
+        self.manifest = manifest
+        self.profile = profile
+        self.attempts = {}  # shard -> number of times run
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.active = {}  # worker_id -> (process, shard)
+        self.finished = 0  # number of files merged into outdir
+        self.completed_shards = []
+        self.failed_shards = []
+        self.start_time = None
+
+    def run(self):
+        """Run all shards; returns lists of completed and failed shards."""
+        if self.n_shards == 0:
+            logger.warning(f'No shards to process.')
+            return self.completed_shards, self.failed_shards
+        self.outdir.mkdir(parents=True, exist_ok=True)
+        n_workers = min(self.n_workers or plan_ctakes_workers(self.max_heap), self.n_shards)
+        if n_workers > len(self.ctakes_homes):
+            logger.warning(f'Running {n_workers} cTAKES pipelines with {len(self.ctakes_homes)} cTAKES install(s):'
+                           f' if cTAKES fails to open its dictionary, use a separate install for each worker.')
+        logger.info(f'Running {self.n_shards} cTAKES shards ({self.total:,} files) with {n_workers} workers'
+                    f' (max heap per worker: {self.max_heap or "set in runClinicalPipeline"}).')
+        self.start_time = time.time()
+        workers = [threading.Thread(target=self._worker, args=(i,), daemon=True) for i in range(n_workers)]
+        is_main_thread = threading.current_thread() is threading.main_thread()
+        if is_main_thread:  # leave shards resumable if killed
+            prev_handler = signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        try:
+            for worker in workers:
+                worker.start()
+            next_report = time.time() + self.progress_interval
+            while any(worker.is_alive() for worker in workers):
+                time.sleep(min(1, self.progress_interval))
+                if time.time() >= next_report:
+                    self.log_progress()
+                    next_report += self.progress_interval
+        except KeyboardInterrupt:
+            self.stop()
+            for worker in workers:
+                worker.join()
+        finally:
+            if is_main_thread:
+                signal.signal(signal.SIGTERM, prev_handler)
+        self.log_progress()
+        if self.stopping.is_set():
+            logger.warning(f'Stopped early: re-run to resume the {self.n_shards - len(self.completed_shards)}'
+                           f' remaining shards.')
+        if self.failed_shards:
+            logger.warning(f'cTAKES failed on {len(self.failed_shards)} shards (after {self.retries} retries): '
+                           f'{", ".join(str(s) for s in self.failed_shards)}')
+        return self.completed_shards, self.failed_shards
+
+    def stop(self):
+        """Stop taking new shards and terminate running cTAKES pipelines."""
+        if self.stopping.is_set():
+            return
+        logger.warning(f'Stopping cTAKES workers...')
+        self.stopping.set()
+        with self.lock:
+            for proc, _ in self.active.values():
+                proc.terminate()
+
+    def log_progress(self):
+        with self.lock:
+            running = sum(
+                sum(1 for _ in iter_shard_files(shard.with_suffix('.xmi'))) if shard.with_suffix('.xmi').exists()
+                else 0 for _, shard in self.active.values()
+            )
+            n_running = len(self.active)
+            done = self.finished + running
+        elapsed = time.time() - self.start_time
+        rate = done / elapsed * 3600 if elapsed else 0
+        eta = f'{(self.total - done) / rate:.1f} hours' if rate else 'unknown'
+        logger.info(f'Progress: {done:,}/{self.total:,} files ({100.0 * done / max(self.total, 1):.02f}%);'
+                    f' {rate:,.0f} files/hour; ETA: {eta};'
+                    f' shards: {len(self.completed_shards)}/{self.n_shards} complete, {n_running} running.')
+
+    def _worker(self, worker_id):
+        ctakes_home = self.ctakes_homes[worker_id % len(self.ctakes_homes)]
+        while not self.stopping.is_set():
+            try:
+                shard = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            self._run_shard(worker_id, shard, ctakes_home)
+
+    def _merge(self, shard: Path) -> list[Path]:
+        """Move xmi files from shard's output directory to `outdir` and remove their links; returns original files."""
+        xmi_dir = shard.with_suffix('.xmi')
+        if not xmi_dir.exists():
+            return []
+        done = []
+        for xmi in iter_shard_files(xmi_dir):
+            link = shard / xmi.name.removesuffix('.xmi')
+            done.append(get_original_path(link))
+            os.replace(xmi, self.outdir / xmi.name)
+            link.unlink(missing_ok=True)
+        return done
+
+    def _run_shard(self, worker_id, shard: Path, ctakes_home: Path):
+        xmi_dir = shard.with_suffix('.xmi')
+        xmi_dir.mkdir(exist_ok=True)
+        with self.lock:
+            self.finished += len(self._merge(shard))  # output from an interrupted run
+        files = list(iter_shard_files(shard))
+        cmd = build_ctakes_command(shard, xmi_dir, ctakes_home, umls_key=self.umls_key, dictionary=self.dictionary,
+                                   max_heap=self.max_heap)
+        if self.manifest is not None:
+            self.manifest.set_shard([get_original_path(f) for f in files], shard, status='running')
+        with self.lock:
+            if self.stopping.is_set():
+                return  # shard is left untouched
+            self.attempts[shard] = self.attempts.get(shard, 0) + 1
+            logger.info(f'Worker {worker_id}: starting {shard.name} ({len(files):,} files;'
+                        f' attempt {self.attempts[shard]}).')
+            logger.debug('Running command >> ' + ' '.join(cmd))
+            proc = subprocess.Popen(cmd, universal_newlines=True, cwd=ctakes_home, shell=is_windows())
+            self.active[worker_id] = (proc, shard)
+        sampler = ProcessSampler(proc.pid).start() if self.profile else None
+        proc.wait()
+        returncode = proc.returncode
+        with self.lock:
+            del self.active[worker_id]
+            done = self._merge(shard)
+            self.finished += len(done)
+        if sampler is not None:
+            samples = sampler.stop()
+            summary = build_summary(samples, started=sampler.start_time, returncode=returncode, files=done,
+                                    label=f'ctakes worker {worker_id}', command=' '.join(cmd))
+            write_run_report(get_report_path(shard), summary, samples)
+        if self.manifest is not None:
+            self.manifest.mark(done, 'done')
+        remaining = list(iter_shard_files(shard))
+        if returncode == 0 or not remaining:
+            if remaining:
+                logger.warning(f'Worker {worker_id}: cTAKES wrote no output for {len(remaining):,} files in'
+                               f' {shard.name}: {", ".join(p.name for p in remaining[:10])}')
+                if self.manifest is not None:
+                    self.manifest.mark([get_original_path(f) for f in remaining], 'failed', error='no output')
+                for link in remaining:
+                    link.unlink()
+            shard.rmdir()
+            xmi_dir.rmdir()
+            self.completed_shards.append(shard)
+            logger.info(f'Worker {worker_id}: completed {shard.name}.')
+        elif self.stopping.is_set():
+            logger.info(f'Worker {worker_id}: stopped {shard.name}; {len(remaining):,} files left to resume.')
+        elif self.attempts[shard] <= self.retries:
+            logger.warning(f'Worker {worker_id}: cTAKES returned with status code {returncode} on {shard.name};'
+                           f' retrying the remaining {len(remaining):,} files.')
+            self.queue.put(shard)
+        else:
+            self.failed_shards.append(shard)
+            if self.manifest is not None:
+                self.manifest.mark([get_original_path(f) for f in remaining], 'failed',
+                                   error=f'status code {returncode}')
+            logger.warning(f'Worker {worker_id}: cTAKES returned with status code {returncode} on {shard.name};'
+                           f' {len(remaining):,} files left to re-run.')
+
+
+def run_ctakes_pool(directory: Path, ctakes_homes, outdir: Path, *, n_workers=None, max_heap=None,
+                    shard_dir: Path = None, shard_size=None, **kwargs):
+    """
+    Run cTAKES in parallel over the files in `directory`, writing all xmi files to `outdir`.
+    :param directory: directory containing text files to run cTAKES on
+    :param ctakes_homes: cTAKES install (or list of installs, one per worker)
+    :param outdir: directory to output xmi files
+    :param n_workers: number of cTAKES pipelines to run at once (None: as many as memory and CPUs allow)
+    :param max_heap: heap size for each pipeline (None: use `runClinicalPipeline` script)
+    :param shard_dir: directory for shards (defaults to `{directory}_ctakes_shards` next to `directory`)
+    :param shard_size: maximum number of files in each shard (default: one shard per worker)
+    :param kwargs: passed to `CtakesPool` (e.g., umls_key, dictionary, retries, manifest, profile)
+    :return: lists of completed and failed shards
+    """
+    directory = Path(directory)
+    n_workers = n_workers or plan_ctakes_workers(max_heap)
+    shards = split_directory_to_shards(directory, outdir, shard_dir=shard_dir, n_shards=n_workers,
+                                       shard_size=shard_size)
+    return CtakesPool(shards, ctakes_homes, outdir, n_workers=n_workers, max_heap=max_heap, **kwargs).run()
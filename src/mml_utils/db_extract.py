@@ -0,0 +1,96 @@
+"""
+Read notes from a database in partitions which can be queried concurrently (`mml-sql-to-txt --partition-col`).
+
+A single query iterated on one connection is too slow for tens of millions of notes. Instead, the query is split on
+    a numeric partition column (e.g., note_id) into `n_partitions` sub-queries, either contiguous ranges
+    (`range`: `lo <= col < hi`) or hash buckets (`hash`: `col % n = k`). Each sub-query is run on its own pooled
+    connection and its rows streamed in `fetchmany`-sized batches.
+
+The condition is added in place of `{partition}` in the query (e.g., `select note_id, text from notes where
+    {partition} order by note_id, line`) or, without the placeholder, by wrapping the query in a subquery (which
+    will not preserve any `order by` on some databases, so use the placeholder for notes with multiple lines).
+
+Each partition is written to its own directory, with a checkpoint once complete (see `partitions`).
+"""
+
+try:
+    import sqlalchemy as sa
+except ImportError:
+    sa = None
+
+PLACEHOLDER = '{partition}'
+METHODS = ('range', 'hash')
+
+
+def create_engine(connection_string, n_workers=1):
+    """Engine whose connection pool can hold a connection for each worker."""
+    if sa is None:
+        raise ImportError(f'Sqlalchemy is required: Install sqlalchemy with `pip install sqlalchemy`.')
+    if connection_string.startswith('sqlite'):  # pool size not configurable for all sqlite pools
+        return sa.create_engine(connection_string)
+    return sa.create_engine(connection_string, pool_size=n_workers, max_overflow=0)
+
+
+def get_partition_query(query: str, condition: str) -> str:
+    """Restrict `query` to rows matching `condition` (replacing `{partition}` if present)."""
+    if PLACEHOLDER in query:
+        return query.replace(PLACEHOLDER, condition)
+    return f'select * from ({query}) mml_partition where {condition}'
+
+
+def get_key_range(engine, query: str, column: str) -> tuple[int, int]:
+    """Minimum and maximum values of `column` in the results of `query`."""
+    with engine.connect() as conn:
+        lo, hi = conn.execute(sa.text(
+            f'select min({column}), max({column}) from ({get_partition_query(query, "1 = 1")}) mml_range'
+        )).one()
+    return lo, hi
+
+
+def get_range_conditions(column: str, lo: int, hi: int, n_partitions: int) -> list[str]:
+    """Split `lo` to `hi` (inclusive) into `n_partitions` contiguous ranges (fewer if there are fewer values)."""
+    lo, hi = int(lo), int(hi)
+    n_partitions = max(1, min(n_partitions, hi - lo + 1))
+    step = (hi - lo + 1) / n_partitions
+    bounds = [lo + round(step * i) for i in range(n_partitions)] + [hi + 1]
+    return [f'{column} >= {start} and {column} < {end}' for start, end in zip(bounds, bounds[1:])]
+
+
+def get_hash_conditions(column: str, n_partitions: int) -> list[str]:
+    return [f'{column} % {n_partitions} = {k}' for k in range(n_partitions)]
+
+
+def get_partition_queries(engine, query: str, column: str, n_partitions: int, *, method='range',
+                          key_range: tuple = None) -> list[str]:
+    """
+    Sub-queries which together return the same rows as `query`.
+    :param method: 'range' (contiguous ranges of `column`) or 'hash' (`column` modulo `n_partitions`)
+    :param key_range: (min, max) of `column` for 'range' (default: queried from the database)
+    """
+    if method == 'hash':
+        conditions = get_hash_conditions(column, n_partitions)
+    elif method == 'range':
+        lo, hi = key_range or get_key_range(engine, query, column)
+        if lo is None:  # no rows
+            return []
+        conditions = get_range_conditions(column, lo, hi, n_partitions)
+    else:
+        raise ValueError(f'Unrecognized partition method: {method}; expected one of {METHODS}.')
+    return [get_partition_query(query, condition) for condition in conditions]
+
+
+def iter_rows(engine, query: str, batch_size=10_000):
+    """Yield (note_id, text) from `query`, streaming results in batches of `batch_size` rows."""
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(sa.text(query))
+        while rows := result.fetchmany(batch_size):
+            for row in rows:
+                yield row[0], row[1]
+
+
+def iter_mappings(engine, query: str, params: dict = None, batch_size=10_000):
+    """Yield each row of `query` as a mapping of column name to value, streaming results in batches."""
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(sa.text(query), params or {})
+        while rows := result.mappings().fetchmany(batch_size):
+            yield from rows
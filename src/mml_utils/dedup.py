@@ -0,0 +1,136 @@
+"""
+Only run MetaMapLite on paragraphs which have not already been annotated in another note.
+
+Clinical notes contain a lot of copied-forward text (templates, medication lists, boilerplate). Each note is split
+    into segments (paragraphs separated by blank lines), and each distinct segment is written once to a segment
+    store, named by the hash of its text. After MetaMapLite has been run on the new segments, each note's json
+    output is rebuilt from its segments' output with offsets shifted back into the note.
+
+    filelist, manifest = dedup_notes(note_files, segment_dir)
+    run_mml(filelist, mml_home, output_format='json')
+    rebuild_outputs(manifest)
+"""
+import hashlib
+import itertools
+import json
+import re
+from datetime import datetime
+from pathlib import Path
+
+from loguru import logger
+
+from mml_utils.filelists import get_output_path
+from mml_utils.parse.json import shift_json_offsets
+
+SEGMENT_BREAK = re.compile(r'\n[ \t\r\f\v]*\n\s*')
+_run_counter = itertools.count()  # distinguishes runs started within the same microsecond
+
+
+def split_segments(text) -> list[tuple[int, str]]:
+    """Split text into paragraphs (separated by blank lines), returning (start offset, paragraph text)."""
+    segments = []
+    start = 0
+    for m in SEGMENT_BREAK.finditer(text):
+        segments += _strip_segment(text, start, m.start())
+        start = m.end()
+    segments += _strip_segment(text, start, len(text))
+    return segments
+
+
+def _strip_segment(text, start, end):
+    segment = text[start:end]
+    stripped = segment.strip()
+    if not stripped:
+        return []
+    return [(start + len(segment) - len(segment.lstrip()), stripped)]
+
+
+def get_segment_digest(segment: str) -> str:
+    return hashlib.sha256(segment.encode('utf8')).hexdigest()
+
+
+def get_segment_path(segment_dir: Path, digest: str) -> Path:
+    return segment_dir / digest[:2] / f'{digest}.txt'
+
+
+def dedup_notes(files, segment_dir: Path, *, encoding='utf8', output_format='json'):
+    """
+    Write each not-yet-seen segment of the notes to `segment_dir`.
+    :param files: note text files
+    :param segment_dir: segment store (re-use across runs to skip segments annotated in previous runs)
+    :param output_format: segments with output in this format have already been run
+    :return: (filelist of segments to run through MetaMapLite, manifest to pass to `rebuild_outputs`)
+    """
+    segment_dir = Path(segment_dir)
+    segment_dir.mkdir(parents=True, exist_ok=True)
+    timestamp = f'{datetime.now().strftime("%Y%m%d_%H%M%S_%f")}_{next(_run_counter)}'
+    filelist_path = segment_dir / f'filelist_{timestamp}.txt'
+    manifest_path = segment_dir / f'manifest_{timestamp}.jsonl'
+    queued = set()
+    total_chars = 0
+    run_chars = 0
+    n_segments = 0
+    with open(filelist_path, 'x', encoding='utf8') as filelist, \
+            open(manifest_path, 'x', encoding='utf8') as manifest:
+        for i, file in enumerate(files):
+            text = Path(file).read_text(encoding=encoding)
+            segments = []
+            for start, segment in split_segments(text):
+                digest = get_segment_digest(segment)
+                segments.append([start, digest])
+                n_segments += 1
+                total_chars += len(segment)
+                if digest in queued:
+                    continue
+                segment_path = get_segment_path(segment_dir, digest)
+                if get_output_path(segment_path, output_format).exists():
+                    continue
+                segment_path.parent.mkdir(exist_ok=True)
+                segment_path.write_text(f'{segment}\n', encoding='utf8')
+                filelist.write(f'{segment_path.absolute()}\n')
+                queued.add(digest)
+                run_chars += len(segment)
+            manifest.write(json.dumps({'file': str(file), 'segments': segments}) + '\n')
+            if (i + 1) % 100_000 == 0:
+                logger.info(f'Segmented {i + 1:,} notes.')
+    logger.info(f'Found {n_segments:,} segments, of which {len(queued):,} need to be run by MetaMapLite.')
+    logger.info(f'MetaMapLite will process {run_chars:,} of {total_chars:,} characters'
+                f' ({100.0 - 100.0 * run_chars / total_chars if total_chars else 0:.1f}% saved by deduplication).')
+    logger.info(f'Run MetaMapLite on {filelist_path}, then rebuild note output from {manifest_path}.')
+    return filelist_path, manifest_path
+
+
+def rebuild_outputs(manifest_path: Path, *, segment_dir: Path = None, output_format='json'):
+    """
+    Write json output for each note in manifest by combining the output of its segments.
+    :param segment_dir: segment store (defaults to directory containing manifest)
+    :return: number of notes rebuilt and list of notes with missing segment output
+    """
+    if output_format != 'json':
+        raise ValueError(f'Only json output can be rebuilt from segments, not: {output_format}.')
+    segment_dir = Path(segment_dir or Path(manifest_path).parent)
+    n_rebuilt = 0
+    incomplete = []
+    with open(manifest_path, encoding='utf8') as fh:
+        for line in fh:
+            record = json.loads(line)
+            results = []
+            for start, digest in record['segments']:
+                try:
+                    with open(get_output_path(get_segment_path(segment_dir, digest), output_format),
+                              encoding='utf8') as seg_fh:
+                        results += shift_json_offsets(json.load(seg_fh), start)
+                except FileNotFoundError:
+                    incomplete.append(record['file'])
+                    break
+            else:
+                for i, el in enumerate(results):
+                    el['id'] = f'en{i}'
+                with open(get_output_path(record['file'], output_format), 'w', encoding='utf8') as out:
+                    json.dump(results, out)
+                n_rebuilt += 1
+    logger.info(f'Rebuilt output for {n_rebuilt:,} notes.')
+    if incomplete:
+        logger.warning(f'Missing segment output for {len(incomplete):,} notes (e.g., {incomplete[0]}):'
+                       f' re-run MetaMapLite on the segment filelist and rebuild again.')
+    return n_rebuilt, incomplete
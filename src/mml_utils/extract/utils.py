@@ -5,6 +5,7 @@ from pathlib import Path
 
 from loguru import logger
 
+from mml_utils.layout import get_hashed_path
 from mml_utils.parse.target_cuis import TargetCuis
 
 try:
@@ -49,17 +50,25 @@ def add_fieldnames(fieldnames):
         NLP_FIELDNAMES.append(fieldname)
 
 
+def _find_in_directory(directory, filename):
+    """Look for filename in directory, in either the flat or hashed layout (see `layout`)."""
+    if (path := Path(directory) / filename).exists():
+        return path
+    if (path := get_hashed_path(directory, filename)).exists():
+        return path
+
+
 def find_path(exp_filename, curr_directory, target_directories=None, dir_index=None):
     """Look for the expected filename + output format at a particular path."""
     if target_directories:
         # prefer output directory corresponding to ordered list of note directories
         if dir_index < len(target_directories) and (
-                path := Path(target_directories[dir_index] / exp_filename)).exists():
+                path := _find_in_directory(target_directories[dir_index], exp_filename)):
             return path
         for i, target_dir in enumerate(target_directories):
             if i == dir_index:  # already looked here
                 continue
-            if (path := Path(target_dir / exp_filename)).exists():
+            if path := _find_in_directory(target_dir, exp_filename):
                 return path
     elif (path := Path(curr_directory / exp_filename)).exists():
         return path
@@ -132,7 +141,10 @@ def build_pivot_table(nlpfile, outfile, target_cuis: TargetCuis = None):
 
 def add_notefile_to_record(record: dict, file: Path, encoding='utf8'):
     with open(file, encoding=encoding) as fh:
-        text = fh.read()
-        record['num_chars'] = len(text)
-        record['num_words'] = len(text.split())
-        record['num_letters'] = len(re.sub(r'[^A-Za-z0-9]', '', text, flags=re.I))
+        add_note_text_to_record(record, fh.read())
+
+
+def add_note_text_to_record(record: dict, text: str):
+    record['num_chars'] = len(text)
+    record['num_words'] = len(text.split())
+    record['num_letters'] = len(re.sub(r'[^A-Za-z0-9]', '', text, flags=re.I))
@@ -1,6 +1,13 @@
 from datetime import datetime
 from pathlib import Path
 
+from mml_utils.layout import iter_files
+
+
+def get_output_path(file, output_format='json') -> Path:
+    """Path of the output file MetaMapLite writes alongside the input file."""
+    return Path(f'{str(file).strip().removesuffix(".txt")}.{output_format}')
+
 
 def build_filelist(path: Path, outpath: Path = None, extensions: set = None) -> Path:
     if outpath is None:
@@ -10,9 +17,7 @@ def build_filelist(path: Path, outpath: Path = None, extensions: set = None) ->
         if path.is_file():
             out.write(f'{path.absolute()}\n')
         else:
-            for file in path.iterdir():
-                if file.is_dir():
-                    continue
+            for file in iter_files(path):
                 if extensions and file.suffix not in extensions:
                     continue
                 if not extensions and file.suffix and file.suffix != '.txt':
@@ -20,3 +25,69 @@ def build_filelist(path: Path, outpath: Path = None, extensions: set = None) ->
                 out.write(f'{file.absolute()}\n')
 
     return filelist_path
+
+
+def read_filelist(filelist: Path) -> list[str]:
+    """Read paths from filelist, skipping blank lines."""
+    with open(filelist, encoding='utf8') as fh:
+        return [line.strip() for line in fh if line.strip()]
+
+
+class FilelistProgress:
+    """Track how far MetaMapLite has gotten through a filelist.
+
+    MetaMapLite processes files in filelist order, so each update only checks for outputs
+        after the last one found rather than re-checking the entire filelist.
+    """
+
+    def __init__(self, filelist: Path, output_format='json', since: float = None, lookahead=10):
+        self.filelist = Path(filelist)
+        self.files = read_filelist(self.filelist)
+        self.output_format = output_format
+        self.since = since  # ignore output files written before this time (e.g., by a previous run)
+        self.lookahead = lookahead  # files without output (e.g., empty) shouldn't stall progress
+        self.completed = 0
+
+    @property
+    def total(self):
+        return len(self.files)
+
+    def is_done(self, file) -> bool:
+        try:
+            mtime = get_output_path(file, self.output_format).stat().st_mtime
+        except FileNotFoundError:
+            return False
+        return self.since is None or mtime >= self.since
+
+    def update(self) -> int:
+        while self.completed < self.total:
+            if self.is_done(self.files[self.completed]):
+                self.completed += 1
+            elif any(self.is_done(file) for file in
+                     self.files[self.completed + 1: self.completed + 1 + self.lookahead]):
+                self.completed += 1  # no output for this file, but metamaplite has moved on
+            else:
+                break
+        return self.completed
+
+    def processed(self, exclude_last=True) -> list[str]:
+        """Files which have been processed.
+        :param exclude_last: exclude the last completed file in case its output is incomplete
+        """
+        end = self.completed - 1 if exclude_last and self.completed > 0 else self.completed
+        return self.files[:end]
+
+    def remaining(self, keep_last=True) -> list[str]:
+        """Files which have not yet been processed.
+        :param keep_last: include the last completed file in case its output is incomplete
+        """
+        start = self.completed - 1 if keep_last and self.completed > 0 else self.completed
+        return self.files[start:]
+
+    def write_remaining(self, path: Path = None, keep_last=True) -> int:
+        """Re-write the filelist (or write to `path`) with only the remaining files."""
+        remaining = self.remaining(keep_last=keep_last)
+        with open(path or self.filelist, 'w', encoding='utf8') as out:
+            for file in remaining:
+                out.write(f'{file}\n')
+        return len(remaining)
@@ -0,0 +1,137 @@
+/*
+ * Keep a MetaMapLite instance loaded and annotate documents sent over stdin.
+ *
+ * Run with the Java 11+ source launcher (no compilation step required):
+ *     java -Xmx12g -D... -cp <metamaplite classpath> MetaMapLiteSession.java
+ *
+ * Protocol (all UTF-8):
+ *  - once MetaMapLite has loaded, the line `READY` is written to stdout
+ *  - each document is sent as a header line `<doc_id>\t<number of bytes>` followed by the text
+ *  - for each document, a single line of JSON (same fields as `--outputformat=json`, including `docid` and
+ *    `fieldid`) is written to stdout
+ *  - an empty line (or end of input) ends the session
+ */
+import java.io.BufferedInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+import java.util.Collection;
+import java.util.Collections;
+import java.util.List;
+import java.util.Properties;
+
+import bioc.BioCDocument;
+import gov.nih.nlm.nls.metamap.document.FreeText;
+import gov.nih.nlm.nls.metamap.lite.types.ConceptInfo;
+import gov.nih.nlm.nls.metamap.lite.types.Entity;
+import gov.nih.nlm.nls.metamap.lite.types.Ev;
+import gov.nih.nlm.nls.ner.MetaMapLite;
+
+public class MetaMapLiteSession {
+
+    public static void main(String[] args) throws Exception {
+        PrintStream out = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        System.setOut(System.err);  // keep anything else MetaMapLite prints out of the protocol
+        Properties properties = MetaMapLite.getDefaultConfiguration();
+        properties.putAll(System.getProperties());
+        MetaMapLite metaMapLite = new MetaMapLite(properties);
+        InputStream in = new BufferedInputStream(System.in);
+        out.println("READY");
+        String header;
+        while ((header = readLine(in)) != null && !header.isEmpty()) {
+            int length = Integer.parseInt(header.substring(header.lastIndexOf('\t') + 1));
+            String text = new String(in.readNBytes(length), StandardCharsets.UTF_8);
+            BioCDocument document = FreeText.instantiateBioCDocument(text);
+            List<Entity> entities = metaMapLite.processDocumentList(Collections.singletonList(document));
+            out.println(toJson(entities));
+        }
+    }
+
+    private static String readLine(InputStream in) throws IOException {
+        ByteArrayOutputStream buffer = new ByteArrayOutputStream();
+        int b;
+        while ((b = in.read()) != -1 && b != '\n') {
+            buffer.write(b);
+        }
+        if (b == -1 && buffer.size() == 0) {
+            return null;
+        }
+        return buffer.toString(StandardCharsets.UTF_8.name()).trim();
+    }
+
+    private static String toJson(List<Entity> entities) {
+        StringBuilder sb = new StringBuilder("[");
+        int entityId = 0;
+        for (Entity entity : entities) {
+            if (entityId > 0) {
+                sb.append(',');
+            }
+            sb.append("{\"matchedtext\":").append(quote(entity.getMatchedText()));
+            sb.append(",\"evlist\":[");
+            int evId = 0;
+            for (Ev ev : entity.getEvSet()) {
+                if (evId > 0) {
+                    sb.append(',');
+                }
+                ConceptInfo info = ev.getConceptInfo();
+                sb.append("{\"score\":").append(ev.getScore());
+                sb.append(",\"matchedtext\":").append(quote(ev.getMatchedText()));
+                sb.append(",\"start\":").append(ev.getStart());
+                sb.append(",\"length\":").append(ev.getLength());
+                sb.append(",\"id\":").append(quote("ev" + evId++));
+                sb.append(",\"conceptinfo\":{\"conceptstring\":").append(quote(info.getConceptString()));
+                sb.append(",\"sources\":").append(quoteAll(info.getSourceSet()));
+                sb.append(",\"cui\":").append(quote(info.getCUI()));
+                sb.append(",\"preferredname\":").append(quote(info.getPreferredName()));
+                sb.append(",\"semantictypes\":").append(quoteAll(info.getSemanticTypeSet()));
+                sb.append("}}");
+            }
+            sb.append("],\"docid\":").append(quote(entity.getDocid()));
+            sb.append(",\"start\":").append(entity.getStart());
+            sb.append(",\"length\":").append(entity.getLength());
+            sb.append(",\"id\":").append(quote("en" + entityId++));
+            sb.append(",\"fieldid\":").append(quote(entity.getFieldId()));
+            sb.append(",\"negated\":").append(entity.isNegated());
+            sb.append('}');
+        }
+        return sb.append(']').toString();
+    }
+
+    private static String quoteAll(Collection<String> values) {
+        StringBuilder sb = new StringBuilder("[");
+        for (String value : values) {
+            if (sb.length() > 1) {
+                sb.append(',');
+            }
+            sb.append(quote(value));
+        }
+        return sb.append(']').toString();
+    }
+
+    private static String quote(String value) {
+        if (value == null) {
+            return "null";
+        }
+        StringBuilder sb = new StringBuilder("\"");
+        for (char c : value.toCharArray()) {
+            switch (c) {
+                case '"': sb.append("\\\""); break;
+                case '\\': sb.append("\\\\"); break;
+                case '\n': sb.append("\\n"); break;
+                case '\r': sb.append("\\r"); break;
+                case '\t': sb.append("\\t"); break;
+                default:
+                    if (c < 0x20) {
+                        sb.append(String.format("\\u%04x", (int) c));
+                    } else {
+                        sb.append(c);
+                    }
+            }
+        }
+        return sb.append('"').toString();
+    }
+}
@@ -0,0 +1,124 @@
+"""
+Optional two-level hash-prefix layout for directories with millions of notes.
+
+Creating, listing, and looking up files in a directory of 10M+ entries is slow (particularly on NFS). In the hashed
+    layout, each file is instead placed in a subdirectory chosen from the md5 of its name (`notes/ab/cd/123.txt`),
+    so that each leaf directory holds about 1/65,536 of the files. Only the part of the name before the first `.`
+    is hashed, so a note and its outputs (`123.txt`, `123.json`, `123.mmi`, `123.txt.xmi`) share a subdirectory,
+    and, as MetaMapLite writes output next to its input, output follows the same layout without any changes.
+
+Functions which list note or output directories use `iter_files`, which handles both flat and hashed directories.
+    Existing flat directories can be converted with `migrate_to_hashed` (`mml-hash-layout`).
+"""
+import hashlib
+import os
+from pathlib import Path
+
+from loguru import logger
+
+HASH_LEVELS = 2
+HASH_WIDTH = 2  # hex digits per level
+HEX_DIGITS = set('0123456789abcdef')
+
+
+def get_hash_prefix(filename) -> list[str]:
+    """Subdirectories for `filename` (e.g., ['ab', 'cd'])."""
+    key = str(filename).split('.', 1)[0]
+    digest = hashlib.md5(key.encode('utf8')).hexdigest()
+    return [digest[i * HASH_WIDTH: (i + 1) * HASH_WIDTH] for i in range(HASH_LEVELS)]
+
+
+def get_hashed_path(directory: Path, filename) -> Path:
+    return Path(directory, *get_hash_prefix(filename), filename)
+
+
+def is_hash_dir(name: str) -> bool:
+    return len(name) == HASH_WIDTH and set(name) <= HEX_DIGITS
+
+
+def get_layout_dir(file: Path) -> Path:
+    """Directory (e.g., `notes`) containing `file`, skipping any hash-prefix subdirectories."""
+    directory = Path(file).parent
+    for _ in range(HASH_LEVELS):
+        if not is_hash_dir(directory.name):
+            break
+        directory = directory.parent
+    return directory
+
+
+def iter_entries(directory: Path, suffix=None, _depth=0):
+    """
+    Yield `os.DirEntry` for each file in `directory` (flat or hashed layout) without building intermediate lists.
+    :param suffix: only yield files whose name ends with this (e.g., '.json')
+    """
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_dir():
+                if _depth < HASH_LEVELS and is_hash_dir(entry.name):
+                    yield from iter_entries(entry.path, suffix, _depth + 1)
+            elif suffix is None or entry.name.endswith(suffix):
+                yield entry
+
+
+def iter_files(directory: Path, suffix=None):
+    """Yield path of each file in `directory` (flat or hashed layout)."""
+    for entry in iter_entries(directory, suffix):
+        yield Path(entry.path)
+
+
+def _rewrite_filelist(filelist: Path, directory: str) -> int:
+    """Update paths in filelist which were directly in (absolute) `directory`; returns number updated."""
+    count = 0
+    tmp = filelist.with_name(f'{filelist.name}.tmp')
+    with open(filelist, encoding='utf8') as fh, open(tmp, 'w', encoding='utf8') as out:
+        for line in fh:
+            path = line.strip()
+            if path and os.path.dirname(os.path.abspath(path)) == directory:
+                path = str(get_hashed_path(os.path.dirname(path), os.path.basename(path)))
+                count += 1
+            if path:
+                out.write(f'{path}\n')
+    os.replace(tmp, filelist)
+    return count
+
+
+def migrate_to_hashed(directory: Path, *, filelists=(), manifest=None, dry_run=False) -> int:
+    """
+    Move files directly in `directory` into the hashed layout (files already in hash subdirectories are untouched,
+        so an interrupted migration can be re-run).
+    :param filelists: filelists to update with the new paths
+    :param manifest: `RunManifest` to update with the new paths
+    :param dry_run: only count the files which would be moved
+    :return: number of files moved
+    """
+    directory = Path(directory)
+    made_dirs = set()
+    count = 0
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_dir() or entry.name.startswith('.'):  # e.g., `.mml_progress.jsonl`
+                continue
+            count += 1
+            if dry_run:
+                continue
+            dest = get_hashed_path(directory, entry.name)
+            if dest.parent not in made_dirs:
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                made_dirs.add(dest.parent)
+            os.replace(entry.path, dest)
+            if count % 100_000 == 0:
+                logger.info(f'Moved {count:,} files.')
+    logger.info(f'{"Would move" if dry_run else "Moved"} {count:,} files in {directory} to the hashed layout.')
+    if dry_run:
+        return count
+    abs_directory = os.path.abspath(directory)
+    for filelist in filelists:
+        n_updated = _rewrite_filelist(Path(filelist), abs_directory)
+        logger.info(f'Updated {n_updated:,} paths in {filelist}.')
+    if manifest is not None:
+        n_updated = manifest.move_paths(
+            lambda path: str(get_hashed_path(os.path.dirname(path), os.path.basename(path)))
+            if os.path.dirname(os.path.abspath(path)) == abs_directory else None
+        )
+        logger.info(f'Updated {n_updated:,} paths in {manifest.path}.')
+    return count
@@ -0,0 +1,179 @@
+"""
+Record the state of each note in a single SQLite database rather than probing the filesystem.
+
+On network storage with millions of notes, checking whether each text/output file exists can take hours. Each stage
+    can instead record what it has done in a `RunManifest`: writing text files (`mml-*-to-txt`), assigning them to
+    filelists (`mml-build-filelists`), and running MetaMapLite (`run_mml`, `mml-run-pool`). Progress, resuming, and
+    cleaning filelists (`mml-check-progress`, `mml-clean-filelist`) then become indexed queries.
+
+Status of each note:
+    * pending: text file written
+    * queued: added to a filelist/shard
+    * running: MetaMapLite started on its filelist
+    * done: MetaMapLite output written
+    * failed: MetaMapLite failed on this note
+    * quarantined: MetaMapLite stalled on this note (see `watchdog`)
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from mml_utils.db_utils import Cursor
+from mml_utils.filelists import FilelistProgress, get_output_path
+
+STATUSES = ('pending', 'queued', 'running', 'done', 'failed', 'quarantined')
+
+
+def get_shard_name(shard) -> str:
+    """Name of filelist/shard without the suffixes used to track its state (e.g., `.in_progress`)."""
+    name = Path(shard).name
+    for suffix in ('.building', '.in_progress', '.complete'):
+        name = name.removesuffix(suffix)
+    return name
+
+
+def get_text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf8')).hexdigest()
+
+
+class RunManifest:
+    """One row per note: text path, note_id, size, hash, shard, MetaMapLite status, output path, timings, error."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.lock = threading.Lock()  # may be shared by workers of `MmlPool`
+        with Cursor(self.conn) as cur:
+            cur.execute('create table if not exists notes ('
+                        ' path text primary key, note_id text, size integer, hash text, shard text,'
+                        ' status text, output_path text, started real, finished real, error text)')
+            cur.execute('create index if not exists notes_status on notes (status)')
+            cur.execute('create index if not exists notes_shard on notes (shard, status)')
+
+    def add_note(self, path, *, note_id=None, text: str = None, size=None):
+        """Record text file as written (resetting any previous status)."""
+        if size is None:
+            size = len(text.encode('utf8')) if text is not None else os.stat(path).st_size
+        self.add_notes([(str(path), note_id, size, get_text_hash(text) if text is not None else None)])
+
+    def add_notes(self, records):
+        """Record text files from (path, note_id, size, hash) tuples."""
+        with self.lock, Cursor(self.conn) as cur:
+            cur.cur.executemany(
+                'insert or replace into notes (path, note_id, size, hash, status) values (?, ?, ?, ?, \'pending\')',
+                ((str(path), None if note_id is None else str(note_id), size, text_hash)
+                 for path, note_id, size, text_hash in records)
+            )
+
+    def add_files(self, files):
+        """Record existing text files."""
+        self.add_notes((str(file), Path(file).stem, os.stat(file).st_size, None) for file in files)
+
+    def set_shard(self, files, shard, status='queued'):
+        """Record filelist/shard which files were added to (adding any files not yet in the manifest)."""
+        shard = get_shard_name(shard)
+        with self.lock, Cursor(self.conn) as cur:
+            cur.cur.executemany(
+                'insert into notes (path, shard, status) values (?, ?, ?)'
+                ' on conflict (path) do update set shard = excluded.shard, status = excluded.status',
+                ((str(file), shard, status) for file in files)
+            )
+
+    def mark(self, files, status, *, output_format=None, error=None):
+        if status not in STATUSES:
+            raise ValueError(f'Unrecognized status: {status}.')
+        now = time.time()
+        started = now if status == 'running' else None
+        finished = now if status in {'done', 'failed', 'quarantined'} else None
+        with self.lock, Cursor(self.conn) as cur:
+            cur.cur.executemany(
+                'insert into notes (path, status, output_path, started, finished, error) values (?, ?, ?, ?, ?, ?)'
+                ' on conflict (path) do update set status = excluded.status,'
+                ' output_path = coalesce(excluded.output_path, output_path),'
+                ' started = coalesce(excluded.started, started),'
+                ' finished = excluded.finished, error = excluded.error',
+                ((str(file), status, str(get_output_path(file, output_format)) if output_format else None,
+                  started, finished, error) for file in files)
+            )
+
+    def mark_progress(self, progress: FilelistProgress, *, error=None):
+        """
+        Record files completed by MetaMapLite; if `error`, the next file is recorded as failed. Files which were
+            not attempted are returned to the queue.
+        """
+        progress.update()
+        self.mark(progress.files[:progress.completed], 'done', output_format=progress.output_format)
+        attempted = progress.completed
+        if error and progress.completed < progress.total:
+            self.mark([progress.files[progress.completed]], 'failed', error=error)
+            attempted += 1
+        self.mark(progress.files[attempted:], 'queued')
+
+    def get_status(self, path):
+        row = self.conn.execute('select status from notes where path = ?', (str(path),)).fetchone()
+        return row[0] if row else None
+
+    def get_done(self, files) -> set[str]:
+        """Subset of files which MetaMapLite has completed."""
+        files = [str(file) for file in files]
+        done = set()
+        for start in range(0, len(files), 900):  # sqlite limits number of parameters
+            batch = files[start: start + 900]
+            done |= {row[0] for row in self.conn.execute(
+                f'select path from notes where status = \'done\' and path in ({",".join("?" * len(batch))})', batch
+            )}
+        return done
+
+    def iter_paths(self, status=None, shard=None):
+        query = 'select path from notes where 1 = 1'
+        params = []
+        if status is not None:
+            query += ' and status = ?'
+            params.append(status)
+        if shard is not None:
+            query += ' and shard = ?'
+            params.append(get_shard_name(shard))
+        for row in self.conn.execute(query, params):
+            yield row[0]
+
+    def move_paths(self, get_new_path) -> int:
+        """Update text and output paths using `get_new_path(path)` (None: unchanged); returns paths updated."""
+        updates = []
+        for path, output_path in self.conn.execute('select path, output_path from notes').fetchall():
+            new_path = get_new_path(path)
+            new_output_path = get_new_path(output_path) if output_path else None
+            if new_path or new_output_path:
+                updates.append((new_path or path, new_output_path or output_path, path))
+        with self.lock, Cursor(self.conn) as cur:
+            cur.cur.executemany('update notes set path = ?, output_path = ? where path = ?', updates)
+        return len(updates)
+
+    def counts(self, shard=None) -> dict[str, int]:
+        if shard is None:
+            rows = self.conn.execute('select status, count(*) from notes group by status')
+        else:
+            rows = self.conn.execute('select status, count(*) from notes where shard = ? group by status',
+                                     (get_shard_name(shard),))
+        return {status: n for status, n in rows}
+
+    def log_progress(self, shard=None):
+        counts = self.counts(shard)
+        total = sum(counts.values())
+        done = counts.get('done', 0)
+        logger.info(f'Completed {done:,} / {total:,}: {100.0 * done / total if total else 0:.02f}%'
+                    f' ({", ".join(f"{status}: {n:,}" for status, n in sorted(counts.items()))})')
+        return done, total
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
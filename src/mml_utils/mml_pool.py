@@ -0,0 +1,329 @@
+"""
+Run multiple MetaMapLite instances in parallel over a queue of filelist shards.
+
+Shards are filelists ending in `.in_progress` (as with `mml-build-filelists`). When MetaMapLite
+    completes a shard, the shard is renamed to `.complete`. If the pool is stopped (or MetaMapLite fails),
+    the shard is re-written to contain only the unprocessed files so that re-running the pool will resume.
+
+With `streaming=True`, shards can be added (`add_shard`) while the pool is running (e.g., from a watched folder);
+    workers wait for more shards until `close` is called.
+"""
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from mml_utils.filelists import FilelistProgress, read_filelist
+from mml_utils.cache import MmlCache, get_config_key
+from mml_utils.manifest import RunManifest
+from mml_utils.planner import AUTO_HEAP, plan_mml_resources
+from mml_utils.profiling import ProcessSampler, build_summary, get_report_path, write_run_report
+from mml_utils.run_mml import build_mml_command, get_env, resolve_umls_version
+from mml_utils.watchdog import StallMonitor, get_check_interval, quarantine_file, remove_current_file
+
+
+def get_shard_dir(filelist: Path, shard_dir: Path = None):
+    return shard_dir or filelist.parent / f'{filelist.stem}_shards'
+
+
+def split_filelist_to_shards(filelist: Path, shard_dir: Path = None, shard_size=10_000) -> list[Path]:
+    """
+    Split filelist into `.in_progress` shards of at most `shard_size` files.
+        If shards from a previous run already exist, the unfinished ones are returned instead.
+    :param filelist: file with one path per line
+    :param shard_dir: directory to write shards to; defaults to `{filelist.stem}_shards` next to the filelist
+    :param shard_size: maximum number of files in each shard
+    :return: list of paths to shards still requiring processing
+    """
+    shard_dir = get_shard_dir(filelist, shard_dir)
+    if shard_dir.exists() and next(shard_dir.glob(f'{filelist.stem}_shard*'), None):
+        shards = sorted(shard_dir.glob(f'{filelist.stem}_shard*.in_progress'))
+        logger.info(f'Resuming with {len(shards)} unfinished shards in {shard_dir}.')
+        return shards
+    shard_dir.mkdir(exist_ok=True, parents=True)
+    files = read_filelist(filelist)
+    shards = []
+    for i, start in enumerate(range(0, len(files), shard_size)):
+        shard = shard_dir / f'{filelist.stem}_shard{i:04d}.in_progress'
+        with open(shard, 'w', encoding='utf8') as out:
+            for file in files[start: start + shard_size]:
+                out.write(f'{file}\n')
+        shards.append(shard)
+    logger.info(f'Split {len(files):,} files from {filelist} into {len(shards)} shards in {shard_dir}.')
+    return shards
+
+
+class MmlPool:
+    """Run up to `n_workers` MetaMapLite JVMs, each taking the next shard from a shared queue."""
+
+    def __init__(self, shards, mml_home: Path, *, n_workers=None, max_heap='12g', output_format='json',
+                 progress_interval=60, cache: MmlCache = None, stall_timeout=None, manifest: RunManifest = None,
+                 streaming=False, profile=False, **mml_kwargs):
+        self.queue = queue.Queue()
+        self.total = 0
+        for shard in shards:
+            self.queue.put(Path(shard))
+            self.total += len(read_filelist(shard))
+        self.n_shards = self.queue.qsize()
+        self.mml_home = mml_home
+        self.n_workers = n_workers
+        self.max_heap = max_heap
+        self.output_format = output_format
+        self.progress_interval = progress_interval
+        self.mml_kwargs = mml_kwargs
+        self.cache = cache
+        self.stall_timeout = stall_timeout  # seconds without output before killing MetaMapLite (None: wait forever)
+        self.manifest = manifest  # record status of each file
+        self.profile = profile  # write run report for each shard
+        self.config_key = None
+        self.stopping = threading.Event()
+        self.closed = threading.Event()  # no more shards will be added
+        if not streaming:
+            self.closed.set()
+        self.lock = threading.Lock()
+        self.active = {}  # worker_id -> (process, progress)
+        self.finished = 0  # number of files completed in shards no longer running
+        self.completed_shards = []
+        self.failed_shards = []
+        self.start_time = None
+
+    def run(self):
+        """Run all shards; returns lists of completed and failed shards."""
+        if self.n_shards == 0 and self.closed.is_set():
+            logger.warning(f'No shards to process.')
+            return self.completed_shards, self.failed_shards
+        self.mml_kwargs['version'], self.mml_kwargs['dataset'] = resolve_umls_version(
+            self.mml_home, self.mml_kwargs.get('version'), self.mml_kwargs.get('dataset', 'USAbase')
+        )
+        if self.cache is not None:
+            self.config_key = get_config_key(self.output_format, **{
+                key: value for key, value in self.mml_kwargs.items()
+                if key in {'version', 'dataset', 'restrict_to_sts', 'restrict_to_src', 'property_file', 'properties'}
+            })
+        if self.max_heap == AUTO_HEAP or self.n_workers is None:  # plan once for all shards
+            self.max_heap, self.n_workers = plan_mml_resources(
+                self.mml_home / 'data' / 'ivf' / self.mml_kwargs['version'] / self.mml_kwargs['dataset'],
+                max_heap=None if self.max_heap == AUTO_HEAP else self.max_heap, n_workers=self.n_workers,
+                max_workers=self.n_shards if self.closed.is_set() else None,
+            )
+        n_workers = min(self.n_workers, self.n_shards) if self.closed.is_set() else self.n_workers
+        logger.info(f'Running {self.n_shards} shards ({self.total:,} files) with {n_workers} workers'
+                    f' (max heap per worker: {self.max_heap}).')
+        self.start_time = time.time()
+        workers = [threading.Thread(target=self._worker, args=(i,), daemon=True) for i in range(n_workers)]
+        is_main_thread = threading.current_thread() is threading.main_thread()
+        if is_main_thread:  # leave shards resumable if killed
+            prev_handler = signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        try:
+            for worker in workers:
+                worker.start()
+            next_report = time.time() + self.progress_interval
+            while any(worker.is_alive() for worker in workers):
+                time.sleep(min(1, self.progress_interval))
+                if time.time() >= next_report:
+                    self.log_progress()
+                    next_report += self.progress_interval
+        except KeyboardInterrupt:
+            self.stop()
+            for worker in workers:
+                worker.join()
+        finally:
+            if is_main_thread:
+                signal.signal(signal.SIGTERM, prev_handler)
+        self.log_progress()
+        if self.stopping.is_set():
+            logger.warning(f'Stopped early: re-run to resume the {self.n_shards - len(self.completed_shards)}'
+                           f' remaining shards.')
+        if self.cache is not None:
+            self.cache.log_stats()
+        if self.failed_shards:
+            logger.warning(f'MetaMapLite failed on {len(self.failed_shards)} shards: '
+                           f'{", ".join(str(s) for s in self.failed_shards)}')
+        return self.completed_shards, self.failed_shards
+
+    def add_shard(self, shard: Path):
+        """Add shard to a streaming pool."""
+        if self.closed.is_set():
+            raise ValueError(f'Cannot add shards to a closed pool.')
+        n_files = len(read_filelist(shard))
+        with self.lock:
+            self.total += n_files
+            self.n_shards += 1
+        self.queue.put(Path(shard))
+
+    def close(self):
+        """No more shards will be added: workers exit once the queue is empty."""
+        self.closed.set()
+
+    def stop(self):
+        """Stop taking new shards and terminate running MetaMapLite instances."""
+        if self.stopping.is_set():
+            return
+        logger.warning(f'Stopping MetaMapLite workers...')
+        self.stopping.set()
+        with self.lock:
+            for proc, _ in self.active.values():
+                proc.terminate()
+
+    def log_progress(self):
+        with self.lock:
+            running = sum(progress.update() for _, progress in self.active.values())
+            n_running = len(self.active)
+            done = self.finished + running
+        elapsed = time.time() - self.start_time
+        rate = done / elapsed * 3600 if elapsed else 0
+        eta = f'{(self.total - done) / rate:.1f} hours' if rate else 'unknown'
+        logger.info(f'Progress: {done:,}/{self.total:,} files ({100.0 * done / max(self.total, 1):.02f}%);'
+                    f' {rate:,.0f} files/hour; ETA: {eta};'
+                    f' shards: {len(self.completed_shards)}/{self.n_shards} complete, {n_running} running.')
+
+    def _worker(self, worker_id):
+        while not self.stopping.is_set():
+            closed = self.closed.is_set()
+            try:
+                shard = self.queue.get_nowait() if closed else self.queue.get(timeout=1)
+            except queue.Empty:
+                if closed:
+                    return
+                continue
+            self._run_shard(worker_id, shard)
+
+    def _apply_cache(self, worker_id, shard: Path) -> bool:
+        """Write output for cached files and remove them from shard; returns True if no files remain."""
+        files = read_filelist(shard)
+        misses = self.cache.apply(files, self.config_key, self.output_format)
+        with self.lock:
+            self.finished += len(files) - len(misses)
+        if self.manifest is not None:
+            self.manifest.mark(set(files) - set(misses), 'done', output_format=self.output_format)
+        logger.info(f'Worker {worker_id}: found {len(files) - len(misses):,}/{len(files):,} files'
+                    f' from {shard.name} in cache.')
+        with open(shard, 'w', encoding='utf8') as out:
+            for file in misses:
+                out.write(f'{file}\n')
+        if misses:
+            return False
+        self._complete_shard(worker_id, shard)
+        return True
+
+    def _complete_shard(self, worker_id, shard: Path):
+        shard.rename(shard.with_suffix('.complete'))
+        self.completed_shards.append(shard)
+
+    def _run_shard(self, worker_id, shard: Path):
+        if self.cache is not None and self._apply_cache(worker_id, shard):
+            return
+        while self._run_shard_once(worker_id, shard):
+            pass  # restart after quarantining file MetaMapLite stalled on
+
+    def _wait(self, proc, monitor: StallMonitor) -> bool:
+        """Wait for MetaMapLite to finish; returns True if it was killed for not making progress."""
+        if self.stall_timeout is None:
+            proc.wait()
+            return False
+        while proc.poll() is None:
+            time.sleep(get_check_interval(self.stall_timeout))
+            with self.lock:
+                stalled = monitor.is_stalled()
+            if stalled and not self.stopping.is_set():
+                proc.kill()
+                proc.wait()
+                return True
+        return False
+
+    def _write_profile(self, worker_id, shard: Path, progress: FilelistProgress, sampler: ProcessSampler,
+                       returncode, cmd):
+        samples = sampler.stop()
+        progress.update()
+        summary = build_summary(
+            samples, started=sampler.start_time, returncode=returncode,
+            files=progress.files[:progress.completed],  # documents actually processed
+            label=f'metamaplite {self.mml_kwargs["version"]} {self.mml_kwargs["dataset"]} worker {worker_id}',
+            command=' '.join(str(x) for x in cmd),
+        )
+        write_run_report(get_report_path(shard.with_suffix('')), summary, samples)
+
+    def _run_shard_once(self, worker_id, shard: Path) -> bool:
+        """Run MetaMapLite on shard; returns True if the shard should be re-run (after a stall)."""
+        cmd = build_mml_command(shard, self.mml_home, output_format=self.output_format, max_heap=self.max_heap,
+                                **self.mml_kwargs)
+        progress = FilelistProgress(shard, self.output_format, since=time.time() - 1)
+        with self.lock:
+            if self.stopping.is_set():
+                return False  # shard is left untouched
+            if self.manifest is not None:
+                self.manifest.set_shard(progress.files, shard, status='running')
+            logger.info(f'Worker {worker_id}: starting {shard.name} ({progress.total:,} files).')
+            logger.debug('Running command >> ' + ' '.join(cmd))
+            proc = subprocess.Popen(cmd, universal_newlines=True, cwd=self.mml_home,
+                                    env=os.environ | get_env(self.mml_home))
+            self.active[worker_id] = (proc, progress)
+        sampler = ProcessSampler(proc.pid).start() if self.profile else None
+        monitor = StallMonitor(progress, self.stall_timeout)
+        stalled = self._wait(proc, monitor)
+        returncode = proc.returncode
+        if sampler is not None:
+            self._write_profile(worker_id, shard, progress, sampler, returncode, cmd)
+        with self.lock:
+            progress.update()
+            del self.active[worker_id]
+            self.finished += progress.completed
+        if self.cache is not None:  # after a failure, the output of the file in flight might be incomplete
+            self.cache.store(progress.files if returncode == 0 else progress.processed(), self.config_key,
+                             self.output_format, since=progress.since)
+        if self.manifest is not None:
+            self.manifest.mark_progress(
+                progress, error=f'status code {returncode}' if returncode != 0 and not stalled
+                and not self.stopping.is_set() else None
+            )
+            if stalled and monitor.current_file() is not None:
+                self.manifest.mark([monitor.current_file()], 'quarantined', error='stalled')
+        if stalled and monitor.current_file() is not None:
+            quarantine_file(monitor.current_file(), shard, reason='stalled',
+                            seconds_since_progress=monitor.seconds_since_progress(),
+                            files_completed=progress.completed, returncode=returncode)
+            if remove_current_file(monitor) > 0:
+                with self.lock:  # last completed file is run again (and counted) after the restart
+                    self.finished -= progress.completed - len(progress.processed())
+                logger.info(f'Worker {worker_id}: restarting {shard.name}.')
+                return True
+        if returncode == 0 or stalled:
+            self._complete_shard(worker_id, shard)
+            logger.info(f'Worker {worker_id}: completed {shard.name}.')
+            return False
+        n_remaining = progress.write_remaining()
+        if self.stopping.is_set():
+            logger.info(f'Worker {worker_id}: stopped {shard.name}; {n_remaining:,} files left to resume.')
+        else:
+            self.failed_shards.append(shard)
+            logger.warning(f'Worker {worker_id}: MetaMapLite returned with status code {returncode}'
+                           f' on {shard.name}; {n_remaining:,} files left to re-run.')
+        return False
+
+
+def run_mml_pool(filelists, mml_home: Path, *, n_workers=None, shard_size=10_000, shard_dir: Path = None,
+                 split=True, **kwargs):
+    """
+    Run MetaMapLite in parallel over one or more filelists.
+    :param filelists: filelists to process
+    :param mml_home: path to metamaplite home
+    :param n_workers: number of MetaMapLite instances to run at once (None: see `planner.plan_mml_resources`)
+    :param shard_size: split filelists into shards of at most this many files
+    :param shard_dir: directory for shards (defaults to `{filelist.stem}_shards` next to each filelist)
+    :param split: if False, run each filelist (e.g., `*.in_progress` from `mml-build-filelists`) as a shard
+    :param kwargs: passed to `MmlPool`/`build_mml_command` (e.g., max_heap, output_format, version, cache,
+        stall_timeout, manifest)
+    :return: lists of completed and failed shards
+    """
+    shards = []
+    for filelist in filelists:
+        if split:
+            shards += split_filelist_to_shards(filelist, shard_dir=shard_dir, shard_size=shard_size)
+        else:
+            shards.append(filelist)
+    return MmlPool(shards, mml_home, n_workers=n_workers, **kwargs).run()
@@ -0,0 +1,156 @@
+"""
+Keep a MetaMapLite instance loaded between batches of documents.
+
+Starting MetaMapLite requires starting the JVM and loading the index, OpenNLP models, etc. `MmlSession`
+    pays this cost once, and then sends documents to the running instance over stdin/stdout
+    (see `java/MetaMapLiteSession.java` for the protocol). This requires a JDK >= 11 to run the Java source.
+"""
+import json
+import os
+import subprocess
+from pathlib import Path
+
+from loguru import logger
+
+from mml_utils.os_utils import is_windows
+from mml_utils.filelists import get_output_path
+from mml_utils.run_mml import get_env, get_mml_classpath, get_mml_jvm_options
+
+SESSION_SOURCE = Path(__file__).parent / 'java' / 'MetaMapLiteSession.java'
+
+
+def build_session_command(mml_home: Path, *, property_file=None, properties=None, version=None,
+                          dataset='USAbase', loglevel='WARN', max_heap='12g'):
+    # use context algorithm for negation (i.e., `--usecontext`)
+    properties = tuple(properties or ()) + (
+        ('metamaplite.negation.detector', 'gov.nih.nlm.nls.metamap.lite.context.ContextWrapper'),
+    )
+    jvm_opts = get_mml_jvm_options(mml_home, property_file=property_file, properties=properties, version=version,
+                                   dataset=dataset, loglevel=loglevel, max_heap=max_heap)
+    classpath = get_mml_classpath(mml_home)
+    if is_windows():  # must have quotes in classpath
+        return f'java {jvm_opts} -cp "{classpath}" {SESSION_SOURCE}'.split()
+    return f'java {jvm_opts} -cp {classpath} {SESSION_SOURCE}'.split()
+
+
+def restrict_results(results, restrict_to_sts=None, restrict_to_src=None):
+    """Only retain concepts with one of the listed semantic types and/or sources (as MetaMapLite's `--restrict_to_*`)"""
+    if not restrict_to_sts and not restrict_to_src:
+        return results
+    restrict_to_sts = set(restrict_to_sts or ())
+    restrict_to_src = set(restrict_to_src or ())
+    restricted = []
+    for entity in results:
+        evlist = [
+            ev for ev in entity['evlist']
+            if (not restrict_to_sts or restrict_to_sts & set(ev['conceptinfo']['semantictypes']))
+               and (not restrict_to_src or restrict_to_src & set(ev['conceptinfo']['sources']))
+        ]
+        if evlist:
+            restricted.append(entity | {'evlist': evlist})
+    return restricted
+
+
+class MmlSession:
+    """
+    Long-running MetaMapLite instance.
+
+    with MmlSession(mml_home, dataset='USAbase') as session:
+        results = session.annotate('Patient reports fever.')
+        for doc_id, results in session.process([('1', text1), ('2', text2)]):
+            ...
+    """
+
+    def __init__(self, mml_home: Path = None, *, cmd=None, restrict_to_sts=None, restrict_to_src=None,
+                 property_file=None, properties=None, version=None, dataset='USAbase', loglevel='WARN',
+                 max_heap='12g'):
+        """
+        :param mml_home: path to metamaplite home
+        :param cmd: command to start the session (defaults to running `MetaMapLiteSession.java` in `mml_home`)
+        :param restrict_to_sts: default semantic types to retain (can be overridden on each call)
+        :param restrict_to_src: default sources to retain (can be overridden on each call)
+        """
+        self.mml_home = mml_home
+        self.restrict_to_sts = restrict_to_sts
+        self.restrict_to_src = restrict_to_src
+        self.cmd = cmd or build_session_command(
+            mml_home, property_file=property_file, properties=properties, version=version, dataset=dataset,
+            loglevel=loglevel, max_heap=max_heap,
+        )
+        self.proc = None
+        self.n_processed = 0
+
+    def start(self):
+        logger.info(f'Starting MetaMapLite session (install location: {self.mml_home})')
+        logger.debug('Running command >> ' + ' '.join(str(x) for x in self.cmd))
+        env = os.environ | get_env(self.mml_home) if self.mml_home else None
+        self.proc = subprocess.Popen(self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     cwd=self.mml_home, env=env)
+        line = self.proc.stdout.readline()
+        if line.strip() != b'READY':
+            self.close()
+            raise RuntimeError(f'MetaMapLite session failed to start (output: {line!r}).')
+        logger.info(f'MetaMapLite session ready.')
+        return self
+
+    def is_running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def annotate(self, text, *, doc_id='text', restrict_to_sts=None, restrict_to_src=None):
+        """Run MetaMapLite on `text`, returning results in MetaMapLite's json format."""
+        if not self.is_running():
+            raise RuntimeError(f'MetaMapLite session is not running.')
+        data = text.encode('utf8')
+        self.proc.stdin.write(f'{doc_id}\t{len(data)}\n'.encode('utf8'))
+        self.proc.stdin.write(data)
+        self.proc.stdin.flush()
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError(f'MetaMapLite session ended unexpectedly while processing: {doc_id}'
+                               f' (status code {self.proc.wait()}).')
+        self.n_processed += 1
+        return restrict_results(json.loads(line),
+                                restrict_to_sts=restrict_to_sts or self.restrict_to_sts,
+                                restrict_to_src=restrict_to_src or self.restrict_to_src)
+
+    def process(self, documents, **kwargs):
+        """Annotate each (doc_id, text) pair, yielding (doc_id, results)."""
+        for doc_id, text in documents:
+            yield doc_id, self.annotate(text, doc_id=doc_id, **kwargs)
+
+    def process_files(self, files, *, encoding='utf8', output_format='json', **kwargs):
+        """Annotate files, writing output alongside each file as MetaMapLite does. Yields output paths."""
+        if output_format != 'json':
+            raise ValueError(f'MetaMapLite session only supports json output, not: {output_format}.')
+        for file in files:
+            file = Path(file)
+            results = self.annotate(file.read_text(encoding=encoding), doc_id=file.stem, **kwargs)
+            outfile = get_output_path(file, output_format)
+            with open(outfile, 'w', encoding='utf8') as out:
+                json.dump(results, out)
+            yield outfile
+
+    def close(self, timeout=30):
+        if self.proc is None:
+            return
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.write(b'\n')
+                self.proc.stdin.close()
+                self.proc.wait(timeout=timeout)
+            except (BrokenPipeError, subprocess.TimeoutExpired):
+                self.proc.kill()
+                self.proc.wait()
+        self.proc.stdout.close()
+        logger.info(f'Closed MetaMapLite session after processing {self.n_processed:,} documents.')
+        self.proc = None
+
+    def restart(self):
+        self.close()
+        return self.start()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
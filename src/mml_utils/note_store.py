@@ -0,0 +1,294 @@
+"""
+Store a corpus in a single append-only data file with a sorted index, rather than one text file per note.
+
+With millions of notes, creating each text file, and re-opening it in each later step (extracting output, preparing
+    reviews, checking offsets), is slow (particularly on NFS). A note store instead holds:
+
+    * `corpus.notes`: the utf8 text of each note, appended one after another
+    * `corpus.notes.log`: an entry (note_id, offset, length) for each note in the order written
+    * `corpus.notes.idx`: the same entries sorted by note_id (the last written for each note_id)
+
+Each entry is `ENTRY_SIZE` bytes, so the index can be binary-searched with `mmap` and a note's text read straight
+    from the mapped data file without reading the rest of the corpus. Note ids can be at most `KEY_WIDTH` bytes.
+
+As MetaMapLite needs text files, `export_notes` writes `.txt` files (and a filelist) for just the notes about to be
+    processed (e.g., `shard` 3 of 100), which can be deleted once MetaMapLite has run.
+
+    write_note_store(((note_id, text) for ...), 'corpus.notes')
+    with NoteStore('corpus.notes') as store:
+        text = store.get_text('123')
+        filelist = export_notes(store, 'shard3', shard=3, n_shards=100)
+"""
+import mmap
+import os
+import struct
+from collections import OrderedDict
+from pathlib import Path
+
+from loguru import logger
+
+from mml_utils.layout import get_hashed_path
+
+KEY_WIDTH = 64
+ENTRY = struct.Struct(f'>{KEY_WIDTH}sQQ')  # note_id (null-padded), offset, length
+ENTRY_SIZE = ENTRY.size
+
+
+def get_log_path(path: Path) -> Path:
+    return Path(f'{path}.log')
+
+
+def get_index_path(path: Path) -> Path:
+    return Path(f'{path}.idx')
+
+
+def get_note_id(file) -> str:
+    """Note id from the name of a note or output file (e.g., `123.txt.json` -> `123`)."""
+    return Path(file).name.split('.', 1)[0]
+
+
+def _pack_key(note_id) -> bytes:
+    key = str(note_id).encode('utf8')
+    if len(key) > KEY_WIDTH:
+        raise ValueError(f'Note id is longer than {KEY_WIDTH} bytes: {note_id}.')
+    return key.ljust(KEY_WIDTH, b'\0')
+
+
+def _unpack_key(key: bytes) -> str:
+    return key.rstrip(b'\0').decode('utf8')
+
+
+def _map(path: Path):
+    """Read-only memory map of file (or empty bytes, as empty files cannot be mapped)."""
+    with open(path, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _iter_log(path: Path):
+    """Yield (key, offset, length) from log, skipping entries whose text was not written (e.g., after a crash)."""
+    log_path = get_log_path(path)
+    if not log_path.exists():
+        return
+    data_size = os.stat(path).st_size if Path(path).exists() else 0
+    with open(log_path, 'rb') as fh:
+        while len(entry := fh.read(ENTRY_SIZE)) == ENTRY_SIZE:
+            key, offset, length = ENTRY.unpack(entry)
+            if offset + length <= data_size:
+                yield key, offset, length
+
+
+def get_note_ids(path: Path) -> set[str]:
+    """Note ids already written to store."""
+    return {_unpack_key(key) for key, _, _ in _iter_log(path)}
+
+
+def build_index(path: Path) -> int:
+    """Write sorted index from log, keeping the last entry for each note id; returns number of notes."""
+    entries = {key: (offset, length) for key, offset, length in _iter_log(path)}
+    index_path = get_index_path(path)
+    tmp = index_path.with_name(f'{index_path.name}.tmp')
+    with open(tmp, 'wb') as out:
+        for key in sorted(entries):
+            out.write(ENTRY.pack(key, *entries[key]))
+    os.replace(tmp, index_path)
+    return len(entries)
+
+
+class NoteStoreWriter:
+    """Append notes to a store; the index is rebuilt on `close`."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.data = open(self.path, 'ab')
+        self.log = open(get_log_path(self.path), 'ab')
+        if partial := self.log.tell() % ENTRY_SIZE:  # interrupted while writing an entry
+            self.log.truncate(self.log.tell() - partial)
+        self.offset = self.data.tell()
+        self.count = 0
+
+    def add(self, note_id, text: str):
+        data = text.encode('utf8', errors='replace')
+        self.data.write(data)
+        self.log.write(ENTRY.pack(_pack_key(note_id), self.offset, len(data)))
+        self.offset += len(data)
+        self.count += 1
+
+    def close(self) -> int:
+        """Close files and build index; returns number of notes in store."""
+        self.data.close()  # log entries written before their text are skipped when read (see `_iter_log`)
+        self.log.close()
+        return build_index(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class NoteStore:
+    """Look up the text of notes by note id in a store (memory mapped)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        if not get_index_path(self.path).exists():
+            raise FileNotFoundError(f'Index for note store not found: {get_index_path(self.path)}.')
+        self.data = _map(self.path)
+        self.index = _map(get_index_path(self.path))
+        self.n_notes = len(self.index) // ENTRY_SIZE
+
+    def _entry(self, i) -> tuple[bytes, int, int]:
+        return ENTRY.unpack_from(self.index, i * ENTRY_SIZE)
+
+    def find(self, note_id) -> tuple[int, int] | None:
+        """Offset and length of note's text in the data file (None if not found)."""
+        key = _pack_key(note_id)
+        lo, hi = 0, self.n_notes
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.index[mid * ENTRY_SIZE: mid * ENTRY_SIZE + KEY_WIDTH] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_notes:
+            entry_key, offset, length = self._entry(lo)
+            if entry_key == key:
+                return offset, length
+        return None
+
+    def get_bytes(self, note_id) -> memoryview | None:
+        """Note's text without copying it (release the view before closing the store)."""
+        if (found := self.find(note_id)) is None:
+            return None
+        offset, length = found
+        return memoryview(self.data)[offset: offset + length]
+
+    def get_text(self, note_id, encoding='utf8', errors='replace') -> str | None:
+        if (view := self.get_bytes(note_id)) is None:
+            return None
+        with view:
+            return str(view, encoding, errors)
+
+    def iter_note_ids(self, start=0, stop=None):
+        """Note ids in sorted order (from index position `start` up to `stop`)."""
+        for i in range(start, self.n_notes if stop is None else min(stop, self.n_notes)):
+            yield _unpack_key(self._entry(i)[0])
+
+    def __contains__(self, note_id):
+        return self.find(note_id) is not None
+
+    def __len__(self):
+        return self.n_notes
+
+    def close(self):
+        for m in (self.data, self.index):
+            if isinstance(m, mmap.mmap):
+                m.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def write_note_store(text_gen, path: Path, *, require_newline=True, resume=False) -> int:
+    """
+    Write notes from generator outputting (note_id, text) to a store, as `build_files` writes text files.
+        Parts of a note (i.e., multiple 'note_lines') must appear within 10 notes of each other.
+    :param require_newline: always add a newline to avoid issues when running MetaMap
+    :param resume: skip notes already in the store (only complete notes are written, so none need re-writing)
+    :return: number of notes written
+    """
+    path = Path(path)
+    if path.exists() and not resume:
+        raise FileExistsError(f'Note store already exists: {path}; use `--resume` to add to it.')
+    skip = get_note_ids(path) if resume else set()
+    if skip:
+        logger.info(f'Skipping {len(skip):,} notes already in {path}.')
+    pending = OrderedDict()  # note_id -> parts
+    writer = NoteStoreWriter(path)
+
+    def _write(note_id, parts):
+        if require_newline:
+            parts.append('\n')
+        writer.add(note_id, ''.join(parts))
+
+    i = 0
+    for note_id, text in text_gen:
+        if not isinstance(text, str) or text.strip() == '':  # handle forms of None/nan
+            continue
+        if str(note_id) in skip:
+            continue
+        if note_id in pending:
+            pending[note_id].append(text)
+            continue
+        if len(pending) >= 10:
+            _write(*pending.popitem(last=False))
+        pending[note_id] = [text]
+        i += 1
+        if i % 100_000 == 0:
+            logger.info(f'Finished reading {i:,} notes.')
+    while pending:
+        _write(*pending.popitem(last=False))
+    n_notes = writer.close()
+    logger.info(f'Done! Wrote {writer.count:,} notes to {path} ({n_notes:,} notes in store).')
+    return writer.count
+
+
+def export_notes(store: NoteStore, outdir: Path, note_ids=None, *, shard=None, n_shards=None,
+                 text_extension='.txt', hashed=False, filelist: Path = None) -> Path:
+    """
+    Write text files (and a filelist) for some of the notes in a store (e.g., those MetaMapLite will process next).
+    :param note_ids: notes to export (default: all, or those in `shard`)
+    :param shard: export the `shard`th of `n_shards` equal parts of the (sorted) store
+    :param hashed: write each note to a hash-prefix subdirectory (see `layout`)
+    :param filelist: path of filelist to write (default: `outdir/filelist.txt`)
+    :return: path of filelist
+    """
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    if note_ids is None:
+        if shard is None:
+            note_ids = store.iter_note_ids()
+        else:
+            note_ids = store.iter_note_ids(shard * len(store) // n_shards, (shard + 1) * len(store) // n_shards)
+    filelist = Path(filelist or outdir / 'filelist.txt')
+    made_dirs = set()
+    count = 0
+    missing = 0
+    with open(filelist, 'w', encoding='utf8') as fl:
+        for note_id in note_ids:
+            if (view := store.get_bytes(note_id)) is None:
+                missing += 1
+                continue
+            filename = f'{note_id}{text_extension}'
+            if hashed:
+                outfile = get_hashed_path(outdir, filename)
+                if outfile.parent not in made_dirs:
+                    outfile.parent.mkdir(parents=True, exist_ok=True)
+                    made_dirs.add(outfile.parent)
+            else:
+                outfile = outdir / filename
+            with view, open(outfile, 'wb') as out:
+                out.write(view)
+            fl.write(f'{outfile.absolute()}\n')
+            count += 1
+    if missing:
+        logger.warning(f'{missing:,} notes were not found in {store.path}.')
+    logger.info(f'Exported {count:,} notes to {outdir}: {filelist}.')
+    return filelist
+
+
+def pack_files(files, path: Path, *, encoding='utf8', resume=False) -> int:
+    """Add existing text files (e.g., from `mml-*-to-txt`) to a store, keyed by their name without extension."""
+
+    def _iter_files():
+        for file in files:
+            with open(file, encoding=encoding, errors='replace') as fh:
+                yield get_note_id(file), fh.read()
+
+    return write_note_store(_iter_files(), path, require_newline=False, resume=resume)
@@ -0,0 +1,176 @@
+"""
+Pack many small notes into larger documents to reduce MetaMapLite's per-file overhead.
+
+With millions of small notes, opening each file, setting up sentence detection, and creating each output file
+    takes much of MetaMapLite's time. Notes are instead concatenated into packs (separated by `SEPARATOR`, which
+    always ends a sentence so that neither matches nor negation can cross between notes), with a sidecar
+    `.map.json` recording where each note starts. After MetaMapLite has run on the packs, `unpack_outputs` writes
+    json/mmi output for each note alongside the note (as MetaMapLite would), with offsets relative to the note.
+    Any match which crosses the boundary of a note is dropped.
+
+    filelist = pack_notes(note_files, pack_dir)
+    run_mml(filelist, mml_home, output_format='json')
+    unpack_outputs(filelist, output_format='json')
+"""
+import json
+from pathlib import Path
+
+from loguru import logger
+
+from mml_utils.filelists import get_output_path, read_filelist
+from mml_utils.parse.json import shift_json_offsets
+from mml_utils.parse.mmi import TRIGGER_INFO_PAT, split_mmi_line
+
+SEPARATOR = '\n\n.\n\n'
+
+
+def get_java_length(text):
+    """MetaMapLite's offsets count UTF-16 code units (i.e., characters outside the BMP count twice)."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def get_map_path(pack: Path) -> Path:
+    return Path(f'{str(pack).removesuffix(".txt")}.map.json')
+
+
+def pack_notes(files, pack_dir: Path, *, max_chars=100_000, max_notes=1_000, encoding='utf8') -> Path:
+    """
+    Concatenate notes into packs of at most `max_notes` notes and (about) `max_chars` characters.
+    :param files: note text files
+    :param pack_dir: directory to write packs (`pack_N.txt`) and their offset maps (`pack_N.map.json`)
+    :return: filelist of packs
+    """
+    pack_dir = Path(pack_dir)
+    pack_dir.mkdir(parents=True, exist_ok=True)
+    filelist_path = pack_dir / 'filelist.txt'
+    n_notes = 0
+    n_packs = 0
+    with open(filelist_path, 'w', encoding='utf8') as filelist:
+        texts = []
+        offset_map = []
+        length = 0
+        for file in files:
+            text = Path(file).read_text(encoding=encoding)
+            if offset_map and (len(offset_map) >= max_notes or length + len(text) > max_chars):
+                filelist.write(f'{_write_pack(pack_dir, n_packs, texts, offset_map).absolute()}\n')
+                n_packs += 1
+                texts, offset_map, length = [], [], 0
+            if offset_map:
+                texts.append(SEPARATOR)
+                length += get_java_length(SEPARATOR)
+            texts.append(text)
+            offset_map.append([str(file), length, get_java_length(text)])
+            length += get_java_length(text)
+            n_notes += 1
+        if offset_map:
+            filelist.write(f'{_write_pack(pack_dir, n_packs, texts, offset_map).absolute()}\n')
+            n_packs += 1
+    logger.info(f'Packed {n_notes:,} notes into {n_packs:,} packs: {filelist_path}.')
+    return filelist_path
+
+
+def _write_pack(pack_dir: Path, n_pack, texts, offset_map) -> Path:
+    pack = pack_dir / f'pack_{n_pack:06d}.txt'
+    with open(pack, 'w', encoding='utf8') as out:
+        out.write(''.join(texts))
+        if not texts[-1].endswith('\n'):
+            out.write('\n')
+    with open(get_map_path(pack), 'w', encoding='utf8') as out:
+        json.dump(offset_map, out)
+    return pack
+
+
+def unpack_json(data, offset_map) -> dict[str, list]:
+    """Split MetaMapLite json results for a pack into results for each note."""
+    results = {file: [] for file, _, _ in offset_map}
+    i = 0
+    for el in sorted(data, key=lambda x: x['start']):
+        while i < len(offset_map) and el['start'] >= offset_map[i][1] + offset_map[i][2]:
+            i += 1
+        if i == len(offset_map):
+            break
+        file, start, length = offset_map[i]
+        if el['start'] < start or el['start'] + el['length'] > start + length:
+            continue  # crosses note boundary (or in separator)
+        results[file].append(el)
+    return {
+        file: _renumber(shift_json_offsets(results[file], -start))
+        for file, start, _ in offset_map
+    }
+
+
+def _renumber(data):
+    """Number entity/event ids from zero in each note as MetaMapLite does."""
+    restarts = all(not el['evlist'] or el['evlist'][0]['id'] == 'ev0' for el in data)
+    n_event = 0
+    for i, el in enumerate(data):
+        el['id'] = f'en{i}'
+        if restarts:
+            continue
+        for event in el['evlist']:
+            event['id'] = f'ev{n_event}'
+            n_event += 1
+    return data
+
+
+def unpack_mmi(text, offset_map) -> dict[str, str]:
+    """
+    Split MetaMapLite mmi output for a pack into output for each note.
+        Note that the score is retained from the pack (it is not recalculated for each note).
+    """
+    lines = {file: [] for file, _, _ in offset_map}
+    for textline in text.splitlines():
+        if not textline.strip():
+            continue
+        line = split_mmi_line(textline)
+        if len(line) < 10 or line[1] != 'MMI':
+            continue
+        triggers = [m.group() for m in TRIGGER_INFO_PAT.finditer(line[6].strip('[]'))]
+        positions = [pos.strip('[]').split('/') for pos in line[8].split(';')]
+        by_file = {}
+        for trigger, (pos_start, pos_length) in zip(triggers, positions):
+            pos_start, pos_length = int(pos_start), int(pos_length)
+            for file, start, length in offset_map:
+                if start <= pos_start and pos_start + pos_length <= start + length:
+                    by_file.setdefault(file, []).append((trigger, pos_start - start, pos_length))
+                    break
+        for file, matches in by_file.items():
+            lines[file].append('|'.join([
+                Path(file).stem, *line[1:6],
+                ','.join(trigger for trigger, _, _ in matches),
+                line[7],
+                ';'.join(f'{pos_start}/{pos_length}' for _, pos_start, pos_length in matches),
+                *line[9:],
+            ]))
+    return {file: ''.join(f'{line}\n' for line in file_lines) for file, file_lines in lines.items()}
+
+
+def unpack_outputs(pack_filelist: Path, output_format='json'):
+    """
+    Write output for each note from MetaMapLite output for each pack in `pack_filelist`.
+    :return: number of notes written, and list of packs without output
+    """
+    n_notes = 0
+    missing = []
+    for pack in read_filelist(pack_filelist):
+        with open(get_map_path(pack), encoding='utf8') as fh:
+            offset_map = json.load(fh)
+        try:
+            with open(get_output_path(pack, output_format), encoding='utf8') as fh:
+                if output_format == 'json':
+                    outputs = {file: json.dumps(data) for file, data in unpack_json(json.load(fh), offset_map).items()}
+                elif output_format == 'mmi':
+                    outputs = unpack_mmi(fh.read(), offset_map)
+                else:
+                    raise ValueError(f'Unrecognized output format: {output_format}.')
+        except FileNotFoundError:
+            missing.append(pack)
+            continue
+        for file, output in outputs.items():
+            with open(get_output_path(file, output_format), 'w', encoding='utf8') as out:
+                out.write(output)
+            n_notes += 1
+    logger.info(f'Unpacked output for {n_notes:,} notes.')
+    if missing:
+        logger.warning(f'Missing MetaMapLite output for {len(missing):,} packs (e.g., {missing[0]}).')
+    return n_notes, missing
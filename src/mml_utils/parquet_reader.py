@@ -0,0 +1,96 @@
+"""
+Read (note_id, text) from parquet files (`mml-parquet-to-txt`), requires `pyarrow`.
+
+Only the id and text columns are read, in record batches, and each batch's columns are converted to lists at once
+    rather than row by row. As parquet files are divided into row groups which can be decoded independently, the
+    row groups of all files can be split into contiguous partitions which are read (and written) concurrently (see
+    `partitions`). The parts of a note (i.e., multiple 'note_lines') must be in the same partition: if a note
+    continues from the last row of one partition to the first row of the next, the boundary is moved.
+"""
+from itertools import groupby
+from pathlib import Path
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+
+def _require_pyarrow():
+    if pq is None:
+        raise ImportError(f'Pyarrow is required to read parquet files: Install pyarrow with `pip install pyarrow`.')
+
+
+def get_parquet_files(sources) -> list[Path]:
+    """Parquet files from each source (a file, or a directory of `.parquet` files)."""
+    files = []
+    for source in sources:
+        source = Path(source)
+        files += sorted(source.glob('**/*.parquet')) if source.is_dir() else [source]
+    return files
+
+
+def get_row_groups(files) -> list[tuple[Path, int, int]]:
+    """(file, row group index, number of rows) for each row group in `files`."""
+    _require_pyarrow()
+    row_groups = []
+    for file in files:
+        metadata = pq.ParquetFile(file).metadata
+        row_groups += [(Path(file), i, metadata.row_group(i).num_rows) for i in range(metadata.num_row_groups)]
+    return row_groups
+
+
+def split_row_groups(row_groups, n_partitions, id_col=None) -> list[list]:
+    """
+    Split row groups (in order) into at most `n_partitions` contiguous partitions with about as many rows each.
+    :param id_col: if specified, move boundaries so that no note (i.e., rows with the same id) spans partitions
+    """
+    total = sum(n_rows for _, _, n_rows in row_groups)
+    partitions = [[]]
+    seen = 0
+    for row_group in row_groups:
+        if partitions[-1] and seen >= total * len(partitions) / n_partitions:
+            partitions.append([])
+        partitions[-1].append(row_group)
+        seen += row_group[2]
+    partitions = [partition for partition in partitions if partition]
+    if id_col is not None:
+        partitions = _join_split_notes(partitions, id_col)
+    return partitions
+
+
+def _get_first_last_ids(row_group, id_col):
+    file, i, _ = row_group
+    ids = pq.ParquetFile(file).read_row_group(i, columns=[id_col]).column(id_col)
+    return (ids[0].as_py(), ids[-1].as_py()) if len(ids) else (None, None)
+
+
+def _join_split_notes(partitions, id_col) -> list[list]:
+    """Move the first row groups of a partition to the previous one while they continue its last note."""
+    _require_pyarrow()
+    ids = {}
+
+    def _ids(row_group):
+        if row_group not in ids:
+            ids[row_group] = _get_first_last_ids(row_group, id_col)
+        return ids[row_group]
+
+    joined = [partitions[0]]
+    for partition in partitions[1:]:
+        partition = list(partition)
+        while partition and _ids(joined[-1][-1])[1] is not None \
+                and _ids(joined[-1][-1])[1] == _ids(partition[0])[0]:
+            joined[-1].append(partition.pop(0))  # note continues into this partition
+        if partition:
+            joined.append(partition)
+    return joined
+
+
+def iter_parquet_rows(row_groups, id_col, text_col, batch_size=10_000):
+    """Yield (note_id, text) from row groups (as from `get_row_groups`), reading only the id and text columns."""
+    _require_pyarrow()
+    for file, file_row_groups in groupby(row_groups, key=lambda x: x[0]):
+        parquet_file = pq.ParquetFile(file)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=[id_col, text_col],
+                                               row_groups=[i for _, i, _ in file_row_groups]):
+            yield from zip(batch.column(id_col).to_pylist(), batch.column(text_col).to_pylist())
@@ -65,3 +65,14 @@ def iter_json_matches(data, *fields):
             'end': match['start'] + match['length'],
         }
         yield [d[field] for field in fields]
+
+
+def shift_json_offsets(data, offset):
+    """Copy of MetaMapLite json results with all offsets moved by `offset` (e.g., from a segment into its note)."""
+    return [
+        el | {
+            'start': el['start'] + offset,
+            'evlist': [event | {'start': event['start'] + offset} for event in el['evlist']],
+        }
+        for el in data
+    ]
@@ -0,0 +1,75 @@
+"""
+Write notes read concurrently from partitions of a source (e.g., ranges of a database query, or row groups of
+    parquet files) each to its own directory: `part0000`, `part0001`, etc., each with its own `notes` directory
+    and filelist.
+
+The plan (a description of each partition, e.g., its query or row groups) is written to `.partitions.json` in the
+    output directory before any partition is read. Once a partition has been completely written, a checkpoint
+    (`.partition.json`, including its description) is written in its directory. When resuming, the recorded plan
+    is used (so partitions do not shift if, e.g., the source has grown), completed partitions are skipped, and
+    incomplete ones are re-written from the start.
+"""
+import json
+import time
+from pathlib import Path
+
+CHECKPOINT_FILENAME = '.partition.json'
+PLAN_FILENAME = '.partitions.json'
+
+
+def get_partition_dir(outdir: Path, k) -> Path:
+    return Path(outdir) / f'part{k:04d}'
+
+
+def read_checkpoint(partition_dir: Path) -> dict | None:
+    """Checkpoint of a completed partition (None if incomplete)."""
+    try:
+        with open(Path(partition_dir) / CHECKPOINT_FILENAME, encoding='utf8') as fh:
+            return json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_checkpoint(partition_dir: Path, **data):
+    _write_json(Path(partition_dir) / CHECKPOINT_FILENAME, {'finished': time.time(), **data})
+
+
+def read_plan(outdir: Path) -> list[dict] | None:
+    """Description of each partition as recorded by `write_plan` (None if not recorded)."""
+    try:
+        with open(Path(outdir) / PLAN_FILENAME, encoding='utf8') as fh:
+            return json.load(fh)['partitions']
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_plan(outdir: Path, descriptions: list[dict]):
+    _write_json(Path(outdir) / PLAN_FILENAME, {'created': time.time(), 'partitions': descriptions})
+
+
+def check_checkpoint(checkpoint: dict, description: dict, k):
+    """Raise ValueError if a completed partition was written from a different part of the source."""
+    recorded = {key: checkpoint.get(key) for key in description}
+    if recorded != description:
+        raise ValueError(f'Completed partition {k} does not match the partition plan: {recorded} != {description}.'
+                         f' Remove its directory to re-write it.')
+
+
+def _write_json(path: Path, data):
+    tmp = path.with_name(f'{path.name}.tmp')
+    with open(tmp, 'w', encoding='utf8') as out:
+        json.dump(data, out)
+    tmp.replace(path)  # so that a partial file is never read
+
+
+class RowCounter:
+    """Count rows passing through a (note_id, text) generator."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
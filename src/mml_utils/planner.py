@@ -0,0 +1,159 @@
+"""
+Choose MetaMapLite's heap size (`-Xmx`) and the number of MetaMapLite instances to run on this machine.
+
+Each MetaMapLite instance needs enough heap for its models and (part of) the UMLS index, and several instances
+    on one host must fit in the memory available (including any container/cgroup limit) and CPUs allowed.
+"""
+import os
+from pathlib import Path
+
+from loguru import logger
+
+GB = 1024 ** 3
+MB = 1024 ** 2
+MIN_HEAP = 2 * GB  # models, etc.
+BASE_HEAP = 1 * GB
+INDEX_HEAP_RATIO = 0.5  # fraction of index size expected to be needed on heap
+HEAP_HEADROOM = 1.5  # preferred heap relative to minimum
+JVM_OVERHEAD = 1.25  # memory used by JVM relative to heap (metaspace, threads, GC)
+CGROUP_ROOT = Path('/sys/fs/cgroup')
+AUTO_HEAP = 'auto'  # `max_heap` value to choose heap size with `plan_mml_resources`
+
+
+def parse_heap_size(size: str) -> int:
+    """Size in bytes of a java memory option (e.g., '12g', '512m')."""
+    size = str(size).strip().lower()
+    units = {'k': 1024, 'm': MB, 'g': GB, 't': 1024 * GB}
+    if size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def format_heap_size(size: int) -> str:
+    """Format bytes as a java memory option (rounded down to megabytes)."""
+    if size % GB == 0:
+        return f'{size // GB}g'
+    return f'{max(size // MB, 1)}m'
+
+
+def get_dir_size(path: Path) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.stat(os.path.join(dirpath, filename)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _read_int(path: Path):
+    try:
+        value = path.read_text().strip().split()[0]
+    except (FileNotFoundError, PermissionError, IndexError, OSError):
+        return None
+    return None if value == 'max' else int(value)
+
+
+def get_cgroup_memory_available(cgroup_root: Path = CGROUP_ROOT):
+    """Memory remaining under the cgroup limit (v2 or v1), or None if there is no limit."""
+    for limit_file, usage_file in [
+        (cgroup_root / 'memory.max', cgroup_root / 'memory.current'),  # v2
+        (cgroup_root / 'memory' / 'memory.limit_in_bytes', cgroup_root / 'memory' / 'memory.usage_in_bytes'),  # v1
+    ]:
+        limit = _read_int(limit_file)
+        if limit is None or limit >= 2 ** 60:  # v1 reports 'no limit' as a huge number
+            continue
+        return max(limit - (_read_int(usage_file) or 0), 0)
+    return None
+
+
+def get_cgroup_cpu_limit(cgroup_root: Path = CGROUP_ROOT):
+    """Number of CPUs allowed by cgroup quota (v2 or v1), or None if there is no limit."""
+    try:
+        quota, period = (cgroup_root / 'cpu.max').read_text().split()  # v2
+        if quota != 'max':
+            return max(int(quota) / int(period), 1)
+    except (FileNotFoundError, PermissionError, ValueError, OSError):
+        pass
+    quota = _read_int(cgroup_root / 'cpu' / 'cpu.cfs_quota_us')  # v1
+    period = _read_int(cgroup_root / 'cpu' / 'cpu.cfs_period_us')
+    if quota and quota > 0 and period:
+        return max(quota / period, 1)
+    return None
+
+
+def get_available_memory(cgroup_root: Path = CGROUP_ROOT):
+    """Memory available for new processes (`MemAvailable`), limited by any cgroup limit."""
+    available = None
+    try:
+        with open('/proc/meminfo') as fh:
+            for line in fh:
+                if line.startswith('MemAvailable:'):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except FileNotFoundError:
+        pass
+    if available is None:
+        try:
+            available = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (AttributeError, ValueError, OSError):
+            return None  # e.g., Windows
+    cgroup_available = get_cgroup_memory_available(cgroup_root)
+    return min(available, cgroup_available) if cgroup_available is not None else available
+
+
+def get_cpu_count(cgroup_root: Path = CGROUP_ROOT) -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    cgroup_cpus = get_cgroup_cpu_limit(cgroup_root)
+    return max(int(min(cpus, cgroup_cpus)) if cgroup_cpus else cpus, 1)
+
+
+def plan_mml_resources(index_dir: Path, *, max_heap=None, n_workers=None, reserve_mb=2048,
+                       max_workers=None) -> tuple[str, int]:
+    """
+    Choose heap size and number of MetaMapLite instances.
+        The minimum heap is estimated from the index size; instances are added (up to the number of CPUs) while
+        each can have its preferred heap, and any remaining memory is shared among them.
+    :param index_dir: MetaMapLite index directory (`data/ivf/{version}/{dataset}`)
+    :param max_heap: use this heap size (e.g., '12g') rather than choosing one
+    :param n_workers: use this many instances rather than choosing
+    :param reserve_mb: memory to leave for everything else
+    :param max_workers: never choose more than this many instances
+    :return: (max_heap, n_workers)
+    """
+    index_size = get_dir_size(index_dir)
+    min_heap = max(MIN_HEAP, BASE_HEAP + int(INDEX_HEAP_RATIO * index_size))
+    preferred_heap = int(min_heap * HEAP_HEADROOM)
+    available = get_available_memory()
+    cpus = get_cpu_count()
+    budget = available - reserve_mb * MB if available is not None else None
+    if n_workers is None:
+        if max_heap is not None:
+            per_worker = parse_heap_size(max_heap) * JVM_OVERHEAD
+        else:
+            per_worker = preferred_heap * JVM_OVERHEAD
+        n_workers = int(budget // per_worker) if budget is not None else 1
+        n_workers = max(min(n_workers, cpus, max_workers or cpus), 1)
+    if max_heap is None:
+        if budget is None:
+            heap = preferred_heap
+        else:
+            heap = min(max(int(budget / n_workers / JVM_OVERHEAD), 0), preferred_heap)
+        if heap < min_heap:
+            logger.warning(f'Available memory may be insufficient for {n_workers} MetaMapLite instance(s):'
+                           f' using minimum heap of {format_heap_size(min_heap)}.')
+            heap = min_heap
+        max_heap = format_heap_size(heap)
+    total = parse_heap_size(max_heap) * JVM_OVERHEAD * n_workers
+    logger.info(f'Planned {n_workers} MetaMapLite instance(s) with heap {max_heap}'
+                f' (index size: {index_size / GB:.1f} GB; available memory:'
+                f' {f"{available / GB:.1f} GB" if available is not None else "unknown"}; CPUs: {cpus};'
+                f' expected usage: {total / GB:.1f} GB).')
+    if budget is not None and total > budget:
+        logger.warning(f'Expected memory usage ({total / GB:.1f} GB) exceeds available memory'
+                       f' ({budget / GB:.1f} GB after reserving {reserve_mb} MB).')
+    return max_heap, n_workers
@@ -0,0 +1,232 @@
+"""
+Sample resource usage of a MetaMapLite/cTAKES subprocess (and its children) while it runs.
+
+On Linux, `/proc/{pid}/stat` and `/proc/{pid}/io` are read every `interval` seconds for the process and its
+    descendants (e.g., the JVM started by cTAKES' shell script): resident memory, CPU time, threads, and bytes
+    read/written. Each run's summary (wall-clock time, documents and bytes processed, docs/sec, MB/sec, CPU
+    utilization, peak memory) is written to `{filelist}.profile.json` (with all samples) and appended to
+    `run_profiles.csv` in the same directory so runs can be compared across hosts, datasets, and JVM settings.
+    Without `/proc` (e.g., Windows), only wall-clock time and throughput are recorded.
+"""
+import csv
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from loguru import logger
+
+PROC = Path('/proc')
+CSV_FILENAME = 'run_profiles.csv'
+CSV_FIELDS = [
+    'started', 'host', 'label', 'returncode', 'wall_seconds', 'n_docs', 'n_bytes', 'docs_per_sec', 'mb_per_sec',
+    'cpu_seconds', 'cpu_utilization', 'peak_rss_mb', 'mean_rss_mb', 'read_mb', 'write_mb', 'max_threads', 'command',
+]
+
+
+def get_report_path(filelist: Path) -> Path:
+    return Path(f'{filelist}.profile.json')
+
+
+def get_file_stats(files) -> tuple[int, int]:
+    """Number of documents and their total size."""
+    n_docs = 0
+    n_bytes = 0
+    for file in files:
+        n_docs += 1
+        try:
+            n_bytes += os.stat(file).st_size
+        except FileNotFoundError:
+            pass
+    return n_docs, n_bytes
+
+
+def _read_stat(pid):
+    """
+    (cpu seconds, rss bytes, threads, parent pid) from `/proc/{pid}/stat`. Cpu excludes reaped children (`cutime`,
+        `cstime`) as each descendant is sampled separately (and its last sample kept after it exits).
+    """
+    with open(PROC / str(pid) / 'stat') as fh:
+        data = fh.read()
+    fields = data[data.rindex(')') + 2:].split()  # command may contain spaces/parentheses
+    utime, stime = (int(x) for x in fields[11:13])
+    cpu = (utime + stime) / os.sysconf('SC_CLK_TCK')
+    return cpu, int(fields[21]) * os.sysconf('SC_PAGE_SIZE'), int(fields[17]), int(fields[1])
+
+
+def _read_io(pid):
+    """(read bytes, write bytes) from `/proc/{pid}/io` (storage I/O, falling back to all reads/writes)."""
+    try:
+        with open(PROC / str(pid) / 'io') as fh:
+            values = dict(line.split(': ') for line in fh.read().splitlines())
+    except (PermissionError, FileNotFoundError, ValueError):
+        return 0, 0
+    read = values.get('read_bytes', values.get('rchar', 0))
+    write = values.get('write_bytes', values.get('wchar', 0))
+    return int(read), int(write)
+
+
+def get_descendants(pid) -> list[int]:
+    """Process ids of `pid` and all its descendants."""
+    parents = {}
+    for entry in os.scandir(PROC):
+        if not entry.name.isdigit():
+            continue
+        try:
+            parents[int(entry.name)] = _read_stat(entry.name)[3]
+        except (FileNotFoundError, ProcessLookupError, ValueError, IndexError):
+            continue
+    pids = [pid]
+    i = 0
+    while i < len(pids):
+        pids += [child for child, parent in parents.items() if parent == pids[i]]
+        i += 1
+    return pids
+
+
+class ProcessSampler:
+    """Record resource usage of a process tree every `interval` seconds in a background thread."""
+
+    def __init__(self, pid, interval=1.0):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.available = PROC.joinpath(str(pid)).exists()
+        self._totals = {}  # pid -> (cpu, read, write): cumulative values are kept after a child exits
+        self._stopping = threading.Event()
+        self._thread = None
+        self.start_time = None
+
+    def sample(self):
+        rss = 0
+        threads = 0
+        for pid in get_descendants(self.pid):
+            try:
+                cpu, pid_rss, pid_threads, _ = _read_stat(pid)
+                read, write = _read_io(pid)
+            except (FileNotFoundError, ProcessLookupError, ValueError, IndexError):
+                continue  # exited
+            self._totals[pid] = (cpu, read, write)
+            rss += pid_rss
+            threads += pid_threads
+        self.samples.append({
+            'seconds': time.time() - self.start_time,
+            'rss_bytes': rss,
+            'cpu_seconds': sum(x[0] for x in self._totals.values()),
+            'read_bytes': sum(x[1] for x in self._totals.values()),
+            'write_bytes': sum(x[2] for x in self._totals.values()),
+            'threads': threads,
+        })
+
+    def _run(self):
+        while True:
+            self.sample()
+            if self._stopping.wait(self.interval):
+                return
+
+    def start(self):
+        self.start_time = time.time()
+        if not self.available:
+            logger.info(f'Cannot profile process {self.pid}: /proc is not available.')
+            return self
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> list[dict]:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.samples
+
+
+def summarize(samples, *, wall_seconds, n_docs=None, n_bytes=None) -> dict:
+    summary = {
+        'wall_seconds': round(wall_seconds, 3),
+        'n_docs': n_docs,
+        'n_bytes': n_bytes,
+        'docs_per_sec': n_docs / wall_seconds if n_docs is not None and wall_seconds else None,
+        'mb_per_sec': n_bytes / 1024 ** 2 / wall_seconds if n_bytes is not None and wall_seconds else None,
+    }
+    if samples:
+        last = samples[-1]
+        rss = [s['rss_bytes'] for s in samples if s['rss_bytes']] or [0]
+        summary.update({
+            'cpu_seconds': last['cpu_seconds'],
+            'cpu_utilization': last['cpu_seconds'] / wall_seconds if wall_seconds else None,
+            'peak_rss_mb': max(rss) / 1024 ** 2,
+            'mean_rss_mb': sum(rss) / len(rss) / 1024 ** 2,
+            'read_mb': last['read_bytes'] / 1024 ** 2,
+            'write_mb': last['write_bytes'] / 1024 ** 2,
+            'max_threads': max(s['threads'] for s in samples),
+        })
+    return summary
+
+
+def build_summary(samples, *, started, returncode, files=None, label=None, command=None) -> dict:
+    """Summary of a run which began at `started` (epoch seconds) and processed `files`."""
+    n_docs, n_bytes = get_file_stats(files) if files is not None else (None, None)
+    return {
+        'started': datetime.fromtimestamp(started).isoformat(),
+        'host': socket.gethostname(),
+        'label': label,
+        'returncode': returncode,
+        'command': command,
+        **summarize(samples, wall_seconds=time.time() - started, n_docs=n_docs, n_bytes=n_bytes),
+    }
+
+
+def write_run_report(report_path: Path, summary: dict, samples=None, csv_path: Path = None):
+    """Write summary and samples to json, and append summary to csv (default: `run_profiles.csv` alongside)."""
+    report_path = Path(report_path)
+    with open(report_path, 'w', encoding='utf8') as out:
+        json.dump({**summary, 'samples': samples or []}, out, indent=2)
+    csv_path = Path(csv_path or report_path.parent / CSV_FILENAME)
+    is_new = not csv_path.exists()
+    with open(csv_path, 'a', newline='', encoding='utf8') as out:
+        writer = csv.DictWriter(out, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        if is_new:
+            writer.writeheader()
+        writer.writerow(summary)
+    details = [f'{summary["wall_seconds"]:.0f} seconds']
+    if summary['docs_per_sec'] is not None:
+        details.append(f'{summary["docs_per_sec"]:.2f} docs/sec')
+    if 'peak_rss_mb' in summary:
+        details.append(f'peak memory {summary["peak_rss_mb"]:,.0f} MB')
+    logger.info(f'Run profile: {", ".join(details)} (see {report_path}).')
+
+
+def profile_process(proc: subprocess.Popen, report_path: Path, *, files=None, label=None, interval=1.0,
+                    started=None):
+    """
+    Sample `proc` until it exits and write a run report; returns the summary.
+    :param files: files processed, or a function returning them (called once `proc` has exited)
+    """
+    started = started or time.time()
+    sampler = ProcessSampler(proc.pid, interval=interval).start()
+    proc.wait()
+    samples = sampler.stop()
+    if callable(files):
+        files = files()
+    command = ' '.join(str(x) for x in proc.args) if isinstance(proc.args, (list, tuple)) else str(proc.args)
+    summary = build_summary(samples, started=started, returncode=proc.returncode, files=files, label=label,
+                            command=command)
+    write_run_report(report_path, summary, samples)
+    return summary
+
+
+def run_profiled(cmd, report_path: Path, *, files=None, label=None, interval=1.0, **kwargs):
+    """Like `subprocess.run`, but sample resource usage and write a run report."""
+    started = time.time()
+    proc = subprocess.Popen(cmd, **kwargs)
+    try:
+        profile_process(proc, report_path, files=files, label=label, interval=interval, started=started)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    return subprocess.CompletedProcess(proc.args, proc.returncode)
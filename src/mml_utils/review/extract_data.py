@@ -11,6 +11,8 @@ from typing import List
 
 from loguru import logger
 
+from mml_utils.layout import iter_files
+from mml_utils.note_store import NoteStore, get_note_id
 from mml_utils.parse.parser import extract_mml_data
 from mml_utils.parse.target_cuis import TargetCuis
 from mml_utils.review.build_excel import compile_to_excel
@@ -95,9 +97,10 @@ def mkdir(path):
 def extract_data_for_review(note_directories: List[pathlib.Path], target_path: pathlib.Path = pathlib.Path('.'),
                             mml_format='json', text_extension='', text_encoding='utf8',
                             text_errors='replace', add_cr=False, sample_size=50, metadata_file=None,
-                            replacements=None):
+                            replacements=None, note_store: pathlib.Path = None):
     """
 
+    :param note_store: read note text from this note store (see `note_store`) rather than text files
     :param text_errors:
     :param add_cr:
     :param sample_size:
@@ -121,6 +124,7 @@ def extract_data_for_review(note_directories: List[pathlib.Path], target_path: p
     note_ids = defaultdict(list)
     # limit note ids to just those in a metadata csv file
     limit_note_ids = _get_note_ids_from_metadata_csv(metadata_file) if metadata_file else None
+    store = NoteStore(note_store) if note_store else None
     # run separately for each feature
     for feature_name in get_feature_names_from_directory(target_path):
         target_cuis = TargetCuis.fromdict(load_first_column(target_path / f'{feature_name}.cui.txt'))
@@ -140,19 +144,25 @@ def extract_data_for_review(note_directories: List[pathlib.Path], target_path: p
                 logger.info(f'Reading directory {note_directory}.')
                 note_count = 0
                 no_text_file_count = 0
-                for mml_file in note_directory.glob(f'*.{mml_format}'):
+                for mml_file in iter_files(note_directory, f'.{mml_format}'):
                     note_id = mml_file.stem
                     if limit_note_ids and note_id not in limit_note_ids:
                         continue
-                    txt_file = note_directory / f'{note_id}{text_extension}'
-                    if not txt_file.exists():
-                        logger.warning(f'Failed to find corresponding text file:'
-                                       f' {txt_file.name} (extension: {text_extension}).')
-                        no_text_file_count += 1
-                        continue
+                    if store is not None:
+                        if (text := store.get_text(get_note_id(mml_file), errors=text_errors)) is None:
+                            logger.warning(f'Failed to find note {note_id} in {store.path}.')
+                            no_text_file_count += 1
+                            continue
+                    else:
+                        txt_file = mml_file.parent / f'{note_id}{text_extension}'
+                        if not txt_file.exists():
+                            logger.warning(f'Failed to find corresponding text file:'
+                                           f' {txt_file.name} (extension: {text_extension}).')
+                            no_text_file_count += 1
+                            continue
+                        with open(txt_file, encoding=text_encoding, errors=text_errors) as fh:
+                            text = fh.read()
                     note_count += 1
-                    with open(txt_file, encoding=text_encoding, errors=text_errors) as fh:
-                        text = fh.read()
                     if add_cr:
                         text = text.replace('\n', '\r\n')
                     if replacements:
@@ -172,6 +182,8 @@ def extract_data_for_review(note_directories: List[pathlib.Path], target_path: p
                 logger.info(f'Completed processing {note_count} notes (Total Matches: {unique_id}).')
                 if no_text_file_count:
                     logger.warning(f'Failed to find {no_text_file_count} text files.')
+    if store is not None:
+        store.close()
     if sample_size:
         compile_to_excel(outpath, note_ids, text_encoding, sample_size, metadata_file)
     return outpath
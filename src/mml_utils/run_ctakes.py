@@ -4,10 +4,11 @@ from pathlib import Path
 from loguru import logger
 
 from mml_utils.os_utils import bat_or_sh
+from mml_utils.profiling import get_report_path, run_profiled
 
 
 def run_ctakes(directory: Path, ctakes_home: Path, outdir: Path, umls_key: str = None,
-               dictionary: Path = None):
+               dictionary: Path = None, profile=False):
     """
     Run `runClinicalPipeline.bat` from cTAKES installation directory.
     :param dictionary: path to XML file associated with custom-built dictionary
@@ -15,6 +16,7 @@ def run_ctakes(directory: Path, ctakes_home: Path, outdir: Path, umls_key: str =
     :param directory: directory containing text files to run cTAKES on
     :param ctakes_home: home directory of cTAKES, e.g., C:/apache-ctakes-4.x.y.z
     :param outdir: directory to output xmi files
+    :param profile: sample resource usage and write run report to `{directory}.profile.json` (see `profiling`)
     :return:
     """
     logger.info(f'Running cTAKES in {directory}.')
@@ -26,7 +28,12 @@ def run_ctakes(directory: Path, ctakes_home: Path, outdir: Path, umls_key: str =
     logger.info(f'* If heap space error, consider increasing integer value in {exe_path}: `-Xmx2g`')
     logger.info(f'* If "trying to serialize non-XML character", add `--clean-files` argument.')
     cmd = cmd_line.split()
-    res = subprocess.run(cmd, shell=True, universal_newlines=True, cwd=ctakes_home)
+    if profile:
+        files = [p for p in Path(directory).iterdir() if p.is_file()]
+        res = run_profiled(cmd, get_report_path(Path(directory)), files=files, label='ctakes',
+                           shell=True, universal_newlines=True, cwd=ctakes_home)
+    else:
+        res = subprocess.run(cmd, shell=True, universal_newlines=True, cwd=ctakes_home)
     if res.returncode != 0:
         logger.warning(f'cTAKES returned with status code {res.returncode}.')
         logger.info(f'cTAKES STDERR: {res.stderr}')
@@ -0,0 +1,239 @@
+"""
+Run full MetaMap over many files in parallel from Python (rather than with the shell scripts from `mml-build-mmscript`).
+
+MetaMap runs on a single input/output file pair per invocation. Up to `n_workers` invocations are run at once; files
+    whose `.mmi` output already exists are skipped, so re-running resumes. Failed invocations are retried, and, as
+    MetaMap depends on the SKR/MedPost tagger (`skrmedpostctl`) and WSD (`wsdserverctl`) servers, these are
+    health-checked (by connecting to their ports) and restarted when they are down. The time taken by each
+    invocation is appended to a csv file (`latency_path`).
+"""
+import csv
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from loguru import logger
+
+from mml_utils.build.mm_scripts import iter_mm_targets
+
+SERVERS = {  # control script -> port
+    'skrmedpostctl': 1795,
+    'wsdserverctl': 5554,
+}
+LATENCY_FIELDS = ['time', 'file', 'outfile', 'worker', 'attempt', 'status', 'returncode', 'seconds']
+
+
+def get_mm_bin(mm_path) -> Path | None:
+    """Directory containing the metamap executable (and the server control scripts)."""
+    path = shutil.which(str(mm_path))
+    return Path(path).parent if path else None
+
+
+def is_port_open(port, host='localhost', timeout=1.0) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class MmServers:
+    """Check that the servers MetaMap relies on are accepting connections, and restart those which are not."""
+
+    def __init__(self, bin_dir: Path, servers: dict = None, *, host='localhost', start_timeout=120,
+                 check_interval=60):
+        """
+        :param bin_dir: directory containing the server control scripts (e.g., `public_mm/bin`)
+        :param servers: control script -> port (default: tagger and WSD servers)
+        :param start_timeout: seconds to wait for a server to accept connections after starting it
+        :param check_interval: minimum seconds between routine health checks
+        """
+        self.bin_dir = Path(bin_dir)
+        self.servers = SERVERS if servers is None else servers
+        self.host = host
+        self.start_timeout = start_timeout
+        self.check_interval = check_interval
+        self.last_check = 0
+        self.restarts = 0
+        self.lock = threading.Lock()
+
+    def get_down(self) -> list[str]:
+        return [name for name, port in self.servers.items() if not is_port_open(port, self.host)]
+
+    def ensure(self, force=False) -> bool:
+        """Restart any servers which are down; returns True if all servers are up."""
+        with self.lock:
+            if not force and time.time() - self.last_check < self.check_interval:
+                return True
+            healthy = True
+            for name in self.get_down():
+                healthy &= self.restart(name)
+            self.last_check = time.time()
+            return healthy
+
+    def restart(self, name) -> bool:
+        script = self.bin_dir / name
+        logger.warning(f'{name} is not accepting connections on port {self.servers[name]}: restarting.')
+        self.restarts += 1
+        subprocess.run([str(script), 'stop'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        subprocess.run([str(script), 'start'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + self.start_timeout
+        while time.time() < deadline:
+            if is_port_open(self.servers[name], self.host):
+                logger.info(f'Restarted {name}.')
+                return True
+            time.sleep(min(1, self.start_timeout))
+        logger.error(f'{name} did not start accepting connections within {self.start_timeout} seconds.')
+        return False
+
+
+class MetaMapExecutor:
+    """Run MetaMap on each (input file, output file, parameters) task with at most `n_workers` at once."""
+
+    def __init__(self, tasks, mm_path='metamap', *, n_workers=4, retries=2, timeout=None,
+                 servers: MmServers = None, latency_path: Path = None):
+        """
+        :param tasks: iterable of (input file, output mmi file, parameters string)
+        :param mm_path: metamap executable
+        :param n_workers: maximum number of metamap processes to run at once
+        :param retries: times to re-run a file after metamap fails (or times out)
+        :param timeout: seconds after which metamap is killed (None: wait forever)
+        :param servers: servers to health-check before running and after failures (None: do not check)
+        :param latency_path: csv file to append each invocation's time taken and status to
+        """
+        self.tasks = list(tasks)
+        self.mm_path = str(mm_path)
+        self.n_workers = n_workers
+        self.retries = retries
+        self.timeout = timeout
+        self.servers = servers
+        self.latency_path = latency_path
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.active = {}  # worker thread -> process
+        self.completed = []
+        self.skipped = []
+        self.failed = []
+
+    def run(self):
+        """Run all tasks; returns lists of completed, skipped (output already exists), and failed input files."""
+        todo = []
+        for file, outfile, parameters in self.tasks:
+            if Path(outfile).exists():
+                self.skipped.append(file)
+            else:
+                todo.append((file, Path(outfile), parameters))
+        logger.info(f'Running metamap on {len(todo):,} files with {self.n_workers} workers'
+                    f' (skipping {len(self.skipped):,} with existing output).')
+        if todo and self.servers is not None and not self.servers.ensure(force=True):
+            logger.warning(f'Servers are not all running: metamap may fail.')
+        for outdir in {outfile.parent for _, outfile, _ in todo}:
+            outdir.mkdir(parents=True, exist_ok=True)
+        start_time = time.time()
+        pool = ThreadPoolExecutor(max_workers=self.n_workers, thread_name_prefix='metamap')
+        try:
+            for future in [pool.submit(self._run_task, *task) for task in todo]:
+                future.result()
+        except KeyboardInterrupt:
+            self.stop()
+            pool.shutdown(cancel_futures=True)
+            logger.warning(f'Stopped early: re-run to resume the remaining files.')
+        else:
+            pool.shutdown()
+        elapsed = time.time() - start_time
+        logger.info(f'Completed {len(self.completed):,} files in {elapsed:.0f} seconds'
+                    f' ({len(self.completed) / elapsed if elapsed else 0:.2f} files/sec);'
+                    f' {len(self.failed):,} failed.')
+        if self.servers is not None and self.servers.restarts:
+            logger.warning(f'Servers were restarted {self.servers.restarts} times.')
+        if self.failed:
+            logger.warning(f'Metamap failed on: {", ".join(str(f) for f in self.failed[:20])}')
+        return self.completed, self.skipped, self.failed
+
+    def stop(self):
+        self.stopping.set()
+        with self.lock:
+            for proc in self.active.values():
+                proc.terminate()
+
+    def _run_task(self, file, outfile: Path, parameters=''):
+        tmpfile = outfile.with_name(f'{outfile.name}.tmp')  # only renamed to `outfile` once complete
+        cmd = [self.mm_path, *shlex.split(parameters), str(file), str(tmpfile)]
+        worker = threading.current_thread().name
+        for attempt in range(1, self.retries + 2):
+            if self.stopping.is_set():
+                return
+            if self.servers is not None:
+                self.servers.ensure()
+            start = time.time()
+            with self.lock:
+                proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                        universal_newlines=True)
+                self.active[worker] = proc
+            try:
+                _, stderr = proc.communicate(timeout=self.timeout)
+                status = 'done' if proc.returncode == 0 else 'failed'
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                _, stderr = proc.communicate()
+                status = 'timeout'
+            finally:
+                with self.lock:
+                    del self.active[worker]
+            if status == 'done':
+                try:
+                    os.replace(tmpfile, outfile)
+                except FileNotFoundError:
+                    status = 'failed'  # no output written
+            self._record(file, outfile, worker, attempt, status, proc.returncode, time.time() - start)
+            if status == 'done':
+                with self.lock:
+                    self.completed.append(file)
+                return
+            tmpfile.unlink(missing_ok=True)
+            if self.stopping.is_set():
+                return
+            logger.warning(f'Metamap {status} on {file} (attempt {attempt}, status code {proc.returncode}):'
+                           f' {stderr.strip()[-500:] if stderr else ""}')
+            if self.servers is not None:
+                self.servers.ensure(force=True)
+        with self.lock:
+            self.failed.append(file)
+
+    def _record(self, file, outfile, worker, attempt, status, returncode, seconds):
+        if self.latency_path is None:
+            return
+        with self.lock:
+            is_new = not os.path.exists(self.latency_path)
+            with open(self.latency_path, 'a', newline='', encoding='utf8') as out:
+                writer = csv.DictWriter(out, fieldnames=LATENCY_FIELDS)
+                if is_new:
+                    writer.writeheader()
+                writer.writerow({
+                    'time': datetime.now().isoformat(), 'file': file, 'outfile': outfile, 'worker': worker,
+                    'attempt': attempt, 'status': status, 'returncode': returncode, 'seconds': round(seconds, 3),
+                })
+
+
+def get_mm_tasks(parameters='', filelist: Path = None, directory: Path = None, mm_outpath: Path = None,
+                 replace=None) -> list[tuple]:
+    """Tasks for `MetaMapExecutor`: same input and output files as `build_mm_script`."""
+    if filelist is None and directory is None:
+        raise ValueError(f'Either `filelist` or `directory` must be specified.')
+    return [(file, outfile, parameters)
+            for file, outfile in iter_mm_targets(directory, filelist, mm_outpath, replace)]
+
+
+def get_mm_tasks_from_config(config) -> list[tuple]:
+    """Tasks for each run in a `MultiBuildMMScript` config (as for `mml-build-mmscript-multi`)."""
+    tasks = []
+    for run in config.runs:
+        tasks += get_mm_tasks(run.parameters, config.filelist, config.directory, run.mm_outpath, config.replace)
+    return tasks
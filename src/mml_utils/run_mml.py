@@ -1,12 +1,19 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import shutil
 import subprocess
+import time
 from string import Template
 
 from loguru import logger
 
+from mml_utils.cache import MmlCache, get_config_key
+from mml_utils.filelists import FilelistProgress, read_filelist
+from mml_utils.manifest import RunManifest
+from mml_utils.profiling import get_report_path, run_profiled
 from mml_utils.os_utils import get_cp_sep, is_windows
+from mml_utils.planner import AUTO_HEAP, plan_mml_resources
 
 LOG4J_CONFIG = Template('''<?xml version="1.0" encoding="UTF-8"?>
 <Configuration status="$LOGLEVEL">
@@ -52,16 +59,8 @@ def get_umls_versions(cwd: Path):
     return sorted(options, reverse=True)
 
 
-def run_mml(filename, cwd: Path, *, output_format='files', restrict_to_sts=None, restrict_to_src=None,
-            property_file=None, properties=None, is_filelist=True, version=None, dataset='USAbase',
-            loglevel='WARN'):
-    restrict_to_sts = f"--restrict_to_sts={','.join(restrict_to_sts)}" if restrict_to_sts else ''
-    restrict_to_src = f"--restrict_to_sources={','.join(restrict_to_src)}" if restrict_to_src else ''
-
-    # handle properties
-    property_file = f'-Dmetamaplite.property.file={property_file}' if property_file else ''
-
-    # handle version/dataset
+def resolve_umls_version(cwd: Path, version=None, dataset='USAbase'):
+    """Find an installed UMLS version/dataset, falling back to the newest version containing `dataset`."""
     installed_versions = get_umls_versions(cwd / 'data' / 'ivf')
     if version is None or (version, dataset) not in installed_versions:
         logger.warning(f'UMLS Version and/or Dataset NOT SPECIFIED or NOT FOUND!')
@@ -75,6 +74,32 @@ def run_mml(filename, cwd: Path, *, output_format='files', restrict_to_sts=None,
             logger.info(f'> Version: {version_}, Dataset: {dataset_}{selected_version}')
     if version is None or not (cwd / 'data' / 'ivf' / version / dataset).exists():
         raise ValueError(f'UMLS Version/Dataset does not exist: {version}/{dataset}.')
+    return version, dataset
+
+
+def resolve_max_heap(cwd: Path, max_heap, *, version=None, dataset='USAbase', n_workers=1):
+    """
+    Heap size to run MetaMapLite with: `max_heap`, or, if 'auto', as chosen by `planner.plan_mml_resources` for
+        `n_workers` instances. Resolve once per run rather than for each command.
+    """
+    if max_heap != AUTO_HEAP:
+        return max_heap
+    version, dataset = resolve_umls_version(cwd, version, dataset)
+    max_heap, _ = plan_mml_resources(cwd / 'data' / 'ivf' / version / dataset, n_workers=n_workers)
+    return max_heap
+
+
+def get_mml_jvm_options(cwd: Path, *, property_file=None, properties=None, version=None, dataset='USAbase',
+                        loglevel='WARN', max_heap='12g'):
+    """
+    Build JVM options (heap size and `-D` properties) required to run MetaMapLite.
+    :param max_heap: maximum heap size (e.g., '12g'), or 'auto' (see `resolve_max_heap`)
+    """
+    # handle properties
+    property_file = f'-Dmetamaplite.property.file={property_file}' if property_file else ''
+
+    # handle version/dataset
+    version, dataset = resolve_umls_version(cwd, version, dataset)
 
     # handle log4j config
     log4j_config_file = cwd / 'config' / f'log4j2-{loglevel}.xml'
@@ -96,7 +121,7 @@ def run_mml(filename, cwd: Path, *, output_format='files', restrict_to_sts=None,
     )
     found_props = set()
     prop_strings = []
-    for key, value in (properties or ()) + default_props:
+    for key, value in tuple(properties or ()) + default_props:
         if key in found_props:
             continue
         prop_strings.append(f'-D{key}={value}')
@@ -104,9 +129,36 @@ def run_mml(filename, cwd: Path, *, output_format='files', restrict_to_sts=None,
     properties = ' '.join(prop_strings)
 
     # JVM options
-    jvm_opts = '-Xmx12g'
+    max_heap = resolve_max_heap(cwd, max_heap, version=version, dataset=dataset)
+    jvm_opts = f'-Xmx{max_heap}'
     # jvm_opts = '-Xmx1024m'  # 32 bit max
-    classpath = get_cp_sep().join(str(x) for x in [
+    return f'{jvm_opts} {property_file} {properties}'
+
+
+def build_mml_command(filename, cwd: Path, *, output_format='files', restrict_to_sts=None, restrict_to_src=None,
+                      property_file=None, properties=None, is_filelist=True, version=None, dataset='USAbase',
+                      loglevel='WARN', max_heap='12g'):
+    """Build the command line to run MetaMapLite on a filelist (or single file)."""
+    restrict_to_sts = f"--restrict_to_sts={','.join(restrict_to_sts)}" if restrict_to_sts else ''
+    restrict_to_src = f"--restrict_to_sources={','.join(restrict_to_src)}" if restrict_to_src else ''
+    jvm_opts = get_mml_jvm_options(cwd, property_file=property_file, properties=properties, version=version,
+                                   dataset=dataset, loglevel=loglevel, max_heap=max_heap)
+    classpath = get_mml_classpath(cwd)
+
+    # metamaplite
+    if is_windows():  # must have quotes in classpath
+        prefix = f'java {jvm_opts} -cp "{classpath}" gov.nih.nlm.nls.ner.MetaMapLite'
+    else:  # cannot have quotes in classpath (ClassNotFoundException)
+        prefix = f'java {jvm_opts} -cp {classpath} gov.nih.nlm.nls.ner.MetaMapLite'
+    file_arg = '--filelistfn' if is_filelist else '--filelist'
+    return (f'{prefix} {file_arg}={filename} --outputformat={output_format}'
+            f' --overwrite --usecontext {restrict_to_sts} {restrict_to_src}'
+            f''.split()
+            )
+
+
+def get_mml_classpath(cwd: Path):
+    return get_cp_sep().join(str(x) for x in [
         cwd / 'target' / 'classes',
         cwd / 'build' / 'classes',
         cwd / 'classes',
@@ -114,31 +166,101 @@ def run_mml(filename, cwd: Path, *, output_format='files', restrict_to_sts=None,
         get_mml_jar(cwd),
     ])
 
-    # metamaplite
+
+def run_mml(filename, cwd: Path, *, output_format='files', restrict_to_sts=None, restrict_to_src=None,
+            property_file=None, properties=None, is_filelist=True, version=None, dataset='USAbase',
+            loglevel='WARN', max_heap='12g', cache: MmlCache = None, manifest: RunManifest = None, profile=False):
+    """
+    Run metamaplite on a filelist (or single file).
+    :param cache: only run metamaplite on files not found in cache (and add their output to the cache)
+    :param manifest: record status of each file in filelist
+    :param profile: sample resource usage and write run report to `{filename}.profile.json` (see `profiling`)
+    """
+    if cache is not None and is_filelist:
+        version, dataset = resolve_umls_version(cwd, version, dataset)
+        config_key = get_config_key(output_format, version=version, dataset=dataset, restrict_to_sts=restrict_to_sts,
+                                    restrict_to_src=restrict_to_src, property_file=property_file,
+                                    properties=properties)
+        files = read_filelist(filename)
+        misses = cache.apply(files, config_key, output_format)
+        if manifest is not None:
+            manifest.mark(set(files) - set(misses), 'done', output_format=output_format)
+        if not misses:
+            logger.info(f'All files found in cache: not running metamaplite.')
+            cache.log_stats()
+            return subprocess.CompletedProcess(args=[], returncode=0)
+        filename = Path(f'{filename}_uncached')
+        with open(filename, 'w', encoding='utf8') as out:
+            for file in misses:
+                out.write(f'{file}\n')
+        start_time = time.time() - 1
+        res = run_mml(filename, cwd, output_format=output_format, restrict_to_sts=restrict_to_sts,
+                      restrict_to_src=restrict_to_src, property_file=property_file, properties=properties,
+                      version=version, dataset=dataset, loglevel=loglevel, max_heap=max_heap, manifest=manifest,
+                      profile=profile)
+        if res.returncode != 0:  # the output of the file in flight might be incomplete
+            progress = FilelistProgress(filename, output_format, since=start_time)
+            progress.update()
+            misses = progress.processed()
+        n_stored = cache.store(misses, config_key, output_format, since=start_time)
+        logger.info(f'Added {n_stored:,} results to cache.')
+        cache.log_stats()
+        return res
+    cmd = build_mml_command(
+        filename, cwd, output_format=output_format, restrict_to_sts=restrict_to_sts,
+        restrict_to_src=restrict_to_src, property_file=property_file, properties=properties,
+        is_filelist=is_filelist, version=version, dataset=dataset, loglevel=loglevel, max_heap=max_heap,
+    )
     logger.info(f'Running Metamaplite on current set (install location: {cwd})')
-    if is_windows():  # must have quotes in classpath
-        prefix = f'java {jvm_opts} {property_file} {properties} -cp "{classpath}" gov.nih.nlm.nls.ner.MetaMapLite'
-    else:  # cannot have quotes in classpath (ClassNotFoundException)
-        prefix = f'java {jvm_opts} {property_file} {properties} -cp {classpath} gov.nih.nlm.nls.ner.MetaMapLite'
-    file_arg = '--filelistfn' if is_filelist else '--filelist'
-    cmd = (f'{prefix} {file_arg}={filename} --outputformat={output_format}'
-           f' --overwrite --usecontext {restrict_to_sts} {restrict_to_src}'
-           f''.split()
-           )
     logger.debug('Running command >> ' + ' '.join(cmd))
-    res = subprocess.run(cmd, universal_newlines=True, cwd=cwd, env=os.environ | get_env(cwd),
-                         # stderr=subprocess.PIPE  # TODO: this will collect all logging and send to stderr
-                         )
+    progress = None
+    if is_filelist and (manifest is not None or profile):
+        progress = FilelistProgress(filename, output_format, since=time.time() - 1)
+    if manifest is not None and progress is not None:
+        manifest.set_shard(progress.files, filename, status='running')
+    if profile:
+        res = run_profiled(cmd, get_report_path(filename),
+                           # only count documents actually processed (e.g., if metamaplite failed part way)
+                           files=(lambda: progress.files[:progress.update()]) if is_filelist else [filename],
+                           label=f'metamaplite {dataset}',
+                           universal_newlines=True, cwd=cwd, env=os.environ | get_env(cwd))
+    else:
+        res = subprocess.run(cmd, universal_newlines=True, cwd=cwd, env=os.environ | get_env(cwd),
+                             # stderr=subprocess.PIPE  # TODO: this will collect all logging and send to stderr
+                             )
     if res.returncode != 0:
         logger.warning(f'Metamaplite returned with status code {res.returncode}.')
         logger.info(f'MML STDERR: {res.stderr}')
         logger.info(f'If no stderr, consider re-running with DEBUG mode.')
+    if manifest is not None and progress is not None:
+        manifest.mark_progress(progress, error=f'status code {res.returncode}' if res.returncode != 0 else None)
     return res
 
 
 def repeat_run_mml(filename, cwd, *, output_format='files', restrict_to_sts=None, max_retry=10,
                    property_file=None, properties=None, version=None, dataset='USAbase',
-                   loglevel='WARN', **kwargs):
+                   loglevel='WARN', max_heap='12g', isolate_failures='first', n_workers=2, cache=None,
+                   manifest: RunManifest = None, profile=False, **kwargs):
+    """
+    Run metamaplite, re-running on the remaining files if it fails.
+    :param max_retry: maximum number of failed files to isolate before giving up
+    :param isolate_failures: how to find files causing metamaplite to fail
+        * first: assume the first file without output caused the failure; skip it and re-run on the rest
+        * bisect: repeatedly split the remaining files in halves, running these in parallel (see `bisect_run_mml`)
+    :param n_workers: number of metamaplite instances to run at once when `isolate_failures='bisect'`
+    :param cache: `MmlCache` to look up files in before running metamaplite
+    :param manifest: `RunManifest` to record status of each file (and look up completed files)
+    :param profile: write a run report for each run of metamaplite (see `profiling`)
+    :return: list of files which caused metamaplite to fail
+    """
+    if isolate_failures == 'bisect':
+        return bisect_run_mml(filename, cwd, output_format=output_format, restrict_to_sts=restrict_to_sts,
+                              property_file=property_file, properties=properties, version=version,
+                              dataset=dataset, loglevel=loglevel, max_heap=max_heap, n_workers=n_workers,
+                              cache=cache, manifest=manifest, profile=profile, max_retry=max_retry)
+    elif isolate_failures != 'first':
+        raise ValueError(f'Unrecognized method to isolate failures: {isolate_failures}.')
+    max_heap = resolve_max_heap(cwd, max_heap, version=version, dataset=dataset)  # once for all retries
     filelist_version = 0
     return_code = 1
     total_completed = 0
@@ -148,7 +270,7 @@ def repeat_run_mml(filename, cwd, *, output_format='files', restrict_to_sts=None
     filename = f'{orig_filename}_{filelist_version}'
     shutil.copy(orig_filename, filename)
 
-    res = None
+    failed_files = []
     while return_code != 0:
         res = run_mml(
             filename,
@@ -160,6 +282,10 @@ def repeat_run_mml(filename, cwd, *, output_format='files', restrict_to_sts=None
             version=version,
             dataset=dataset,
             loglevel=loglevel,
+            max_heap=max_heap,
+            cache=cache,
+            manifest=manifest,
+            profile=profile,
         )
         return_code = res.returncode
         if return_code == 0:
@@ -173,9 +299,14 @@ def repeat_run_mml(filename, cwd, *, output_format='files', restrict_to_sts=None
                 open(f'{orig_filename}_{filelist_version}', 'w', encoding='utf8') as out:
             missing_count = 0
             still_todo = 0
-            for file in fh.read().split('\n'):
-                outfile = Path(f'{file}.files')
-                if outfile.exists():
+            files = fh.read().split('\n')
+            done = manifest.get_done(files) if manifest is not None else None
+            for file in files:
+                if done is not None:
+                    is_done = file in done
+                else:
+                    is_done = Path(f'{file}.files').exists()
+                if is_done:
                     total_completed += 1
                     continue
                 elif missing_count == 0:  # first record assumed to be faulty
@@ -183,6 +314,9 @@ def repeat_run_mml(filename, cwd, *, output_format='files', restrict_to_sts=None
                                 f'Metamaplite has difficulty with control (and other) characters. '
                                 f'You can retry MML on just that file.')
                     err.write(f'{file}\n')
+                    failed_files.append(file)
+                    if manifest is not None:
+                        manifest.mark([file], 'failed', error=f'status code {return_code}')
                 else:
                     still_todo += 1
                     out.write(f'{file}\n')
@@ -194,8 +328,90 @@ def repeat_run_mml(filename, cwd, *, output_format='files', restrict_to_sts=None
         logger.info(f'Completed: {total_completed}')
         if filelist_version > max_retry:
             logger.error(f'Too many retries: {max_retry}; exiting process.')
+            break
     if total_completed == -1:
         logger.info(f'Completed all.')
     else:
         logger.info(f'Completed all: {total_completed}')
-    return res
+    return failed_files
+
+
+def bisect_run_mml(filename, cwd, *, output_format='json', n_workers=2, max_retry=10, **kwargs):
+    """
+    Run metamaplite on filelist, isolating files which cause metamaplite to fail.
+
+    When a run fails, the files without output are split in half and each half is re-run (in parallel). This
+        repeats until each failing run contains a single file, which is then recorded in `errors.txt`.
+        Multiple problem files are thus found in about log2(n) rounds, regardless of where they occur in the list.
+        Bisection stops early if more than `max_retry` files fail, or if no run has processed any file after a
+        round of at least 4 runs, which suggests a problem with metamaplite itself (e.g., memory) rather than
+        individual files.
+    :param filename: filelist
+    :param cwd: path to metamaplite home
+    :param n_workers: maximum number of metamaplite instances to run at once
+    :param max_retry: maximum number of failed files to isolate before giving up
+    :param kwargs: passed to `run_mml`
+    :return: list of files which caused metamaplite to fail
+    """
+    filename = Path(filename)
+    error_path = filename.parent / 'errors.txt'
+    bisect_dir = filename.parent / f'{filename.stem}_bisect'
+    bisect_dir.mkdir(exist_ok=True)
+    kwargs['version'], kwargs['dataset'] = resolve_umls_version(cwd, kwargs.get('version'),
+                                                                kwargs.get('dataset', 'USAbase'))
+    kwargs['max_heap'] = resolve_max_heap(cwd, kwargs.get('max_heap', '12g'), version=kwargs['version'],
+                                          dataset=kwargs['dataset'], n_workers=n_workers)
+    segments = [read_filelist(filename)]
+    failed_files = []
+    n_round = 0
+    any_processed = False
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        while segments:
+            logger.info(f'Bisection round {n_round}: running metamaplite on {len(segments)} sets'
+                        f' ({sum(len(segment) for segment in segments):,} files).')
+            segment_paths = []
+            for i, segment in enumerate(segments):
+                segment_path = bisect_dir / f'{filename.stem}_{n_round}_{i}.txt'
+                with open(segment_path, 'w', encoding='utf8') as out:
+                    for file in segment:
+                        out.write(f'{file}\n')
+                segment_paths.append(segment_path)
+            results = pool.map(
+                lambda segment_path: _run_mml_segment(segment_path, cwd, output_format=output_format, **kwargs),
+                segment_paths
+            )
+            results = list(results)
+            any_processed |= any(remaining != segment for segment, remaining in zip(segments, results))
+            if not any_processed and len(segments) >= 4:
+                logger.error(f'Metamaplite has failed on every set through round {n_round} without processing any'
+                             f' files: stopping as this is unlikely to be caused by individual files.')
+                break
+            next_segments = []
+            for remaining in results:
+                if len(remaining) == 1:
+                    logger.info(f'Failed file: {remaining[0]}. '
+                                f'Metamaplite has difficulty with control (and other) characters. '
+                                f'You can retry MML on just that file.')
+                    failed_files.append(remaining[0])
+                elif remaining:
+                    mid = len(remaining) // 2
+                    next_segments += [remaining[:mid], remaining[mid:]]
+            segments = next_segments
+            n_round += 1
+            if len(failed_files) > max_retry:
+                logger.error(f'Too many failed files: {len(failed_files)} > {max_retry}; stopping.')
+                break
+    with open(error_path, 'a', encoding='utf8') as err:
+        for file in failed_files:
+            err.write(f'{file}\n')
+    logger.info(f'Completed all after {n_round} rounds: {len(failed_files)} failed files written to {error_path}.')
+    return failed_files
+
+
+def _run_mml_segment(segment_path, cwd, *, output_format='json', **kwargs):
+    """Run metamaplite on filelist, returning files which were not processed if it fails."""
+    progress = FilelistProgress(segment_path, output_format, since=time.time() - 1)
+    res = run_mml(segment_path, cwd, output_format=output_format, **kwargs)
+    if res.returncode == 0:
+        return []
+    return [file for file in progress.files if not progress.is_done(file)]
@@ -0,0 +1,59 @@
+"""
+Read (note_id, text) from large sas7bdat files in parallel (`mml-sas-to-txt --n-workers`), requires `pyreadstat`.
+
+`pd.read_sas` decodes the whole file on a single core. Instead, the file's rows are split into chunks of `chunksize`
+    rows, and each chunk is decoded by a worker process (with `pyreadstat`, which seeks to the chunk's rows rather than
+    decoding those before it). Only the id and text columns are decoded, and each is converted to a list at once
+    rather than row by row. Chunks are returned in order, with at most 2 chunks per worker decoded ahead.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    import pyreadstat
+except ImportError:
+    pyreadstat = None
+
+
+def _require_pyreadstat():
+    if pyreadstat is None:
+        raise ImportError(f'Pyreadstat is required to read sas7bdat files in parallel:'
+                          f' Install pyreadstat with `pip install pyreadstat`.')
+
+
+def get_row_count(path: Path) -> int:
+    _require_pyreadstat()
+    _, meta = pyreadstat.read_sas7bdat(str(path), metadataonly=True)
+    return meta.number_rows
+
+
+def read_chunk(path: Path, id_col, text_col, row_offset, row_limit, encoding='latin1',
+               id_as_int=False) -> tuple[list, list]:
+    """Ids and texts of `row_limit` rows starting at `row_offset`."""
+    df, _ = pyreadstat.read_sas7bdat(str(path), usecols=[id_col, text_col], row_offset=row_offset,
+                                     row_limit=row_limit, encoding=encoding)
+    ids = df[id_col].astype('int64') if id_as_int else df[id_col]
+    return ids.tolist(), df[text_col].tolist()
+
+
+def iter_chunks(path: Path, id_col, text_col, *, encoding='latin1', id_as_int=False, chunksize=100_000,
+                n_workers=4, start_chunk=0):
+    """Yield (chunk index, ids, texts) for each chunk (from `start_chunk`) in order."""
+    n_rows = get_row_count(path)
+    n_chunks = -(-n_rows // chunksize)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        try:
+            for chunk in range(start_chunk, n_chunks):
+                pending.append((chunk, pool.submit(read_chunk, path, id_col, text_col, chunk * chunksize,
+                                                   chunksize, encoding, id_as_int)))
+                if len(pending) >= 2 * n_workers:
+                    chunk, future = pending.popleft()
+                    yield chunk, *future.result()
+            while pending:
+                chunk, future = pending.popleft()
+                yield chunk, *future.result()
+        finally:  # e.g., stopped early
+            for _, future in pending:
+                future.cancel()
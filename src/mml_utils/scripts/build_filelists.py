@@ -28,16 +28,38 @@ Example:
                 - files_[date].building  [currently being built; don't process]
 
     After, run `run_mml.py` to process all these files. Their extension will be changed to `.complete`.
+
+Watch mode (`--watch`):
+    Rather than collecting files once, keep watching `clarity` for new files (see `mml_utils.watch_folder`). Files
+    are moved once they have finished being written (or their marker file exists), and grouped into filelists by
+    number of files, size, or time waited. With `--mml-home`, each filelist is passed straight to running
+    MetaMapLite instances (see `MmlPool`).
+
+    python build_filelists.py --outpath /path/to/dir --watch --max-wait 300 --mml-home ./public_mm_lite
 """
+import itertools
 import pathlib
 import shutil
+import threading
 import time
 from datetime import datetime
 
 from loguru import logger
 
+from mml_utils.layout import get_hashed_path, get_layout_dir
+from mml_utils.manifest import RunManifest
+from mml_utils.mml_pool import MmlPool
+from mml_utils.sharding import CostModel, shard_files
+from mml_utils.watch_folder import Batcher, FolderWatcher
+
+_filelist_counter = itertools.count()  # so that filelists built in the same microsecond have unique names
+
 
-def run(outpath: pathlib.Path, *, n_dirs=3, file_limit=100_000):
+def run(outpath: pathlib.Path, *, n_dirs=3, file_limit=100_000, balance=False, cost_model=None, manifest=None):
+    if isinstance(manifest, (str, pathlib.Path)):
+        manifest = RunManifest(manifest)
+    if balance:
+        return run_balanced(outpath, n_dirs=n_dirs, file_limit=file_limit, cost_model=cost_model, manifest=manifest)
     # parameters
     clarity_path = outpath / 'clarity'
     mml_path = outpath / 'mml'
@@ -63,37 +85,183 @@ def run(outpath: pathlib.Path, *, n_dirs=3, file_limit=100_000):
             continue
         files.append(f)
         if len(files) >= file_limit:
-            prepare_mml_list(files, mml_path, mml_run_paths[curr_dir])
+            prepare_mml_list(files, mml_path, mml_run_paths[curr_dir], manifest=manifest)
             curr_dir = (curr_dir + 1) % n_dirs
             files = []
             logger.info('Continuing building file list.')
-    prepare_mml_list(files, mml_path, mml_run_paths[curr_dir])
+    prepare_mml_list(files, mml_path, mml_run_paths[curr_dir], manifest=manifest)
+
+
+def run_balanced(outpath: pathlib.Path, *, n_dirs=3, file_limit=100_000, cost_model=None,
+                 manifest: RunManifest = None):
+    """Like `run`, but assign files to directories so each has about the same expected processing time."""
+    clarity_path = outpath / 'clarity'
+    mml_path = outpath / 'mml'
+    mml_run_path = outpath / 'mml_lists'
+    mml_run_path.mkdir(exist_ok=True)
+    logger.add(outpath / 'collect_for_mml_{time}.log')
+    if isinstance(cost_model, (str, pathlib.Path)):
+        cost_model = CostModel.load(cost_model)
+
+    logger.info(f'Collecting new files from {clarity_path}.')
+    files = [f for f in clarity_path.rglob("*") if not f.is_dir()]
+    for i, shard in enumerate(shard_files(files, n_dirs, cost_model=cost_model)):
+        mrpath = mml_run_path / str(i)
+        mrpath.mkdir(exist_ok=True)
+        for start in range(0, len(shard), file_limit):
+            prepare_mml_list(shard[start: start + file_limit], mml_path, mrpath, manifest=manifest)
 
 
-def prepare_mml_list(files, mml_path, mml_run_path):
+def watch(outpath: pathlib.Path, *, n_dirs=3, file_limit=100_000, max_mb=None, max_wait=300, quiescence=5.0,
+          marker_ext=None, poll_interval=1.0, idle_exit=None, manifest=None, mml_home: pathlib.Path = None,
+          n_workers=None, **mml_kwargs):
+    """
+    Like `run`, but keep watching for new files, building a filelist from each batch.
+    :param max_mb: start a new filelist once files in batch exceed this size
+    :param max_wait: start a new filelist once the first file in the batch has waited this many seconds
+    :param quiescence: seconds without a change in size/mtime before a file is considered complete
+    :param marker_ext: consider a file complete once `{file}{marker_ext}` exists
+    :param poll_interval: seconds to wait for new files
+    :param idle_exit: stop after this many seconds without any new files (default: run until interrupted)
+    :param mml_home: if specified, run MetaMapLite on each filelist as soon as it is built
+    :param n_workers: number of MetaMapLite instances (see `MmlPool`)
+    :param mml_kwargs: passed to `MmlPool` (e.g., max_heap, output_format, stall_timeout)
+    :return: list of filelists built
+    """
+    if isinstance(manifest, (str, pathlib.Path)):
+        manifest = RunManifest(manifest)
+    clarity_path = outpath / 'clarity'
+    mml_path = outpath / 'mml'
+    mml_path.mkdir(exist_ok=True)
+    mml_run_paths = []
+    for i in range(n_dirs):
+        mrpath = outpath / 'mml_lists' / str(i)
+        mrpath.mkdir(exist_ok=True, parents=True)
+        mml_run_paths.append(mrpath)
+    logger.add(outpath / 'collect_for_mml_{time}.log')
+
+    watcher = FolderWatcher(clarity_path, quiescence=quiescence, marker_ext=marker_ext)
+    batcher = Batcher(max_files=file_limit, max_bytes=max_mb * 1024 ** 2 if max_mb else None, max_wait=max_wait)
+    pool = None
+    pool_thread = None
+    if mml_home:
+        pool = MmlPool([], mml_home, n_workers=n_workers, streaming=True, **mml_kwargs)
+        pool_thread = threading.Thread(target=pool.run, daemon=True)
+        pool_thread.start()
+    logger.info(f'Watching {clarity_path} for new files.')
+    filelists = []
+    curr_dir = 0
+    last_arrival = time.time()
+
+    def _prepare(batch):
+        nonlocal curr_dir
+        filelist = prepare_mml_list(batch, mml_path, mml_run_paths[curr_dir], manifest=manifest, settle_seconds=0)
+        for file in batch:
+            watcher.remove_marker(file)
+        curr_dir = (curr_dir + 1) % n_dirs
+        filelists.append(filelist)
+        if pool is not None:
+            pool.add_shard(filelist)
+
+    try:
+        while True:
+            ready = watcher.poll(timeout=poll_interval)
+            if ready:
+                last_arrival = time.time()
+            for batch in batcher.add(ready):
+                _prepare(batch)
+            if idle_exit is not None and time.time() - last_arrival >= idle_exit and not watcher.candidates:
+                logger.info(f'No new files for {idle_exit} seconds: stopping.')
+                break
+    except KeyboardInterrupt:
+        logger.info(f'Stopping watch.')
+    if batcher.files:
+        _prepare(batcher.flush())
+    if pool is not None:
+        pool.close()
+        pool_thread.join()
+    return filelists
+
+
+def prepare_mml_list(files, mml_path, mml_run_path, manifest: RunManifest = None, settle_seconds=10):
+    """
+    Move files to `mml_path` and list them in a new filelist in `mml_run_path`. Files in the hashed layout (see
+        `layout`) are kept in it, so that `mml_path` does not become one very large directory.
+    :param settle_seconds: wait this long first to make sure files are finished writing
+    :return: path to filelist (`.in_progress`)
+    """
     logger.info(f'Processing {len(files)} files.')
     if not files:
-        return
-    time.sleep(10)  # make sure these are finished writing
+        return None
+    time.sleep(settle_seconds)
 
     logger.info(f'Moving files from {mml_path} to {mml_run_path}.')
-    fp = mml_run_path / f'files_{datetime.now().strftime("%Y%m%d_%H%M%S")}.building'
-    with open(fp, 'w') as out:
+    fp = mml_run_path / f'files_{datetime.now().strftime("%Y%m%d_%H%M%S_%f")}_{next(_filelist_counter)}.building'
+    targets = []
+    with open(fp, 'x') as out:  # never overwrite another filelist
         for file in files:
-            target = mml_path / file.name
+            if get_layout_dir(file) != file.parent:  # hashed layout
+                target = get_hashed_path(mml_path, file.name)
+                target.parent.mkdir(parents=True, exist_ok=True)
+            else:
+                target = mml_path / file.name
             out.write(f'{target}\n')
             shutil.move(file, target)
-    fp.rename(str(fp).replace('.building', '.in_progress'))
+            targets.append(target)
+    if manifest is not None:
+        manifest.set_shard(targets, fp)
+    return fp.rename(str(fp).replace('.building', '.in_progress'))
 
 
-if __name__ == '__main__':
+def main():
+    """Command line entry point for `mml-build-filelists`."""
     import argparse
     parser = argparse.ArgumentParser(fromfile_prefix_chars='@')
     parser.add_argument('-o', '--outpath', type=pathlib.Path,
                         help='Directory for output to be placed.'
                              ' Three sub-directories will be created for processing.')
-    parser.add_argument('--n-dirs', dest='n_dirs', default=3,
+    parser.add_argument('--n-dirs', dest='n_dirs', default=3, type=int,
                         help='Number of directories to place output files. (Allows MML parallel-processing.')
-    parser.add_argument('--file-limit', dest='file_limit', default=100_000,
+    parser.add_argument('--file-limit', dest='file_limit', default=100_000, type=int,
                         help='Maximum number of files to include in input files for MML.')
-    run(**vars(parser.parse_args()))
+    parser.add_argument('--balance', action='store_true', default=False,
+                        help='Assign files to directories based on file size so that each directory'
+                             ' takes about the same time to process.')
+    parser.add_argument('--cost-model', dest='cost_model', default=None, type=pathlib.Path,
+                        help='Json file with calibrated cost model (see `mml-calibrate-cost`); use with `--balance`.')
+    parser.add_argument('--manifest', dest='manifest', default=None, type=pathlib.Path,
+                        help='SQLite run manifest to record the filelist each file is added to.')
+    parser.add_argument('--watch', action='store_true', default=False,
+                        help='Keep watching for new files, building a filelist from each batch.')
+    parser.add_argument('--max-wait', dest='max_wait', default=300, type=float,
+                        help='With `--watch`, build a filelist once the first file has waited this many seconds.')
+    parser.add_argument('--max-mb', dest='max_mb', default=None, type=float,
+                        help='With `--watch`, build a filelist once the files exceed this size.')
+    parser.add_argument('--quiescence', dest='quiescence', default=5.0, type=float,
+                        help='With `--watch`, seconds without a change in size/mtime before a file is complete.')
+    parser.add_argument('--marker-ext', dest='marker_ext', default=None,
+                        help='With `--watch`, a file is complete once `{file}{marker_ext}` exists (e.g., `.done`).')
+    parser.add_argument('--idle-exit', dest='idle_exit', default=None, type=float,
+                        help='With `--watch`, stop after this many seconds without new files.')
+    parser.add_argument('--mml-home', dest='mml_home', default=None, type=pathlib.Path,
+                        help='With `--watch`, run MetaMapLite on each filelist as soon as it is built.')
+    parser.add_argument('--n-workers', dest='n_workers', default=None, type=int,
+                        help='With `--mml-home`, number of MetaMapLite instances (default: based on available'
+                             ' memory and CPUs).')
+    parser.add_argument('--output-format', dest='output_format', default='json',
+                        help='With `--mml-home`, MetaMapLite output format.')
+    args = vars(parser.parse_args())
+    watch_args = ['max_wait', 'max_mb', 'quiescence', 'marker_ext', 'idle_exit', 'mml_home', 'n_workers',
+                  'output_format']
+    if args.pop('watch'):
+        args.pop('balance')
+        args.pop('cost_model')
+        watch(**args)
+    else:
+        for arg in watch_args:
+            args.pop(arg)
+        run(**args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+"""
+Fit a cost model (seconds per file and per byte) for MetaMapLite from previously-processed filelists.
+
+The resulting json file can be passed to `mml-split-filelist --balance-by size --cost-model PATH`
+    (and other commands supporting size-balanced sharding).
+"""
+import pathlib
+
+import click
+
+from mml_utils.sharding import calibrate_cost_model
+
+
+@click.command()
+@click.argument('filelists', nargs=-1, type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
+@click.option('--outfile', default='cost_model.json', type=click.Path(dir_okay=False, path_type=pathlib.Path),
+              help='Json file to write cost model to.')
+@click.option('--output-format', type=str, default='json',
+              help='Extension of MetaMapLite output files (e.g., json or mmi).')
+def calibrate_cost_model_cmd(filelists, outfile: pathlib.Path, output_format='json'):
+    model = calibrate_cost_model(filelists, output_format=output_format)
+    model.save(outfile)
+
+
+if __name__ == '__main__':
+    calibrate_cost_model_cmd()
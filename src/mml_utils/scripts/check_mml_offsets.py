@@ -8,6 +8,8 @@ from typing import Iterable
 import click
 from loguru import logger
 
+from mml_utils.layout import iter_files
+from mml_utils.note_store import NoteStore, get_note_id
 from mml_utils.parse.json import iter_json_matches_from_file
 
 
@@ -28,13 +30,16 @@ from mml_utils.parse.json import iter_json_matches_from_file
                    ' replace "from" with "to" before checking offsets.')
 @click.option('--limit-files', default=0, type=int,
               help='Max number of files to process.')
+@click.option('--note-store', type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path), default=None,
+              help='Read note text from this note store (e.g., `corpus.notes`) rather than from text files.')
 def check_mml_offsets(mml_directories: Iterable[pathlib.Path], *, mml_format='json',
                       text_extension='', text_encoding='utf8',
-                      text_errors='replace', add_cr=False, replacements=None, limit_files=0):
+                      text_errors='replace', add_cr=False, replacements=None, limit_files=0, note_store=None):
     """
     Check offsets in Metamaplite to ensure that the output is retrievable and locatable in the text.
 
     :param limit_files: Limit number of files run.
+    :param note_store: read note text from this note store (see `note_store`) rather than text files
     :param text_extension: If text files, e.g., are the same as the .json files but end in '.txt', add '.txt' here.
     :param mml_directories: directories already processed by Metamaplite
     :param mml_format:
@@ -56,17 +61,24 @@ def check_mml_offsets(mml_directories: Iterable[pathlib.Path], *, mml_format='js
     if replacements:
         replacements = [replace.split('==') for replace in replacements]
         logger.info(f'Loaded {len(replacements)} replacements.')
+    store = NoteStore(note_store) if note_store else None
     for mml_directory in mml_directories:
         has_error = False
         logger.info(f'Processing: {mml_directory}')
-        for mml_file in mml_directory.glob(f'*.{mml_format}'):
+        for mml_file in iter_files(mml_directory, f'.{mml_format}'):
             if limit_files and file_count > limit_files:
                 break
             file_count += 1
             logger.info(f'Processing file: {mml_file.name}')
-            text_file = mml_directory / f'{mml_file.stem}.{text_extension}'
-            with open(text_file, encoding=text_encoding, errors=text_errors) as fh:
-                text = fh.read()
+            text_file = mml_file.parent / f'{mml_file.stem}.{text_extension}'
+            if store is not None:
+                text = store.get_text(get_note_id(mml_file), errors=text_errors)
+                if text is None:
+                    logger.warning(f'Failed to find note {get_note_id(mml_file)} in {store.path}.')
+                    continue
+            else:
+                with open(text_file, encoding=text_encoding, errors=text_errors) as fh:
+                    text = fh.read()
             if add_cr:
                 text = text.replace('\n', '\r\n')
             if replacements:
@@ -103,6 +115,8 @@ def check_mml_offsets(mml_directories: Iterable[pathlib.Path], *, mml_format='js
                             first_errors.append(error_text)
                         break
 
+    if store is not None:
+        store.close()
     print(f'Total files processed: {file_count}')
     print(f'Total Errors in Characters: {errors}')
     print(f'Count Correct: {correct}')
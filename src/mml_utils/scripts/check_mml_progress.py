@@ -1,16 +1,31 @@
 """
-Check Metamaplite's progress in a particular directory.
+Check Metamaplite's progress in one or more directories.
+
+Each check is appended to a history file (`.mml_progress.jsonl` in the first directory, unless `--history` is
+    specified) so that throughput (notes and bytes of text per hour) and ETA can be calculated from the previous check.
+    Directories (e.g., one per MetaMapLite instance) expected to finish well after the others are reported as
+    stragglers. With `--json`, each check is also printed as a single line of json.
 """
+import json
+import os
 import pathlib
+import statistics
 import time
 from datetime import datetime, timedelta
 
 import click
 from loguru import logger
 
+from mml_utils.layout import iter_entries
+from mml_utils.manifest import RunManifest
+
+HISTORY_FILENAME = '.mml_progress.jsonl'
+MAX_HISTORY = 1000  # number of checks to retain in history file
+
 
 @click.command()
-@click.argument('outdir', type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path))
+@click.argument('outdirs', nargs=-1, required=True,
+                type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path))
 @click.option('--textfile-ext', type=str, default='',
               help='Extension (if any) for textfiles.')
 @click.option('--mmlout-ext', type=str, default='.json',
@@ -22,16 +37,30 @@ from loguru import logger
               help='Stop running after this many hours (defaults to never stop).')
 @click.option('--repeat-end-after-datetime', type=click.DateTime(), default=None,
               help='Do not re-run after this datetime.')
-def check_mml_progress_repeat(outdir: pathlib.Path, *, textfile_ext='', mmlout_ext='.json',
-                              repeat_hours=None, repeat_end_after_hours=None, repeat_end_after_datetime=None):
+@click.option('--manifest', 'manifest_path', type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+              default=None,
+              help='Count statuses recorded in this SQLite run manifest rather than looking for files in OUTDIRS.')
+@click.option('--history', 'history_path', type=click.Path(dir_okay=False, path_type=pathlib.Path), default=None,
+              help=f'File to record each check in (default: `{HISTORY_FILENAME}` in the first of OUTDIRS).')
+@click.option('--json', 'as_json', is_flag=True, default=False,
+              help='Print each check as a line of json (e.g., for graphing throughput).')
+@click.option('--straggler-ratio', type=float, default=2.0,
+              help='Report directories whose ETA is more than this many times the median ETA.')
+def check_mml_progress_repeat(outdirs, *, textfile_ext='', mmlout_ext='.json',
+                              repeat_hours=None, repeat_end_after_hours=None, repeat_end_after_datetime=None,
+                              manifest_path=None, history_path=None, as_json=False, straggler_ratio=2.0):
     """
 
     :param repeat_end_after_datetime:
     :param repeat_end_after_hours:
     :param repeat_hours:
-    :param outdir: directory containing text files and metamaplite
+    :param outdirs: directories containing text files and metamaplite output
     :param textfile_ext:
     :param mmlout_ext:
+    :param manifest_path: sqlite run manifest (used instead of checking files in `outdirs`)
+    :param history_path: jsonl file of previous checks
+    :param as_json: print each check as json
+    :param straggler_ratio: report directories with ETA more than this times the median
     :return:
     """
     if repeat_hours:
@@ -50,7 +79,14 @@ def check_mml_progress_repeat(outdir: pathlib.Path, *, textfile_ext='', mmlout_e
 
     while True:
         logger.info(f'Calculating Metamaplite Progress.')
-        check_mml_progress(outdir, textfile_ext=textfile_ext, mmlout_ext=mmlout_ext)
+        if manifest_path:
+            with RunManifest(manifest_path) as manifest:
+                manifest.log_progress()
+        else:
+            record = check_mml_progress(outdirs, textfile_ext=textfile_ext, mmlout_ext=mmlout_ext,
+                                        history_path=history_path, straggler_ratio=straggler_ratio)
+            if as_json:
+                click.echo(json.dumps(record))
         logger.info(f'Completed Metamaplite Progress Calculation.')
         if not repeat_hours:
             break
@@ -61,15 +97,119 @@ def check_mml_progress_repeat(outdir: pathlib.Path, *, textfile_ext='', mmlout_e
         time.sleep(repeat_hours * 60 * 60)
 
 
-def check_mml_progress(outdir: pathlib.Path, *, textfile_ext='', mmlout_ext='.json'):
-    completed = 0
-    total = 0
-    for f in outdir.iterdir():
-        if f.suffix == textfile_ext:
-            if (outdir / f'{f.stem}{mmlout_ext}').exists():
-                completed += 1
-            total += 1
-    logger.info(f'Completed {completed} / {total}: {100.0 * completed/total:.02f}%')
+def scan_progress(outdir: pathlib.Path, *, textfile_ext='', mmlout_ext='.json'):
+    """Count text files (and their bytes) and those with metamaplite output in a single pass over `outdir`
+        (including its subdirectories in the hashed layout)."""
+    text_sizes = {}  # stem -> size
+    outputs = set()
+    for entry in iter_entries(outdir):
+        stem, ext = os.path.splitext(entry.name)
+        if ext == mmlout_ext:
+            outputs.add(stem)
+        elif ext == textfile_ext:
+            text_sizes[stem] = entry.stat().st_size
+    completed = outputs & text_sizes.keys()
+    return {
+        'directory': str(outdir),
+        'completed': len(completed),
+        'total': len(text_sizes),
+        'completed_bytes': sum(text_sizes[stem] for stem in completed),
+        'total_bytes': sum(text_sizes.values()),
+    }
+
+
+def get_history_path(outdirs, history_path=None) -> pathlib.Path:
+    return pathlib.Path(history_path) if history_path else pathlib.Path(outdirs[0]) / HISTORY_FILENAME
+
+
+def read_history(history_path: pathlib.Path) -> list[dict]:
+    try:
+        with open(history_path, encoding='utf8') as fh:
+            return [json.loads(line) for line in fh if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def write_history(history_path: pathlib.Path, history: list[dict]):
+    with open(history_path, 'w', encoding='utf8') as out:
+        for record in history[-MAX_HISTORY:]:
+            out.write(json.dumps(record) + '\n')
+
+
+def _add_rates(current: dict, previous: dict, hours):
+    """Add notes/bytes per hour (since previous check) and ETA in hours."""
+    if previous is None or hours <= 0:
+        current.update(notes_per_hour=None, bytes_per_hour=None, eta_hours=None)
+        return
+    current['notes_per_hour'] = (current['completed'] - previous['completed']) / hours
+    current['bytes_per_hour'] = (current['completed_bytes'] - previous['completed_bytes']) / hours
+    remaining = current['total'] - current['completed']
+    if remaining == 0:
+        current['eta_hours'] = 0.0
+    elif current['notes_per_hour'] > 0:
+        current['eta_hours'] = remaining / current['notes_per_hour']
+    else:
+        current['eta_hours'] = None  # no progress since previous check
+
+
+def find_stragglers(directories: list[dict], straggler_ratio=2.0) -> list[str]:
+    """Directories expected to finish (or making no progress) well after the others."""
+    etas = [d['eta_hours'] for d in directories if d['eta_hours']]
+    median_eta = statistics.median(etas) if etas else None
+    stragglers = []
+    for d in directories:
+        if d['completed'] == d['total'] or d['notes_per_hour'] is None:
+            continue
+        if d['eta_hours'] is None or (median_eta and d['eta_hours'] > straggler_ratio * median_eta):
+            stragglers.append(d['directory'])
+    return stragglers
+
+
+def check_mml_progress(outdirs, *, textfile_ext='', mmlout_ext='.json', history_path=None, straggler_ratio=2.0):
+    """
+    Count completed notes in each of `outdirs`, calculate throughput since the previous check, and record in history.
+    :return: record of this check
+    """
+    if isinstance(outdirs, (str, pathlib.Path)):
+        outdirs = [outdirs]
+    history_path = get_history_path(outdirs, history_path)
+    history = read_history(history_path)
+    previous = history[-1] if history else None
+    now = time.time()
+    hours = (now - previous['time']) / 3600 if previous else 0
+    prev_dirs = {d['directory']: d for d in previous['directories']} if previous else {}
+    directories = []
+    for outdir in outdirs:
+        d = scan_progress(outdir, textfile_ext=textfile_ext, mmlout_ext=mmlout_ext)
+        _add_rates(d, prev_dirs.get(d['directory']), hours)
+        directories.append(d)
+    record = {
+        'time': now,
+        'datetime': datetime.fromtimestamp(now).isoformat(),
+        **{key: sum(d[key] for d in directories) for key in ('completed', 'total', 'completed_bytes', 'total_bytes')},
+    }
+    _add_rates(record, previous, hours)
+    record['stragglers'] = find_stragglers(directories, straggler_ratio)
+    record['directories'] = directories
+    history.append(record)
+    write_history(history_path, history)
+    _log_record(record)
+    return record
+
+
+def _log_record(record):
+    completed, total = record['completed'], record['total']
+    logger.info(f'Completed {completed} / {total}: {100.0 * completed / total if total else 0:.02f}%')
+    if record['notes_per_hour'] is not None:
+        eta = f'{record["eta_hours"]:.1f} hours' if record['eta_hours'] is not None else 'unknown (no progress)'
+        logger.info(f'Since previous check: {record["notes_per_hour"]:,.0f} notes/hour,'
+                    f' {record["bytes_per_hour"] / 1024 ** 2:,.1f} MB/hour; ETA: {eta}.')
+    if len(record['directories']) > 1:
+        for d in record['directories']:
+            rate = f'; {d["notes_per_hour"]:,.0f} notes/hour' if d['notes_per_hour'] is not None else ''
+            logger.info(f'> {d["directory"]}: {d["completed"]:,} / {d["total"]:,}{rate}')
+    for straggler in record['stragglers']:
+        logger.warning(f'Straggler: {straggler} is expected to finish well after the other directories.')
 
 
 if __name__ == '__main__':
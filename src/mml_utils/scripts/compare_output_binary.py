@@ -19,10 +19,13 @@ from mml_utils.compare.compare import extract_binary_text_differences
               help='Name for data in path1.')
 @click.option('--name2', default=None,
               help='Name for data in path2.')
+@click.option('--note-store', type=click.Path(exists=True, dir_okay=False, path_type=Path), default=None,
+              help='Read note text from this note store (e.g., `corpus.notes`) rather than from text files.')
 def compare_output_binary(path1: Path, path2: Path, outpath: Path = None, text_encoding='latin1',
-                          name1=None, name2=None):
+                          name1=None, name2=None, note_store=None):
     """Compare output (result of `mml-extract-mml`) of two different feature extraction versions"""
-    extract_binary_text_differences(path1, path2, outpath, name1, name2, text_encoding=text_encoding)
+    extract_binary_text_differences(path1, path2, outpath, name1, name2, text_encoding=text_encoding,
+                                    note_store=note_store)
 
 
 if __name__ == '__main__':
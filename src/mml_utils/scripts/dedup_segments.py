@@ -0,0 +1,36 @@
+"""
+Deduplicate paragraphs across notes before running MetaMapLite, and rebuild each note's output afterwards.
+
+Example:
+    mml-dedup-notes /path/to/filelist.txt --segment-dir /path/to/segments
+    mml-run-filelist --filelist /path/to/segments/filelist_[date].txt --mml-home ./public_mm_lite
+    mml-dedup-rebuild /path/to/segments/manifest_[date].jsonl
+"""
+from pathlib import Path
+
+import click
+
+from mml_utils.dedup import dedup_notes, rebuild_outputs
+from mml_utils.filelists import read_filelist
+
+
+@click.command()
+@click.argument('filelist', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option('--segment-dir', type=click.Path(file_okay=False, path_type=Path), required=True,
+              help='Directory to store segments in; re-use it so segments annotated previously are not re-run.')
+@click.option('--text-encoding', default='utf8',
+              help='Encoding of the note text files.')
+def dedup_notes_cmd(filelist: Path, segment_dir: Path, text_encoding='utf8'):
+    dedup_notes(read_filelist(filelist), segment_dir, encoding=text_encoding)
+
+
+@click.command()
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option('--segment-dir', type=click.Path(file_okay=False, path_type=Path), default=None,
+              help='Directory containing segments; defaults to the directory containing the manifest.')
+def rebuild_outputs_cmd(manifest: Path, segment_dir: Path = None):
+    rebuild_outputs(manifest, segment_dir=segment_dir)
+
+
+if __name__ == '__main__':
+    dedup_notes_cmd()
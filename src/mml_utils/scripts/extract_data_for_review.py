@@ -83,14 +83,16 @@ from mml_utils.review.extract_data import extract_data_for_review
 @click.option('--replacements', type=str, multiple=True,
               help='Replace text to fix offset issues. Arguments should look like "from==to" which will'
                    ' replace "from" with "to" before checking offsets.')
+@click.option('--note-store', type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path), default=None,
+              help='Read note text from this note store (e.g., `corpus.notes`) rather than from text files.')
 def _extract_data_for_review(note_directories: List[pathlib.Path], target_path: pathlib.Path = pathlib.Path('.'),
                              mml_format='json', text_extension='', text_encoding='utf8',
                              text_errors='replace', add_cr=False,
                              sample_size=50, metadata_file=None,
-                             replacements=None):
+                             replacements=None, note_store=None):
     extract_data_for_review(note_directories, target_path, mml_format, text_extension, text_encoding,
                             text_errors=text_errors, add_cr=add_cr, sample_size=sample_size,
-                            metadata_file=metadata_file, replacements=replacements)
+                            metadata_file=metadata_file, replacements=replacements, note_store=note_store)
 
 
 if __name__ == '__main__':
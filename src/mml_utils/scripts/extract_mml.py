@@ -14,8 +14,10 @@ from typing import List
 import click
 from loguru import logger
 
-from mml_utils.extract.utils import NLP_FIELDNAMES, add_notefile_to_record
+from mml_utils.extract.utils import NLP_FIELDNAMES, add_note_text_to_record, add_notefile_to_record
 from mml_utils.extract.utils import prepare_extract, find_path, build_pivot_table, build_extracted_file
+from mml_utils.layout import iter_files
+from mml_utils.note_store import NoteStore, get_note_id
 from mml_utils.parse.parser import extract_mml_data
 from mml_utils.parse.target_cuis import TargetCuis
 
@@ -49,22 +51,26 @@ from mml_utils.parse.target_cuis import TargetCuis
 @click.option('--extract-suffix', default=None,
               help='Specify output suffix for mmi/json files if different from default `--output-format`.'
                    ' Include the period.')
+@click.option('--note-store', type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path), default=None,
+              help='Read note text from this note store (e.g., `corpus.notes`) rather than from text files.')
 def _extract_mml(extract_directories: List[pathlib.Path], outdir: pathlib.Path, cui_file: pathlib.Path = None,
                  *, encoding='utf8', extract_format='json', max_search=1000, add_fieldname: List[str] = None,
                  exclude_negated=False, note_directories=None, extract_encoding='cp1252', note_suffix='.txt',
-                 extract_suffix=None, skip_missing=False):
+                 extract_suffix=None, skip_missing=False, note_store=None):
     extract_mml(extract_directories, outdir, cui_file,
                 encoding=encoding, extract_format=extract_format, max_search=max_search, add_fieldname=add_fieldname,
                 exclude_negated=exclude_negated, note_directories=note_directories, extract_encoding=extract_encoding,
-                note_suffix=note_suffix, extract_suffix=extract_suffix, skip_missing=skip_missing)
+                note_suffix=note_suffix, extract_suffix=extract_suffix, skip_missing=skip_missing,
+                note_store=note_store)
 
 
 def extract_mml(extract_directories: List[pathlib.Path], outdir: pathlib.Path, cui_file: pathlib.Path = None,
                 *, encoding='utf8', extract_format='json', max_search=1000, add_fieldname: List[str] = None,
                 exclude_negated=False, note_directories=None, extract_encoding='cp1252',
-                note_suffix='.txt', extract_suffix=None, skip_missing=False):
+                note_suffix='.txt', extract_suffix=None, skip_missing=False, note_store: pathlib.Path = None):
     """
 
+    :param note_store: read note text from this note store (see `note_store`) rather than text files
     :param note_directories:
     :param extract_encoding:
     :param note_suffix:
@@ -87,11 +93,14 @@ def extract_mml(extract_directories: List[pathlib.Path], outdir: pathlib.Path, c
         note_directories = extract_directories
     get_field_names(extract_directories, extract_format=extract_format, max_search=max_search,
                     extract_encoding=extract_encoding, extract_suffix=extract_suffix)
+    store = NoteStore(note_store) if note_store else None
     result_iter = extract_data(extract_directories, target_cuis=target_cuis, extract_format=extract_format,
                                encoding=encoding, exclude_negated=exclude_negated, note_directories=note_directories,
                                extract_encoding=extract_encoding, note_suffix=note_suffix,
-                               extract_suffix=extract_suffix, skip_missing=skip_missing)
+                               extract_suffix=extract_suffix, skip_missing=skip_missing, note_store=store)
     build_extracted_file(result_iter, note_outfile, nlp_outfile)
+    if store is not None:
+        store.close()
     build_pivot_table(nlp_outfile, cuis_by_doc_outfile, target_cuis)
     return note_outfile, nlp_outfile, cuis_by_doc_outfile
 
@@ -140,7 +149,7 @@ def get_field_names(extract_directories: List[pathlib.Path], *, extract_format='
     logger.info(f'Exploring first {target_search} of {len(extract_directories)} directories.')
     for i, extract_dir in enumerate(extract_directories):
         cnt = 0
-        for extract_file in extract_dir.glob(f'*{extract_suffix or "." + extract_format}'):
+        for extract_file in iter_files(extract_dir, extract_suffix or f'.{extract_format}'):
             for data in extract_mml_data(extract_file, encoding=extract_encoding, extract_format=extract_format,
                                          target_cuis=TargetCuis()):
                 for fieldname in set(data.keys()) - fieldnames:
@@ -154,31 +163,35 @@ def get_field_names(extract_directories: List[pathlib.Path], *, extract_format='
 def extract_data(extract_directories: List[pathlib.Path], *, target_cuis=None, encoding='utf8',
                  extract_encoding='cp1252',
                  extract_format='json', exclude_negated=False, note_directories=None, note_suffix='.txt',
-                 extract_suffix=None, skip_missing=False):
+                 extract_suffix=None, skip_missing=False, note_store: NoteStore = None):
     for i, extract_dir in enumerate(extract_directories):
         logger.info(f'Processing directory: {extract_dir}')
         yield from extract_data_from_directory(
             extract_dir, encoding=encoding, exclude_negated=exclude_negated, extract_encoding=extract_encoding,
             extract_format=extract_format, target_cuis=target_cuis, note_directories=note_directories,
             note_suffix=note_suffix, extract_suffix=extract_suffix, skip_missing=skip_missing, dir_index=i,
+            note_store=note_store,
         )
 
 
 def extract_data_from_directory(extract_dir, *, target_cuis=None, encoding='utf8', extract_encoding='cp1252',
                                 extract_format='json', exclude_negated=False, note_directories=None,
-                                note_suffix='.txt', extract_suffix=None, skip_missing=False, dir_index=None):
-    for file in extract_dir.glob(f'*{extract_suffix or "." + extract_format}'):
+                                note_suffix='.txt', extract_suffix=None, skip_missing=False, dir_index=None,
+                                note_store: NoteStore = None):
+    for file in iter_files(extract_dir, extract_suffix or f'.{extract_format}'):
         logger.info(f'Processing file: {file}')
         yield from extract_data_from_file(
             file, encoding=encoding, exclude_negated=exclude_negated, extract_encoding=extract_encoding,
             extract_format=extract_format, target_cuis=target_cuis, note_directories=note_directories,
             extract_suffix=extract_suffix, skip_missing=skip_missing, dir_index=dir_index, note_suffix=note_suffix,
+            note_store=note_store,
         )
 
 
 def extract_data_from_file(file, *, target_cuis=None, encoding='utf8', extract_encoding='cp1252',
                            extract_format='json', exclude_negated=False, skip_missing=False,
-                           note_directories=None, extract_suffix=None, dir_index=None, note_suffix='.txt'):
+                           note_directories=None, extract_suffix=None, dir_index=None, note_suffix='.txt',
+                           note_store: NoteStore = None):
     """
 
     :yield: tuple[ is_record = True (i.e., note data) vs False (i.e., nlp data),
@@ -197,6 +210,13 @@ def extract_data_from_file(file, *, target_cuis=None, encoding='utf8', extract_e
         yield False, data
 
     # find note data
+    if note_store is not None:
+        if (text := note_store.get_text(get_note_id(file))) is not None:
+            add_note_text_to_record(record, text)
+            yield True, record
+        else:
+            logger.warning(f'Expected note for {extract_format} file {file} in {note_store.path}.')
+        return
     note = get_note_file(file.parent, file.name, extract_format, skip_missing=skip_missing,
                          note_directories=note_directories, note_suffix=note_suffix,
                          dir_index=dir_index, extract_suffix=extract_suffix)
@@ -16,7 +16,7 @@ from loguru import logger
 
 from mml_utils.extract.utils import NLP_FIELDNAMES, add_notefile_to_record
 from mml_utils.extract.utils import prepare_extract, find_path, build_pivot_table, build_extracted_file
-from mml_utils.os_utils import scandir
+from mml_utils.layout import iter_files
 from mml_utils.parse.parser import extract_mml_data
 from mml_utils.parse.target_cuis import TargetCuis
 
@@ -151,8 +151,8 @@ def get_field_names(note_directories: List[pathlib.Path], *, extract_format='jso
     logger.info(f'Exploring first {target_search} of {len(note_directories)} directories.')
     for i, note_dir in enumerate(note_directories):
         cnt = 0
-        for file in scandir(note_dir):
-            if (file.suffix not in {note_suffix, ''} and ''.join(file.suffixes) != note_suffix) or file.is_dir():
+        for file in iter_files(note_dir):
+            if file.suffix not in {note_suffix, ''} and ''.join(file.suffixes) != note_suffix:
                 continue
             extract_file = get_extract_file(file.parent, file.stem, extract_format, skip_missing=skip_missing,
                                             extract_directories=extract_directories, extract_suffix=extract_suffix,
@@ -184,8 +184,8 @@ def extract_data(note_directories: List[pathlib.Path], *, target_cuis=None, enco
 def extract_data_from_directory(note_dir, *, target_cuis=None, encoding='utf8', extract_encoding='cp1252',
                                 extract_format='json', exclude_negated=False, extract_directories=None,
                                 note_suffix='.txt', extract_suffix=None, skip_missing=False, dir_index=None):
-    for file in scandir(note_dir):
-        if (file.suffix not in {note_suffix, ''} and ''.join(file.suffixes) != note_suffix) or file.is_dir():
+    for file in iter_files(note_dir):
+        if file.suffix not in {note_suffix, ''} and ''.join(file.suffixes) != note_suffix:
             continue
         logger.info(f'Processing file: {file}')
         yield from extract_data_from_file(
@@ -4,16 +4,33 @@ A script to build the initial file structure required by MetaMapLite.
 This file will build 1 or more directories containing files with the name
  f'{note_id}.txt' and containing only the note's complete text.
 """
-import csv
-import json
+import hashlib
+import itertools
 import os
 import pathlib
-from collections import UserDict, OrderedDict
+import queue
+import shutil
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import click
-import pandas as pd
 from loguru import logger
 
+from mml_utils import db_extract, parquet_reader, sas_reader
+from mml_utils.build_progress import ProgressTracker, read_listed_since, read_progress, write_progress
+from mml_utils.layout import get_hashed_path, get_layout_dir, iter_files
+from mml_utils.manifest import RunManifest
+from mml_utils.note_store import write_note_store
+from mml_utils.partitions import (RowCounter, check_checkpoint, get_partition_dir, read_checkpoint, read_plan,
+                                  write_checkpoint, write_plan)
+from mml_utils.sharding import OnlineBalancer, log_imbalance
+from mml_utils.text_sources import CsvSource, JsonlSource, ParallelSasSource, ParquetSource, SasSource, SqlSource, \
+    TextSource
+
+PROGRESS_EVERY = 10_000  # notes between progress files (see `build_progress`)
+
 
 @click.command()
 @click.argument('connection-string')
@@ -27,30 +44,150 @@ from loguru import logger
 @click.option('--text-encoding', default='utf8',
               help='Encoding for writing text files.')
 @click.option('--resume', is_flag=True, default=False,
-              help='Safely resume processing (will re-run the last recorded note_id).')
+              help='Safely resume processing from the last recorded progress (`.build_progress.json`).')
+@click.option('--balance', is_flag=True, default=False,
+              help='Assign each note to the output directory with the least total text so far (rather than'
+                   ' round-robin) so that each directory takes about the same time to process.')
+@click.option('--manifest', 'manifest_path', type=click.Path(dir_okay=False, path_type=pathlib.Path), default=None,
+              help='SQLite run manifest to record each text file (and its note_id, size, and hash) in.')
+@click.option('--hashed-layout', 'hashed', is_flag=True, default=False,
+              help='Write each note to a hash-prefix subdirectory (e.g., `notes/ab/cd/{note_id}.txt`) rather than'
+                   ' directly into `notes`, for corpora with millions of notes.')
+@click.option('--note-store', type=click.Path(dir_okay=False, path_type=pathlib.Path), default=None,
+              help='Write notes to a single note store (e.g., `corpus.notes`) rather than to a text file per note;'
+                   ' export text files for MetaMapLite with `mml-export-notes`.')
+@click.option('--write-threads', default=0, type=int,
+              help='Number of threads to write text files with (e.g., 8 on network storage where creating files'
+                   ' is slow); by default, files are written while reading the source.')
+@click.option('--partition-col', default=None,
+              help='Numeric column to split the query on so that partitions are read concurrently, each into its'
+                   ' own directory (`part0000`, ...). Use `{partition}` in the query to place the condition.')
+@click.option('--n-partitions', default=None, type=int,
+              help='Number of partitions (default: 4 x number of workers).')
+@click.option('--partition-method', type=click.Choice(['range', 'hash']), default='range',
+              help='Split partition column into contiguous ranges or hash buckets (`col % n`).')
+@click.option('--partition-range', type=(int, int), default=None,
+              help='Minimum and maximum values of partition column (default: queried from the database).')
+@click.option('--n-workers', default=4, type=int,
+              help='Number of partitions to read concurrently (each on its own connection).')
+@click.option('--batch-size', default=10_000, type=int,
+              help='Number of rows to fetch from the database at once.')
+@click.option('--keyset-col', default=None,
+              help='Column returned by (and ordering) the query, e.g., note_id. Progress records its value so that'
+                   ' `--resume` queries from there (`col >= value`) rather than from the start.')
 def text_from_database_cmd(connection_string, query, outdir: pathlib.Path, n_dirs=1, text_extension='.txt',
-                           text_encoding='utf8', resume=False):
-    text_from_database(connection_string, query, outdir, n_dirs=n_dirs, text_extension=text_extension,
-                       text_encoding=text_encoding, resume=resume)
+                           text_encoding='utf8', resume=False, balance=False,
+                           manifest_path=None, hashed=False, partition_col=None, n_partitions=None,
+                           partition_method='range', partition_range=None, n_workers=4, batch_size=10_000,
+                           note_store=None, write_threads=0, keyset_col=None):
+    if partition_col and note_store:
+        raise click.UsageError('`--note-store` cannot be used with `--partition-col`.')
+    manifest = RunManifest(manifest_path) if manifest_path else None
+    if partition_col:
+        text_from_database_partitioned(
+            connection_string, query, outdir, partition_col, n_partitions=n_partitions,
+            method=partition_method, key_range=partition_range, n_workers=n_workers, batch_size=batch_size,
+            n_dirs=n_dirs, text_extension=text_extension, text_encoding=text_encoding, resume=resume,
+            balance=balance, manifest=manifest, hashed=hashed, write_threads=write_threads,
+        )
+    else:
+        text_from_database(connection_string, query, outdir, n_dirs=n_dirs, text_extension=text_extension,
+                           text_encoding=text_encoding, resume=resume, balance=balance, manifest=manifest,
+                           hashed=hashed, batch_size=batch_size, note_store=note_store, write_threads=write_threads,
+                           keyset_col=keyset_col)
 
 
 def text_from_database(connection_string, query, outdir: pathlib.Path, n_dirs=1, text_extension='.txt',
-                       text_encoding='utf8', resume=False):
+                       text_encoding='utf8', resume=False, balance=False,
+                       manifest: RunManifest = None, hashed=False, batch_size=10_000, note_store=None,
+                       write_threads=0, keyset_col=None):
+    """
+    :param keyset_col: column returned by (and ordering) `query` to resume from (see `text_sources.SqlSource`)
+    """
     try:
-        import sqlalchemy as sa
+        eng = db_extract.create_engine(connection_string)
     except ImportError as ie:
         logger.exception(ie)
         logger.warning(f'Sqlalchemy is required: Install sqlalchemy with `pip install sqlalchemy`.')
         logger.warning(f'Depending on your connection string, pyodbc might also be required: `pip install pyodbc`.')
         return
 
-    eng = sa.create_engine(connection_string)
-    if resume:
-        resume_building_files(eng.execute(query), outdir=outdir, n_dirs=n_dirs,
-                              text_extension=text_extension, text_encoding=text_encoding)
+    _build(SqlSource(eng, query, keyset_col=keyset_col, batch_size=batch_size), outdir, resume=resume,
+           note_store=note_store, n_dirs=n_dirs, text_extension=text_extension, text_encoding=text_encoding,
+           balance=balance, manifest=manifest, hashed=hashed, write_threads=write_threads)
+
+
+def text_from_database_partitioned(connection_string, query, outdir: pathlib.Path, partition_col, *,
+                                   n_partitions=None, method='range', key_range=None, n_workers=4,
+                                   batch_size=10_000, n_dirs=1, text_extension='.txt', text_encoding='utf8',
+                                   resume=False, balance=False, manifest: RunManifest = None, hashed=False,
+                                   write_threads=0):
+    """
+    Split `query` on `partition_col` (see `db_extract`) and write each partition to its own directory
+        (`outdir/part0000`, with its own `notes` directory and filelist) using `n_workers` concurrent connections.
+    :param n_partitions: number of partitions (default: 4 x `n_workers`); more partitions lose less work when
+        resuming as incomplete partitions are re-written from the start
+    :param key_range: (min, max) of `partition_col` (default: queried from the database)
+    :param resume: skip partitions which have completed, and re-write the rest
+    :return: number of rows read from each partition
+    """
+    try:
+        eng = db_extract.create_engine(connection_string, n_workers)
+    except ImportError as ie:
+        logger.exception(ie)
+        logger.warning(f'Depending on your connection string, pyodbc might also be required: `pip install pyodbc`.')
+        return
+    queries = db_extract.get_partition_queries(eng, query, partition_col, n_partitions or 4 * n_workers,
+                                               method=method, key_range=key_range)
+    logger.info(f'Reading {len(queries)} partitions of {partition_col} with {n_workers} workers.')
+    return _build_partitions(
+        [{'query': partition_query} for partition_query in queries],
+        lambda description: db_extract.iter_rows(eng, description['query'], batch_size),
+        outdir, n_workers=n_workers, resume=resume, n_dirs=n_dirs, text_extension=text_extension,
+        text_encoding=text_encoding, balance=balance, manifest=manifest, hashed=hashed,
+        write_threads=write_threads,
+    )
+
+
+def _build_partitions(partitions, get_rows, outdir: pathlib.Path, *, n_workers=4, resume=False, **kwargs):
+    """
+    Write each partition to its own directory (see `partitions`) with `build_files`, `n_workers` at a time.
+    :param partitions: description of each partition (JSON-serializable dicts, recorded in the plan and checkpoint)
+    :param get_rows: function taking a description and returning an iterator of (note_id, text)
+    :param resume: use the recorded plan, skip partitions which have completed, and re-write the rest
+    :return: number of rows read from each partition
+    """
+    if outdir is None:
+        outdir = pathlib.Path('.')
+    if outdir.exists() and not resume and any(outdir.glob('part*')):
+        raise ValueError(f'Partitions already exist in {outdir}: use `--resume` to continue.')
+    if resume and (plan := read_plan(outdir)) is not None:
+        if plan != partitions:
+            logger.warning(f'Source partitions have changed: resuming with the partitions recorded in {outdir}.')
+        partitions = plan
     else:
-        build_files(eng.execute(query), outdir=outdir, n_dirs=n_dirs,
-                    text_extension=text_extension, text_encoding=text_encoding)
+        outdir.mkdir(parents=True, exist_ok=True)
+        write_plan(outdir, partitions)
+
+    def _run_partition(k, description):
+        partition_dir = get_partition_dir(outdir, k)
+        if checkpoint := read_checkpoint(partition_dir):
+            check_checkpoint(checkpoint, description, k)
+            logger.info(f'Skipping completed partition {k} ({checkpoint["rows"]:,} rows).')
+            return checkpoint['rows']
+        shutil.rmtree(partition_dir, ignore_errors=True)  # incomplete: re-write from the start
+        start = time.time()
+        rows = RowCounter(get_rows(description))
+        build_files(rows, partition_dir, **kwargs)
+        write_checkpoint(partition_dir, partition=k, rows=rows.count, seconds=round(time.time() - start, 3),
+                         **description)
+        logger.info(f'Completed partition {k} ({rows.count:,} rows in {time.time() - start:.0f} seconds).')
+        return rows.count
+
+    with ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix='partition') as pool:
+        counts = list(pool.map(_run_partition, range(len(partitions)), partitions))
+    logger.info(f'Done! Read {sum(counts):,} rows from {len(partitions)} partitions.')
+    return counts
 
 
 @click.command()
@@ -72,24 +209,37 @@ def text_from_database(connection_string, query, outdir: pathlib.Path, n_dirs=1,
 @click.option('--csv-delimiter', default=',',
               help='Column delimiter for csv file.')
 @click.option('--resume', is_flag=True, default=False,
-              help='Safely resume processing (will re-run the last recorded note_id).')
+              help='Safely resume processing from the last recorded progress (`.build_progress.json`).')
+@click.option('--balance', is_flag=True, default=False,
+              help='Assign each note to the output directory with the least total text so far (rather than'
+                   ' round-robin) so that each directory takes about the same time to process.')
+@click.option('--manifest', 'manifest_path', type=click.Path(dir_okay=False, path_type=pathlib.Path), default=None,
+              help='SQLite run manifest to record each text file (and its note_id, size, and hash) in.')
+@click.option('--hashed-layout', 'hashed', is_flag=True, default=False,
+              help='Write each note to a hash-prefix subdirectory (e.g., `notes/ab/cd/{note_id}.txt`) rather than'
+                   ' directly into `notes`, for corpora with millions of notes.')
+@click.option('--note-store', type=click.Path(dir_okay=False, path_type=pathlib.Path), default=None,
+              help='Write notes to a single note store (e.g., `corpus.notes`) rather than to a text file per note;'
+                   ' export text files for MetaMapLite with `mml-export-notes`.')
+@click.option('--write-threads', default=0, type=int,
+              help='Number of threads to write text files with (e.g., 8 on network storage where creating files'
+                   ' is slow); by default, files are written while reading the source.')
 def text_from_csv_cmd(csv_file, id_col, text_col, outdir: pathlib.Path, n_dirs=1, text_extension='.txt',
-                      text_encoding='utf8', csv_encoding='utf8', csv_delimiter=',', resume=False):
+                      text_encoding='utf8', csv_encoding='utf8', csv_delimiter=',', resume=False, balance=False,
+                      manifest_path=None, hashed=False, note_store=None, write_threads=0):
+    manifest = RunManifest(manifest_path) if manifest_path else None
     text_from_csv(csv_file, id_col, text_col, outdir, n_dirs=n_dirs, text_extension=text_extension,
-                  text_encoding=text_encoding, csv_encoding=csv_encoding, csv_delimiter=csv_delimiter, resume=resume)
+                  text_encoding=text_encoding, csv_encoding=csv_encoding, csv_delimiter=csv_delimiter, resume=resume,
+                  balance=balance, manifest=manifest, hashed=hashed, note_store=note_store, write_threads=write_threads)
 
 
 def text_from_csv(csv_file, id_col, text_col, outdir: pathlib.Path, n_dirs=1, text_extension='.txt',
-                  text_encoding='utf8', csv_encoding='utf8', csv_delimiter=',', resume=False):
-    with open(csv_file, newline='', encoding=csv_encoding) as fh:
-        reader = csv.DictReader(fh, delimiter=csv_delimiter)
-        text_gen = ((row[id_col], row[text_col]) for row in reader)
-        if resume:
-            resume_building_files(text_gen, outdir=outdir, n_dirs=n_dirs,
-                                  text_extension=text_extension, text_encoding=text_encoding)
-        else:
-            build_files(text_gen, outdir=outdir, n_dirs=n_dirs,
-                        text_extension=text_extension, text_encoding=text_encoding)
+                  text_encoding='utf8', csv_encoding='utf8', csv_delimiter=',', resume=False, balance=False,
+                  manifest: RunManifest = None, hashed=False, note_store=None, write_threads=0):
+    _build(CsvSource(csv_file, id_col, text_col, encoding=csv_encoding, delimiter=csv_delimiter), outdir,
+           resume=resume, note_store=note_store, n_dirs=n_dirs, text_extension=text_extension,
+           text_encoding=text_encoding, balance=balance, manifest=manifest, hashed=hashed,
+           write_threads=write_threads)
 
 
 @click.command()
@@ -108,36 +258,59 @@ def text_from_csv(csv_file, id_col, text_col, outdir: pathlib.Path, n_dirs=1, te
               help='Encoding for writing text files.')
 @click.option('--sas-encoding', default='latin1',
               help='Encoding for source SAS7BDAT file.')
-@click.option('--force-id-to-int/--dont-force-id-to-int', default=False,
-              help='By default, id column will be coerced to an int due to preference in pandas for float.')
+@click.option('--force-id-to-int/--dont-force-id-to-int', '--id-as-int/--id-as-is', 'force_id_to_int', default=False,
+              help='Coerce id column (read as float) to int, converting the whole column of each chunk at once.')
 @click.option('--resume', is_flag=True, default=False,
-              help='Safely resume processing (will re-run the last recorded note_id).')
+              help='Safely resume processing from the last recorded progress (`.build_progress.json`).')
+@click.option('--balance', is_flag=True, default=False,
+              help='Assign each note to the output directory with the least total text so far (rather than'
+                   ' round-robin) so that each directory takes about the same time to process.')
+@click.option('--manifest', 'manifest_path', type=click.Path(dir_okay=False, path_type=pathlib.Path), default=None,
+              help='SQLite run manifest to record each text file (and its note_id, size, and hash) in.')
+@click.option('--hashed-layout', 'hashed', is_flag=True, default=False,
+              help='Write each note to a hash-prefix subdirectory (e.g., `notes/ab/cd/{note_id}.txt`) rather than'
+                   ' directly into `notes`, for corpora with millions of notes.')
+@click.option('--note-store', type=click.Path(dir_okay=False, path_type=pathlib.Path), default=None,
+              help='Write notes to a single note store (e.g., `corpus.notes`) rather than to a text file per note;'
+                   ' export text files for MetaMapLite with `mml-export-notes`.')
+@click.option('--write-threads', default=0, type=int,
+              help='Number of threads to write text files with (e.g., 8 on network storage where creating files'
+                   ' is slow); by default, files are written while reading the source.')
+@click.option('--n-workers', default=1, type=int,
+              help='Number of processes to decode chunks of the file with (requires pyreadstat).')
+@click.option('--chunksize', default=None, type=int,
+              help='Number of rows to decode at once (default: 2,000, or 100,000 with multiple workers).')
 def text_from_sas7bdat_cmd(sas_file, id_col, text_col, outdir: pathlib.Path, n_dirs=1, text_extension='.txt',
-                           text_encoding='utf8', sas_encoding='latin1', force_id_to_int=True, resume=False):
+                           text_encoding='utf8', sas_encoding='latin1', force_id_to_int=True, resume=False,
+                           balance=False, manifest_path=None, hashed=False, note_store=None, write_threads=0,
+                           n_workers=1, chunksize=None):
+    manifest = RunManifest(manifest_path) if manifest_path else None
     text_from_sas7bdat(sas_file, id_col, text_col, outdir, n_dirs=n_dirs, text_extension=text_extension,
                        text_encoding=text_encoding, sas_encoding=sas_encoding, force_id_to_int=force_id_to_int,
-                       resume=resume)
+                       resume=resume, balance=balance, manifest=manifest, hashed=hashed, note_store=note_store,
+                       write_threads=write_threads, n_workers=n_workers, chunksize=chunksize)
 
 
 def text_from_sas7bdat(sas_file, id_col, text_col, outdir: pathlib.Path, n_dirs=1, text_extension='.txt',
-                       text_encoding='utf8', sas_encoding='latin1', force_id_to_int=True, resume=False):
-    if resume:
-        resume_building_files(
-            _text_from_sas7bdat_iter(sas_file, sas_encoding, id_col, text_col, force_id_to_int=force_id_to_int),
-            outdir=outdir, n_dirs=n_dirs, text_extension=text_extension, text_encoding=text_encoding)
+                       text_encoding='utf8', sas_encoding='latin1', force_id_to_int=True, resume=False, balance=False,
+                       manifest: RunManifest = None, hashed=False, note_store=None, write_threads=0, n_workers=1,
+                       chunksize=None):
+    """
+    :param n_workers: if > 1, decode chunks of `chunksize` rows in this many processes (see `sas_reader`)
+    :param chunksize: number of rows to decode at once (default: 2,000, or 100,000 with multiple workers)
+    """
+    if n_workers > 1:
+        if sas_reader.pyreadstat is None:
+            logger.warning(f'Pyreadstat is required to read sas7bdat files in parallel:'
+                           f' Install pyreadstat with `pip install pyreadstat`.')
+            return
+        source = ParallelSasSource(sas_file, id_col, text_col, encoding=sas_encoding, id_as_int=force_id_to_int,
+                                   chunksize=chunksize or 100_000, n_workers=n_workers)
     else:
-        build_files(_text_from_sas7bdat_iter(sas_file, sas_encoding, id_col, text_col, force_id_to_int=force_id_to_int),
-                    outdir=outdir, n_dirs=n_dirs, text_extension=text_extension, text_encoding=text_encoding)
-
-
-def _text_from_sas7bdat_iter(sas_file, sas_encoding, id_col, text_col, force_id_to_int=True):
-    for df in pd.read_sas(sas_file, encoding=sas_encoding, chunksize=2000):
-        for row in df.itertuples():
-            id_ = getattr(row, id_col)
-            if force_id_to_int:
-                id_ = int(id_)
-            text = getattr(row, text_col)
-            yield id_, text
+        source = SasSource(sas_file, id_col, text_col, encoding=sas_encoding, force_id_to_int=force_id_to_int,
+                           chunksize=chunksize or 2000)
+    _build(source, outdir, resume=resume, note_store=note_store, n_dirs=n_dirs, text_extension=text_extension,
+           text_encoding=text_encoding, balance=balance, manifest=manifest, hashed=hashed, write_threads=write_threads)
 
 
 @click.command()
@@ -157,58 +330,363 @@ def _text_from_sas7bdat_iter(sas_file, sas_encoding, id_col, text_col, force_id_
 @click.option('--jsonl-encoding', default='utf8',
               help='Encoding for source JSONL file.')
 @click.option('--resume', is_flag=True, default=False,
-              help='Safely resume processing (will re-run the last recorded note_id).')
+              help='Safely resume processing from the last recorded progress (`.build_progress.json`).')
+@click.option('--balance', is_flag=True, default=False,
+              help='Assign each note to the output directory with the least total text so far (rather than'
+                   ' round-robin) so that each directory takes about the same time to process.')
+@click.option('--manifest', 'manifest_path', type=click.Path(dir_okay=False, path_type=pathlib.Path), default=None,
+              help='SQLite run manifest to record each text file (and its note_id, size, and hash) in.')
+@click.option('--hashed-layout', 'hashed', is_flag=True, default=False,
+              help='Write each note to a hash-prefix subdirectory (e.g., `notes/ab/cd/{note_id}.txt`) rather than'
+                   ' directly into `notes`, for corpora with millions of notes.')
+@click.option('--note-store', type=click.Path(dir_okay=False, path_type=pathlib.Path), default=None,
+              help='Write notes to a single note store (e.g., `corpus.notes`) rather than to a text file per note;'
+                   ' export text files for MetaMapLite with `mml-export-notes`.')
+@click.option('--write-threads', default=0, type=int,
+              help='Number of threads to write text files with (e.g., 8 on network storage where creating files'
+                   ' is slow); by default, files are written while reading the source.')
 def text_from_jsonl_cmd(jsonl_file, id_col, text_col, outdir: pathlib.Path, n_dirs=1, text_extension='.txt',
-                        text_encoding='utf8', jsonl_encoding='utf8', resume=False):
+                        text_encoding='utf8', jsonl_encoding='utf8', resume=False, balance=False,
+                        manifest_path=None, hashed=False, note_store=None, write_threads=0):
+    manifest = RunManifest(manifest_path) if manifest_path else None
     text_from_jsonl(jsonl_file, id_col, text_col, outdir, n_dirs=n_dirs, text_extension=text_extension,
-                    text_encoding=text_encoding, jsonl_encoding=jsonl_encoding, resume=resume)
+                    text_encoding=text_encoding, jsonl_encoding=jsonl_encoding, resume=resume, balance=balance,
+                    manifest=manifest, hashed=hashed, note_store=note_store, write_threads=write_threads)
 
 
 def text_from_jsonl(jsonl_file, id_col, text_col, outdir: pathlib.Path, n_dirs=1, text_extension='.txt',
-                    text_encoding='utf8', jsonl_encoding='utf8', resume=False):
-    if resume:
-        resume_building_files(_text_from_jsonl_iter(jsonl_file, jsonl_encoding, id_col, text_col),
-                              outdir=outdir,
-                              n_dirs=n_dirs,
-                              text_extension=text_extension,
-                              text_encoding=text_encoding)
-    else:
-        build_files(_text_from_jsonl_iter(jsonl_file, jsonl_encoding, id_col, text_col),
-                    outdir=outdir,
-                    n_dirs=n_dirs,
-                    text_extension=text_extension,
-                    text_encoding=text_encoding)
+                    text_encoding='utf8', jsonl_encoding='utf8', resume=False, balance=False,
+                    manifest: RunManifest = None, hashed=False, note_store=None, write_threads=0):
+    _build(JsonlSource(jsonl_file, id_col, text_col, encoding=jsonl_encoding), outdir, resume=resume,
+           note_store=note_store, n_dirs=n_dirs, text_extension=text_extension, text_encoding=text_encoding,
+           balance=balance, manifest=manifest, hashed=hashed, write_threads=write_threads)
 
 
-def _text_from_jsonl_iter(jsonl_file, jsonl_encoding, id_col, text_col):
-    with open(jsonl_file, encoding=jsonl_encoding) as fh:
-        for line in fh:
-            data = json.loads(line)
-            yield data[id_col], data[text_col]
+@click.command()
+@click.argument('parquet-files', nargs=-1, required=True, type=click.Path(exists=True, path_type=pathlib.Path))
+@click.option('--id-col', default='docid', type=str,
+              help='Name of column containing note ids.')
+@click.option('--text-col', default='text', type=str,
+              help='Name of column containing text.')
+@click.option('--outdir', type=click.Path(file_okay=False, path_type=pathlib.Path), default=None,
+              help='Directory to create subfolders and filelists.')
+@click.option('--n-dirs', default=1, type=int,
+              help='Number of directories to create.')
+@click.option('--text-extension', default='.txt',
+              help='Extension of text files to be created.')
+@click.option('--text-encoding', default='utf8',
+              help='Encoding for writing text files.')
+@click.option('--resume', is_flag=True, default=False,
+              help='Safely resume processing from the last recorded progress (`.build_progress.json`), or, with'
+                   ' multiple workers, re-write incomplete partitions.')
+@click.option('--balance', is_flag=True, default=False,
+              help='Assign each note to the output directory with the least total text so far (rather than'
+                   ' round-robin) so that each directory takes about the same time to process.')
+@click.option('--manifest', 'manifest_path', type=click.Path(dir_okay=False, path_type=pathlib.Path), default=None,
+              help='SQLite run manifest to record each text file (and its note_id, size, and hash) in.')
+@click.option('--hashed-layout', 'hashed', is_flag=True, default=False,
+              help='Write each note to a hash-prefix subdirectory (e.g., `notes/ab/cd/{note_id}.txt`) rather than'
+                   ' directly into `notes`, for corpora with millions of notes.')
+@click.option('--note-store', type=click.Path(dir_okay=False, path_type=pathlib.Path), default=None,
+              help='Write notes to a single note store (e.g., `corpus.notes`) rather than to a text file per note;'
+                   ' export text files for MetaMapLite with `mml-export-notes`.')
+@click.option('--write-threads', default=0, type=int,
+              help='Number of threads to write text files with (e.g., 8 on network storage where creating files'
+                   ' is slow); by default, files are written while reading the source.')
+@click.option('--n-workers', default=1, type=int,
+              help='Read and write partitions of row groups concurrently, each into its own directory'
+                   ' (`part0000`, ...).')
+@click.option('--n-partitions', default=None, type=int,
+              help='Number of partitions of row groups when using multiple workers (default: 4 x number of workers).')
+@click.option('--batch-size', default=10_000, type=int,
+              help='Number of rows to read at once.')
+def text_from_parquet_cmd(parquet_files, id_col, text_col, outdir: pathlib.Path, n_dirs=1, text_extension='.txt',
+                          text_encoding='utf8', resume=False, balance=False, manifest_path=None, hashed=False,
+                          note_store=None, n_workers=1, n_partitions=None, batch_size=10_000, write_threads=0):
+    if n_workers > 1 and note_store:
+        raise click.UsageError('`--note-store` cannot be used with multiple workers.')
+    manifest = RunManifest(manifest_path) if manifest_path else None
+    text_from_parquet(parquet_files, id_col, text_col, outdir, n_dirs=n_dirs, text_extension=text_extension,
+                      text_encoding=text_encoding, resume=resume, balance=balance, manifest=manifest, hashed=hashed,
+                      note_store=note_store, n_workers=n_workers, n_partitions=n_partitions, batch_size=batch_size,
+                      write_threads=write_threads)
+
+
+def text_from_parquet(parquet_files, id_col, text_col, outdir: pathlib.Path, n_dirs=1, text_extension='.txt',
+                      text_encoding='utf8', resume=False, balance=False, manifest: RunManifest = None, hashed=False,
+                      note_store=None, n_workers=1, n_partitions=None, batch_size=10_000, write_threads=0):
+    """
+    Write notes from parquet files (or directories of them), reading only `id_col` and `text_col`.
+    :param n_workers: if > 1, split row groups into `n_partitions` (default: 4 x `n_workers`) partitions, and
+        write each to its own directory (see `partitions`) with `n_workers` at a time
+    """
+    try:
+        row_groups = parquet_reader.get_row_groups(parquet_reader.get_parquet_files(parquet_files))
+    except ImportError as ie:
+        logger.exception(ie)
+        return
+    if n_workers <= 1:
+        _build(ParquetSource(row_groups, id_col, text_col, batch_size=batch_size), outdir,
+               resume=resume, note_store=note_store, n_dirs=n_dirs, text_extension=text_extension,
+               text_encoding=text_encoding, balance=balance, manifest=manifest, hashed=hashed,
+               write_threads=write_threads)
+        return
+    partitions = parquet_reader.split_row_groups(row_groups, n_partitions or 4 * n_workers, id_col=id_col)
+    logger.info(f'Reading {len(row_groups):,} row groups in {len(partitions)} partitions with {n_workers} workers.')
+    return _build_partitions(
+        [{'row_groups': [[str(file), i] for file, i, _ in partition]} for partition in partitions],
+        lambda description: parquet_reader.iter_parquet_rows(
+            [(pathlib.Path(file), i, None) for file, i in description['row_groups']], id_col, text_col, batch_size),
+        outdir, n_workers=n_workers, resume=resume, n_dirs=n_dirs, text_extension=text_extension,
+        text_encoding=text_encoding, balance=balance, manifest=manifest, hashed=hashed,
+        write_threads=write_threads,
+    )
+
+
+def _build(text_gen, outdir: pathlib.Path, *, resume=False, note_store: pathlib.Path = None, **kwargs):
+    """Write notes to text files with `build_files` (or `resume_building_files`), or to a note store."""
+    if note_store:
+        write_note_store(text_gen, note_store, resume=resume)
+    elif resume:
+        resume_building_files(text_gen, outdir=outdir, **kwargs)
+    else:
+        build_files(text_gen, outdir=outdir, **kwargs)
 
 
-class FIFOOrderedDict(UserDict):
-    """Limit the memory footprint of dict by only retaining most recent n
-    ASSUMPTION: if > max_length are present in dict (somehow) only 1 will be removed with each new insertion..
+class NoteBuffer:
+    """
+    Hold the parts of recent notes (i.e., multiple 'note_lines') in memory, and write each note's file once all its
+        parts have been read rather than re-reading and re-writing the file for every additional part.
+    Only the most recent `max_notes` notes are held: multiple lines must appear together. A note is written (and
+        added to its filelist) when it is pushed out by newer notes or the buffer is closed, so notes are written in
+        the order they first appear. Once a note's buffered text exceeds `max_chars`, it is appended to its file
+        (spilled) so that memory stays bounded for very long notes.
+    With `n_writers`, notes pushed out are instead put on a queue (of at most `queue_size` notes) and written by
+        that many threads, so that reading the source is not held up by slow file creation (e.g., on network
+        storage). Notes are then added to filelists as they finish, and `progress_dir` should be given so that
+        `resume_building_files` can tell which notes have been written (see `build_progress`).
     """
 
-    def __init__(self, max_length=10):
-        super().__init__()
-        self.data = OrderedDict(self.data)
-        self.max_length = max_length
-
-    def __setitem__(self, key, value):
-        super().__setitem__(key, value)
-        if len(self.data) > self.max_length:
-            self.data.popitem(last=False)
+    def __init__(self, filelists, text_encoding='utf8', require_newline=True, manifest: RunManifest = None,
+                 max_notes=10, max_chars=2 ** 23, *, n_writers=0, queue_size=1000, progress_dir=None, start=0,
+                 listed=None, recent=()):
+        """
+        :param progress_dir: write progress file to this directory every `PROGRESS_EVERY` notes
+        :param start: number of notes already written (when resuming)
+        :param listed: paths of notes already in a filelist (when resuming; see `build_progress`)
+        :param recent: note_ids of the (already written) notes just before `start`, any more parts of which are
+            ignored (when resuming)
+        """
+        self.filelists = filelists
+        self.text_encoding = text_encoding
+        self.require_newline = require_newline
+        self.manifest = manifest
+        self.max_notes = max_notes
+        self.max_chars = max_chars
+        self.notes = OrderedDict()  # note_id -> _PendingNote
+        self.records = []  # for manifest, written in batches
+        self.n_notes = start  # number of notes started (i.e., number given to the next note)
+        self.progress_dir = progress_dir
+        self.tracker = ProgressTracker(start, recent, max_recent=max_notes)
+        self.balancer = None  # loads are recorded in progress
+        self.listed = set(listed or ())
+        self.lock = threading.Lock()  # for filelists, manifest records, and progress
+        self.in_flight = Counter()  # outfile -> number of notes queued or being written
+        self.error = None  # first exception in a writer thread
+        self.queue = queue.Queue(maxsize=queue_size) if n_writers > 0 else None
+        self.writers = [threading.Thread(target=self._run_writer, name=f'note-writer-{i}', daemon=True)
+                        for i in range(n_writers)]
+        for writer in self.writers:
+            writer.start()
+        for note_id in recent:
+            self.notes[note_id] = _PendingNote(note_id, None, None, None)
+
+    def __contains__(self, note_id):
+        return note_id in self.notes
+
+    def add(self, note_id, outfile: pathlib.Path, idx, text, *, written=False, position=None):
+        """
+        Start a new note.
+        :param idx: index of filelist to add note to
+        :param written: `text` is already in `outfile` and `outfile` is in its filelist (e.g., when resuming)
+        :param position: position of `text` in source (see `text_sources`)
+        """
+        if len(self.notes) >= self.max_notes:
+            self._submit(self.notes.popitem(last=False)[1])
+        if self.queue is not None:
+            with self.lock:
+                rewriting = self.in_flight[outfile] > 0
+            if rewriting:  # same note_id seen again: wait for the earlier version to be written first
+                self._drain()
+        note = _PendingNote(note_id, outfile, idx, self.n_notes, listed=written)
+        with self.lock:
+            self.tracker.start(self.n_notes, note_id, position)
+        self.n_notes += 1
+        if written:
+            note.spilled = True
+            note.update_hash(text)
+        else:
+            note.append(text)
+        self.notes[note_id] = note
+        if self.progress_dir is not None and self.n_notes % PROGRESS_EVERY == 0:
+            self.save_progress()
+
+    def extend(self, note_id, text):
+        """Add another part to a note; returns its filelist index (None for skipped notes)."""
+        note = self.notes[note_id]
+        if note.number is None:
+            return None
+        note.append(text)
+        if note.size > self.max_chars:
+            self._spill(note)
+        return note.idx
+
+    def _spill(self, note):
+        with open(note.outfile, 'a' if note.spilled else 'w', encoding=self.text_encoding, errors='replace') as out:
+            out.writelines(note.parts)
+        note.spilled = True
+        note.parts = []
+        note.size = 0
+
+    def _submit(self, note):
+        if note.number is None:  # skipped
+            return
+        if self.queue is None:
+            self._write(note)
+            return
+        self._check_error()
+        with self.lock:
+            self.in_flight[note.outfile] += 1
+        self.queue.put(note)
+
+    def _run_writer(self):
+        while (note := self.queue.get()) is not None:
+            try:
+                if self.error is None:
+                    self._write(note)
+            except BaseException as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+        self.queue.task_done()
+
+    def _check_error(self):
+        if self.error is not None:
+            raise RuntimeError(f'Failed to write note: {self.error}') from self.error
+
+    def _drain(self):
+        """Wait for all queued notes to be written."""
+        self.queue.join()
+        self._check_error()
+
+    def _write(self, note):
+        if self.require_newline:
+            note.append('\n')
+        self._spill(note)
+        path = str(note.outfile.absolute())
+        with self.lock:
+            if not note.listed and path not in self.listed:
+                self.filelists[note.idx].write(f'{path}\n')
+            self.listed.discard(path)
+            if self.manifest is not None:
+                self.records.append((path, note.note_id, note.n_bytes, note.hasher.hexdigest()))
+                if len(self.records) >= 10_000:
+                    self._add_records()
+            self.tracker.complete(note.number, path)
+            if note.outfile in self.in_flight:
+                self.in_flight[note.outfile] -= 1
+                if not self.in_flight[note.outfile]:
+                    del self.in_flight[note.outfile]
+
+    def _add_records(self):
+        if self.manifest is not None and self.records:
+            self.manifest.add_notes(self.records)
+            self.records = []
+
+    def save_progress(self):
+        """Durably record which notes have been written (see `build_progress`)."""
+        with self.lock:
+            for fl in self.filelists:
+                fl.flush()
+                os.fsync(fl.fileno())
+            self._add_records()
+            progress = {'notes': self.tracker.done, 'filelists': [fl.tell() for fl in self.filelists],
+                        'listed': list(self.tracker.ahead.values()), 'position': self.tracker.get_position(),
+                        'recent': self.tracker.get_recent()}
+            if self.balancer is not None:
+                progress['loads'] = list(self.balancer.loads)
+        write_progress(self.progress_dir, **progress)
+
+    def _stop_writers(self):
+        for _ in self.writers:
+            self.queue.put(None)
+        for writer in self.writers:
+            writer.join()
+        self.writers = []
+
+    def close(self):
+        if self.queue is not None:
+            self._drain()
+        if self.progress_dir is not None:
+            # notes still held might get more parts if the source continues (e.g., resuming with more rows)
+            self.save_progress()
+        while self.notes:
+            self._submit(self.notes.popitem(last=False)[1])
+        if self.queue is not None:
+            self._stop_writers()
+            self._check_error()
+        with self.lock:
+            self._add_records()
+
+    def abort(self):
+        """Finish writing queued notes (e.g., after an error reading the source) without writing held notes."""
+        if self.queue is not None:
+            self._stop_writers()
+        with self.lock:
+            for fl in self.filelists:
+                fl.flush()
+            self._add_records()
+
+
+class _PendingNote:
+
+    def __init__(self, note_id, outfile: pathlib.Path, idx, number, listed=False):
+        """
+        :param number: order of note in source (None for notes skipped when resuming)
+        """
+        self.note_id = note_id
+        self.outfile = outfile
+        self.idx = idx
+        self.number = number
+        self.listed = listed
+        self.spilled = False  # some text has already been written to `outfile`
+        self.parts = []
+        self.size = 0  # characters in `parts`
+        self.n_bytes = 0  # total utf8 bytes (for manifest)
+        self.hasher = hashlib.sha256()  # of all text (see `get_text_hash`)
+
+    def append(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        self.update_hash(text)
+
+    def update_hash(self, text):
+        data = text.encode('utf8')
+        self.n_bytes += len(data)
+        self.hasher.update(data)
 
 
 def build_files(text_gen, outdir: pathlib.Path, n_dirs=1,
-                text_extension='.txt', text_encoding='utf8', require_newline=True):
+                text_extension='.txt', text_encoding='utf8', require_newline=True, balance=False,
+                manifest: RunManifest = None, hashed=False, write_threads=0):
     """
     Write files to directory from generator outputting (note_id, text).
         A filelist will also be created for each outdirectory.
     :param require_newline: always add a newline to avoid issues when running MetaMap
+    :param balance: assign each note to the directory with the least text (rather than round-robin)
+    :param manifest: record each file written (with its note_id, size, and hash of text)
+    :param hashed: write each note to a hash-prefix subdirectory (see `layout`)
+    :param write_threads: number of threads to write files with (0 to write them while reading)
     :param text_gen:
     :param outdir:
     :param n_dirs:
@@ -227,43 +705,73 @@ def build_files(text_gen, outdir: pathlib.Path, n_dirs=1,
     filelists = [open(outdir / f'filelist{i}.txt', 'w') if n_dirs > 1
                  else open(outdir / f'filelist.txt', 'w')
                  for i in range(n_dirs)]
-    _build_files(text_gen, n_dirs, outdirs, filelists, text_encoding, text_extension, require_newline)
+    buffer = NoteBuffer(filelists, text_encoding, require_newline, manifest=manifest, n_writers=write_threads,
+                        progress_dir=outdir)
+    buffer.save_progress()
+    balancer = OnlineBalancer(n_dirs) if balance else None
+    _build_files(text_gen, n_dirs, outdirs, filelists, text_encoding, text_extension, require_newline, buffer,
+                 balancer=balancer, manifest=manifest, hashed=hashed)
 
 
 def _build_files(text_gen, n_dirs, outdirs, filelists, text_encoding, text_extension, require_newline,
-                 completed: FIFOOrderedDict = None):
-    if not completed:
-        completed = FIFOOrderedDict(max_length=10)  # only retain last 10: multiple lines must appear together
+                 buffer: NoteBuffer = None, balancer: OnlineBalancer = None, manifest: RunManifest = None,
+                 hashed=False, source: TextSource = None, assigned: dict = None):
+    """
+    :param source: source of `text_gen` (if not `text_gen` itself) to record positions from
+    :param assigned: file name -> path of notes already written to a directory (when resuming with `balancer`)
+    """
+    if buffer is None:
+        buffer = NoteBuffer(filelists, text_encoding, require_newline, manifest=manifest)
+    buffer.balancer = balancer
+    if isinstance(text_gen, TextSource):
+        source = text_gen
+    made_dirs = set()  # hash-prefix subdirectories already created
     i = 0
-    for note_id, text in text_gen:
-        if not isinstance(text, str) or text.strip() == '':  # handle forms of None/nan
-            continue
-        if note_id in completed:  # handle notes with multiple 'note_lines'
-            with open(completed[note_id], encoding=text_encoding) as fh:
-                prev_text = fh.read()
-            if require_newline:
-                prev_text = prev_text[:-1]
-            with open(completed[note_id], 'w', encoding=text_encoding, errors='replace') as out:
-                out.write(prev_text)
-                out.write(text)
-                if require_newline:
-                    out.write('\n')
-            continue
-        outfile = outdirs[i % n_dirs] / f'{note_id}{text_extension}'
-        completed[note_id] = outfile
-        with open(outfile, 'w', encoding=text_encoding, errors='replace') as out:
-            out.write(text)
-            if require_newline:
-                out.write('\n')
-        filelists[i % n_dirs].write(f'{outfile.absolute()}\n')
-        i += 1
-        if i % 100_000 == 0:
-            logger.info(f'Finished reading {i:,} lines.')
-    for fl in filelists:
-        fl.close()
+    try:
+        for note_id, text in text_gen:
+            if not isinstance(text, str) or text.strip() == '':  # handle forms of None/nan
+                continue
+            if note_id in buffer:  # handle notes with multiple 'note_lines'
+                idx = buffer.extend(note_id, text)
+                if balancer and idx is not None:
+                    balancer.add(idx, len(text))
+                continue
+            if assigned and (outfile := assigned.pop(f'{note_id}{text_extension}', None)):
+                idx = _get_dir_index(outdirs, outfile)  # keep in the same directory
+            else:
+                idx = balancer.assign(len(text)) if balancer else buffer.n_notes % n_dirs
+                if hashed:
+                    outfile = get_hashed_path(outdirs[idx], f'{note_id}{text_extension}')
+                    if outfile.parent not in made_dirs:
+                        outfile.parent.mkdir(parents=True, exist_ok=True)
+                        made_dirs.add(outfile.parent)
+                else:
+                    outfile = outdirs[idx] / f'{note_id}{text_extension}'
+            buffer.add(note_id, outfile, idx, text, position=source.position if source else None)
+            i += 1
+            if i % 100_000 == 0:
+                logger.info(f'Finished reading {i:,} lines.')
+        buffer.close()
+    except BaseException:
+        buffer.abort()  # leave progress at last checkpoint
+        raise
+    finally:
+        for fl in filelists:
+            fl.close()
+    if balancer:
+        log_imbalance(balancer.loads, label='directories (characters of text)')
     logger.info(f'Done! Finished reading {i:,} lines (i.e., notes/note parts) from source dataset.')
 
 
+def _get_dir_index(outdirs, file: pathlib.Path):
+    return next(i for i, d in enumerate(outdirs) if d.name == get_layout_dir(file).name)
+
+
+def _get_dir_size(outdir: pathlib.Path, text_extension='.txt'):
+    """Total size of text files already written to directory (used as starting load when resuming)."""
+    return sum(os.stat(file).st_size for file in iter_files(outdir, text_extension))
+
+
 def _get_last_path(file: pathlib.Path):
     num_newlines = 0
     with open(file, 'rb') as f:
@@ -279,17 +787,43 @@ def _get_last_path(file: pathlib.Path):
     return pathlib.Path(last_line)
 
 
+def _skip_notes(text_gen, n_notes, max_notes=10):
+    """
+    Skip the first `n_notes` notes (counted as by `_build_files`) from `text_gen`.
+    :return: remaining (note_id, text) iterator, and note_ids of skipped notes which could still have more parts
+    """
+    text_gen = iter(text_gen)
+    recent = OrderedDict()
+    count = 0
+    for note_id, text in text_gen:
+        if not isinstance(text, str) or text.strip() == '' or note_id in recent:
+            continue
+        if count == n_notes:
+            return itertools.chain([(note_id, text)], text_gen), list(recent)
+        if len(recent) >= max_notes:
+            recent.popitem(last=False)
+        recent[note_id] = None
+        count += 1
+    return iter([]), list(recent)
+
+
 def resume_building_files(text_gen, outdir: pathlib.Path, n_dirs=1,
-                          text_extension='.txt', text_encoding='utf8', require_newline=True):
+                          text_extension='.txt', text_encoding='utf8', require_newline=True, balance=False,
+                          manifest: RunManifest = None, hashed=False, write_threads=0):
     """
-    Figure otu where the process was interrupted by getting last note ids written to filelist. Re-run the last one
-      and then keep going.
+    Figure out where the process was interrupted from the progress file (see `build_progress`), skip the notes
+      which have been written, and re-write the rest. Without a progress file, get last note ids written to
+      filelist, re-run the last one and then keep going.
     :param text_gen:
     :param outdir:
     :param n_dirs:
     :param text_extension:
     :param text_encoding:
     :param require_newline:
+    :param balance: assign each note to the directory with the least text (rather than round-robin)
+    :param manifest: record each file written (with its note_id, size, and hash of text)
+    :param hashed: write each note to a hash-prefix subdirectory (see `layout`)
+    :param write_threads: number of threads to write files with (0 to write them while reading)
     :return:
     """
     logger.info(f'Attempting to resume building files.')
@@ -297,6 +831,38 @@ def resume_building_files(text_gen, outdir: pathlib.Path, n_dirs=1,
     filelist_paths = [p for p in sorted(outdir.glob('filelist*.txt'))]
     assert len(outdirs) == len(
         filelist_paths) == n_dirs, 'Ensure no disagreement between number of output directories/sets.'
+    source = text_gen if isinstance(text_gen, TextSource) else None
+    listed = set()
+    if (progress := read_progress(outdir)) is None:
+        buffer = _resume_from_filelists(text_gen, outdirs, filelist_paths, text_extension, text_encoding,
+                                        require_newline, manifest=manifest, n_writers=write_threads)
+    else:
+        listed = set(progress['listed'])
+        for filelist, size in zip(filelist_paths, progress['filelists']):
+            listed |= read_listed_since(filelist, size)
+        if source is not None and progress.get('position') is not None:
+            logger.info(f'Resuming from note {progress["notes"]:,} at position {progress["position"]} in source.')
+            source.seek(progress['position'])
+            recent = progress['recent']
+        else:
+            logger.info(f'Skipping {progress["notes"]:,} notes already written.')
+            text_gen, recent = _skip_notes(text_gen, progress['notes'])
+        buffer = NoteBuffer([open(f, 'a') for f in filelist_paths], text_encoding, require_newline,
+                            manifest=manifest, n_writers=write_threads, start=progress['notes'], listed=listed,
+                            recent=recent)
+    buffer.progress_dir = outdir
+    balancer = None
+    if balance:
+        loads = progress.get('loads') if progress else None
+        balancer = OnlineBalancer(n_dirs, loads=loads or [_get_dir_size(d, text_extension) for d in outdirs])
+    _build_files(text_gen, n_dirs, outdirs, buffer.filelists, text_encoding, text_extension, require_newline,
+                 buffer, balancer=balancer, manifest=manifest, hashed=hashed, source=source,
+                 assigned={pathlib.Path(p).name: pathlib.Path(p) for p in listed} if balance else None)
+
+
+def _resume_from_filelists(text_gen, outdirs, filelist_paths, text_extension, text_encoding, require_newline,
+                           manifest: RunManifest = None, n_writers=0):
+    """Skip notes until the last note_id in each filelist has been found, and re-write the last found."""
     # get last value in each filelist
     last_paths = [_get_last_path(f) for f in filelist_paths]
     last_noteids = {p.name.removesuffix(text_extension): p for p in last_paths}
@@ -304,10 +870,16 @@ def resume_building_files(text_gen, outdir: pathlib.Path, n_dirs=1,
                 f' Will skip all files until all three of these are found.'
                 f' The last found will be re-processed.')
     filelists = [open(f, 'a') for f in filelist_paths]
-    completed = FIFOOrderedDict(max_length=10)  # only retain last 10: multiple lines must appear together
+    recent = OrderedDict()  # to number notes as `_build_files` does
+    n_notes = 0
     for note_id, text in text_gen:
         if not isinstance(text, str) or text.strip() == '':  # handle forms of None/nan
             continue
+        if note_id not in recent:
+            if len(recent) >= 10:
+                recent.popitem(last=False)
+            recent[note_id] = None
+            n_notes += 1
         note_id_str = str(note_id)
         if note_id_str in last_noteids:
             if len(last_noteids) == 1:
@@ -315,16 +887,17 @@ def resume_building_files(text_gen, outdir: pathlib.Path, n_dirs=1,
                 logger.info(f'Last completed note_id: {note_id_str}.')
                 logger.info(f'Preparing to re-run and re-build: {last_file}.')
                 last_file.unlink(missing_ok=True)  # might not have been written, possible cause of error
-                completed[note_id] = last_file
                 with open(last_file, 'w', encoding=text_encoding, errors='replace') as out:
                     out.write(text)
-                    if require_newline:
-                        out.write('\n')
+                buffer = NoteBuffer(filelists, text_encoding, require_newline, manifest=manifest,
+                                    n_writers=n_writers, start=n_notes - 1)
+                buffer.add(note_id, last_file, _get_dir_index(outdirs, last_file), text, written=True)
                 logger.info(f'Successfully re-wrote {note_id} to {last_file}. Running notes going forward.')
-                break
+                return buffer
             else:
-                del last_noteids[note_id]
-    _build_files(text_gen, n_dirs, outdirs, filelists, text_encoding, text_extension, require_newline, completed)
+                del last_noteids[note_id_str]
+    return NoteBuffer(filelists, text_encoding, require_newline, manifest=manifest, n_writers=n_writers,
+                      start=n_notes)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,36 @@
+"""
+Convert flat note directories (e.g., `notes/123.txt`, `notes/123.json`) to the hashed layout (`notes/ab/cd/123.txt`).
+
+Text files and their MetaMapLite/MetaMap output are moved together. Filelists (`--filelist`) and a run manifest
+    (`--manifest`) can be updated with the new paths. Files already in hash subdirectories are not moved, so an
+    interrupted migration can be safely re-run.
+
+Example:
+    mml-hash-layout /path/to/notes0 /path/to/notes1 --filelist /path/to/filelist0.txt --filelist /path/to/filelist1.txt
+"""
+from pathlib import Path
+
+import click
+
+from mml_utils.layout import migrate_to_hashed
+from mml_utils.manifest import RunManifest
+
+
+@click.command()
+@click.argument('directories', nargs=-1, required=True,
+                type=click.Path(exists=True, file_okay=False, path_type=Path))
+@click.option('--filelist', 'filelists', multiple=True, type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              help='Filelist to update with the new paths (may be repeated).')
+@click.option('--manifest', 'manifest_path', type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              default=None,
+              help='SQLite run manifest to update with the new paths.')
+@click.option('--dry-run', is_flag=True, default=False,
+              help='Only report how many files would be moved.')
+def hash_layout_cmd(directories, filelists=(), manifest_path=None, dry_run=False):
+    manifest = RunManifest(manifest_path) if manifest_path else None
+    for directory in directories:
+        migrate_to_hashed(directory, filelists=filelists, manifest=manifest, dry_run=dry_run)
+
+
+if __name__ == '__main__':
+    hash_layout_cmd()
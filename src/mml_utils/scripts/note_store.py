@@ -0,0 +1,73 @@
+"""
+Keep a corpus in a single note store (see `note_store`), and export text files for each shard before running
+    MetaMapLite on it.
+
+Example:
+    mml-csv-to-txt /path/to/corpus.csv --id-col note_id --text-col note_text --note-store /path/to/corpus.notes
+    mml-export-notes /path/to/corpus.notes --outdir /path/to/shard3 --shard 3 --n-shards 100
+    mml-run-filelist --filelist /path/to/shard3/filelist.txt --mml-home ./public_mm_lite --output-format json
+    mml-extract /path/to/shard3 --outdir /path/to/extract --note-store /path/to/corpus.notes
+
+Existing text files can be added to a store with:
+    mml-store-notes /path/to/filelist.txt --note-store /path/to/corpus.notes
+"""
+from pathlib import Path
+
+import click
+
+from mml_utils.filelists import read_filelist
+from mml_utils.layout import iter_files
+from mml_utils.note_store import NoteStore, export_notes, pack_files
+
+
+@click.command()
+@click.argument('sources', nargs=-1, required=True, type=click.Path(exists=True, path_type=Path))
+@click.option('--note-store', type=click.Path(dir_okay=False, path_type=Path), required=True,
+              help='Note store to write (e.g., `corpus.notes`).')
+@click.option('--text-extension', default='.txt',
+              help='Extension of text files to add when a source is a directory.')
+@click.option('--text-encoding', default='utf8',
+              help='Encoding of the text files.')
+@click.option('--resume', is_flag=True, default=False,
+              help='Add to an existing store, skipping notes already in it.')
+def store_notes_cmd(sources, note_store: Path, text_extension='.txt', text_encoding='utf8', resume=False):
+    """Add text files from filelists or directories to a note store."""
+
+    def _iter_sources():
+        for source in sources:
+            if source.is_dir():
+                yield from iter_files(source, text_extension)
+            else:
+                yield from read_filelist(source)
+
+    pack_files(_iter_sources(), note_store, encoding=text_encoding, resume=resume)
+
+
+@click.command()
+@click.argument('note-store', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option('--outdir', type=click.Path(file_okay=False, path_type=Path), required=True,
+              help='Directory to write text files and `filelist.txt` to.')
+@click.option('--note-ids', 'note_id_file', type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              default=None,
+              help='File with one note id per line to export (default: all, or `--shard`).')
+@click.option('--shard', type=int, default=None,
+              help='Export only this shard (from 0) of `--n-shards` equal parts of the store.')
+@click.option('--n-shards', type=int, default=None,
+              help='Number of shards to divide the store into.')
+@click.option('--text-extension', default='.txt',
+              help='Extension of text files to be created.')
+@click.option('--hashed-layout', 'hashed', is_flag=True, default=False,
+              help='Write each note to a hash-prefix subdirectory (e.g., `outdir/ab/cd/{note_id}.txt`).')
+def export_notes_cmd(note_store: Path, outdir: Path, note_id_file: Path = None, shard=None, n_shards=None,
+                     text_extension='.txt', hashed=False):
+    """Write text files (and a filelist) for notes in a note store so that MetaMapLite can process them."""
+    if (shard is None) != (n_shards is None):
+        raise click.UsageError('`--shard` and `--n-shards` must be specified together.')
+    note_ids = read_filelist(note_id_file) if note_id_file else None
+    with NoteStore(note_store) as store:
+        export_notes(store, outdir, note_ids, shard=shard, n_shards=n_shards, text_extension=text_extension,
+                     hashed=hashed)
+
+
+if __name__ == '__main__':
+    export_notes_cmd()
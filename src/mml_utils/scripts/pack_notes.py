@@ -0,0 +1,40 @@
+"""
+Pack many small notes into larger documents before running MetaMapLite, and unpack the output afterwards.
+
+Example:
+    mml-pack-notes /path/to/filelist.txt --pack-dir /path/to/packs
+    mml-run-filelist --filelist /path/to/packs/filelist.txt --mml-home ./public_mm_lite --output-format json
+    mml-unpack-output /path/to/packs/filelist.txt --output-format json
+"""
+from pathlib import Path
+
+import click
+
+from mml_utils.filelists import read_filelist
+from mml_utils.packing import pack_notes, unpack_outputs
+
+
+@click.command()
+@click.argument('filelist', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option('--pack-dir', type=click.Path(file_okay=False, path_type=Path), required=True,
+              help='Directory to write packs, their offset maps, and a filelist of packs.')
+@click.option('--max-chars', type=int, default=100_000,
+              help='Approximate maximum number of characters in each pack.')
+@click.option('--max-notes', type=int, default=1_000,
+              help='Maximum number of notes in each pack.')
+@click.option('--text-encoding', default='utf8',
+              help='Encoding of the note text files.')
+def pack_notes_cmd(filelist: Path, pack_dir: Path, max_chars=100_000, max_notes=1_000, text_encoding='utf8'):
+    pack_notes(read_filelist(filelist), pack_dir, max_chars=max_chars, max_notes=max_notes, encoding=text_encoding)
+
+
+@click.command()
+@click.argument('pack-filelist', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option('--output-format', type=str, default='json',
+              help='Output format (e.g., json or mmi)')
+def unpack_outputs_cmd(pack_filelist: Path, output_format='json'):
+    unpack_outputs(pack_filelist, output_format=output_format)
+
+
+if __name__ == '__main__':
+    pack_notes_cmd()
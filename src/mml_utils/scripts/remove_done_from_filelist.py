@@ -8,6 +8,8 @@ from pathlib import Path
 import click
 from loguru import logger
 
+from mml_utils.manifest import RunManifest
+
 
 @click.command()
 @click.argument('filelist', type=click.Path(path_type=Path, dir_okay=False))
@@ -15,20 +17,27 @@ from loguru import logger
               help='Output format (e.g., json, mmi, xmi)')
 @click.option('--output-directory', default=None, type=click.Path(path_type=Path, file_okay=False),
               help='Output directory if different than input.')
-def clean_filelist(filelist: Path, output_directory: Path = None, output_format='json'):
+@click.option('--manifest', 'manifest_path', type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              default=None,
+              help='Use statuses recorded in this SQLite run manifest rather than looking for output files.')
+def clean_filelist(filelist: Path, output_directory: Path = None, output_format='json', manifest_path=None):
     now = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
     bk = filelist.rename(str(filelist) + f'.{now}.bk')
     logger.info(f'Backup of original filelist at {bk}.')
     last_line = None  # keep pointer to last completed to force re-running this one
     cnt = 0
     undone = 0
+    done = None
+    if manifest_path:
+        with open(bk) as fh, RunManifest(manifest_path) as manifest:
+            done = manifest.get_done(line.strip() for line in fh)
     with open(filelist, 'w') as out:
         with open(bk) as fh:
             for line in fh:
                 p = Path(line.strip().removesuffix('.txt') + f'.{output_format}')
                 if output_directory:
                     p = output_directory / p.name
-                if p.exists():
+                if line.strip() in done if done is not None else p.exists():
                     last_line = line
                     cnt += 1
                     continue
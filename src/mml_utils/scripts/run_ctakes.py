@@ -22,8 +22,12 @@ from mml_utils.run_ctakes import run_ctakes
               help='Remove non-xml characters from files in directories. Overwrites the files.')
 @click.option('--clean-files-src-encoding', default='utf8',
               help='File format to read in src files for cleaning.')
+@click.option('--profile', is_flag=True, default=False,
+              help='Sample memory, CPU, and I/O of cTAKES and write a run report (`{directory}.profile.json` and'
+                   ' `run_profiles.csv`) next to the directory.')
 def run_ctakes_directory(directory: Path, ctakes_home: Path, outdir: Path, umls_key: str = None,
-                         dictionary: Path = None, clean_files: bool = False, clean_files_src_encoding='utf8'):
+                         dictionary: Path = None, clean_files: bool = False, clean_files_src_encoding='utf8',
+                         profile=False):
     if clean_files:
         logger.info(f'Overwriting files in {directory} to remove non-XML characters.')
         count = clean_non_xml(directory, encoding=clean_files_src_encoding)
@@ -31,7 +35,7 @@ def run_ctakes_directory(directory: Path, ctakes_home: Path, outdir: Path, umls_
     else:
         logger.info(f'Skipping removing non-XML characters from text:'
                     f' cTAKES may error out if these have not been removed.')
-    run_ctakes(directory, ctakes_home, outdir, umls_key, dictionary)
+    run_ctakes(directory, ctakes_home, outdir, umls_key, dictionary, profile=profile)
 
 
 if __name__ == '__main__':
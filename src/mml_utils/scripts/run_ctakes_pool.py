@@ -0,0 +1,71 @@
+"""
+Run multiple cTAKES pipelines in parallel over the files in a directory.
+
+The directory is split into shard directories of links (balanced by file size), each run by its own cTAKES JVM.
+    Output from every shard is merged into `--outdir`, and shards on which cTAKES fails are retried with their
+    remaining files. If interrupted, re-run the same command to resume.
+
+cTAKES locks its dictionary, so give each worker its own cTAKES install by repeating `--ctakes-home`.
+
+Example:
+    mml-run-ctakes-pool /path/to/notes --ctakes-home /opt/ctakes0 --ctakes-home /opt/ctakes1 --outdir /path/to/xmi
+"""
+from pathlib import Path
+
+import click
+from loguru import logger
+
+from mml_utils.ctakes.clean import clean_non_xml
+from mml_utils.ctakes_pool import run_ctakes_pool
+from mml_utils.manifest import RunManifest
+
+
+@click.command()
+@click.argument('directory', type=click.Path(exists=True, path_type=Path, file_okay=False))
+@click.option('--ctakes-home', 'ctakes_homes', multiple=True, required=True,
+              type=click.Path(path_type=Path, file_okay=False),
+              help='Path to cTAKES home (should have "bin" dir inside). Repeat to give workers separate installs.')
+@click.option('--outdir', type=click.Path(path_type=Path, file_okay=False), required=True,
+              help='Directory to put output XMI files.')
+@click.option('--umls-key', default=None,
+              help='UMLS key including hyphens for using UMLS dictionary.')
+@click.option('--dictionary', type=click.Path(path_type=Path, dir_okay=True),
+              help='Path to XML file for custom-created dictionary.')
+@click.option('--n-workers', type=int, default=None,
+              help='Number of cTAKES pipelines to run in parallel. By default, as many as available memory'
+                   ' and CPUs allow.')
+@click.option('--max-heap', type=str, default=None,
+              help='Maximum heap size for each cTAKES pipeline (passed to java as `-Xmx`). By default, the'
+                   ' `runClinicalPipeline` script (and its heap size) is used.')
+@click.option('--shard-dir', type=click.Path(path_type=Path, file_okay=False), default=None,
+              help='Directory to write shards to; defaults to `{directory}_ctakes_shards` next to DIRECTORY.')
+@click.option('--shard-size', type=int, default=None,
+              help='Maximum number of files in each shard (default: one shard per worker).')
+@click.option('--retries', type=int, default=2,
+              help='Number of times to re-run the remaining files of a shard on which cTAKES failed.')
+@click.option('--progress-interval', type=int, default=60,
+              help='Report progress every this many seconds.')
+@click.option('--manifest', 'manifest_path', type=click.Path(path_type=Path, dir_okay=False), default=None,
+              help='SQLite run manifest to record the status of each file in (see `mml-check-progress --manifest`).')
+@click.option('--profile', is_flag=True, default=False,
+              help='Sample memory, CPU, and I/O of each cTAKES pipeline and write a run report'
+                   ' (`{shard}.profile.json` and `run_profiles.csv`) in the shard directory.')
+@click.option('--clean-files', default=False, is_flag=True,
+              help='Remove non-xml characters from files in directories. Overwrites the files.')
+@click.option('--clean-files-src-encoding', default='utf8',
+              help='File format to read in src files for cleaning.')
+def run_ctakes_pool_cmd(directory: Path, ctakes_homes, outdir: Path, umls_key=None, dictionary=None, n_workers=None,
+                        max_heap=None, shard_dir=None, shard_size=None, retries=2, progress_interval=60,
+                        manifest_path=None, profile=False, clean_files=False, clean_files_src_encoding='utf8'):
+    if clean_files:
+        logger.info(f'Overwriting files in {directory} to remove non-XML characters.')
+        count = clean_non_xml(directory, encoding=clean_files_src_encoding)
+        logger.info(f'Overwrote {count} files in {directory} containing non-XML characters.')
+    manifest = RunManifest(manifest_path) if manifest_path else None
+    run_ctakes_pool(directory, ctakes_homes, outdir, n_workers=n_workers, max_heap=max_heap, shard_dir=shard_dir,
+                    shard_size=shard_size, umls_key=umls_key, dictionary=dictionary, retries=retries,
+                    progress_interval=progress_interval, manifest=manifest, profile=profile)
+
+
+if __name__ == '__main__':
+    run_ctakes_pool_cmd()
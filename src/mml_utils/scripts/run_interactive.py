@@ -6,6 +6,8 @@ from tempfile import TemporaryDirectory
 
 import click
 
+from mml_utils.mml_session import MmlSession
+
 
 def run_mml_from_text(text, mml_home, *, restrict_to_sts=None, restrict_to_src=None, output_format='json'):
     restrict_to_sts = f"--restrict_to_sts={','.join(restrict_to_sts)}" if restrict_to_sts else ''
@@ -56,7 +58,25 @@ def help(sources, semantic_types):
 
 @click.command()
 @click.argument('mml-home', type=click.Path(exists=True, path_type=pathlib.Path))
-def interactive_mml(mml_home: pathlib.Path):
+@click.option('--warm', is_flag=True, default=False,
+              help='Keep MetaMapLite loaded between queries rather than starting it for each query'
+                   ' (requires JDK 11+).')
+@click.option('--version', default=None,
+              help='Specify UMLS version (only used with `--warm`).')
+@click.option('--dataset', default='USAbase',
+              help='Specify UMLS dataset (only used with `--warm`).')
+@click.option('--max-heap', type=str, default='12g',
+              help='Maximum heap size for MetaMapLite (only used with `--warm`).')
+def interactive_mml(mml_home: pathlib.Path, warm=False, version=None, dataset='USAbase', max_heap='12g'):
+    session = MmlSession(mml_home, version=version, dataset=dataset, max_heap=max_heap).start() if warm else None
+    try:
+        _interactive_mml(mml_home, session)
+    finally:
+        if session:
+            session.close()
+
+
+def _interactive_mml(mml_home: pathlib.Path, session: MmlSession = None):
     sources = []
     semantic_types = []
     help(sources, semantic_types)
@@ -85,7 +105,10 @@ def interactive_mml(mml_home: pathlib.Path):
             else:
                 data.append(datum)
         text = '\n'.join(data)
-        result = run_mml_from_text(text, mml_home, restrict_to_src=sources, restrict_to_sts=semantic_types)
+        if session:
+            result = session.annotate(text, restrict_to_src=sources, restrict_to_sts=semantic_types)
+        else:
+            result = run_mml_from_text(text, mml_home, restrict_to_src=sources, restrict_to_sts=semantic_types)
         print(' === === === ')
         print(f'RESULTS: {len(result)}')
         print(json.dumps(result, indent=2))
@@ -0,0 +1,67 @@
+"""
+Run full MetaMap on a filelist or directory (or each run in a `mml-build-mmscript-multi` config) in parallel.
+
+Unlike the shell scripts from `mml-build-mmscript`, files with existing `.mmi` output are skipped, failures are
+    retried, the tagger/WSD servers are restarted if they stop accepting connections, and the time taken for each
+    file is recorded (`--latency-file`).
+
+Example:
+    mml-run-mm --filelist /path/to/filelist.txt --mm-outpath /path/to/out --parameters "-R MDR -N" --n-workers 8
+"""
+from pathlib import Path
+
+import click
+
+from mml_utils.config.build_mm_script import MultiBuildMMScript
+from mml_utils.config.parser import parse_config
+from mml_utils.planner import get_cpu_count
+from mml_utils.run_mm import MetaMapExecutor, MmServers, get_mm_bin, get_mm_tasks, get_mm_tasks_from_config
+
+
+@click.command()
+@click.option('--config', 'config_file', default=None, type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              help='Config file (toml/json) as for `mml-build-mmscript-multi`: run metamap for each of its runs.')
+@click.option('--mm-path', default=None, type=click.Path(path_type=Path),
+              help='If `metamap` not in PATH, use this to specify the full path.')
+@click.option('--filelist', type=click.Path(dir_okay=False, path_type=Path),
+              help='Filelist containing fullpaths to files to process.')
+@click.option('--directory', type=click.Path(file_okay=False, path_type=Path),
+              help='Path to directory to process.')
+@click.option('--mm-outpath', default=None, type=click.Path(file_okay=False, path_type=Path),
+              help='Directory to output metamap-processed files. Defaults to the same location as the file itself.')
+@click.option('--parameters', default='',
+              help='Parameters that should be passed to metamap.')
+@click.option('--n-workers', type=int, default=None,
+              help='Maximum number of metamap processes to run at once (default: number of CPUs).')
+@click.option('--retries', type=int, default=2,
+              help='Number of times to re-run metamap on a file after it fails.')
+@click.option('--timeout', type=float, default=None,
+              help='Kill metamap if a file takes more than this many seconds (and retry).')
+@click.option('--no-servers', is_flag=True, default=False,
+              help='Do not check (or restart) the skrmedpostctl/wsdserverctl servers.')
+@click.option('--server-check-interval', type=float, default=60,
+              help='Check the servers are running at most every this many seconds (and after any failure).')
+@click.option('--latency-file', type=click.Path(dir_okay=False, path_type=Path), default=Path('mm_latency.csv'),
+              help='CSV file to append the time taken (and status) of each metamap invocation to.')
+def run_mm_cmd(config_file=None, mm_path=None, filelist=None, directory=None, mm_outpath=None, parameters='',
+               n_workers=None, retries=2, timeout=None, no_servers=False, server_check_interval=60,
+               latency_file=Path('mm_latency.csv')):
+    if config_file:
+        config = MultiBuildMMScript(**parse_config(config_file))
+        tasks = get_mm_tasks_from_config(config)
+        mm_path = mm_path or config.mm_path
+    else:
+        tasks = get_mm_tasks(parameters, filelist, directory, mm_outpath)
+    mm_path = mm_path or 'metamap'
+    servers = None
+    if not no_servers:
+        bin_dir = get_mm_bin(mm_path)
+        if bin_dir is None:
+            raise click.UsageError(f'Unable to find metamap executable: {mm_path}.')
+        servers = MmServers(bin_dir, check_interval=server_check_interval)
+    MetaMapExecutor(tasks, mm_path, n_workers=n_workers or get_cpu_count(), retries=retries, timeout=timeout,
+                    servers=servers, latency_path=latency_file).run()
+
+
+if __name__ == '__main__':
+    run_mm_cmd()
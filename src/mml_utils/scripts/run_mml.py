@@ -11,6 +11,9 @@ Arguments:
         - Must choose one of the numbered outputs.
         - Will only process current `in_progress` (reads at initialization; doesn't keep checking for new files)
 
+    * --n-workers INTEGER
+        - Number of MetaMapLite instances to run in parallel (each `in_progress` file is run by one instance).
+
 Example:
     python.exe run_mml.py --mml-home ./public_mm_lite --filedir /path/to/dir/mml_lists/0
 
@@ -22,7 +25,11 @@ import pathlib
 
 import click
 
+from mml_utils.cache import MmlCache
+from mml_utils.manifest import RunManifest
+from mml_utils.mml_pool import run_mml_pool
 from mml_utils.run_mml import repeat_run_mml, run_mml
+from mml_utils.watchdog import supervise_run_mml
 
 
 @click.command()
@@ -43,23 +50,73 @@ from mml_utils.run_mml import repeat_run_mml, run_mml
 @click.option('--loglevel', default='WARN',
               type=click.Choice(['ALL', 'DEBUG', 'INFO', 'WARN', 'ERROR', 'FATAL', 'OFF', 'TRACE']),
               help='Select logging level. Defaults to WARN to avoid MML\'s dense logging output.')
+@click.option('--repeat', is_flag=True, default=False,
+              help='If MetaMapLite fails, skip the file causing the failure and re-run on the remaining files.')
+@click.option('--isolate-failures', default='first', type=click.Choice(['first', 'bisect']),
+              help='With `--repeat`, how to find files causing failures: assume it is the first file without'
+                   ' output, or repeatedly split the remaining files in half and run these in parallel.')
+@click.option('--n-workers', type=int, default=1,
+              help='Number of MetaMapLite instances to run in parallel. Use 0 to run as many as available memory'
+                   ' and CPUs allow.')
+@click.option('--max-heap', type=str, default='12g',
+              help='Maximum heap size for each MetaMapLite instance (passed to java as `-Xmx`). Use `auto` to'
+                   ' choose based on the size of the index and available memory.')
+@click.option('--cache', 'cache_path', type=click.Path(path_type=pathlib.Path, dir_okay=False), default=None,
+              help='SQLite file to cache MetaMapLite output in: files with identical text (and settings) already'
+                   ' in the cache are not re-run.')
+@click.option('--cache-max-mb', type=float, default=1024,
+              help='Maximum size of `--cache`; least recently used results are removed beyond this.')
+@click.option('--stall-timeout', type=float, default=None,
+              help='If MetaMapLite writes no output for this many seconds, kill it, quarantine the file it is stuck'
+                   ' on (see `quarantine.txt` and `stalls.jsonl`), and restart it on the remaining files.')
+@click.option('--manifest', 'manifest_path', type=click.Path(path_type=pathlib.Path, dir_okay=False), default=None,
+              help='SQLite run manifest to record the status of each file in (see `mml-check-progress --manifest`).')
+@click.option('--profile', is_flag=True, default=False,
+              help='Sample memory, CPU, and I/O of each MetaMapLite run and write a run report'
+                   ' (`{filelist}.profile.json` and `run_profiles.csv`) next to the filelist.')
 def run_mml_filelists_in_dir(filedir: pathlib.Path, mml_home: pathlib.Path, output_format='json',
                              property_file=None, properties=None, repeat=False, version=None, dataset='USAbase',
-                             loglevel='WARN'):
+                             loglevel='WARN', isolate_failures='first', n_workers=1, max_heap='12g',
+                             cache_path=None, cache_max_mb=1024, stall_timeout=None, manifest_path=None,
+                             profile=False):
     """
 
+    :param isolate_failures: with repeat, method for finding files causing failures ('first' or 'bisect')
+    :param max_heap: maximum heap size for each metamaplite instance
+    :param cache_path: sqlite file to cache metamaplite output in
+    :param cache_max_mb: maximum size of cache
+    :param stall_timeout: seconds without output before restarting metamaplite without the current file
+    :param manifest_path: sqlite run manifest to record status of each file in
+    :param profile: write a run report for each run of metamaplite
+    :param n_workers: number of metamaplite instances to run in parallel
     :param repeat:
     :param filedir:
     :param mml_home: path to metmaplite instance
     :return:
     """
+    cache = MmlCache(cache_path, max_size_mb=cache_max_mb) if cache_path else None
+    manifest = RunManifest(manifest_path) if manifest_path else None
+    if n_workers != 1 and not repeat:
+        run_mml_pool(sorted(filedir.glob('*.in_progress')), mml_home, n_workers=n_workers or None, split=False,
+                     max_heap=max_heap, output_format=output_format, property_file=property_file,
+                     properties=properties, version=version, dataset=dataset, loglevel=loglevel, cache=cache,
+                     stall_timeout=stall_timeout, manifest=manifest, profile=profile)
+        return
     for file in filedir.glob('*.in_progress'):
-        if repeat:
+        if stall_timeout:
+            supervise_run_mml(file, mml_home, stall_timeout=stall_timeout, output_format=output_format,
+                              property_file=property_file, properties=properties, version=version,
+                              dataset=dataset, loglevel=loglevel, max_heap=max_heap, manifest=manifest,
+                              profile=profile)
+        elif repeat:
             repeat_run_mml(file, mml_home, output_format=output_format, property_file=property_file,
-                           properties=properties, version=version, dataset=dataset, loglevel=loglevel)
+                           properties=properties, version=version, dataset=dataset, loglevel=loglevel,
+                           max_heap=max_heap, isolate_failures=isolate_failures, n_workers=max(n_workers, 2),
+                           cache=cache, manifest=manifest, profile=profile)
         else:
             run_mml(file, mml_home, output_format=output_format, property_file=property_file, properties=properties,
-                    version=version, dataset=dataset, loglevel=loglevel)
+                    version=version, dataset=dataset, loglevel=loglevel, max_heap=max_heap, cache=cache,
+                    manifest=manifest, profile=profile)
         file.rename(str(file).replace('.in_progress', '.complete'))
 
 
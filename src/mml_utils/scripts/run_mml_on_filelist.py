@@ -5,8 +5,11 @@ from pathlib import Path
 
 import click
 
+from mml_utils.cache import MmlCache
+from mml_utils.manifest import RunManifest
 from mml_utils.filelists import build_filelist
 from mml_utils.run_mml import repeat_run_mml, run_mml
+from mml_utils.watchdog import supervise_run_mml
 
 
 @click.command()
@@ -32,21 +35,55 @@ from mml_utils.run_mml import repeat_run_mml, run_mml
 @click.option('--loglevel', default='WARN',
               type=click.Choice(['ALL', 'DEBUG', 'INFO', 'WARN', 'ERROR', 'FATAL', 'OFF', 'TRACE']),
               help='Select logging level. Defaults to WARN to avoid MML\'s dense logging output.')
+@click.option('--repeat', is_flag=True, default=False,
+              help='If MetaMapLite fails, skip the file causing the failure and re-run on the remaining files.')
+@click.option('--isolate-failures', default='first', type=click.Choice(['first', 'bisect']),
+              help='With `--repeat`, how to find files causing failures: assume it is the first file without'
+                   ' output, or repeatedly split the remaining files in half and run these in parallel.')
+@click.option('--n-workers', type=int, default=2,
+              help='Number of MetaMapLite instances to run in parallel with `--isolate-failures bisect`.')
+@click.option('--max-heap', type=str, default='12g',
+              help='Maximum heap size for each MetaMapLite instance (passed to java as `-Xmx`). Use `auto` to'
+                   ' choose based on the size of the index and available memory.')
+@click.option('--cache', 'cache_path', type=click.Path(path_type=Path, dir_okay=False), default=None,
+              help='SQLite file to cache MetaMapLite output in: files with identical text (and settings) already'
+                   ' in the cache are not re-run.')
+@click.option('--cache-max-mb', type=float, default=1024,
+              help='Maximum size of `--cache`; least recently used results are removed beyond this.')
+@click.option('--stall-timeout', type=float, default=None,
+              help='If MetaMapLite writes no output for this many seconds, kill it, quarantine the file it is stuck'
+                   ' on (see `quarantine.txt` and `stalls.jsonl`), and restart it on the remaining files.')
+@click.option('--manifest', 'manifest_path', type=click.Path(path_type=Path, dir_okay=False), default=None,
+              help='SQLite run manifest to record the status of each file in (see `mml-check-progress --manifest`).')
+@click.option('--profile', is_flag=True, default=False,
+              help='Sample memory, CPU, and I/O of each MetaMapLite run and write a run report'
+                   ' (`{filelist}.profile.json` and `run_profiles.csv`) next to the filelist.')
 def run_single_mml_filelist(filelist: Path, file: Path, directory: Path, mml_home: Path, output_format='json',
                             property_file=None, properties=None, repeat=False, version=None, dataset='USAbase',
-                            loglevel='WARN'):
+                            loglevel='WARN', isolate_failures='first', n_workers=2, max_heap='12g',
+                            cache_path=None, cache_max_mb=1024, stall_timeout=None, manifest_path=None,
+                            profile=False):
     if file:
         filelist = build_filelist(file)
     elif directory:
         filelist = build_filelist(directory)
     if not filelist:
         raise ValueError(f'No filelist specified. Must supply `--file`, `--filelist`, or `--directory` arguments.')
-    if repeat:
+    cache = MmlCache(cache_path, max_size_mb=cache_max_mb) if cache_path else None
+    manifest = RunManifest(manifest_path) if manifest_path else None
+    if stall_timeout:
+        supervise_run_mml(filelist, mml_home, stall_timeout=stall_timeout, output_format=output_format,
+                          property_file=property_file, properties=properties, version=version, dataset=dataset,
+                          loglevel=loglevel, max_heap=max_heap, manifest=manifest, profile=profile)
+    elif repeat:
         repeat_run_mml(filelist, mml_home, output_format=output_format, property_file=property_file,
-                       properties=properties, version=version, dataset=dataset, loglevel=loglevel)
+                       properties=properties, version=version, dataset=dataset, loglevel=loglevel,
+                       isolate_failures=isolate_failures, n_workers=n_workers, max_heap=max_heap, cache=cache,
+                       manifest=manifest, profile=profile)
     else:
         run_mml(filelist, mml_home, output_format=output_format, property_file=property_file, properties=properties,
-                version=version, dataset=dataset, loglevel=loglevel)
+                version=version, dataset=dataset, loglevel=loglevel, max_heap=max_heap, cache=cache,
+                manifest=manifest, profile=profile)
 
 
 if __name__ == '__main__':
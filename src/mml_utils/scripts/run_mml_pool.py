@@ -0,0 +1,78 @@
+"""
+Run multiple MetaMapLite instances in parallel over one or more filelists.
+
+Each filelist is split into shards (default: 10,000 files) which are placed on a queue. Each worker runs
+    its own MetaMapLite JVM, taking the next shard when it finishes the previous one. Completed shards are
+    renamed to `.complete`. If interrupted (Ctrl+C or SIGTERM), running shards are re-written to contain only
+    unprocessed files: re-run the same command to resume.
+
+Example:
+    mml-run-pool /path/to/filelist.txt --mml-home ./public_mm_lite --n-workers 8 --max-heap 6g
+"""
+from pathlib import Path
+
+import click
+
+from mml_utils.cache import MmlCache
+from mml_utils.manifest import RunManifest
+from mml_utils.mml_pool import run_mml_pool
+
+
+@click.command()
+@click.argument('filelists', nargs=-1, type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option('--mml-home', type=click.Path(path_type=Path, file_okay=False),
+              help='Path to metamaplite home.')
+@click.option('--n-workers', type=int, default=None,
+              help='Number of MetaMapLite instances to run in parallel. By default, as many as available memory'
+                   ' and CPUs allow.')
+@click.option('--max-heap', type=str, default='12g',
+              help='Maximum heap size for each MetaMapLite instance (passed to java as `-Xmx`). Use `auto` to'
+                   ' choose based on the size of the index and available memory.')
+@click.option('--shard-size', type=int, default=10_000,
+              help='Maximum number of files in each shard.')
+@click.option('--shard-dir', type=click.Path(path_type=Path, file_okay=False), default=None,
+              help='Directory to write shards to; defaults to `{filelist}_shards` next to each filelist.')
+@click.option('--progress-interval', type=int, default=60,
+              help='Report progress every this many seconds.')
+@click.option('--output-format', type=str, default='json',
+              help='Output format (e.g., json or mmi)')
+@click.option('--property-file', type=str, default=None,
+              help='Path to properety file to run.')
+@click.option('--properties', nargs=2, default=None, multiple=True,
+              help='Specify additional properties, e.g., --properties metamaplite.index.directory $PATH.')
+@click.option('--version', default=None,
+              help='Specify UMLS version. If not specified, relevant version will be automatically selected'
+                   ' according to dataset.')
+@click.option('--dataset', default='USAbase',
+              help='Specify UMLS dataset.')
+@click.option('--loglevel', default='WARN',
+              type=click.Choice(['ALL', 'DEBUG', 'INFO', 'WARN', 'ERROR', 'FATAL', 'OFF', 'TRACE']),
+              help='Select logging level. Defaults to WARN to avoid MML\'s dense logging output.')
+@click.option('--cache', 'cache_path', type=click.Path(path_type=Path, dir_okay=False), default=None,
+              help='SQLite file to cache MetaMapLite output in: files with identical text (and settings) already'
+                   ' in the cache are not re-run.')
+@click.option('--cache-max-mb', type=float, default=1024,
+              help='Maximum size of `--cache`; least recently used results are removed beyond this.')
+@click.option('--stall-timeout', type=float, default=None,
+              help='If MetaMapLite writes no output for this many seconds, kill it, quarantine the file it is stuck'
+                   ' on (see `quarantine.txt` and `stalls.jsonl`), and restart it on the remaining files.')
+@click.option('--manifest', 'manifest_path', type=click.Path(path_type=Path, dir_okay=False), default=None,
+              help='SQLite run manifest to record the status of each file in (see `mml-check-progress --manifest`).')
+@click.option('--profile', is_flag=True, default=False,
+              help='Sample memory, CPU, and I/O of each MetaMapLite run and write a run report'
+                   ' (`{filelist}.profile.json` and `run_profiles.csv`) next to the filelist.')
+def run_mml_pool_cmd(filelists, mml_home: Path, n_workers=None, max_heap='12g', shard_size=10_000, shard_dir=None,
+                     progress_interval=60, output_format='json', property_file=None, properties=None, version=None,
+                     dataset='USAbase', loglevel='WARN', cache_path=None, cache_max_mb=1024, stall_timeout=None,
+                     manifest_path=None, profile=False):
+    cache = MmlCache(cache_path, max_size_mb=cache_max_mb) if cache_path else None
+    manifest = RunManifest(manifest_path) if manifest_path else None
+    run_mml_pool(filelists, mml_home, n_workers=n_workers, max_heap=max_heap, shard_size=shard_size,
+                 shard_dir=shard_dir, progress_interval=progress_interval, output_format=output_format,
+                 property_file=property_file, properties=properties, version=version, dataset=dataset,
+                 loglevel=loglevel, cache=cache, stall_timeout=stall_timeout, manifest=manifest,
+                 profile=profile)
+
+
+if __name__ == '__main__':
+    run_mml_pool_cmd()
@@ -0,0 +1,89 @@
+"""
+Run MetaMapLite on several hosts sharing a queue directory (e.g., on NFS).
+
+Create the queue once (from any host), start a worker on each host, and check status from anywhere:
+    mml-queue-create /path/to/filelist.txt /shared/queue --shard-size 10000
+    mml-queue-worker /shared/queue --mml-home ./public_mm_lite --n-workers 4
+    mml-queue-status /shared/queue
+
+Workers claim shards by creating lease files (see `mml_utils.work_queue`). If a host dies, its shards are reclaimed
+    by other workers once `--lease-timeout` seconds pass without a heartbeat.
+"""
+from pathlib import Path
+
+import click
+
+from mml_utils.cache import MmlCache
+from mml_utils.mml_pool import split_filelist_to_shards
+from mml_utils.work_queue import LeaseQueue, LeasedMmlPool, log_queue_status
+
+
+@click.command()
+@click.argument('filelists', nargs=-1, type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.argument('queue-dir', type=click.Path(file_okay=False, path_type=Path))
+@click.option('--shard-size', type=int, default=10_000,
+              help='Maximum number of files in each shard.')
+def create_queue_cmd(filelists, queue_dir: Path, shard_size=10_000):
+    for filelist in filelists:
+        split_filelist_to_shards(filelist, shard_dir=queue_dir, shard_size=shard_size)
+
+
+@click.command()
+@click.argument('queue-dir', type=click.Path(exists=True, file_okay=False, path_type=Path))
+@click.option('--mml-home', type=click.Path(path_type=Path, file_okay=False),
+              help='Path to metamaplite home.')
+@click.option('--n-workers', type=int, default=None,
+              help='Number of MetaMapLite instances to run in parallel on this host. By default, as many as'
+                   ' available memory and CPUs allow.')
+@click.option('--max-heap', type=str, default='12g',
+              help='Maximum heap size for each MetaMapLite instance (passed to java as `-Xmx`). Use `auto` to'
+                   ' choose based on the size of the index and available memory.')
+@click.option('--lease-timeout', type=float, default=600,
+              help='Seconds without a heartbeat before another worker may reclaim a shard.')
+@click.option('--heartbeat-interval', type=float, default=None,
+              help='Seconds between heartbeats (default: a tenth of `--lease-timeout`).')
+@click.option('--host', type=str, default=None,
+              help='Name to record for this host (default: hostname).')
+@click.option('--progress-interval', type=int, default=60,
+              help='Report progress every this many seconds.')
+@click.option('--output-format', type=str, default='json',
+              help='Output format (e.g., json or mmi)')
+@click.option('--property-file', type=str, default=None,
+              help='Path to properety file to run.')
+@click.option('--properties', nargs=2, default=None, multiple=True,
+              help='Specify additional properties, e.g., --properties metamaplite.index.directory $PATH.')
+@click.option('--version', default=None,
+              help='Specify UMLS version. If not specified, relevant version will be automatically selected'
+                   ' according to dataset.')
+@click.option('--dataset', default='USAbase',
+              help='Specify UMLS dataset.')
+@click.option('--loglevel', default='WARN',
+              type=click.Choice(['ALL', 'DEBUG', 'INFO', 'WARN', 'ERROR', 'FATAL', 'OFF', 'TRACE']),
+              help='Select logging level. Defaults to WARN to avoid MML\'s dense logging output.')
+@click.option('--cache', 'cache_path', type=click.Path(path_type=Path, dir_okay=False), default=None,
+              help='SQLite file (on local disk) to cache MetaMapLite output in: files with identical text'
+                   ' (and settings) already in the cache are not re-run.')
+@click.option('--cache-max-mb', type=float, default=1024,
+              help='Maximum size of `--cache`; least recently used results are removed beyond this.')
+@click.option('--stall-timeout', type=float, default=None,
+              help='If MetaMapLite writes no output for this many seconds, kill it, quarantine the file it is stuck'
+                   ' on (see `quarantine.txt` and `stalls.jsonl`), and restart it on the remaining files.')
+def run_queue_worker_cmd(queue_dir: Path, mml_home: Path, n_workers=None, max_heap='12g', lease_timeout=600,
+                         heartbeat_interval=None, host=None, progress_interval=60, output_format='json',
+                         property_file=None, properties=None, version=None, dataset='USAbase', loglevel='WARN',
+                         cache_path=None, cache_max_mb=1024, stall_timeout=None):
+    cache = MmlCache(cache_path, max_size_mb=cache_max_mb) if cache_path else None
+    lease_queue = LeaseQueue(queue_dir, lease_timeout=lease_timeout, heartbeat_interval=heartbeat_interval, host=host)
+    LeasedMmlPool(lease_queue, mml_home, n_workers=n_workers, max_heap=max_heap, progress_interval=progress_interval,
+                  output_format=output_format, property_file=property_file, properties=properties, version=version,
+                  dataset=dataset, loglevel=loglevel, cache=cache, stall_timeout=stall_timeout).run()
+
+
+@click.command()
+@click.argument('queue-dir', type=click.Path(exists=True, file_okay=False, path_type=Path))
+def queue_status_cmd(queue_dir: Path):
+    log_queue_status(queue_dir)
+
+
+if __name__ == '__main__':
+    run_queue_worker_cmd()
@@ -6,6 +6,9 @@ import pathlib
 import click
 from loguru import logger
 
+from mml_utils.filelists import read_filelist
+from mml_utils.sharding import CostModel, shard_files
+
 
 class MultiWriter:
     def __init__(self, file: pathlib.Path, n):
@@ -30,13 +33,22 @@ class MultiWriter:
 @click.command()
 @click.argument('filelist', type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
 @click.argument('n', type=int)
-def split_filelist(filelist: pathlib.Path, n: int):
+@click.option('--balance-by', default='count', type=click.Choice(['count', 'size']),
+              help='Give each part the same number of files (count) or the same expected processing time'
+                   ' based on file sizes (size).')
+@click.option('--cost-model', default=None, type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+              help='With `--balance-by size`, json file with calibrated cost model (see `mml-calibrate-cost`).')
+def split_filelist(filelist: pathlib.Path, n: int, balance_by='count', cost_model=None):
     """
     Split filelist into n separate (and mostly equal) parts
+    :param cost_model: path to calibrated cost model
+    :param balance_by: 'count' (round-robin) or 'size'
     :param filelist:
     :param n:
     :return:
     """
+    if balance_by == 'size':
+        return split_filelist_by_size(filelist, n, cost_model=CostModel.load(cost_model) if cost_model else None)
     total_rows = 0
     with MultiWriter(filelist, n) as writer:
         with open(filelist, encoding='utf8') as fh:
@@ -46,5 +58,15 @@ def split_filelist(filelist: pathlib.Path, n: int):
         logger.info(f'Divided {total_rows} into {n} separate files: {writer.counts} ({sum(writer.counts)})')
 
 
+def split_filelist_by_size(filelist: pathlib.Path, n: int, cost_model: CostModel = None):
+    """Split filelist into n parts with about the same total expected processing time."""
+    shards = shard_files(read_filelist(filelist), n, cost_model=cost_model)
+    with MultiWriter(filelist, n) as writer:
+        for i, shard in enumerate(shards):
+            for file in shard:
+                writer.write(f'{file}\n', i)
+        logger.info(f'Divided {sum(writer.counts)} into {n} separate files: {writer.counts}')
+
+
 if __name__ == '__main__':
     split_filelist()
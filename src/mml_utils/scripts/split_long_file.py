@@ -2,12 +2,24 @@
 MML seems to have trouble with longer files. Split these up but preserve the offsets (if possible).
 
 I am not clear if this is based on line number or character count.
+
+`split_files_on_windows` splits into overlapping windows of bounded size (cutting at sentence/line boundaries) and
+    records the offset of each part in a manifest, so that `merge_split_output` can rebuild output for the whole file.
 """
+import json
 import pathlib
+import re
 from typing import List
 
 import click
 from charset_normalizer import from_path
+from loguru import logger
+
+from mml_utils.filelists import get_output_path
+from mml_utils.packing import get_java_length
+from mml_utils.parse.json import shift_json_offsets
+
+BOUNDARY_PAT = re.compile(r'(?<=[.!?])\s+|\n+')
 
 
 @click.command()
@@ -49,5 +61,142 @@ def split_on_lines(file, n_lines=200, *, in_encoding='cp1252', out_encoding='cp1
     yield name
 
 
+def _find_boundary(text, lo, hi):
+    """Position after the last sentence/line boundary in text[lo:hi] (or `hi` if there is none)."""
+    end = None
+    for m in BOUNDARY_PAT.finditer(text, lo, hi):
+        end = m.end()
+    return end if end else hi
+
+
+def get_windows(text, max_chars=20_000, overlap=500) -> list[tuple[int, int]]:
+    """
+    Split text into windows of at most `max_chars`, ending at sentence or line boundaries where possible.
+        Consecutive windows overlap by about `overlap` characters so matches cut by one window are found in the next.
+    :return: list of (start, end) of each window
+    """
+    if overlap * 4 >= max_chars:
+        raise ValueError(f'Overlap ({overlap}) must be less than a quarter of window size ({max_chars}).')
+    windows = []
+    start = 0
+    while len(text) - start > max_chars:
+        end = _find_boundary(text, start + max_chars // 2, start + max_chars)
+        windows.append((start, end))
+        start = _find_boundary(text, end - 2 * overlap, end - overlap)
+    windows.append((start, len(text)))
+    return windows
+
+
+def split_on_windows(file, max_chars=20_000, overlap=500, *, in_encoding='utf8', out_encoding='utf8',
+                     detect_encoding=False, errors='replace'):
+    """
+    Split file into overlapping windows, yielding manifest records for each part.
+        Offsets in the manifest are in MetaMapLite's units (see `packing.get_java_length`).
+    :param detect_encoding: guess encoding with `charset_normalizer` rather than using `in_encoding`
+    """
+    if detect_encoding:
+        text = str(from_path(file).best())
+    else:
+        with open(file, encoding=in_encoding, errors=errors, newline='') as fh:  # keep CRLF: MetaMapLite counts it
+            text = fh.read()
+    windows = get_windows(text, max_chars=max_chars, overlap=overlap)
+    for i, (start, end) in enumerate(windows):
+        name = file.parent / f'{file.stem}_{i}{file.suffix}'
+        with open(name, 'w', encoding=out_encoding, errors=errors, newline='') as out:
+            out.write(text[start:end])
+        # each part keeps matches starting in the middle of overlaps with its neighbours
+        own_start = 0 if i == 0 else (start + windows[i - 1][1]) // 2
+        own_end = len(text) if i == len(windows) - 1 else (windows[i + 1][0] + end) // 2
+        yield {
+            'part': str(name),
+            'source': str(file),
+            'start': get_java_length(text[:start]),
+            'own_start': get_java_length(text[:own_start]),
+            'own_end': get_java_length(text[:own_end]),
+        }
+
+
+def get_manifest_path(filelist: pathlib.Path) -> pathlib.Path:
+    return filelist.parent / f'{filelist.stem}.manifest.jsonl'
+
+
+@click.command()
+@click.argument('files', nargs=-1, type=click.Path(exists=True, dir_okay=True, path_type=pathlib.Path))
+@click.option('--max-chars', type=int, default=20_000,
+              help='Maximum number of characters in each part.')
+@click.option('--overlap', type=int, default=500,
+              help='Number of characters shared by consecutive parts (so matches at the edge of a part are found).')
+@click.option('--encoding', default='utf8',
+              help='Encoding of the input files (parts are written as utf8).')
+@click.option('--detect-encoding', is_flag=True, default=False,
+              help='Guess the encoding of each file (slow) rather than using `--encoding`.')
+@click.option('--filelist', type=click.Path(dir_okay=False, path_type=pathlib.Path),
+              help='Choose to create a particularly-named filelist. All content will be appended.')
+def split_files_on_windows(files: List[pathlib.Path], max_chars=20_000, overlap=500, encoding='utf8',
+                           detect_encoding=False, filelist=None):
+    if not filelist:
+        filelist = files[0].parent / f'filelist_split_{files[0].stem}.txt'
+    manifest_path = get_manifest_path(filelist)
+    n_parts = 0
+    with open(filelist, 'a', encoding='utf8') as filelist_out, \
+            open(manifest_path, 'a', encoding='utf8') as manifest_out:
+        for file in files:
+            for _file in (file.iterdir() if file.is_dir() else [file]):
+                for record in split_on_windows(_file, max_chars=max_chars, overlap=overlap, in_encoding=encoding,
+                                               detect_encoding=detect_encoding):
+                    filelist_out.write(f'{record["part"]}\n')
+                    manifest_out.write(json.dumps(record) + '\n')
+                    n_parts += 1
+    logger.info(f'Wrote {n_parts:,} parts to {filelist}; manifest: {manifest_path}.')
+
+
+def merge_split_output(manifest_path: pathlib.Path, output_format='json'):
+    """
+    Combine MetaMapLite json output for parts into output for each source file (with offsets in the source file).
+        Where parts overlap, matches are kept from the part whose half of the overlap they start in.
+    :return: number of source files written, and list of parts without output
+    """
+    if output_format != 'json':
+        raise ValueError(f'Only json output can be merged, not: {output_format}.')
+    sources = {}
+    with open(manifest_path, encoding='utf8') as fh:
+        for line in fh:
+            record = json.loads(line)
+            sources.setdefault(record['source'], []).append(record)
+    missing = []
+    n_written = 0
+    for source, records in sources.items():
+        results = []
+        for record in records:
+            try:
+                with open(get_output_path(record['part'], output_format), encoding='utf8') as fh:
+                    data = json.load(fh)
+            except FileNotFoundError:
+                missing.append(record['part'])
+                continue
+            results += [
+                el for el in shift_json_offsets(data, record['start'])
+                if record['own_start'] <= el['start'] < record['own_end']
+            ]
+        results.sort(key=lambda el: el['start'])
+        for i, el in enumerate(results):
+            el['id'] = f'en{i}'
+        with open(get_output_path(source, output_format), 'w', encoding='utf8') as out:
+            json.dump(results, out)
+        n_written += 1
+    logger.info(f'Merged output for {n_written:,} files.')
+    if missing:
+        logger.warning(f'Missing MetaMapLite output for {len(missing):,} parts (e.g., {missing[0]}).')
+    return n_written, missing
+
+
+@click.command()
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path))
+@click.option('--output-format', type=str, default='json',
+              help='Output format (only json is supported)')
+def merge_split_output_cmd(manifest: pathlib.Path, output_format='json'):
+    merge_split_output(manifest, output_format=output_format)
+
+
 if __name__ == '__main__':
     split_files_on_lines()
@@ -0,0 +1,147 @@
+"""
+Assign files to shards so that each shard takes MetaMapLite about the same amount of time.
+
+Files are weighted by a `CostModel` (by default, the file size) and assigned using
+    longest-processing-time-first: the most expensive files are placed first, each into the currently
+    least-loaded shard. `OnlineBalancer` does the same when files arrive one at a time (e.g., while writing notes).
+"""
+import heapq
+import json
+import os
+from pathlib import Path
+
+from loguru import logger
+
+from mml_utils.filelists import get_output_path, read_filelist
+
+
+class CostModel:
+    """Estimated MetaMapLite processing time for a file: `per_file + per_byte * size`."""
+
+    def __init__(self, per_file=0.0, per_byte=1.0):
+        self.per_file = per_file
+        self.per_byte = per_byte
+
+    def cost(self, size):
+        return self.per_file + self.per_byte * size
+
+    @classmethod
+    def fit(cls, observations):
+        """Least-squares fit from (size in bytes, seconds) pairs."""
+        n = len(observations)
+        if n < 2:
+            raise ValueError(f'At least two observations are required to fit cost model.')
+        mean_size = sum(size for size, _ in observations) / n
+        mean_secs = sum(secs for _, secs in observations) / n
+        var = sum((size - mean_size) ** 2 for size, _ in observations)
+        cov = sum((size - mean_size) * (secs - mean_secs) for size, secs in observations)
+        per_byte = max(cov / var, 0.0) if var else 0.0
+        per_file = max(mean_secs - per_byte * mean_size, 0.0)
+        return cls(per_file=per_file, per_byte=per_byte)
+
+    @classmethod
+    def load(cls, path: Path):
+        with open(path, encoding='utf8') as fh:
+            return cls(**json.load(fh))
+
+    def save(self, path: Path):
+        with open(path, 'w', encoding='utf8') as out:
+            json.dump({'per_file': self.per_file, 'per_byte': self.per_byte}, out)
+
+    def __repr__(self):
+        return f'CostModel(per_file={self.per_file:.4g}s, per_byte={self.per_byte:.4g}s)'
+
+
+def calibrate_cost_model(filelists, output_format='json', max_gap=600) -> CostModel:
+    """
+    Fit cost model from previous MetaMapLite runs.
+        Since MetaMapLite processes files in filelist order, the time to process each file is estimated
+        as the time between consecutive output files being written.
+    :param filelists: filelists already processed by MetaMapLite
+    :param output_format: extension of MetaMapLite output
+    :param max_gap: ignore gaps longer than this many seconds (e.g., from restarting a run)
+    """
+    observations = []
+    for filelist in filelists:
+        prev_mtime = None
+        for file in read_filelist(filelist):
+            try:
+                mtime = get_output_path(file, output_format).stat().st_mtime
+                size = os.stat(file).st_size
+            except FileNotFoundError:
+                prev_mtime = None
+                continue
+            if prev_mtime is not None and 0 <= mtime - prev_mtime <= max_gap:
+                observations.append((size, mtime - prev_mtime))
+            prev_mtime = mtime
+    model = CostModel.fit(observations)
+    logger.info(f'Fit {model} from {len(observations):,} files.')
+    return model
+
+
+def get_file_costs(files, cost_model: CostModel = None):
+    """Estimate cost of each file from its size."""
+    cost_model = cost_model or CostModel()
+    costs = []
+    for file in files:
+        try:
+            size = os.stat(file).st_size
+        except FileNotFoundError:
+            logger.warning(f'File not found, assuming empty: {file}')
+            size = 0
+        costs.append(cost_model.cost(size))
+    return costs
+
+
+def lpt_partition(costs, n) -> list[list[int]]:
+    """
+    Partition items into `n` bins with longest-processing-time-first.
+    :param costs: cost of each item
+    :param n: number of bins
+    :return: list of indices into `costs` for each bin (in original order)
+    """
+    balancer = OnlineBalancer(n)
+    bins = [[] for _ in range(n)]
+    for idx in sorted(range(len(costs)), key=lambda i: costs[i], reverse=True):
+        bins[balancer.assign(costs[idx])].append(idx)
+    return [sorted(b) for b in bins]
+
+
+def imbalance(loads):
+    """Ratio of the largest load to the mean load (1.0 is perfectly balanced)."""
+    mean = sum(loads) / len(loads) if loads else 0
+    return max(loads) / mean if mean else 1.0
+
+
+def log_imbalance(loads, label='shards'):
+    logger.info(f'Expected load across {len(loads)} {label}: min={min(loads):,.1f}, max={max(loads):,.1f};'
+                f' imbalance (max/mean): {imbalance(loads):.3f}.')
+
+
+def shard_files(files, n, cost_model: CostModel = None):
+    """Split files into `n` shards with roughly equal expected MetaMapLite time."""
+    costs = get_file_costs(files, cost_model)
+    bins = lpt_partition(costs, n)
+    log_imbalance([sum(costs[i] for i in b) for b in bins])
+    return [[files[i] for i in b] for b in bins]
+
+
+class OnlineBalancer:
+    """Assign each item, as it arrives, to the least-loaded bin."""
+
+    def __init__(self, n, loads=None):
+        self.loads = list(loads) if loads else [0.0] * n
+        self.heap = [(load, i) for i, load in enumerate(self.loads)]
+        heapq.heapify(self.heap)
+
+    def assign(self, cost) -> int:
+        load, idx = heapq.heappop(self.heap)
+        self.loads[idx] = load + cost
+        heapq.heappush(self.heap, (self.loads[idx], idx))
+        return idx
+
+    def add(self, idx, cost):
+        """Add cost to an already-assigned bin (e.g., another part of the same note)."""
+        self.loads[idx] += cost
+        self.heap = [(load, i) for i, load in enumerate(self.loads)]
+        heapq.heapify(self.heap)
@@ -0,0 +1,209 @@
+"""
+Sources of (note_id, text) for `mml-*-to-txt` which can report the position of each row and start from a position,
+    so that `--resume` can continue from the position recorded in the build progress (see `build_progress`) rather
+    than re-reading the source from the start.
+
+Positions (which must be JSON-serializable):
+    * CSV, JSONL: byte offset of the row
+    * SAS7BDAT: row number
+    * Parquet: [row group index, row in row group]
+    * SQL: value of `keyset_col` (the query must be ordered by it), otherwise row number (rows before it are re-read)
+"""
+import csv
+import itertools
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from mml_utils import db_extract, parquet_reader, sas_reader
+
+
+class TextSource:
+    """
+    Iterator of (note_id, text). `position` is the position of the last row returned. Call `seek` before iterating
+        to start at a position.
+    """
+
+    def __init__(self):
+        self.position = None
+        self.start = None
+        self._rows = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._rows is None:
+            self._rows = self.iter_rows(self.start)
+        self.position, note_id, text = next(self._rows)
+        return note_id, text
+
+    def seek(self, position):
+        if self._rows is not None:
+            raise ValueError(f'Cannot seek after starting to read from {self}.')
+        self.start = position
+
+    def iter_rows(self, start):
+        """Yield (position, note_id, text) starting from `start` (None for the beginning)."""
+        raise NotImplementedError
+
+
+def _iter_lines(fh, offset, encoding):
+    """Yield (byte offset, line) from binary file `fh` (positioned at `offset`)."""
+    for line in fh:
+        yield offset, line.decode(encoding)
+        offset += len(line)
+
+
+class CsvSource(TextSource):
+
+    def __init__(self, path: Path, id_col, text_col, encoding='utf8', delimiter=','):
+        super().__init__()
+        self.path = path
+        self.id_col = id_col
+        self.text_col = text_col
+        self.encoding = encoding
+        self.delimiter = delimiter
+
+    def iter_rows(self, start):
+        with open(self.path, 'rb') as fh:
+            header = next(csv.reader((line for _, line in _iter_lines(fh, 0, self.encoding)),
+                                     delimiter=self.delimiter))
+            id_idx, text_idx = header.index(self.id_col), header.index(self.text_col)
+            if start is not None:
+                fh.seek(start)
+            lines = _iter_lines(fh, fh.tell(), self.encoding)
+            offset = None
+
+            def _track(lines_):  # note offset of the first line of each row
+                nonlocal offset
+                for line_offset, line in lines_:
+                    if offset is None:
+                        offset = line_offset
+                    yield line
+
+            for row in csv.reader(_track(lines), delimiter=self.delimiter):
+                row_offset, offset = offset, None
+                if not row:  # blank line (as skipped by `csv.DictReader`)
+                    continue
+                yield (row_offset, row[id_idx] if id_idx < len(row) else None,
+                       row[text_idx] if text_idx < len(row) else None)
+
+
+class JsonlSource(TextSource):
+
+    def __init__(self, path: Path, id_col, text_col, encoding='utf8'):
+        super().__init__()
+        self.path = path
+        self.id_col = id_col
+        self.text_col = text_col
+        self.encoding = encoding
+
+    def iter_rows(self, start):
+        with open(self.path, 'rb') as fh:
+            fh.seek(start or 0)
+            for offset, line in _iter_lines(fh, start or 0, self.encoding):
+                data = json.loads(line)
+                yield offset, data[self.id_col], data[self.text_col]
+
+
+class SasSource(TextSource):
+    """Chunks before the starting position are still decoded by pandas (but not iterated)."""
+
+    def __init__(self, path: Path, id_col, text_col, encoding='latin1', force_id_to_int=True, chunksize=2000):
+        super().__init__()
+        self.path = path
+        self.id_col = id_col
+        self.text_col = text_col
+        self.encoding = encoding
+        self.force_id_to_int = force_id_to_int
+        self.chunksize = chunksize
+
+    def iter_rows(self, start):
+        start = start or 0
+        with pd.read_sas(self.path, encoding=self.encoding, chunksize=self.chunksize) as reader:
+            first = 0  # row number of first row in chunk
+            for df in reader:
+                if first + len(df) > start:
+                    ids = df[self.id_col].astype('int64') if self.force_id_to_int else df[self.id_col]
+                    yield from _with_row_numbers(ids.tolist(), df[self.text_col].tolist(), first, start)
+                first += len(df)
+
+
+class ParallelSasSource(TextSource):
+    """Decode chunks of a sas7bdat file in `n_workers` processes (see `sas_reader`)."""
+
+    def __init__(self, path: Path, id_col, text_col, encoding='latin1', id_as_int=True, chunksize=100_000,
+                 n_workers=4):
+        super().__init__()
+        self.path = path
+        self.id_col = id_col
+        self.text_col = text_col
+        self.encoding = encoding
+        self.id_as_int = id_as_int
+        self.chunksize = chunksize
+        self.n_workers = n_workers
+
+    def iter_rows(self, start):
+        start = start or 0
+        for chunk, ids, texts in sas_reader.iter_chunks(
+                self.path, self.id_col, self.text_col, encoding=self.encoding, id_as_int=self.id_as_int,
+                chunksize=self.chunksize, n_workers=self.n_workers, start_chunk=start // self.chunksize):
+            yield from _with_row_numbers(ids, texts, chunk * self.chunksize, start)
+
+
+def _with_row_numbers(ids, texts, first, start=0):
+    """Yield (row number, note_id, text) for rows (numbered from `first`) from `start`."""
+    for row in range(max(start - first, 0), len(ids)):
+        yield first + row, ids[row], texts[row]
+
+
+class ParquetSource(TextSource):
+
+    def __init__(self, row_groups, id_col, text_col, batch_size=10_000):
+        """:param row_groups: as from `parquet_reader.get_row_groups`"""
+        super().__init__()
+        self.row_groups = row_groups
+        self.id_col = id_col
+        self.text_col = text_col
+        self.batch_size = batch_size
+
+    def iter_rows(self, start):
+        start_group, start_row = start or (0, 0)
+        for k in range(start_group, len(self.row_groups)):
+            rows = parquet_reader.iter_parquet_rows([self.row_groups[k]], self.id_col, self.text_col,
+                                                    batch_size=self.batch_size)
+            first = start_row if k == start_group else 0
+            for row, (note_id, text) in enumerate(itertools.islice(rows, first, None), start=first):
+                yield [k, row], note_id, text
+
+
+class SqlSource(TextSource):
+
+    def __init__(self, engine, query, keyset_col=None, batch_size=10_000):
+        """
+        :param keyset_col: column returned by (and ordering) `query`; to start from a position, the query is
+            restricted to `keyset_col >= position` (replacing `{partition}` if present; see `db_extract`)
+        """
+        super().__init__()
+        self.engine = engine
+        self.query = query
+        self.keyset_col = keyset_col
+        self.batch_size = batch_size
+
+    def iter_rows(self, start):
+        query = self.query.replace(db_extract.PLACEHOLDER, '1 = 1')
+        if self.keyset_col is None:
+            rows = db_extract.iter_rows(self.engine, query, batch_size=self.batch_size)
+            for i, (note_id, text) in enumerate(itertools.islice(rows, start, None), start=start or 0):
+                yield i, note_id, text
+            return
+        if start is None:
+            params = None
+        else:
+            query = db_extract.get_partition_query(self.query, f'{self.keyset_col} >= :mml_keyset')
+            params = {'mml_keyset': start}
+        for row in db_extract.iter_mappings(self.engine, query, params=params, batch_size=self.batch_size):
+            values = list(row.values())
+            yield row[self.keyset_col], values[0], values[1]
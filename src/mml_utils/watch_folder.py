@@ -0,0 +1,181 @@
+"""
+Notice new text files in a directory as they finish being written, and group them into batches.
+
+Files are found by polling the directory (only files not yet returned are checked), or, if `inotify_simple` is
+    installed (Linux), from close-after-write/move events with an occasional poll to catch anything missed (e.g.,
+    files written from another host over NFS). A file is ready once its size and modification time have not
+    changed for `quiescence` seconds or, with `marker_ext`, once its marker file (e.g., `note.txt.done`) exists. A
+    file closed after writing might be re-opened (e.g., written in several parts), so is only a candidate until it
+    has been quiet for `quiescence` seconds; a file moved into the directory is ready at once.
+
+    watcher = FolderWatcher(input_dir, quiescence=5)
+    batcher = Batcher(max_files=10_000, max_wait=300)
+    while True:
+        for batch in batcher.add(watcher.poll(timeout=1)):
+            ...
+"""
+import os
+import time
+from pathlib import Path
+
+from loguru import logger
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+
+class FolderWatcher:
+    """Return each file in `input_dir` once it has finished being written."""
+
+    def __init__(self, input_dir: Path, *, quiescence=5.0, marker_ext=None, use_inotify=True, rescan_interval=60):
+        """
+        :param input_dir: directory (including subdirectories) to watch for new files
+        :param quiescence: seconds a file's size and mtime must be unchanged before it is considered complete
+        :param marker_ext: if specified, a file is complete once `{file}{marker_ext}` exists (markers are ignored)
+        :param use_inotify: use inotify (if `inotify_simple` is installed) rather than polling
+        :param rescan_interval: with inotify, seconds between polls for files without events
+        """
+        self.input_dir = Path(input_dir)
+        self.quiescence = quiescence
+        self.marker_ext = marker_ext
+        self.rescan_interval = rescan_interval
+        self.candidates = {}  # path -> (size, mtime_ns, time first seen with this size/mtime)
+        self.returned = set()  # files already returned which are still in the directory
+        self.inotify = None
+        self.watches = {}  # watch descriptor -> directory
+        self.last_scan = 0
+        if use_inotify and INotify is not None:
+            self.inotify = INotify()
+            self._add_watch(self.input_dir)
+        elif use_inotify:
+            logger.info(f'Polling {self.input_dir} for new files: install `inotify_simple` to use inotify instead.')
+
+    def _add_watch(self, directory: Path):
+        wd = self.inotify.add_watch(directory, flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE)
+        self.watches[wd] = directory
+        for entry in os.scandir(directory):  # subdirectories created before the watch was added
+            if entry.is_dir():
+                self._add_watch(Path(entry.path))
+
+    def poll(self, timeout=1.0) -> list[Path]:
+        """Return files which have finished being written (each file is only returned once)."""
+        ready = []
+        if self.inotify is not None:
+            ready += self._read_events(timeout)
+            if time.time() - self.last_scan >= (self.quiescence if self.candidates else self.rescan_interval):
+                ready += self._scan()
+        else:
+            ready += self._scan()
+            if not ready:
+                time.sleep(timeout)
+        return ready
+
+    def _read_events(self, timeout) -> list[Path]:
+        ready = []
+        for event in self.inotify.read(timeout=int(timeout * 1000)):
+            path = self.watches.get(event.wd, self.input_dir) / event.name
+            if event.mask & flags.ISDIR:
+                if event.mask & (flags.CREATE | flags.MOVED_TO):
+                    self._add_watch(path)
+                continue
+            if event.mask & (flags.CLOSE_WRITE | flags.MOVED_TO):
+                if self.marker_ext and path.name.endswith(self.marker_ext):
+                    path = path.with_name(path.name.removesuffix(self.marker_ext))
+                elif self.marker_ext:
+                    continue
+                elif event.mask & flags.CLOSE_WRITE:  # wait for quiescence (checked when scanning)
+                    self._add_candidate(path)
+                    continue
+                if path not in self.returned and path.exists():
+                    self.candidates.pop(path, None)
+                    self.returned.add(path)
+                    ready.append(path)
+        return ready
+
+    def _add_candidate(self, path: Path):
+        if path in self.returned:
+            return
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        self.candidates[path] = (stat.st_size, stat.st_mtime_ns, time.time())
+
+    def _scan(self) -> list[Path]:
+        """Check directory for files which are complete."""
+        self.last_scan = time.time()
+        now = time.time()
+        ready = []
+        present = set()
+        for path, stat in self._iter_files(self.input_dir):
+            present.add(path)
+            if path in self.returned:
+                continue
+            if self.marker_ext:
+                if Path(f'{path}{self.marker_ext}').exists():
+                    ready.append(path)
+                continue
+            size, mtime, first_seen = self.candidates.get(path, (None, None, None))
+            if (size, mtime) != (stat.st_size, stat.st_mtime_ns):
+                self.candidates[path] = (stat.st_size, stat.st_mtime_ns, now)
+            elif now - first_seen >= self.quiescence:
+                ready.append(path)
+        for path in ready:
+            self.candidates.pop(path, None)
+            self.returned.add(path)
+        self.candidates = {path: value for path, value in self.candidates.items() if path in present}
+        self.returned &= present  # forget files which have been moved away
+        return ready
+
+    def _iter_files(self, directory: Path):
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir():
+                    yield from self._iter_files(Path(entry.path))
+                elif not (self.marker_ext and entry.name.endswith(self.marker_ext)):
+                    try:
+                        yield Path(entry.path), entry.stat()
+                    except FileNotFoundError:
+                        continue
+
+    def remove_marker(self, path: Path):
+        if self.marker_ext:
+            Path(f'{path}{self.marker_ext}').unlink(missing_ok=True)
+
+
+class Batcher:
+    """Group files into batches of at most `max_files` files or `max_bytes`, or after waiting `max_wait` seconds."""
+
+    def __init__(self, *, max_files=100_000, max_bytes=None, max_wait=300):
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_wait = max_wait
+        self.files = []
+        self.size = 0
+        self.started = None  # time first file in current batch arrived
+
+    def add(self, files) -> list[list[Path]]:
+        """Add files; returns any batches which are now complete."""
+        batches = []
+        for file in files:
+            if not self.files:
+                self.started = time.time()
+            self.files.append(file)
+            try:
+                self.size += os.stat(file).st_size
+            except FileNotFoundError:
+                pass
+            if len(self.files) >= self.max_files or (self.max_bytes and self.size >= self.max_bytes):
+                batches.append(self.flush())
+        if self.files and time.time() - self.started >= self.max_wait:
+            batches.append(self.flush())
+        return batches
+
+    def flush(self) -> list[Path]:
+        files = self.files
+        self.files = []
+        self.size = 0
+        self.started = None
+        return files
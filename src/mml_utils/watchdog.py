@@ -0,0 +1,156 @@
+"""
+Notice when MetaMapLite stops making progress, and skip the document it is stuck on.
+
+A single pathological note can keep MetaMapLite busy indefinitely. Since MetaMapLite processes a filelist in
+    order, writing each output file as it goes, progress can be tracked by watching for output files
+    (see `filelists.FilelistProgress`). If no new output appears within `stall_timeout` seconds, MetaMapLite is
+    killed, the next file without output is quarantined (listed in `quarantine.txt`), and MetaMapLite is restarted
+    on the remaining files. Each event is recorded in `stalls.jsonl` to help tune the timeout.
+"""
+import json
+import os
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+
+from loguru import logger
+
+from mml_utils.filelists import FilelistProgress
+from mml_utils.profiling import ProcessSampler, build_summary, get_report_path, write_run_report
+from mml_utils.run_mml import build_mml_command, get_env, resolve_umls_version
+
+
+class StallMonitor:
+    """Track time since MetaMapLite last wrote output for a file in `progress`."""
+
+    def __init__(self, progress: FilelistProgress, stall_timeout=600):
+        self.progress = progress
+        self.stall_timeout = stall_timeout
+        self.last_completed = progress.completed
+        self.last_change = time.time()
+
+    def seconds_since_progress(self):
+        return time.time() - self.last_change
+
+    def is_stalled(self) -> bool:
+        """Update progress; True if there has been no progress for `stall_timeout` seconds."""
+        if self.progress.update() != self.last_completed:
+            self.last_completed = self.progress.completed
+            self.last_change = time.time()
+        return self.seconds_since_progress() > self.stall_timeout
+
+    def current_file(self):
+        """File MetaMapLite is (presumably) working on."""
+        if self.progress.completed < self.progress.total:
+            return self.progress.files[self.progress.completed]
+        return None
+
+
+def get_check_interval(stall_timeout):
+    return min(5.0, stall_timeout / 10)
+
+
+def quarantine_file(file, filelist: Path, *, reason, seconds_since_progress=None, files_completed=None,
+                    returncode=None, outdir: Path = None):
+    """Record file which MetaMapLite stalled or failed on in `quarantine.txt` and `stalls.jsonl`."""
+    outdir = Path(outdir or Path(filelist).parent)
+    logger.warning(f'Quarantining {file} after MetaMapLite {reason}'
+                   f'{f" ({seconds_since_progress:.0f} seconds without progress)" if reason == "stalled" else ""}.')
+    with open(outdir / 'quarantine.txt', 'a', encoding='utf8') as out:
+        out.write(f'{file}\n')
+    try:
+        file_size = os.stat(file).st_size
+    except (FileNotFoundError, TypeError):
+        file_size = None
+    with open(outdir / 'stalls.jsonl', 'a', encoding='utf8') as out:
+        out.write(json.dumps({
+            'time': datetime.now().isoformat(),
+            'filelist': str(filelist),
+            'file': str(file) if file else None,
+            'file_size': file_size,
+            'reason': reason,
+            'seconds_since_progress': seconds_since_progress,
+            'files_completed': files_completed,
+            'returncode': returncode,
+        }) + '\n')
+
+
+def remove_current_file(monitor: StallMonitor) -> int:
+    """Re-write filelist without the file MetaMapLite is stuck on; returns number of files remaining."""
+    progress = monitor.progress
+    stuck = monitor.current_file()
+    remaining = [file for file in progress.remaining(keep_last=True) if file != stuck]
+    with open(progress.filelist, 'w', encoding='utf8') as out:
+        for file in remaining:
+            out.write(f'{file}\n')
+    return len(remaining)
+
+
+def supervise_run_mml(filename, cwd: Path, *, stall_timeout=600, check_interval=None, output_format='json',
+                      max_restarts=100, manifest=None, profile=False, **kwargs):
+    """
+    Run metamaplite on a filelist, restarting it (without the current file) if it stalls or fails.
+    :param filename: filelist (a working copy `{filename}_supervised` is re-written with the remaining files)
+    :param cwd: path to metamaplite home
+    :param stall_timeout: seconds without a new output file before metamaplite is considered stuck
+    :param check_interval: seconds between checking for new output files (default: `stall_timeout / 10`, max 5)
+    :param max_restarts: give up after this many restarts
+    :param manifest: `RunManifest` to record status of each file in
+    :param profile: write a run report for each run of metamaplite (see `profiling`)
+    :param kwargs: passed to `build_mml_command`
+    :return: list of quarantined files
+    """
+    check_interval = check_interval or get_check_interval(stall_timeout)
+    filename = Path(filename)
+    working_filelist = Path(f'{filename}_supervised')
+    working_filelist.write_bytes(filename.read_bytes())
+    kwargs['version'], kwargs['dataset'] = resolve_umls_version(cwd, kwargs.get('version'),
+                                                                kwargs.get('dataset', 'USAbase'))
+    cmd = build_mml_command(working_filelist, cwd, output_format=output_format, **kwargs)
+    quarantined = []
+    for n_restart in range(max_restarts + 1):
+        monitor = StallMonitor(FilelistProgress(working_filelist, output_format, since=time.time() - 1),
+                               stall_timeout=stall_timeout)
+        if manifest is not None:
+            manifest.set_shard(monitor.progress.files, filename, status='running')
+        logger.info(f'Running Metamaplite on {monitor.progress.total:,} files'
+                    f' (restarts: {n_restart}; install location: {cwd})')
+        logger.debug('Running command >> ' + ' '.join(str(x) for x in cmd))
+        proc = subprocess.Popen(cmd, universal_newlines=True, cwd=cwd, env=os.environ | get_env(cwd))
+        sampler = ProcessSampler(proc.pid).start() if profile else None
+        stalled = False
+        while proc.poll() is None:
+            time.sleep(check_interval)
+            if monitor.is_stalled():
+                stalled = True
+                proc.kill()
+                proc.wait()
+        monitor.progress.update()
+        if sampler is not None:
+            write_run_report(get_report_path(filename), build_summary(
+                sampler.stop(), started=sampler.start_time, returncode=proc.returncode,
+                files=monitor.progress.files[:monitor.progress.completed], label=f'metamaplite {kwargs["dataset"]}',
+                command=' '.join(str(x) for x in cmd),
+            ), sampler.samples)
+        if manifest is not None:
+            manifest.mark_progress(monitor.progress)
+        if proc.returncode == 0 and not stalled:
+            logger.info(f'Completed all: {len(quarantined):,} files quarantined.')
+            return quarantined
+        stuck = monitor.current_file()
+        if stuck is None:  # all output written
+            logger.warning(f'Metamaplite returned with status code {proc.returncode} after writing all output.')
+            return quarantined
+        quarantine_file(stuck, filename, reason='stalled' if stalled else 'failed',
+                        seconds_since_progress=monitor.seconds_since_progress(),
+                        files_completed=monitor.progress.completed, returncode=proc.returncode)
+        quarantined.append(stuck)
+        if manifest is not None:
+            manifest.mark([stuck], 'quarantined', error='stalled' if stalled else f'status code {proc.returncode}')
+        if remove_current_file(monitor) == 0:
+            break
+    else:
+        logger.error(f'Too many restarts: {max_restarts}; exiting process.')
+    logger.info(f'Finished: {len(quarantined):,} files quarantined.')
+    return quarantined
@@ -0,0 +1,305 @@
+"""
+Coordinate MetaMapLite workers on several hosts through a queue directory on a shared (e.g., NFS) filesystem.
+
+The queue directory contains filelist shards ending in `.in_progress` (e.g., from `mml-queue-create`,
+    `mml-build-filelists`, or `mml-run-pool --shard-dir`). To claim a shard, a worker creates `{shard}.lease`
+    with `O_CREAT | O_EXCL` (so only one worker can succeed) and keeps touching it (heartbeat) while MetaMapLite
+    runs. When the shard is finished, it is renamed to `.complete` (or `.failed`), statistics are written to
+    `{shard}.done`, and the lease is removed.
+
+If a host dies, its leases stop being touched. Once a lease's modification time has not changed for `lease_timeout`
+    seconds (measured on the observing host, so clocks need not agree), another worker breaks it by renaming it
+    away (only one rename can succeed) and claims the shard. The shard has been re-written with only its unprocessed
+    files (see `MmlPool`) if the worker was stopped cleanly; otherwise, it is re-run from the start.
+
+    queue = LeaseQueue('/shared/queue', lease_timeout=600)
+    LeasedMmlPool(queue, mml_home, n_workers=4).run()
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from loguru import logger
+
+from mml_utils.filelists import read_filelist
+from mml_utils.manifest import get_shard_name
+from mml_utils.mml_pool import MmlPool
+
+
+def get_lease_path(shard: Path) -> Path:
+    return Path(shard).parent / f'{get_shard_name(shard)}.lease'
+
+
+def get_done_path(shard: Path) -> Path:
+    return Path(shard).parent / f'{get_shard_name(shard)}.done'
+
+
+def _read_json(path: Path):
+    try:
+        with open(path, encoding='utf8') as fh:
+            return json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):  # removed, or not yet written
+        return None
+
+
+class Lease:
+    """Lock file for a shard, touched every `heartbeat_interval` seconds while in use (`with lease: ...`)."""
+
+    def __init__(self, path: Path, token, heartbeat_interval=30):
+        self.path = Path(path)
+        self.token = token
+        self.heartbeat_interval = heartbeat_interval
+        self.lost = False  # broken by another worker (e.g., heartbeats stopped for too long)
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def is_owned(self) -> bool:
+        data = _read_json(self.path)
+        return data is not None and data.get('token') == self.token
+
+    def beat(self):
+        if self.lost:
+            return
+        if not self.is_owned():
+            self.lost = True
+            logger.warning(f'Lost lease {self.path}: another worker may now be processing this shard.')
+            return
+        os.utime(self.path)
+
+    def _heartbeat(self):
+        while not self._stopping.wait(self.heartbeat_interval):
+            try:
+                self.beat()
+            except OSError as e:  # e.g., temporary network filesystem error: retry at next heartbeat
+                logger.warning(f'Failed to renew lease {self.path}: {e}')
+
+    def release(self):
+        if self.is_owned():
+            self.path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stopping.set()
+        self._thread.join()
+
+
+class LeaseQueue:
+    """Shards (`*.in_progress`) in a shared directory, claimed by creating lease files."""
+
+    def __init__(self, queue_dir: Path, *, lease_timeout=600, heartbeat_interval=None, host=None):
+        """
+        :param queue_dir: directory of `.in_progress` shards
+        :param lease_timeout: seconds without a heartbeat before a lease may be broken
+        :param heartbeat_interval: seconds between heartbeats (default: `lease_timeout / 10`)
+        :param host: name to record in leases and statistics (default: hostname)
+        """
+        self.queue_dir = Path(queue_dir)
+        self.lease_timeout = lease_timeout
+        self.heartbeat_interval = heartbeat_interval or lease_timeout / 10
+        self.host = host or socket.gethostname()
+        self._observed = {}  # lease path -> (mtime_ns, local time first observed)
+        self._observed_lock = threading.Lock()  # shared by workers (threads) on this host
+
+    def shards(self):
+        return sorted(self.queue_dir.glob('*.in_progress'))
+
+    def claim(self, worker=0, wait=True):
+        """
+        Claim the next unleased shard; returns (shard, lease), or None once no shards remain.
+        :param wait: if all remaining shards are leased, wait to see if any lease expires
+        """
+        while True:
+            shards = self.shards()
+            if not shards:
+                return None
+            for shard in shards:
+                lease = self._acquire(shard, worker)
+                if lease is None:
+                    continue
+                if shard.exists():
+                    return shard, lease
+                lease.release()  # completed by another worker after listing shards
+            if not wait:
+                return None
+            time.sleep(min(self.heartbeat_interval, 5))
+
+    def _acquire(self, shard: Path, worker):
+        lease_path = get_lease_path(shard)
+        if lease_path.exists() and self._is_stale(lease_path):
+            self._break(lease_path)
+        token = f'{self.host}:{os.getpid()}:{worker}:{uuid.uuid4().hex}'
+        try:
+            fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, 'w', encoding='utf8') as out:
+            json.dump({'token': token, 'host': self.host, 'pid': os.getpid(), 'worker': worker,
+                       'claimed': datetime.now().isoformat()}, out)
+        with self._observed_lock:
+            self._observed.pop(lease_path, None)
+        return Lease(lease_path, token, heartbeat_interval=self.heartbeat_interval)
+
+    def _is_stale(self, lease_path: Path) -> bool:
+        """True if the lease has not been touched since this host first saw it `lease_timeout` seconds ago."""
+        try:
+            mtime = os.stat(lease_path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        with self._observed_lock:
+            prev_mtime, first_seen = self._observed.get(lease_path, (None, None))
+            if prev_mtime != mtime:
+                self._observed[lease_path] = (mtime, time.time())
+                return False
+        return time.time() - first_seen > self.lease_timeout
+
+    def _break(self, lease_path: Path):
+        """Remove an expired lease; renaming ensures only one worker breaks it."""
+        with self._observed_lock:
+            mtime, _ = self._observed.pop(lease_path, (None, None))
+        if mtime is None:
+            return  # being broken by another worker on this host
+        broken = lease_path.with_name(f'{lease_path.name}.{self.host}.{os.getpid()}.{uuid.uuid4().hex}.broken')
+        try:
+            os.rename(lease_path, broken)
+        except FileNotFoundError:
+            return  # released, or broken by another worker
+        if os.stat(broken).st_mtime_ns != mtime:  # heartbeat arrived in the meantime: restore it
+            try:
+                os.link(broken, lease_path)
+            except FileExistsError:
+                pass
+            broken.unlink()
+            return
+        logger.warning(f'Broke expired lease {lease_path} ({(_read_json(broken) or {}).get("host")}):'
+                       f' no heartbeat for {self.lease_timeout} seconds.')
+        broken.unlink()
+
+    def finish(self, shard: Path, lease: Lease, *, status, worker=0, files=0, started=None):
+        """Record statistics for a finished shard (already renamed to `.complete`/`.failed`) and remove lease."""
+        if lease.lost:
+            logger.warning(f'Not recording {shard.name}: lease was lost.')
+            return
+        with open(get_done_path(shard), 'w', encoding='utf8') as out:
+            json.dump({
+                'shard': get_shard_name(shard),
+                'status': status,
+                'host': self.host,
+                'pid': os.getpid(),
+                'worker': worker,
+                'files': files,
+                'started': started,
+                'finished': time.time(),
+            }, out)
+        lease.release()
+
+
+class LeasedMmlPool(MmlPool):
+    """`MmlPool` whose workers claim shards from a `LeaseQueue` (shared with workers on other hosts)."""
+
+    def __init__(self, lease_queue: LeaseQueue, mml_home: Path, **kwargs):
+        super().__init__([], mml_home, **kwargs)
+        self.lease_queue = lease_queue
+        self.n_shards = len(lease_queue.shards())  # total is counted as shards are claimed
+        self.leases = {}  # worker_id -> lease on the shard it is running
+
+    def _holds_lease(self, worker_id, shard: Path) -> bool:
+        lease = self.leases[worker_id]
+        if lease.lost or not lease.is_owned():
+            lease.lost = True
+            logger.warning(f'Worker {worker_id}: lease on {shard.name} was lost; leaving it to the other worker.')
+            return False
+        return True
+
+    def _complete_shard(self, worker_id, shard: Path):
+        if not self._holds_lease(worker_id, shard):
+            return
+        try:
+            super()._complete_shard(worker_id, shard)
+        except FileNotFoundError:  # finished by the worker which broke the lease
+            logger.warning(f'Worker {worker_id}: {shard.name} was already renamed by another worker.')
+
+    def _worker(self, worker_id):
+        while not self.stopping.is_set():
+            claim = self.lease_queue.claim(worker=worker_id)
+            if claim is None:
+                return
+            shard, lease = claim
+            n_files = len(read_filelist(shard))
+            with self.lock:
+                self.total += n_files
+            started = time.time()
+            self.leases[worker_id] = lease
+            with lease:
+                self._run_shard(worker_id, shard)
+            if shard in self.completed_shards:
+                self.lease_queue.finish(shard, lease, status='complete', worker=worker_id, files=n_files,
+                                        started=started)
+            elif shard in self.failed_shards:
+                if not self._holds_lease(worker_id, shard):
+                    continue
+                try:
+                    n_done = n_files - len(read_filelist(shard))
+                    shard.rename(shard.with_suffix('.failed'))
+                except FileNotFoundError:
+                    logger.warning(f'Worker {worker_id}: {shard.name} was already renamed by another worker.')
+                    continue
+                self.lease_queue.finish(shard, lease, status='failed', worker=worker_id, files=n_done,
+                                        started=started)
+            else:  # stopped: leave remaining files for another worker
+                lease.release()
+
+
+def get_queue_status(queue_dir: Path):
+    """Number of shards in each state, current leases, and per-host totals from `.done` files."""
+    queue_dir = Path(queue_dir)
+    shards = {
+        state: len(list(queue_dir.glob(f'*.{state}')))
+        for state in ('in_progress', 'complete', 'failed')
+    }
+    leases = []
+    for lease_path in sorted(queue_dir.glob('*.lease')):
+        data = _read_json(lease_path) or {}
+        try:
+            age = time.time() - os.stat(lease_path).st_mtime
+        except FileNotFoundError:
+            continue
+        leases.append({'shard': lease_path.stem, 'host': data.get('host'), 'worker': data.get('worker'),
+                       'seconds_since_heartbeat': age})
+    hosts = {}
+    for done_path in queue_dir.glob('*.done'):
+        data = _read_json(done_path)
+        if data is None:
+            continue
+        host = hosts.setdefault(data['host'], {'shards': 0, 'failed': 0, 'files': 0, 'first': None, 'last': None})
+        host['shards'] += 1
+        host['failed'] += data['status'] == 'failed'
+        host['files'] += data['files']
+        if data.get('started') is not None:
+            host['first'] = min(data['started'], host['first'] or data['started'])
+        host['last'] = max(data['finished'], host['last'] or data['finished'])
+    for host in hosts.values():
+        hours = (host['last'] - host['first']) / 3600 if host['first'] is not None else 0
+        host['files_per_hour'] = host['files'] / hours if hours else None
+    return shards, leases, hosts
+
+
+def log_queue_status(queue_dir: Path):
+    shards, leases, hosts = get_queue_status(queue_dir)
+    logger.info(f'Shards: {shards["in_progress"]} remaining ({len(leases)} leased),'
+                f' {shards["complete"]} complete, {shards["failed"]} failed.')
+    for lease in leases:
+        logger.info(f'> {lease["shard"]}: {lease["host"]} (worker {lease["worker"]});'
+                    f' last heartbeat {lease["seconds_since_heartbeat"]:.0f} seconds ago.')
+    for name, host in sorted(hosts.items()):
+        rate = f'{host["files_per_hour"]:,.0f} files/hour' if host['files_per_hour'] else 'unknown rate'
+        logger.info(f'{name}: {host["shards"]} shards ({host["failed"]} failed), {host["files"]:,} files; {rate}.')
+    return shards, leases, hosts
@@ -1,4 +1,6 @@
 import files
+import os
+import sys
 from pathlib import Path
 
 import pytest
@@ -72,3 +74,34 @@ def mrrel(umls_path):
 @pytest.fixture
 def source_data_path():
     return Path('data')
+
+
+@pytest.fixture
+def fake_mml_home(tmp_path, monkeypatch):
+    """MetaMapLite install directory with a fake `java` on the PATH which runs `fake_mml.py`."""
+    mml_home = tmp_path / 'public_mm_lite'
+    (mml_home / 'data' / 'ivf' / '2022AB' / 'USAbase').mkdir(parents=True)
+    (mml_home / 'target').mkdir()
+    (mml_home / 'target' / 'metamaplite-3.6.2rc8-standalone.jar').touch()
+    (mml_home / 'config').mkdir()
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    java = bin_dir / 'java'
+    java.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{Path(__file__).parent / "fake_mml.py"}" "$@"\n')
+    java.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{bin_dir}{os.pathsep}{os.environ["PATH"]}')
+    return mml_home
+
+
+@pytest.fixture
+def fever_notes(tmp_path):
+    """Directory of notes mentioning fever, and a filelist for them."""
+    notes_dir = tmp_path / 'notes'
+    notes_dir.mkdir()
+    filelist = tmp_path / 'filelist.txt'
+    with open(filelist, 'w', encoding='utf8') as out:
+        for i in range(20):
+            note = notes_dir / f'{i}.txt'
+            note.write_text(f'Note {i}: patient has fever.\nNo fever yesterday.\n', encoding='utf8')
+            out.write(f'{note}\n')
+    return filelist
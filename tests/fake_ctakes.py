@@ -0,0 +1,26 @@
+"""
+Stand-in for cTAKES' `bin/runClinicalPipeline.sh` used in tests.
+
+Writes `{name}.xmi` to `--xmiOut` for each file in `-i` (in name order). Notes containing "CRASH" cause the
+    process to exit with an error the first time they are seen (a `{name}.crashed` marker is written next to
+    the original note).
+"""
+import os
+import sys
+from pathlib import Path
+
+
+def main(args):
+    indir = Path(args[args.index('-i') + 1])
+    outdir = Path(args[args.index('--xmiOut') + 1])
+    for file in sorted(indir.iterdir()):
+        text = file.read_text(encoding='utf8')
+        marker = Path(f'{os.path.realpath(file)}.crashed')
+        if 'CRASH' in text and not marker.exists():
+            marker.touch()
+            sys.exit(1)
+        (outdir / f'{file.name}.xmi').write_text(f'<xmi:XMI sofaString="{text}"/>', encoding='utf8')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
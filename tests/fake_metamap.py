@@ -0,0 +1,28 @@
+"""
+Stand-in for full MetaMap's `metamap [options] infile outfile` used in tests.
+
+Writes fever annotations in mmi format. Notes containing "CRASH" cause the process to exit with an error the
+    first time they are seen (a `{infile}.crashed` marker is written), and notes containing "STALL" hang.
+"""
+import sys
+import time
+from pathlib import Path
+
+from fake_mml import annotate, to_mmi
+
+
+def main(args):
+    infile, outfile = Path(args[-2]), Path(args[-1])
+    text = infile.read_text(encoding='utf8')
+    marker = Path(f'{infile}.crashed')
+    if 'CRASH' in text and not marker.exists():
+        marker.touch()
+        outfile.write_text('partial', encoding='utf8')
+        sys.exit(1)
+    while 'STALL' in text:
+        time.sleep(1)
+    outfile.write_text(to_mmi(annotate(text), infile.stem), encoding='utf8')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
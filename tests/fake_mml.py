@@ -0,0 +1,75 @@
+"""
+Stand-in for `java ... gov.nih.nlm.nls.ner.MetaMapLite` used in tests.
+
+Every occurrence of "fever" is reported as C0015967. Notes containing "CRASH" cause the process to exit
+    with an error (before writing that note's output), and notes containing "STALL" hang.
+"""
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+
+def annotate(text):
+    results = []
+    for i, m in enumerate(re.finditer('fever', text)):
+        results.append({
+            'matchedtext': m.group(),
+            'evlist': [{
+                'score': 0,
+                'matchedtext': m.group(),
+                'start': m.start(),
+                'length': len(m.group()),
+                'id': f'ev{i}',
+                'conceptinfo': {
+                    'conceptstring': 'Fever',
+                    'sources': ['MTH', 'MDR'],
+                    'cui': 'C0015967',
+                    'preferredname': 'Fever',
+                    'semantictypes': ['sosy'],
+                },
+            }],
+            'docid': '00000000.tx',
+            'start': m.start(),
+            'length': len(m.group()),
+            'id': f'en{i}',
+            'fieldid': 'text',
+            'negated': False,
+        })
+    return results
+
+
+def to_mmi(results, identifier):
+    if not results:
+        return ''
+    triggers = ','.join('"Fever"-text-0-"fever"--0' for _ in results)
+    positions = ';'.join(f'{r["start"]}/{r["length"]}' for r in results)
+    return f'{identifier}|MMI|3.75|Fever|C0015967|[sosy]|{triggers}|text|{positions}|C23.888.119.344\n'
+
+
+def main(args):
+    options = dict(arg.lstrip('-').split('=', 1) for arg in args if arg.startswith('--') and '=' in arg)
+    output_format = options.get('outputformat', 'json')
+    if 'filelistfn' in options:
+        with open(options['filelistfn'], encoding='utf8') as fh:
+            files = [line.strip() for line in fh if line.strip()]
+    else:
+        files = [options['filelist']]
+    for file in files:
+        text = Path(file).read_text(encoding='utf8')
+        if 'CRASH' in text:
+            sys.exit(1)
+        while 'STALL' in text:
+            time.sleep(1)
+        results = annotate(text)
+        outfile = Path(f'{file.removesuffix(".txt")}.{output_format}')
+        with open(outfile, 'w', encoding='utf8') as out:
+            if output_format == 'mmi':
+                out.write(to_mmi(results, Path(file).stem))
+            else:
+                json.dump(results, out)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
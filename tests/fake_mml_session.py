@@ -0,0 +1,24 @@
+"""
+Stand-in for `MetaMapLiteSession.java` used in tests (see `fake_mml.py` for annotation behaviour).
+"""
+import json
+import sys
+
+from fake_mml import annotate
+
+
+def main():
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout
+    stdout.write('READY\n')
+    stdout.flush()
+    while header := stdin.readline().decode('utf8').strip():
+        text = stdin.read(int(header.rsplit('\t', 1)[1])).decode('utf8')
+        if 'CRASH' in text:
+            sys.exit(1)
+        stdout.write(json.dumps(annotate(text)) + '\n')
+        stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+from mml_utils.build_progress import ProgressTracker, read_listed_since
+
+
+def test_progress_tracker_out_of_order():
+    tracker = ProgressTracker(start=5)
+    tracker.complete(6, 'b')
+    tracker.complete(8, 'd')
+    assert (tracker.done, tracker.ahead) == (5, {6: 'b', 8: 'd'})
+    tracker.complete(5, 'a')
+    assert (tracker.done, tracker.ahead) == (7, {8: 'd'})
+    tracker.complete(7, 'c')
+    assert (tracker.done, tracker.ahead) == (9, {})
+
+
+def test_read_listed_since(tmp_path):
+    filelist = tmp_path / 'filelist.txt'
+    filelist.write_text('/notes/1.txt\n/notes/2.txt\n/notes/3.txt\n/notes/4')
+    assert read_listed_since(filelist, len('/notes/1.txt\n')) == {'/notes/2.txt', '/notes/3.txt'}
+    assert filelist.read_text() == '/notes/1.txt\n/notes/2.txt\n/notes/3.txt\n'
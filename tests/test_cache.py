@@ -0,0 +1,82 @@
+from mml_utils.cache import MmlCache, _replace_mmi_doc_id
+from mml_utils.filelists import get_output_path, read_filelist
+from mml_utils.mml_pool import run_mml_pool
+from mml_utils.run_mml import run_mml
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    with MmlCache(tmp_path / 'cache.db', max_size_mb=250 / 1024 / 1024) as cache:
+        cache.put('a', 'a', b'x' * 100)
+        cache.put('b', 'b', b'x' * 100)
+        assert cache.get('a') is not None  # 'b' is now least recently used
+        cache.put('c', 'c', b'x' * 100)
+        assert cache.get('b') is None
+        assert cache.get('a') is not None
+        assert cache.get('c') is not None
+        assert cache.evictions == 1
+        assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_cache_missing_file_is_miss(fever_notes, tmp_path):
+    files = read_filelist(fever_notes)[:2] + [str(tmp_path / 'missing.txt')]
+    with MmlCache(tmp_path / 'cache.db') as cache:
+        get_output_path(files[0]).write_text('[]', encoding='utf8')
+        assert cache.store(files, 'key') == 1
+        get_output_path(files[0]).unlink()
+        assert cache.apply(files, 'key') == files[1:]
+        assert get_output_path(files[0]).exists()
+        assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_replace_mmi_doc_id():
+    data = b'1|MMI|3.75|Fever|C0015967|[sosy]|...|text|20/5|C23\n1|MMI|2.0|Pain|...\n'
+    assert _replace_mmi_doc_id(data, '1', '22') == data.replace(b'1|MMI', b'22|MMI')
+
+
+def test_run_mml_with_cache(fake_mml_home, fever_notes, tmp_path):
+    files = read_filelist(fever_notes)
+    cache = MmlCache(tmp_path / 'cache.db')
+    run_mml(fever_notes, fake_mml_home, output_format='json', cache=cache)
+    expected = [get_output_path(file).read_text() for file in files]
+    assert (cache.hits, cache.misses) == (0, 20)
+    for file in files:
+        get_output_path(file).unlink()
+    res = run_mml(fever_notes, fake_mml_home, output_format='json', cache=cache)
+    assert res.returncode == 0
+    assert cache.hits == 20
+    assert [get_output_path(file).read_text() for file in files] == expected
+
+
+def test_run_mml_with_cache_new_settings(fake_mml_home, fever_notes, tmp_path):
+    cache = MmlCache(tmp_path / 'cache.db')
+    run_mml(fever_notes, fake_mml_home, output_format='json', cache=cache)
+    run_mml(fever_notes, fake_mml_home, output_format='json', cache=cache, restrict_to_sts=['sosy'])
+    assert (cache.hits, cache.misses) == (0, 40)
+
+
+def test_run_mml_pool_with_cache(fake_mml_home, fever_notes, tmp_path):
+    cache = MmlCache(tmp_path / 'cache.db')
+    run_mml(fever_notes, fake_mml_home, output_format='mmi', cache=cache)
+    # same text under a different note id
+    new_file = tmp_path / 'notes' / '999.txt'
+    new_file.write_text(open(read_filelist(fever_notes)[0], encoding='utf8').read())
+    filelist = tmp_path / 'new_filelist.txt'
+    filelist.write_text(f'{new_file}\n')
+    completed, failed = run_mml_pool([filelist], fake_mml_home, output_format='mmi', cache=cache,
+                                     shard_dir=tmp_path / 'shards')
+    assert len(completed) == 1
+    assert cache.hits == 1
+    assert get_output_path(new_file, 'mmi').read_text().startswith('999|MMI|')
+
+
+def test_run_mml_failure_caches_completed_files(fake_mml_home, fever_notes, tmp_path):
+    files = read_filelist(fever_notes)
+    with open(files[10], 'a', encoding='utf8') as out:
+        out.write('CRASH\n')
+    cache = MmlCache(tmp_path / 'cache.db')
+    res = run_mml(fever_notes, fake_mml_home, output_format='json', cache=cache)
+    assert res.returncode != 0
+    for file in files[:10]:
+        get_output_path(file).unlink()
+    run_mml(fever_notes, fake_mml_home, output_format='json', cache=cache)
+    assert cache.hits == 9  # the last file before the failure might not have been completely written
@@ -0,0 +1,48 @@
+import json
+
+from click.testing import CliRunner
+
+from mml_utils.scripts.check_mml_progress import check_mml_progress, check_mml_progress_repeat, read_history
+
+
+def _write_notes(outdir, n_notes, n_done):
+    outdir.mkdir()
+    for i in range(n_notes):
+        (outdir / f'{i}.txt').write_text('fever' * 10)
+        if i < n_done:
+            (outdir / f'{i}.json').write_text('[]')
+
+
+def test_check_mml_progress_rates(tmp_path):
+    dirs = [tmp_path / 'notes0', tmp_path / 'notes1', tmp_path / 'notes2']
+    for d in dirs:
+        _write_notes(d, 10, 2)
+    history_path = tmp_path / 'history.jsonl'
+    first = check_mml_progress(dirs, textfile_ext='.txt', history_path=history_path)
+    assert (first['completed'], first['total'], first['completed_bytes']) == (6, 30, 300)
+    assert first['notes_per_hour'] is None
+
+    # pretend previous check was an hour ago
+    history = read_history(history_path)
+    history[0]['time'] -= 3600
+    history_path.write_text(json.dumps(history[0]) + '\n')
+    for i in range(2, 8):
+        (dirs[0] / f'{i}.json').write_text('[]')
+        (dirs[2] / f'{i}.json').write_text('[]')
+    (dirs[1] / '2.json').write_text('[]')
+    second = check_mml_progress(dirs, textfile_ext='.txt', history_path=history_path)
+    assert round(second['notes_per_hour']) == 13
+    assert round(second['bytes_per_hour']) == 650
+    assert round(second['eta_hours'], 2) == round(11 / 13, 2)
+    assert second['stragglers'] == [str(dirs[1])]  # 7 hours left, compared to 20 minutes
+    assert len(read_history(history_path)) == 2
+
+
+def test_check_mml_progress_json(tmp_path):
+    _write_notes(tmp_path / 'notes', 4, 1)
+    result = CliRunner().invoke(check_mml_progress_repeat, [str(tmp_path / 'notes'), '--textfile-ext', '.txt',
+                                                            '--json'])
+    assert result.exit_code == 0
+    record = json.loads(result.output)
+    assert (record['completed'], record['total']) == (1, 4)
+    assert (tmp_path / 'notes' / '.mml_progress.jsonl').exists()
@@ -0,0 +1,61 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from mml_utils.ctakes_pool import build_ctakes_command, run_ctakes_pool, split_directory_to_shards
+from mml_utils.manifest import RunManifest
+
+
+@pytest.fixture
+def fake_ctakes_home(tmp_path):
+    """cTAKES install directory whose `runClinicalPipeline.sh` runs `fake_ctakes.py`."""
+    ctakes_home = tmp_path / 'ctakes'
+    (ctakes_home / 'bin').mkdir(parents=True)
+    script = ctakes_home / 'bin' / 'runClinicalPipeline.sh'
+    script.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{Path(__file__).parent / "fake_ctakes.py"}" "$@"\n')
+    script.chmod(0o755)
+    return ctakes_home
+
+
+@pytest.fixture
+def notes_dir(tmp_path):
+    notes_dir = tmp_path / 'notes'
+    notes_dir.mkdir()
+    for i in range(20):
+        (notes_dir / f'{i:02d}.txt').write_text(f'Note {i}: patient has fever.\n' * (i + 1), encoding='utf8')
+    return notes_dir
+
+
+def test_build_ctakes_command_heap(tmp_path):
+    cmd = build_ctakes_command(tmp_path / 'in', tmp_path / 'out', tmp_path / 'ctakes', max_heap='6g',
+                               umls_key='key')
+    assert 'java' == cmd[0]
+    assert '-Xmx6g' in cmd
+    assert cmd[-2:] == ['--key', 'key']
+    assert '--lookupXml' not in cmd
+
+
+def test_split_directory_to_shards_skips_done(tmp_path, notes_dir):
+    outdir = tmp_path / 'xmi'
+    outdir.mkdir()
+    (outdir / '00.txt.xmi').touch()
+    shards = split_directory_to_shards(notes_dir, outdir, n_shards=4)
+    assert len(shards) == 4
+    files = sorted(p.name for shard in shards for p in shard.iterdir())
+    assert files == [f'{i:02d}.txt' for i in range(1, 20)]
+    assert all(p.resolve().parent == notes_dir.resolve() for shard in shards for p in shard.iterdir())
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='requires sh')
+def test_run_ctakes_pool_merges_and_retries(tmp_path, fake_ctakes_home, notes_dir):
+    (notes_dir / '05.txt').write_text('CRASH', encoding='utf8')
+    outdir = tmp_path / 'xmi'
+    with RunManifest(tmp_path / 'manifest.db') as manifest:
+        completed, failed = run_ctakes_pool(notes_dir, fake_ctakes_home, outdir, n_workers=3, retries=1,
+                                            progress_interval=1, manifest=manifest)
+        assert len(completed) == 3
+        assert not failed
+        assert sorted(p.name for p in outdir.iterdir()) == [f'{i:02d}.txt.xmi' for i in range(20)]
+        assert manifest.counts() == {'done': 20}
+    assert not list((tmp_path / 'notes_ctakes_shards').glob('shard*'))
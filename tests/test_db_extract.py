@@ -0,0 +1,93 @@
+import sqlite3
+
+import pytest
+
+from mml_utils.db_extract import get_partition_query, get_range_conditions
+from mml_utils.filelists import read_filelist
+from mml_utils.partitions import CHECKPOINT_FILENAME, read_checkpoint, write_checkpoint
+from mml_utils.scripts.extract_text_to_files import text_from_database, text_from_database_partitioned
+
+QUERY = 'select note_id, text from notes where {partition} order by note_id, line'
+
+
+@pytest.fixture
+def notes_db(tmp_path):
+    """SQLite database of 100 notes, every 10th of which has 3 lines."""
+    path = tmp_path / 'notes.db'
+    conn = sqlite3.connect(path)
+    conn.execute('create table notes (note_id integer, line integer, text text)')
+    rows = []
+    for note_id in range(1, 101):
+        for line in range(3 if note_id % 10 == 0 else 1):
+            rows.append((note_id, line, f'Note {note_id} line {line} has fever. '))
+    conn.executemany('insert into notes values (?, ?, ?)', reversed(rows))
+    conn.commit()
+    conn.close()
+    return f'sqlite:///{path}'
+
+
+def _read_notes(outdir):
+    notes = {}
+    for filelist in outdir.glob('**/filelist*.txt'):
+        for file in read_filelist(filelist):
+            with open(file, encoding='utf8') as fh:
+                notes[int(file.rsplit('/', 1)[-1].split('.')[0])] = fh.read()
+    return notes
+
+
+def test_get_range_conditions():
+    assert get_range_conditions('id', 1, 10, 3) == ['id >= 1 and id < 4', 'id >= 4 and id < 8', 'id >= 8 and id < 11']
+    assert len(get_range_conditions('id', 1, 2, 8)) == 2
+
+
+def test_get_partition_query():
+    assert get_partition_query(QUERY, 'k = 1').startswith('select note_id, text from notes where k = 1 order')
+    assert get_partition_query('select * from t', 'k = 1') == 'select * from (select * from t) mml_partition where k = 1'
+
+
+@pytest.mark.parametrize('method', ['range', 'hash'])
+def test_text_from_database_partitioned(notes_db, tmp_path, method):
+    pytest.importorskip('sqlalchemy')
+    text_from_database(notes_db, QUERY.replace('{partition}', '1 = 1'), tmp_path / 'single')
+    counts = text_from_database_partitioned(notes_db, QUERY, tmp_path / 'parts', 'note_id', n_partitions=7,
+                                            method=method, n_workers=3, batch_size=8)
+    assert sum(counts) == 120
+    expected = _read_notes(tmp_path / 'single')
+    assert len(expected) == 100
+    assert expected[10] == 'Note 10 line 0 has fever. Note 10 line 1 has fever. Note 10 line 2 has fever. \n'
+    assert _read_notes(tmp_path / 'parts') == expected
+    assert len(list((tmp_path / 'parts').glob('part*'))) == 7
+
+
+def test_text_from_database_partitioned_resume(notes_db, tmp_path):
+    pytest.importorskip('sqlalchemy')
+    outdir = tmp_path / 'parts'
+    text_from_database_partitioned(notes_db, QUERY, outdir, 'note_id', n_partitions=4, n_workers=2)
+    completed = outdir / 'part0000'
+    (completed / 'notes' / 'extra.txt').write_text('kept')
+    interrupted = outdir / 'part0002'
+    (interrupted / CHECKPOINT_FILENAME).unlink()
+    (interrupted / 'notes' / 'partial.txt').write_text('removed')
+    with pytest.raises(ValueError):
+        text_from_database_partitioned(notes_db, QUERY, outdir, 'note_id', n_partitions=4, n_workers=2)
+    counts = text_from_database_partitioned(notes_db, QUERY, outdir, 'note_id', n_partitions=4, n_workers=2,
+                                            resume=True)
+    assert sum(counts) == 120
+    assert (completed / 'notes' / 'extra.txt').exists()
+    assert not (interrupted / 'notes' / 'partial.txt').exists()
+    assert read_checkpoint(interrupted)['rows'] == counts[2]
+    assert len(_read_notes(outdir)) == 100
+    # partitions recorded in the plan are reused, even if they would now be split differently
+    assert text_from_database_partitioned(notes_db, QUERY, outdir, 'note_id', n_partitions=6, n_workers=2,
+                                          resume=True) == counts
+
+
+def test_text_from_database_partitioned_checkpoint_mismatch(notes_db, tmp_path):
+    pytest.importorskip('sqlalchemy')
+    outdir = tmp_path / 'parts'
+    text_from_database_partitioned(notes_db, QUERY, outdir, 'note_id', n_partitions=4, n_workers=2)
+    checkpoint = read_checkpoint(outdir / 'part0001')
+    write_checkpoint(outdir / 'part0001', **checkpoint | {'query': QUERY})
+    with pytest.raises(ValueError, match='partition 1'):
+        text_from_database_partitioned(notes_db, QUERY, outdir, 'note_id', n_partitions=4, n_workers=2,
+                                       resume=True)
@@ -0,0 +1,49 @@
+import json
+
+from mml_utils.dedup import dedup_notes, rebuild_outputs, split_segments
+from mml_utils.filelists import get_output_path, read_filelist
+from mml_utils.run_mml import run_mml
+
+
+def test_split_segments():
+    text = 'Fever today.\n\n  \nMeds:\n- aspirin\n\n\nPlan: none\n'
+    segments = split_segments(text)
+    assert [segment for _, segment in segments] == ['Fever today.', 'Meds:\n- aspirin', 'Plan: none']
+    assert all(text[start: start + len(segment)] == segment for start, segment in segments)
+
+
+def test_dedup_notes_unique_names(tmp_path):
+    note = tmp_path / 'note.txt'
+    note.write_text('Fever today.\n')
+    first = dedup_notes([note], tmp_path / 'segments')
+    second = dedup_notes([note], tmp_path / 'segments')
+    assert len(set(first) | set(second)) == 4
+    assert len(read_filelist(first[0])) == 1  # not overwritten by the second run
+
+
+def test_dedup_notes_matches_full_run(fake_mml_home, tmp_path):
+    notes_dir = tmp_path / 'notes'
+    notes_dir.mkdir()
+    boilerplate = 'Review of systems: no fever, no chills.'
+    files = []
+    for i in range(5):
+        file = notes_dir / f'{i}.txt'
+        file.write_text(f'Note {i}: fever since {i} days.\n\n{boilerplate}\n\nPlan: monitor fever.\n')
+        files.append(file)
+    filelist = tmp_path / 'filelist.txt'
+    filelist.write_text(''.join(f'{file}\n' for file in files))
+    run_mml(filelist, fake_mml_home, output_format='json')
+    expected = [json.loads(get_output_path(file).read_text()) for file in files]
+    for file in files:
+        get_output_path(file).unlink()
+
+    segment_filelist, manifest = dedup_notes(files, tmp_path / 'segments')
+    assert len(read_filelist(segment_filelist)) == 7  # 5 distinct first lines + 2 shared segments
+    run_mml(segment_filelist, fake_mml_home, output_format='json')
+    n_rebuilt, incomplete = rebuild_outputs(manifest)
+    assert n_rebuilt == 5
+    assert not incomplete
+    for file, exp in zip(files, expected):
+        actual = json.loads(get_output_path(file).read_text())
+        assert [(el['start'], el['length'], el['id']) for el in actual] == \
+               [(el['start'], el['length'], el['id']) for el in exp]
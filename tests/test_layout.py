@@ -0,0 +1,66 @@
+import pathlib
+
+from mml_utils.filelists import get_output_path, read_filelist
+from mml_utils.layout import get_hashed_path, get_layout_dir, iter_files, migrate_to_hashed
+from mml_utils.manifest import RunManifest
+from mml_utils.run_mml import run_mml
+from mml_utils.scripts.build_filelists import prepare_mml_list
+from mml_utils.scripts.check_mml_progress import scan_progress
+from mml_utils.scripts.extract_mml_output import get_extract_file
+from mml_utils.scripts.extract_text_to_files import build_files
+
+
+def test_build_files_hashed(tmp_path):
+    notes = [('1', 'fever '), ('1', 'and chills'), ('2', 'fever'), ('3.5', 'no fever')]
+    build_files(iter(notes), tmp_path, n_dirs=2, hashed=True)
+    files = sorted(iter_files(tmp_path / 'notes0')) + sorted(iter_files(tmp_path / 'notes1'))
+    assert sorted(f.name for f in files) == ['1.txt', '2.txt', '3.5.txt']
+    for file in files:
+        assert file == get_hashed_path(get_layout_dir(file), file.name)
+    assert get_hashed_path(tmp_path / 'notes0', '1.txt').read_text() == 'fever and chills\n'
+    filelists = read_filelist(tmp_path / 'filelist0.txt') + read_filelist(tmp_path / 'filelist1.txt')
+    assert sorted(filelists) == sorted(str(f.absolute()) for f in files)
+
+
+def test_run_mml_hashed(tmp_path, fake_mml_home):
+    build_files(iter([(str(i), f'Note {i} has fever.') for i in range(10)]), tmp_path, hashed=True)
+    run_mml(tmp_path / 'filelist.txt', fake_mml_home, output_format='json', max_heap='1g')
+    progress = scan_progress(tmp_path / 'notes', textfile_ext='.txt', mmlout_ext='.json')
+    assert (progress['completed'], progress['total']) == (10, 10)
+
+
+def test_prepare_mml_list_keeps_hashed_layout(tmp_path):
+    build_files(iter([(str(i), f'Note {i} has fever.') for i in range(10)]), tmp_path, hashed=True)
+    (tmp_path / 'mml').mkdir()
+    (tmp_path / 'lists').mkdir()
+    filelist = prepare_mml_list(list(iter_files(tmp_path / 'notes')), tmp_path / 'mml', tmp_path / 'lists',
+                                settle_seconds=0)
+    files = read_filelist(filelist)
+    assert len(files) == 10
+    for file in files:
+        assert pathlib.Path(file) == get_hashed_path(tmp_path / 'mml', pathlib.Path(file).name)
+        assert pathlib.Path(file).exists()
+
+
+def test_migrate_to_hashed(tmp_path, fever_notes):
+    notes_dir = fever_notes.parent / 'notes'
+    for file in read_filelist(fever_notes):
+        get_output_path(file).write_text('[]')
+    (notes_dir / '.mml_progress.jsonl').write_text('')
+    with RunManifest(tmp_path / 'manifest.db') as manifest:
+        manifest.add_files(read_filelist(fever_notes))
+        manifest.mark(read_filelist(fever_notes)[:5], 'done', output_format='json')
+        assert migrate_to_hashed(notes_dir, filelists=[fever_notes], manifest=manifest) == 40
+        paths = list(manifest.iter_paths())
+    assert sorted(p.name for p in notes_dir.iterdir()) == sorted(
+        {'.mml_progress.jsonl'} | {get_hashed_path(notes_dir, f'{i}.txt').parts[-3] for i in range(20)}
+    )
+    files = read_filelist(fever_notes)
+    assert files[0] == str(get_hashed_path(notes_dir, '0.txt'))
+    assert all(get_output_path(file).exists() for file in files)
+    assert sorted(paths) == sorted(files)
+    assert get_extract_file(notes_dir, '7', 'json', extract_directories=[notes_dir], dir_index=0) \
+           == get_hashed_path(notes_dir, '7.json')
+    # re-running does nothing
+    assert migrate_to_hashed(notes_dir, filelists=[fever_notes]) == 0
+    assert read_filelist(fever_notes) == files
@@ -0,0 +1,51 @@
+from mml_utils.filelists import get_output_path, read_filelist
+from mml_utils.manifest import RunManifest, get_shard_name
+from mml_utils.mml_pool import run_mml_pool
+from mml_utils.run_mml import run_mml
+from mml_utils.scripts.extract_text_to_files import build_files
+from mml_utils.scripts.remove_done_from_filelist import clean_filelist
+
+
+def test_get_shard_name():
+    assert get_shard_name('lists/files_1.in_progress') == get_shard_name('files_1.building') == 'files_1'
+
+
+def test_build_files_records_notes(tmp_path):
+    manifest = RunManifest(tmp_path / 'manifest.db')
+    notes = [(1, 'Fever.'), (2, 'Part one. '), (2, 'Part two.'), (3, '')]
+    build_files(notes, tmp_path / 'out', manifest=manifest)
+    rows = dict(((path, (note_id, size)) for path, note_id, size in manifest.conn.execute(
+        'select path, note_id, size from notes where status = \'pending\'')))
+    assert len(rows) == 2
+    for path, (note_id, size) in rows.items():
+        with open(path, 'rb') as fh:
+            assert len(fh.read()) == size
+    assert sorted(note_id for note_id, _ in rows.values()) == ['1', '2']
+
+
+def test_run_mml_pool_records_status(fake_mml_home, fever_notes, tmp_path):
+    files = read_filelist(fever_notes)
+    with open(files[7], 'a', encoding='utf8') as out:
+        out.write('CRASH\n')
+    manifest = RunManifest(tmp_path / 'manifest.db')
+    manifest.add_files(files)
+    run_mml_pool([fever_notes], fake_mml_home, n_workers=2, shard_size=5, shard_dir=tmp_path / 'shards',
+                 progress_interval=1, manifest=manifest)
+    assert manifest.get_status(files[7]) == 'failed'
+    assert manifest.get_done(files) == {file for i, file in enumerate(files) if i not in {7, 8, 9}}
+    counts = manifest.counts()
+    assert counts == {'done': 17, 'failed': 1, 'queued': 2}  # files after the failure were not attempted
+    assert manifest.counts('filelist_shard0001.in_progress') == {'done': 2, 'failed': 1, 'queued': 2}
+
+
+def test_clean_filelist_uses_manifest(fake_mml_home, fever_notes, tmp_path):
+    files = read_filelist(fever_notes)
+    manifest = RunManifest(tmp_path / 'manifest.db')
+    run_mml(fever_notes, fake_mml_home, output_format='json', manifest=manifest)
+    assert manifest.get_done(files) == set(files)
+    manifest.mark(files[10:], 'failed')
+    for file in files:
+        get_output_path(file).unlink()  # manifest is used rather than output files
+    manifest.close()
+    clean_filelist.callback(fever_notes, manifest_path=tmp_path / 'manifest.db')
+    assert read_filelist(fever_notes) == files[9:]  # last completed is repeated
@@ -0,0 +1,44 @@
+from mml_utils.filelists import FilelistProgress, get_output_path, read_filelist
+from mml_utils.mml_pool import run_mml_pool, split_filelist_to_shards
+
+
+def test_split_filelist_to_shards(fever_notes, tmp_path):
+    shards = split_filelist_to_shards(fever_notes, shard_dir=tmp_path / 'shards', shard_size=6)
+    assert [len(read_filelist(shard)) for shard in shards] == [6, 6, 6, 2]
+    assert all(shard.suffix == '.in_progress' for shard in shards)
+
+
+def test_split_filelist_to_shards_resumes(fever_notes, tmp_path):
+    shards = split_filelist_to_shards(fever_notes, shard_dir=tmp_path / 'shards', shard_size=6)
+    shards[0].rename(shards[0].with_suffix('.complete'))
+    assert split_filelist_to_shards(fever_notes, shard_dir=tmp_path / 'shards', shard_size=6) == shards[1:]
+
+
+def test_run_mml_pool(fake_mml_home, fever_notes, tmp_path):
+    completed, failed = run_mml_pool([fever_notes], fake_mml_home, n_workers=3, shard_size=4,
+                                     shard_dir=tmp_path / 'shards', max_heap='1g', progress_interval=1)
+    assert len(completed) == 5
+    assert not failed
+    assert all(get_output_path(file).exists() for file in read_filelist(fever_notes))
+    assert not list((tmp_path / 'shards').glob('*.in_progress'))
+
+
+def test_run_mml_pool_failed_shard_is_resumable(fake_mml_home, fever_notes, tmp_path):
+    bad_file = read_filelist(fever_notes)[6]
+    with open(bad_file, 'a', encoding='utf8') as out:
+        out.write('CRASH\n')
+    completed, failed = run_mml_pool([fever_notes], fake_mml_home, n_workers=2, shard_size=4,
+                                     shard_dir=tmp_path / 'shards', progress_interval=1)
+    assert len(completed) == 4
+    assert len(failed) == 1
+    # last completed file is retained in case its output is incomplete
+    assert read_filelist(failed[0]) == read_filelist(fever_notes)[5:8]
+
+
+def test_filelist_progress(fever_notes):
+    progress = FilelistProgress(fever_notes)
+    assert progress.update() == 0
+    for file in read_filelist(fever_notes)[:5]:
+        get_output_path(file).touch()
+    assert progress.update() == 5
+    assert progress.remaining() == read_filelist(fever_notes)[4:]
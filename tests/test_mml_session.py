@@ -0,0 +1,57 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+import fake_mml
+from mml_utils.filelists import read_filelist
+from mml_utils.mml_session import MmlSession, build_session_command, restrict_results
+from mml_utils.parse.json import extract_mml_from_json_data
+
+
+@pytest.fixture
+def session_cmd():
+    return [sys.executable, str(Path(__file__).parent / 'fake_mml_session.py')]
+
+
+def test_session_multiple_batches(session_cmd):
+    with MmlSession(cmd=session_cmd) as session:
+        results = session.annotate('No fever. Still has fever°.')
+        assert [r['start'] for r in results] == [3, 20]
+        assert results[0].keys() == fake_mml.annotate('fever')[0].keys()  # same fields as `--outputformat=json`
+        batch = list(session.process([('a', 'fever'), ('b', 'none'), ('c', 'fever\nfever')]))
+        assert [(doc_id, len(r)) for doc_id, r in batch] == [('a', 1), ('b', 0), ('c', 2)]
+        assert session.n_processed == 4
+
+
+def test_session_process_files(session_cmd, fever_notes):
+    files = read_filelist(fever_notes)
+    with MmlSession(cmd=session_cmd) as session:
+        outfiles = list(session.process_files(files))
+    assert len(outfiles) == len(files)
+    with open(outfiles[0]) as fh:
+        data = list(extract_mml_from_json_data(json.load(fh), outfiles[0]))
+    assert [d['start'] for d in data] == [20, 30]
+
+
+def test_session_restrict_results(session_cmd):
+    with MmlSession(cmd=session_cmd, restrict_to_src=['MDR']) as session:
+        assert len(session.annotate('fever')) == 1
+        assert session.annotate('fever', restrict_to_src=['SNOMEDCT_US']) == []
+        assert session.annotate('fever', restrict_to_sts=['dsyn']) == []
+
+
+def test_session_crash(session_cmd):
+    with MmlSession(cmd=session_cmd) as session:
+        with pytest.raises(RuntimeError):
+            session.annotate('CRASH')
+        session.restart()
+        assert len(session.annotate('fever')) == 1
+
+
+def test_build_session_command(fake_mml_home):
+    cmd = build_session_command(fake_mml_home, max_heap='4g')
+    assert cmd[:2] == ['java', '-Xmx4g']
+    assert cmd[-1].endswith('MetaMapLiteSession.java')
+    assert any('metamaplite.index.directory' in arg and '2022AB' in arg for arg in cmd)
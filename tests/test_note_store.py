@@ -0,0 +1,67 @@
+import shutil
+
+import pytest
+
+from mml_utils.filelists import read_filelist
+from mml_utils.note_store import (ENTRY_SIZE, NoteStore, export_notes, get_log_path, get_note_ids, pack_files,
+                                  write_note_store)
+from mml_utils.scripts.extract_mml import extract_data_from_file
+from mml_utils.scripts.extract_text_to_files import text_from_csv
+
+
+def test_note_store_from_csv(source_data_path, tmp_path):
+    path = tmp_path / 'corpus.notes'
+    text_from_csv(source_data_path / 'corpus.csv', id_col='note_id', text_col='note_text', outdir=None,
+                  note_store=path)
+    text_from_csv(source_data_path / 'corpus.csv', id_col='note_id', text_col='note_text', outdir=tmp_path / 'txt')
+    with NoteStore(path) as store:
+        assert len(store) == 9
+        for file in read_filelist(tmp_path / 'txt' / 'filelist.txt'):
+            with open(file, encoding='utf8') as fh:
+                assert store.get_text(file.rsplit('/', 1)[-1].removesuffix('.txt')) == fh.read()
+        assert store.get_text('missing') is None
+        assert list(store.iter_note_ids()) == sorted(store.iter_note_ids())
+
+
+def test_note_store_resume(tmp_path):
+    path = tmp_path / 'corpus.notes'
+    notes = [(i, f'Note {i} has fever.') for i in range(10)] + [(3, ' And chills.')]
+    write_note_store(iter(notes[:5]), path)
+    with open(get_log_path(path), 'ab') as out:
+        out.write(b'\0' * (ENTRY_SIZE - 1))  # interrupted while writing an entry
+    with pytest.raises(FileExistsError):
+        write_note_store(iter(notes), path)
+    assert write_note_store(iter(notes), path, resume=True) == 5
+    assert get_note_ids(path) == {str(i) for i in range(10)}
+    with NoteStore(path) as store:
+        assert len(store) == 10
+        assert store.get_text(3) == 'Note 3 has fever.\n'  # already written before resuming
+        assert store.get_text(9) == 'Note 9 has fever.\n'
+
+
+def test_export_notes_shards(tmp_path):
+    path = tmp_path / 'corpus.notes'
+    write_note_store(((i, f'Note {i}.') for i in range(25)), path)
+    exported = []
+    with NoteStore(path) as store:
+        for shard in range(4):
+            filelist = export_notes(store, tmp_path / f'shard{shard}', shard=shard, n_shards=4, hashed=shard == 1)
+            exported += read_filelist(filelist)
+        export_notes(store, tmp_path / 'some', ['7', '99'])
+    assert len(exported) == 25
+    assert sorted(int(file.rsplit('/', 1)[-1].removesuffix('.txt')) for file in exported) == list(range(25))
+    assert read_filelist(tmp_path / 'some' / 'filelist.txt') == [str((tmp_path / 'some' / '7.txt').absolute())]
+    assert (tmp_path / 'some' / '7.txt').read_text() == 'Note 7.\n'
+
+
+def test_extract_data_from_file_with_note_store(short_fever_dir, tmp_path):
+    outdir = tmp_path / 'out'
+    outdir.mkdir()
+    shutil.copy(short_fever_dir / 'fever.json', outdir / 'fever.json')
+    path = tmp_path / 'corpus.notes'
+    pack_files([short_fever_dir / 'fever.txt'], path)
+    with NoteStore(path) as store:
+        results = list(extract_data_from_file(outdir / 'fever.json', note_store=store))
+    record = [data for is_record, data in results if is_record][0]
+    assert record['num_chars'] == len((short_fever_dir / 'fever.txt').read_text())
+    assert any(not is_record for is_record, _ in results)
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from mml_utils.filelists import get_output_path, read_filelist
+from mml_utils.packing import SEPARATOR, pack_notes, unpack_json, unpack_outputs
+from mml_utils.parse.json import extract_mml_from_json_data
+from mml_utils.parse.mmi import extract_mml_from_mmi_data
+from mml_utils.run_mml import run_mml
+
+
+def _run_unpacked_and_packed(fake_mml_home, fever_notes, tmp_path, output_format):
+    files = read_filelist(fever_notes)
+    run_mml(fever_notes, fake_mml_home, output_format=output_format)
+    expected = {file: get_output_path(file, output_format).read_text() for file in files}
+    for file in files:
+        get_output_path(file, output_format).unlink()
+    pack_filelist = pack_notes(files, tmp_path / 'packs', max_notes=6)
+    assert len(read_filelist(pack_filelist)) == 4
+    run_mml(pack_filelist, fake_mml_home, output_format=output_format)
+    n_notes, missing = unpack_outputs(pack_filelist, output_format=output_format)
+    assert n_notes == 20
+    assert not missing
+    return expected, {file: get_output_path(file, output_format).read_text() for file in files}
+
+
+def test_packing_json(fake_mml_home, fever_notes, tmp_path):
+    expected, actual = _run_unpacked_and_packed(fake_mml_home, fever_notes, tmp_path, 'json')
+    for file in expected:
+        filename = get_output_path(file)
+        assert list(extract_mml_from_json_data(json.loads(actual[file]), filename)) == \
+               list(extract_mml_from_json_data(json.loads(expected[file]), filename))
+
+
+def test_packing_mmi(fake_mml_home, fever_notes, tmp_path):
+    expected, actual = _run_unpacked_and_packed(fake_mml_home, fever_notes, tmp_path, 'mmi')
+    for file in expected:
+        filename = get_output_path(file, 'mmi').name
+        assert list(extract_mml_from_mmi_data(actual[file], filename)) == \
+               list(extract_mml_from_mmi_data(expected[file], filename))
+
+
+@pytest.mark.parametrize('start, length, expected', [
+    (0, 5, [0]),  # within first note
+    (8, 5, []),  # crosses into separator/next note
+    (10 + len(SEPARATOR), 5, [1]),  # within second note
+])
+def test_unpack_json_drops_boundary_matches(start, length, expected):
+    offset_map = [['a.txt', 0, 10], ['b.txt', 10 + len(SEPARATOR), 10]]
+    data = [{'start': start, 'length': length, 'id': 'en0', 'evlist': [{'start': start, 'id': 'ev0'}]}]
+    results = unpack_json(data, offset_map)
+    assert [i for i, file in enumerate(['a.txt', 'b.txt']) if results[file]] == expected
@@ -0,0 +1,81 @@
+import pytest
+
+from mml_utils.filelists import read_filelist
+from mml_utils.parquet_reader import get_row_groups, split_row_groups
+from mml_utils.partitions import CHECKPOINT_FILENAME
+from mml_utils.scripts.extract_text_to_files import text_from_parquet
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+@pytest.fixture
+def parquet_dir(tmp_path):
+    """Two parquet files of 50 notes each (with other columns) in row groups of 10 rows."""
+    directory = tmp_path / 'parquet'
+    directory.mkdir()
+    for part in range(2):
+        ids = list(range(part * 50, (part + 1) * 50))
+        table = pa.table({
+            'note_id': ids,
+            'patient': [f'P{i % 7}' for i in ids],
+            'note_text': [None if i == 13 else f'Note {i}: patient has fever.' for i in ids],
+        })
+        pq.write_table(table, directory / f'part{part}.parquet', row_group_size=10)
+    return directory
+
+
+def _read_notes(outdir):
+    notes = {}
+    for filelist in outdir.glob('**/filelist*.txt'):
+        for file in read_filelist(filelist):
+            with open(file, encoding='utf8') as fh:
+                notes[file.rsplit('/', 1)[-1]] = fh.read()
+    return notes
+
+
+def test_split_row_groups(parquet_dir):
+    row_groups = get_row_groups(sorted(parquet_dir.glob('*.parquet')))
+    assert len(row_groups) == 10
+    partitions = split_row_groups(row_groups, 3)
+    assert [len(p) for p in partitions] == [4, 3, 3]
+    assert [rg for p in partitions for rg in p] == row_groups
+    assert len(split_row_groups(row_groups, 20)) == 10
+
+
+def test_split_row_groups_keeps_notes_together(tmp_path):
+    path = tmp_path / 'notes.parquet'
+    ids = [i // 3 for i in range(60)]  # 3 rows per note, so notes span row groups of 10 rows
+    pq.write_table(pa.table({'note_id': ids, 'note_text': [f'line {i}. ' for i in range(60)]}), path,
+                   row_group_size=10)
+    row_groups = get_row_groups([path])
+    partitions = split_row_groups(row_groups, 6, id_col='note_id')
+    assert [rg for p in partitions for rg in p] == row_groups
+    assert [len(p) for p in partitions] == [3, 3]  # only row group 3 starts with a new note
+    counts = text_from_parquet([path], 'note_id', 'note_text', tmp_path / 'parts', n_workers=2, n_partitions=6)
+    assert sum(counts) == 60
+    notes = _read_notes(tmp_path / 'parts')
+    assert len(notes) == 20
+    assert notes['9.txt'] == 'line 27. line 28. line 29. \n'
+
+
+def test_text_from_parquet(parquet_dir, tmp_path):
+    text_from_parquet([parquet_dir], 'note_id', 'note_text', tmp_path / 'single', batch_size=7)
+    notes = _read_notes(tmp_path / 'single')
+    assert len(notes) == 99
+    assert notes['42.txt'] == 'Note 42: patient has fever.\n'
+    counts = text_from_parquet([parquet_dir], 'note_id', 'note_text', tmp_path / 'parts', n_workers=3,
+                               n_partitions=4, batch_size=7)
+    assert sum(counts) == 100
+    assert _read_notes(tmp_path / 'parts') == notes
+
+
+def test_text_from_parquet_resume(parquet_dir, tmp_path):
+    outdir = tmp_path / 'parts'
+    text_from_parquet([parquet_dir], 'note_id', 'note_text', outdir, n_workers=2, n_partitions=5)
+    (outdir / 'part0001' / CHECKPOINT_FILENAME).unlink()
+    (outdir / 'part0001' / 'filelist.txt').write_text('')
+    counts = text_from_parquet([parquet_dir], 'note_id', 'note_text', outdir, n_workers=2, n_partitions=5,
+                               resume=True)
+    assert counts == [20] * 5
+    assert len(_read_notes(outdir)) == 99
@@ -0,0 +1,77 @@
+import pytest
+
+from mml_utils import planner
+from mml_utils.planner import (GB, format_heap_size, get_cgroup_cpu_limit, get_cgroup_memory_available,
+                               parse_heap_size, plan_mml_resources)
+from mml_utils.run_mml import build_mml_command, resolve_max_heap
+
+
+@pytest.mark.parametrize('size, expected', [
+    ('12g', 12 * GB),
+    ('512m', 512 * 1024 ** 2),
+    ('1.5G', int(1.5 * GB)),
+])
+def test_parse_heap_size(size, expected):
+    assert parse_heap_size(size) == expected
+
+
+def test_format_heap_size():
+    assert format_heap_size(12 * GB) == '12g'
+    assert format_heap_size(int(1.5 * GB)) == '1536m'
+
+
+def test_cgroup_v2(tmp_path):
+    (tmp_path / 'memory.max').write_text(f'{8 * GB}\n')
+    (tmp_path / 'memory.current').write_text(f'{2 * GB}\n')
+    (tmp_path / 'cpu.max').write_text('400000 100000\n')
+    assert get_cgroup_memory_available(tmp_path) == 6 * GB
+    assert get_cgroup_cpu_limit(tmp_path) == 4
+
+
+def test_cgroup_v1(tmp_path):
+    (tmp_path / 'memory').mkdir()
+    (tmp_path / 'memory' / 'memory.limit_in_bytes').write_text(f'{8 * GB}\n')
+    (tmp_path / 'memory' / 'memory.usage_in_bytes').write_text(f'{1 * GB}\n')
+    (tmp_path / 'cpu').mkdir()
+    (tmp_path / 'cpu' / 'cpu.cfs_quota_us').write_text('-1\n')
+    (tmp_path / 'cpu' / 'cpu.cfs_period_us').write_text('100000\n')
+    assert get_cgroup_memory_available(tmp_path) == 7 * GB
+    assert get_cgroup_cpu_limit(tmp_path) is None
+
+
+def test_no_cgroup_limits(tmp_path):
+    (tmp_path / 'memory.max').write_text('max\n')
+    assert get_cgroup_memory_available(tmp_path) is None
+    assert get_cgroup_cpu_limit(tmp_path) is None
+
+
+@pytest.fixture
+def machine(monkeypatch):
+    def _machine(memory_gb, cpus):
+        monkeypatch.setattr(planner, 'get_available_memory', lambda: memory_gb * GB)
+        monkeypatch.setattr(planner, 'get_cpu_count', lambda: cpus)
+    return _machine
+
+
+def test_plan_limited_by_memory(machine, tmp_path):
+    (tmp_path / 'index.dat').write_bytes(b'\0' * 1024)  # minimum heap: 2g; preferred: 3g
+    machine(memory_gb=17, cpus=16)  # 15g after reserve; 3.75g per instance
+    assert plan_mml_resources(tmp_path) == ('3g', 4)
+
+
+def test_plan_limited_by_cpus(machine, tmp_path):
+    machine(memory_gb=100, cpus=2)
+    assert plan_mml_resources(tmp_path) == ('3g', 2)
+
+
+def test_plan_with_overrides(machine, tmp_path):
+    machine(memory_gb=17, cpus=16)
+    assert plan_mml_resources(tmp_path, max_heap='6g') == ('6g', 2)
+    assert plan_mml_resources(tmp_path, n_workers=5) == ('2457m', 5)
+
+
+def test_max_heap_default_and_auto(machine, fake_mml_home):
+    machine(memory_gb=100, cpus=2)
+    assert '-Xmx12g' in build_mml_command('filelist.txt', fake_mml_home)
+    assert '-Xmx3g' in build_mml_command('filelist.txt', fake_mml_home, max_heap='auto')
+    assert resolve_max_heap(fake_mml_home, '6g') == '6g'
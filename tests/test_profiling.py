@@ -0,0 +1,73 @@
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+
+import pytest
+
+from mml_utils.filelists import read_filelist
+from mml_utils.mml_pool import run_mml_pool
+from mml_utils.profiling import run_profiled
+from mml_utils.run_mml import run_mml
+
+requires_proc = pytest.mark.skipif(not os.path.exists('/proc/self/stat'), reason='requires /proc')
+
+
+@requires_proc
+def test_run_profiled_samples_children(tmp_path):
+    report = tmp_path / 'run.profile.json'
+    # shell -> python child which allocates memory and does some work
+    cmd = f'"{sys.executable}" -c "x = bytearray(50 * 1024 ** 2); sum(range(10 ** 7))"'
+    res = run_profiled(cmd, report, files=[], interval=0.05, shell=True)
+    assert res.returncode == 0
+    data = json.loads(report.read_text())
+    assert data['samples']
+    assert data['peak_rss_mb'] > 40
+    assert data['cpu_seconds'] > 0
+    with open(tmp_path / 'run_profiles.csv', newline='') as fh:
+        rows = list(csv.DictReader(fh))
+    assert len(rows) == 1
+    assert rows[0]['returncode'] == '0'
+
+
+@requires_proc
+def test_run_profiled_counts_child_cpu_once(tmp_path):
+    report = tmp_path / 'run.profile.json'
+    # the shell waits on its child, so the child's cpu is added to the shell's `cutime`
+    cmd = f'"{sys.executable}" -c "sum(range(3 * 10 ** 7))"; sleep 0.5'
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    run_profiled(cmd, report, files=[], interval=0.05, shell=True)
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    actual = after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime
+    assert json.loads(report.read_text())['cpu_seconds'] <= actual * 1.2 + 0.1
+
+
+def test_run_mml_profile(fake_mml_home, fever_notes):
+    res = run_mml(fever_notes, fake_mml_home, output_format='json', profile=True)
+    assert res.returncode == 0
+    data = json.loads((fever_notes.parent / 'filelist.txt.profile.json').read_text())
+    assert data['n_docs'] == 20
+    assert data['n_bytes'] == sum(os.stat(file).st_size for file in read_filelist(fever_notes))
+    assert data['docs_per_sec'] > 0
+    assert 'metamaplite' in data['label']
+
+
+def test_run_mml_profile_failure(fake_mml_home, fever_notes):
+    files = read_filelist(fever_notes)
+    with open(files[5], 'a', encoding='utf8') as out:
+        out.write('CRASH\n')
+    res = run_mml(fever_notes, fake_mml_home, output_format='json', profile=True)
+    assert res.returncode != 0
+    data = json.loads((fever_notes.parent / 'filelist.txt.profile.json').read_text())
+    assert data['n_docs'] == 5  # only documents processed before the failure
+
+
+def test_run_mml_pool_profile(fake_mml_home, fever_notes, tmp_path):
+    run_mml_pool([fever_notes], fake_mml_home, n_workers=2, shard_size=10, shard_dir=tmp_path / 'shards',
+                 progress_interval=1, max_heap='1g', profile=True)
+    with open(tmp_path / 'shards' / 'run_profiles.csv', newline='') as fh:
+        rows = list(csv.DictReader(fh))
+    assert sorted(int(row['n_docs']) for row in rows) == [10, 10]
+    assert len(list((tmp_path / 'shards').glob('*.profile.json'))) == 2
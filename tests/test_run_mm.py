@@ -0,0 +1,73 @@
+import csv
+import socket
+import sys
+from pathlib import Path
+
+import pytest
+
+from mml_utils.run_mm import MetaMapExecutor, MmServers, get_mm_tasks
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='requires sh')
+
+
+def _write_script(path: Path, text):
+    path.write_text(f'#!/bin/sh\n{text}\n')
+    path.chmod(0o755)
+    return path
+
+
+@pytest.fixture
+def fake_metamap(tmp_path):
+    """`metamap` executable which runs `fake_metamap.py`."""
+    bin_dir = tmp_path / 'public_mm' / 'bin'
+    bin_dir.mkdir(parents=True)
+    return _write_script(bin_dir / 'metamap',
+                         f'exec "{sys.executable}" "{Path(__file__).parent / "fake_metamap.py"}" "$@"')
+
+
+def test_executor_skips_retries_and_records(tmp_path, fake_metamap, fever_notes):
+    outdir = tmp_path / 'mmi'
+    notes = fever_notes.parent / 'notes'
+    (notes / '3.txt').write_text('CRASH fever', encoding='utf8')
+    outdir.mkdir()
+    (outdir / '0.mmi').write_text('', encoding='utf8')  # already processed
+    latency_path = tmp_path / 'latency.csv'
+    executor = MetaMapExecutor(get_mm_tasks('-N', filelist=fever_notes, mm_outpath=outdir), fake_metamap,
+                               n_workers=4, retries=1, latency_path=latency_path)
+    completed, skipped, failed = executor.run()
+    assert len(completed) == 19
+    assert len(skipped) == 1
+    assert not failed
+    assert 'C0015967' in (outdir / '3.mmi').read_text(encoding='utf8')
+    assert not list(outdir.glob('*.tmp'))  # output is written to a temporary file and renamed once complete
+    with open(latency_path, newline='') as fh:
+        rows = list(csv.DictReader(fh))
+    assert len(rows) == 20
+    assert sorted(row['status'] for row in rows if Path(row['file']).name == '3.txt') == ['done', 'failed']
+
+
+def test_executor_timeout(tmp_path, fake_metamap, fever_notes):
+    (fever_notes.parent / 'notes' / '1.txt').write_text('STALL', encoding='utf8')
+    tasks = get_mm_tasks('', filelist=fever_notes, mm_outpath=tmp_path / 'mmi')[:2]
+    completed, _, failed = MetaMapExecutor(tasks, fake_metamap, n_workers=2, retries=0, timeout=2).run()
+    assert len(completed) == 1
+    assert failed == [tasks[1][0]]
+    assert not (tmp_path / 'mmi' / '1.mmi').exists()
+
+
+def test_servers_restarted_when_down(tmp_path, fake_metamap):
+    log = tmp_path / 'ctl.log'
+    for name in ('skrmedpostctl', 'wsdserverctl'):
+        _write_script(fake_metamap.parent / name, f'echo "{name} $1" >> "{log}"')
+    with socket.socket() as listening:  # the tagger is up, WSD server is not
+        listening.bind(('localhost', 0))
+        listening.listen()
+        port = listening.getsockname()[1]
+        with socket.socket() as closed:
+            closed.bind(('localhost', 0))
+            closed_port = closed.getsockname()[1]
+        servers = MmServers(fake_metamap.parent, {'skrmedpostctl': port, 'wsdserverctl': closed_port},
+                            start_timeout=0.5)
+        assert not servers.ensure(force=True)
+    assert log.read_text().splitlines() == ['wsdserverctl stop', 'wsdserverctl start']
+    assert servers.restarts == 1
@@ -0,0 +1,43 @@
+from mml_utils.filelists import get_output_path, read_filelist
+from mml_utils.run_mml import repeat_run_mml
+
+
+def test_repeat_run_mml_bisect(fake_mml_home, fever_notes):
+    files = read_filelist(fever_notes)
+    bad_files = [files[3], files[11], files[17]]
+    for bad_file in bad_files:
+        with open(bad_file, 'a', encoding='utf8') as out:
+            out.write('CRASH\n')
+    failed = repeat_run_mml(fever_notes, fake_mml_home, output_format='json', isolate_failures='bisect',
+                            n_workers=4)
+    assert sorted(failed) == sorted(bad_files)
+    assert read_filelist(fever_notes.parent / 'errors.txt') == failed
+    for file in files:
+        assert get_output_path(file).exists() == (file not in bad_files)
+
+
+def test_repeat_run_mml_bisect_no_failures(fake_mml_home, fever_notes):
+    assert repeat_run_mml(fever_notes, fake_mml_home, output_format='json', isolate_failures='bisect') == []
+    assert all(get_output_path(file).exists() for file in read_filelist(fever_notes))
+
+
+def test_repeat_run_mml_bisect_max_retry(fake_mml_home, fever_notes):
+    files = read_filelist(fever_notes)
+    for bad_file in files[::4]:
+        with open(bad_file, 'a', encoding='utf8') as out:
+            out.write('CRASH\n')
+    failed = repeat_run_mml(fever_notes, fake_mml_home, output_format='json', isolate_failures='bisect',
+                            max_retry=1)
+    assert 1 < len(failed) < 5
+
+
+def test_repeat_run_mml_bisect_systemic_failure(fake_mml_home, fever_notes, caplog):
+    for file in read_filelist(fever_notes):
+        with open(file, 'a', encoding='utf8') as out:
+            out.write('CRASH\n')
+    assert repeat_run_mml(fever_notes, fake_mml_home, output_format='json', isolate_failures='bisect') == []
+    assert 'failed on every set through round 2' in caplog.text
+
+
+def test_repeat_run_mml_first_no_failures(fake_mml_home, fever_notes):
+    assert repeat_run_mml(fever_notes, fake_mml_home, output_format='json') == []
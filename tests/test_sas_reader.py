@@ -0,0 +1,35 @@
+import pytest
+
+from mml_utils.filelists import read_filelist
+from mml_utils.scripts.extract_text_to_files import text_from_sas7bdat
+from mml_utils.text_sources import ParallelSasSource, SasSource
+
+pytest.importorskip('pyreadstat')
+
+
+def _read_notes(outdir):
+    notes = {}
+    for file in read_filelist(outdir / 'filelist.txt'):
+        with open(file, encoding='utf8') as fh:
+            notes[file.rsplit('/', 1)[-1]] = fh.read()
+    return notes
+
+
+def test_parallel_sas_source(source_data_path):
+    path = source_data_path / 'corpus.sas7bdat'
+    expected = list(SasSource(path, 'note_id', 'note_text', chunksize=4))
+    assert len(expected) == 10
+    assert list(ParallelSasSource(path, 'note_id', 'note_text', chunksize=3, n_workers=2)) == expected
+    source = ParallelSasSource(path, 'note_id', 'note_text', chunksize=3, n_workers=2)
+    source.seek(4)
+    assert list(source) == expected[4:]
+    assert source.position == 9
+
+
+def test_text_from_sas7bdat_parallel(source_data_path, tmp_path):
+    path = source_data_path / 'corpus.sas7bdat'
+    text_from_sas7bdat(path, 'note_id', 'note_text', tmp_path / 'serial')
+    text_from_sas7bdat(path, 'note_id', 'note_text', tmp_path / 'parallel', n_workers=2, chunksize=3)
+    notes = _read_notes(tmp_path / 'serial')
+    assert len(notes) == 9
+    assert _read_notes(tmp_path / 'parallel') == notes
@@ -0,0 +1,55 @@
+from mml_utils.filelists import read_filelist
+from mml_utils.scripts.extract_text_to_files import build_files
+from mml_utils.scripts.split_filelist import split_filelist_by_size
+from mml_utils.sharding import CostModel, OnlineBalancer, imbalance, lpt_partition
+
+
+def test_lpt_partition():
+    costs = [7, 1, 1, 1, 5, 2, 3]
+    bins = lpt_partition(costs, 2)
+    assert sorted(i for b in bins for i in b) == list(range(len(costs)))
+    assert sorted(sum(costs[i] for i in b) for b in bins) == [10, 10]
+
+
+def test_imbalance():
+    assert imbalance([5, 5, 5]) == 1.0
+    assert imbalance([10, 0]) == 2.0
+
+
+def test_online_balancer_add():
+    balancer = OnlineBalancer(2)
+    assert balancer.assign(10) == 0
+    assert balancer.assign(3) == 1
+    balancer.add(1, 10)  # e.g., second part of same note
+    assert balancer.assign(1) == 0
+
+
+def test_cost_model_fit():
+    model = CostModel.fit([(100, 1.5), (200, 2.5), (300, 3.5)])
+    assert round(model.per_file, 6) == 0.5
+    assert round(model.per_byte, 6) == 0.01
+    assert model.cost(1000) == model.per_file + model.per_byte * 1000
+
+
+def test_split_filelist_by_size(tmp_path):
+    files = []
+    for i, size in enumerate([900, 100, 100, 100, 100, 100, 100, 100, 100, 100]):
+        file = tmp_path / f'{i}.txt'
+        file.write_text('x' * size)
+        files.append(str(file))
+    filelist = tmp_path / 'filelist.txt'
+    filelist.write_text('\n'.join(files) + '\n')
+    split_filelist_by_size(filelist, 2)
+    parts = [read_filelist(f'{filelist}_part{i}') for i in range(2)]
+    assert sorted(len(part) for part in parts) == [1, 9]
+    assert sorted(parts, key=len)[0] == [files[0]]
+
+
+def test_build_files_balanced(tmp_path):
+    notes = [(1, 'a' * 1000), (2, 'b'), (3, 'c'), (1, 'a' * 1000), (4, 'd' * 500), (5, 'e' * 500)]
+    build_files(iter(notes), tmp_path, n_dirs=2, balance=True)
+    sizes = [
+        sum(len(open(f).read()) for f in read_filelist(tmp_path / f'filelist{i}.txt'))
+        for i in range(2)
+    ]
+    assert sorted(sizes) == [1006, 2001]
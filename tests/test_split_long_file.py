@@ -0,0 +1,52 @@
+import json
+
+from mml_utils.filelists import get_output_path, read_filelist
+from mml_utils.run_mml import run_mml
+from mml_utils.scripts.split_long_file import get_windows, merge_split_output, split_files_on_windows
+
+
+def test_get_windows():
+    text = ''.join(f'Sentence {i} mentions fever. ' for i in range(200))
+    windows = get_windows(text, max_chars=500, overlap=100)
+    assert windows[0][0] == 0
+    assert windows[-1][1] == len(text)
+    for (start, end), (next_start, _) in zip(windows, windows[1:]):
+        assert end - start <= 500
+        assert text[end - 1] == ' '  # cut after a sentence
+        assert start < next_start < end  # overlaps
+
+
+def test_split_and_merge_matches_full_run(fake_mml_home, tmp_path):
+    file = tmp_path / 'long.txt'
+    file.write_text(''.join(f'Line {i}: patient has fever.\nNo fever yesterday.\n' for i in range(300)))
+    filelist = tmp_path / 'filelist.txt'
+    filelist.write_text(f'{file}\n')
+    run_mml(filelist, fake_mml_home, output_format='json')
+    expected = json.loads(get_output_path(file).read_text())
+
+    split_filelist = tmp_path / 'filelist_split.txt'
+    split_files_on_windows.callback([file], max_chars=1_000, overlap=100, filelist=split_filelist)
+    assert len(read_filelist(split_filelist)) > 10
+    get_output_path(file).unlink()
+    run_mml(split_filelist, fake_mml_home, output_format='json')
+    n_written, missing = merge_split_output(tmp_path / 'filelist_split.manifest.jsonl')
+    assert n_written == 1
+    assert not missing
+    actual = json.loads(get_output_path(file).read_text())
+    assert [(el['start'], el['length'], el['id']) for el in actual] == \
+           [(el['start'], el['length'], el['id']) for el in expected]
+
+
+def test_split_keeps_crlf_offsets(tmp_path):
+    file = tmp_path / 'long.txt'
+    file.write_bytes(''.join(f'Line {i}: patient has fever.\r\n' for i in range(300)).encode('utf8'))
+    split_filelist = tmp_path / 'filelist_split.txt'
+    split_files_on_windows.callback([file], max_chars=1_000, overlap=100, filelist=split_filelist)
+    data = file.read_bytes()
+    with open(tmp_path / 'filelist_split.manifest.jsonl', encoding='utf8') as fh:
+        records = [json.loads(line) for line in fh]
+    assert len(records) > 5
+    for record in records:
+        part = open(record['part'], 'rb').read()
+        assert b'\r\n' in part
+        assert data[record['start']: record['start'] + len(part)] == part
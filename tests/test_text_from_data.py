@@ -1,9 +1,16 @@
+import itertools
+import json
 import shutil
+import time
 from pathlib import Path
 
 import pandas as pd
 
-from mml_utils.scripts.extract_text_to_files import text_from_csv, text_from_sas7bdat
+from mml_utils.filelists import read_filelist
+from mml_utils.scripts import extract_text_to_files
+from mml_utils.scripts.extract_text_to_files import NoteBuffer, build_files, resume_building_files, text_from_csv, \
+    text_from_sas7bdat
+from mml_utils.text_sources import JsonlSource
 
 
 def test_text_from_sas7bdat(source_data_path):
@@ -50,3 +57,116 @@ def _check_text_vs_dataframe(df, outdir):
             assert source_text_with_newline == path.read_text()
             count += 1
     assert count == 9, 'Count number of files generated'
+
+
+def test_build_files_many_parts(tmp_path, monkeypatch):
+    """Each note is written once, however many parts (rows) it has."""
+    opened = []
+
+    def counting_open(file, mode='r', *args, **kwargs):
+        if 'w' in mode or 'a' in mode:
+            opened.append(Path(file).name)
+        return open(file, mode, *args, **kwargs)
+
+    monkeypatch.setattr(extract_text_to_files, 'open', counting_open, raising=False)
+    parts = [f'Part {i} of a long note. ' for i in range(500)]
+    notes = [(1, 'Short note.')] + [(2, part) for part in parts] + [(3, 'Another.')] + [(4, part) for part in parts]
+    start = time.time()
+    build_files(iter(notes), tmp_path)
+    elapsed = time.time() - start
+    assert (tmp_path / 'notes' / '2.txt').read_text() == (tmp_path / 'notes' / '4.txt').read_text() == ''.join(
+        parts) + '\n'
+    assert sorted(name for name in opened if name.endswith('.txt') and name[0].isdigit()) == [
+        '1.txt', '2.txt', '3.txt', '4.txt']
+    assert elapsed < 5, f'Took {elapsed:.1f} seconds to write 1,002 parts.'
+
+
+def test_note_buffer_spills_long_notes(tmp_path):
+    filelist = tmp_path / 'filelist.txt'
+    with open(filelist, 'w') as fh:
+        buffer = NoteBuffer([fh], max_chars=100)
+        buffer.add(1, tmp_path / '1.txt', 0, 'a' * 60)
+        for _ in range(9):
+            buffer.extend(1, 'b' * 60)
+            assert len(buffer.notes[1].parts) <= 2
+        assert (tmp_path / '1.txt').exists()
+        assert fh.tell() == 0  # not listed until complete
+        buffer.close()
+    assert (tmp_path / '1.txt').read_text() == 'a' * 60 + 'b' * 540 + '\n'
+    assert read_filelist(filelist) == [str((tmp_path / '1.txt').absolute())]
+
+
+def test_resume_many_parts(tmp_path):
+    notes = [(1, 'First.')] + [(2, f'Part {i}. ') for i in range(300)] + [(3, 'Last.')]
+    build_files(iter(notes[:150]), tmp_path)  # interrupted part way through note 2
+    resume_building_files(iter(notes), tmp_path)
+    assert read_filelist(tmp_path / 'filelist.txt') == [
+        str((tmp_path / 'notes' / f'{i}.txt').absolute()) for i in (1, 2, 3)
+    ]
+    assert (tmp_path / 'notes' / '2.txt').read_text() == ''.join(f'Part {i}. ' for i in range(300)) + '\n'
+
+
+def _many_notes(n=200):
+    """Notes with 1-3 parts each."""
+    return [(i, f'Note {i} part {j}. ') for i in range(n) for j in range(i % 3 + 1)]
+
+
+def _read_notes(outdir):
+    notes = {}
+    for filelist in sorted(outdir.glob('filelist*.txt')):
+        for file in read_filelist(filelist):
+            assert file not in notes, f'Listed more than once: {file}'
+            notes[file] = Path(file).read_text()
+    return notes
+
+
+def test_build_files_write_threads(tmp_path):
+    build_files(iter(_many_notes()), tmp_path / 'sync', n_dirs=3)
+    build_files(iter(_many_notes()), tmp_path / 'threads', n_dirs=3, write_threads=4)
+    expected = {file.replace('sync', 'threads'): text for file, text in _read_notes(tmp_path / 'sync').items()}
+    assert len(expected) == 200
+    assert _read_notes(tmp_path / 'threads') == expected
+
+
+def test_resume_write_threads(tmp_path, monkeypatch):
+    monkeypatch.setattr(extract_text_to_files, 'PROGRESS_EVERY', 7)
+    notes = _many_notes()
+
+    def interrupted():
+        yield from notes[:250]
+        raise KeyboardInterrupt
+
+    try:
+        build_files(interrupted(), tmp_path / 'out', n_dirs=2, write_threads=4)
+    except KeyboardInterrupt:
+        pass
+    with open(tmp_path / 'out' / 'filelist0.txt', 'a') as fh:
+        fh.write(str(tmp_path / 'out' / 'notes0' / 'partial'))  # killed while writing filelist
+    resume_building_files(iter(notes), tmp_path / 'out', n_dirs=2, write_threads=4)
+    build_files(iter(notes), tmp_path / 'expected', n_dirs=2)
+    expected = {file.replace('expected', 'out'): text for file, text in _read_notes(tmp_path / 'expected').items()}
+    assert _read_notes(tmp_path / 'out') == expected
+
+
+def test_resume_seeks_to_position(tmp_path, monkeypatch):
+    monkeypatch.setattr(extract_text_to_files, 'PROGRESS_EVERY', 7)
+    path = tmp_path / 'notes.jsonl'
+    with open(path, 'w') as out:
+        for note_id, text in _many_notes():
+            out.write(json.dumps({'docid': note_id, 'text': text}) + '\n')
+
+    class InterruptedSource(JsonlSource):
+        def iter_rows(self, start):
+            yield from itertools.islice(super().iter_rows(start), 250)
+            raise KeyboardInterrupt
+
+    try:
+        build_files(InterruptedSource(path, 'docid', 'text'), tmp_path / 'out', n_dirs=2)
+    except KeyboardInterrupt:
+        pass
+    source = JsonlSource(path, 'docid', 'text')
+    resume_building_files(source, tmp_path / 'out', n_dirs=2, write_threads=2)
+    assert source.start > 0  # did not re-read from the start
+    build_files(iter(_many_notes()), tmp_path / 'expected', n_dirs=2)
+    expected = {file.replace('expected', 'out'): text for file, text in _read_notes(tmp_path / 'expected').items()}
+    assert _read_notes(tmp_path / 'out') == expected
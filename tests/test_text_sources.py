@@ -0,0 +1,82 @@
+import csv
+import json
+import sqlite3
+
+import pytest
+
+from mml_utils.text_sources import CsvSource, JsonlSource, SasSource, SqlSource
+
+
+def _check_seek(make_source):
+    """Seeking to the position of each row reads the same rows from there."""
+    source = make_source()
+    rows = list(source)
+    positions = []
+    source = make_source()
+    for _ in source:
+        positions.append(source.position)
+    for i in (0, 1, len(rows) // 2, len(rows) - 1):
+        source = make_source()
+        source.seek(positions[i])
+        assert list(source) == rows[i:]
+    return rows
+
+
+def test_csv_source(tmp_path):
+    path = tmp_path / 'notes.csv'
+    with open(path, 'w', newline='', encoding='utf8') as out:
+        writer = csv.writer(out)
+        writer.writerow(['docid', 'other', 'text'])
+        for i in range(20):
+            writer.writerow([i, 'x', f'Note {i}\nhas "fever",\r\nand café.' if i % 3 else f'Note {i}'])
+        out.write('\r\n')
+        writer.writerow([20, 'x'])
+    rows = _check_seek(lambda: CsvSource(path, 'docid', 'text'))
+    with open(path, newline='', encoding='utf8') as fh:
+        assert rows == [(row['docid'], row['text']) for row in csv.DictReader(fh)]
+
+
+def test_csv_source_delimiter(tmp_path):
+    path = tmp_path / 'notes.csv'
+    with open(path, 'w', newline='', encoding='utf8') as out:
+        writer = csv.writer(out, delimiter='|')
+        writer.writerow(['docid', 'text'])
+        for i in range(10):
+            writer.writerow([i, f'Note {i} has fever, chills|aches.'])
+    rows = _check_seek(lambda: CsvSource(path, 'docid', 'text', delimiter='|'))
+    assert rows[3] == ('3', 'Note 3 has fever, chills|aches.')
+
+
+def test_jsonl_source(tmp_path):
+    path = tmp_path / 'notes.jsonl'
+    with open(path, 'w', encoding='utf8') as out:
+        for i in range(20):
+            out.write(json.dumps({'docid': i, 'text': f'Note {i} has fever (café).'}, ensure_ascii=False) + '\n')
+    rows = _check_seek(lambda: JsonlSource(path, 'docid', 'text'))
+    assert rows[7] == (7, 'Note 7 has fever (café).')
+
+
+def test_sas_source(source_data_path):
+    rows = _check_seek(lambda: SasSource(source_data_path / 'corpus.sas7bdat', 'note_id', 'note_text', chunksize=3))
+    assert len(rows) > 3
+
+
+def test_sql_source_keyset(tmp_path):
+    pytest.importorskip('sqlalchemy')
+    from mml_utils.db_extract import create_engine
+    path = tmp_path / 'notes.db'
+    conn = sqlite3.connect(path)
+    conn.execute('create table notes (note_id integer, line integer, text text)')
+    conn.executemany('insert into notes values (?, ?, ?)', [(i, j, f'Note {i} line {j}.') for i in range(10)
+                                                            for j in range(2)])
+    conn.commit()
+    conn.close()
+    engine = create_engine(f'sqlite:///{path}')
+    query = 'select note_id, text from notes where {partition} order by note_id, line'
+    source = SqlSource(engine, query, keyset_col='note_id', batch_size=3)
+    rows = list(source)
+    assert len(rows) == 20 and source.position == 9
+    source = SqlSource(engine, query, keyset_col='note_id')
+    source.seek(6)
+    assert list(source) == rows[12:]
+    _check_seek(lambda: SqlSource(engine, query, batch_size=3))  # row numbers
@@ -0,0 +1,70 @@
+import time
+
+from mml_utils.filelists import get_output_path, read_filelist
+from mml_utils.scripts.build_filelists import prepare_mml_list, watch
+from mml_utils.watch_folder import Batcher, FolderWatcher
+
+
+def test_watcher_waits_for_quiescence(tmp_path):
+    watcher = FolderWatcher(tmp_path, quiescence=0.3, use_inotify=False)
+    note = tmp_path / 'a.txt'
+    note.write_text('fever')
+    assert watcher.poll(timeout=0.1) == []
+    note.write_text('fever and chills')  # still being written
+    assert watcher.poll(timeout=0.2) == []
+    time.sleep(0.3)
+    assert watcher.poll(timeout=0) == [note]
+    assert watcher.poll(timeout=0) == []  # only returned once
+
+
+def test_watcher_marker_file(tmp_path):
+    watcher = FolderWatcher(tmp_path, quiescence=60, marker_ext='.done', use_inotify=False)
+    (tmp_path / 'sub').mkdir()
+    note = tmp_path / 'sub' / 'a.txt'
+    note.write_text('fever')
+    assert watcher.poll(timeout=0) == []
+    (tmp_path / 'sub' / 'a.txt.done').touch()
+    assert watcher.poll(timeout=0) == [note]
+
+
+def test_batcher(tmp_path):
+    files = []
+    for i in range(5):
+        files.append(tmp_path / f'{i}.txt')
+        files[-1].write_text('x' * 100)
+    batcher = Batcher(max_files=2, max_wait=60)
+    assert batcher.add(files) == [files[:2], files[2:4]]
+    assert batcher.flush() == files[4:]
+    batcher = Batcher(max_files=10, max_bytes=250, max_wait=60)
+    assert batcher.add(files) == [files[:3]]
+    batcher = Batcher(max_files=10, max_wait=0)
+    assert batcher.add(files[:1]) == [files[:1]]
+
+
+def test_watch_hands_off_to_mml(fake_mml_home, tmp_path):
+    outpath = tmp_path / 'work'
+    (outpath / 'clarity').mkdir(parents=True)
+    for i in range(5):
+        (outpath / 'clarity' / f'{i}.txt').write_text(f'Note {i} with fever.\n')
+    filelists = watch(outpath, n_dirs=2, file_limit=2, max_wait=0.5, quiescence=0.2, poll_interval=0.1, idle_exit=1,
+                      mml_home=fake_mml_home, n_workers=2, max_heap='1g')
+    assert len(filelists) == 3
+    assert not list((outpath / 'clarity').iterdir())
+    for filelist in filelists:
+        assert not filelist.exists()
+        completed = filelist.with_suffix('.complete')
+        for file in read_filelist(completed):
+            assert get_output_path(file).exists()
+
+
+def test_prepare_mml_list_unique_filelists(tmp_path):
+    src, mml_path, run_path = tmp_path / 'clarity', tmp_path / 'mml', tmp_path / 'run'
+    for path in (src, mml_path, run_path):
+        path.mkdir()
+    filelists = []
+    for i in range(10):  # built within the same second
+        (src / f'{i}.txt').write_text(f'Note {i} with fever.\n')
+        filelists.append(prepare_mml_list([src / f'{i}.txt'], mml_path, run_path, settle_seconds=0))
+    assert len(set(filelists)) == 10
+    assert sorted(str(file) for filelist in filelists for file in read_filelist(filelist)) == sorted(
+        str(mml_path / f'{i}.txt') for i in range(10))
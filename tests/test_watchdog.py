@@ -0,0 +1,48 @@
+import json
+
+from mml_utils.filelists import get_output_path, read_filelist
+from mml_utils.mml_pool import MmlPool, run_mml_pool
+from mml_utils.watchdog import supervise_run_mml
+
+
+def _add_to_note(file, text):
+    with open(file, 'a', encoding='utf8') as out:
+        out.write(text)
+
+
+def test_supervise_run_mml_quarantines_stalled_file(fake_mml_home, fever_notes):
+    files = read_filelist(fever_notes)
+    _add_to_note(files[5], 'STALL\n')
+    _add_to_note(files[12], 'CRASH\n')
+    quarantined = supervise_run_mml(fever_notes, fake_mml_home, stall_timeout=2, check_interval=0.2)
+    assert quarantined == [files[5], files[12]]
+    assert read_filelist(fever_notes.parent / 'quarantine.txt') == quarantined
+    with open(fever_notes.parent / 'stalls.jsonl', encoding='utf8') as fh:
+        events = [json.loads(line) for line in fh]
+    assert [event['reason'] for event in events] == ['stalled', 'failed']
+    assert events[0]['seconds_since_progress'] > 2
+    for file in files:
+        assert get_output_path(file).exists() == (file not in quarantined)
+
+
+def test_run_mml_pool_stall_timeout(fake_mml_home, fever_notes, tmp_path):
+    files = read_filelist(fever_notes)
+    _add_to_note(files[6], 'STALL\n')
+    completed, failed = run_mml_pool([fever_notes], fake_mml_home, n_workers=2, shard_size=5,
+                                     shard_dir=tmp_path / 'shards', progress_interval=1, stall_timeout=2)
+    assert len(completed) == 4
+    assert not failed
+    assert read_filelist(tmp_path / 'shards' / 'quarantine.txt') == [files[6]]
+    for file in files:
+        assert get_output_path(file).exists() == (file != files[6])
+
+
+def test_mml_pool_counts_restarted_files_once(fake_mml_home, fever_notes, tmp_path):
+    files = read_filelist(fever_notes)[:5]
+    _add_to_note(files[2], 'STALL\n')
+    shard = tmp_path / 'shard.in_progress'
+    shard.write_text(''.join(f'{file}\n' for file in files), encoding='utf8')
+    pool = MmlPool([shard], fake_mml_home, n_workers=1, progress_interval=1, stall_timeout=2)
+    completed, failed = pool.run()
+    assert len(completed) == 1
+    assert pool.finished == 4  # all but the quarantined file; files[1] is re-run after the restart
@@ -0,0 +1,66 @@
+import json
+import multiprocessing
+import time
+
+from mml_utils.filelists import get_output_path, read_filelist
+from mml_utils.mml_pool import split_filelist_to_shards
+from mml_utils.work_queue import LeaseQueue, LeasedMmlPool, get_lease_path, get_queue_status
+
+
+def _run_worker(queue_dir, mml_home, host):
+    lease_queue = LeaseQueue(queue_dir, lease_timeout=5, heartbeat_interval=0.2, host=host)
+    LeasedMmlPool(lease_queue, mml_home, n_workers=2, max_heap='1g', progress_interval=1).run()
+
+
+def test_lease_is_exclusive(tmp_path):
+    shard = tmp_path / 'a_shard0000.in_progress'
+    shard.write_text('x.txt\n')
+    claimed, _ = LeaseQueue(tmp_path, host='one').claim(wait=False)
+    assert claimed == shard
+    assert LeaseQueue(tmp_path, host='two').claim(wait=False) is None
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    shard = tmp_path / 'a_shard0000.in_progress'
+    shard.write_text('x.txt\n')
+    get_lease_path(shard).write_text(json.dumps({'token': 'dead', 'host': 'dead'}))
+    lease_queue = LeaseQueue(tmp_path, lease_timeout=0.5, heartbeat_interval=0.1, host='alive')
+    start = time.time()
+    claimed, lease = lease_queue.claim()
+    assert claimed == shard
+    assert time.time() - start > 0.5
+    assert lease.is_owned()
+
+
+def test_workers_share_queue(fake_mml_home, fever_notes, tmp_path):
+    queue_dir = tmp_path / 'queue'
+    split_filelist_to_shards(fever_notes, shard_dir=queue_dir, shard_size=2)
+    ctx = multiprocessing.get_context('fork')
+    procs = [ctx.Process(target=_run_worker, args=(queue_dir, fake_mml_home, f'host{i}')) for i in range(3)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join(timeout=120)
+        assert proc.exitcode == 0
+    for file in read_filelist(fever_notes):
+        assert get_output_path(file).exists()
+    shards, leases, hosts = get_queue_status(queue_dir)
+    assert shards == {'in_progress': 0, 'complete': 10, 'failed': 0}
+    assert not leases
+    assert sum(host['files'] for host in hosts.values()) == 20  # each shard was run exactly once
+    assert not list(queue_dir.glob('*.broken'))
+
+
+def test_lost_lease_leaves_shard(fake_mml_home, tmp_path):
+    shard = tmp_path / 'a_shard0000.in_progress'
+    shard.write_text('x.txt\n')
+    lease_queue = LeaseQueue(tmp_path, host='one')
+    _, lease = lease_queue.claim(wait=False)
+    lease_queue._break(get_lease_path(shard))  # not observed as stale: nothing to break
+    assert lease.is_owned()
+    pool = LeasedMmlPool(lease_queue, fake_mml_home)
+    pool.leases[0] = lease
+    get_lease_path(shard).write_text(json.dumps({'token': 'other', 'host': 'two'}))  # broken and re-claimed
+    pool._complete_shard(0, shard)
+    assert shard.exists() and not pool.completed_shards
+    assert lease.lost